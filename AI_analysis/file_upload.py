@@ -1,12 +1,13 @@
 import os
 import uuid
 from werkzeug.utils import secure_filename
+from .text_extraction import extract_text, ExtractionError
 
 # 支持的文件类型
 ALLOWED_EXTENSIONS = {'doc', 'docx', 'pdf', 'md', 'txt'}
 
-# 文件上传目录
-UPLOAD_FOLDER = 'AI_analysis/uploads'
+# 文件上传目录（本包下的 uploads，不随进程启动时的工作目录变化）
+UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 
 # 确保上传目录存在
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -37,49 +38,15 @@ def handle_file_upload(file):
             'error': '不支持的文件类型，请上传Word/PDF/Markdown/TXT格式的文件'
         }
 
-def read_file_content(file_path):
-    """读取文件内容（根据文件类型进行不同处理）"""
+def read_file_content(file_path, max_chars=None):
+    """
+    读取文件内容（根据文件类型进行不同处理），同一份文件的提取结果会被缓存（见 text_extraction.py）。
+    只需要开头部分时传入 max_chars，凑够字符数后即停止解析。
+    无法读取时返回提示文字而不是抛出异常
+    """
     try:
-        _, ext = os.path.splitext(file_path)
-        ext = ext.lower()
-        
-        if ext in ['.txt', '.md']:
-            # 读取文本文件，尝试不同编码
-            encodings = ['utf-8', 'gbk', 'gb2312', 'utf-16']
-            for encoding in encodings:
-                try:
-                    with open(file_path, 'r', encoding=encoding) as f:
-                        content = f.read()
-                    # 验证内容是否合理（至少包含一些中文字符或英文字符）
-                    if any(char.isalpha() or char.isdigit() for char in content):
-                        return content
-                except UnicodeDecodeError:
-                    continue
-            return '无法读取文件内容，可能是编码问题'
-        elif ext in ['.doc', '.docx']:
-            # 使用python-docx读取Word文件
-            try:
-                from docx import Document
-                doc = Document(file_path)
-                content = []
-                for para in doc.paragraphs:
-                    content.append(para.text)
-                return '\n'.join(content)
-            except ImportError:
-                return '需要安装python-docx库来读取Word文件'
-        elif ext == '.pdf':
-            # 使用PyPDF2读取PDF文件
-            try:
-                import PyPDF2
-                with open(file_path, 'rb') as f:
-                    reader = PyPDF2.PdfReader(f)
-                    content = []
-                    for page in reader.pages:
-                        content.append(page.extract_text())
-                    return '\n'.join(content)
-            except ImportError:
-                return '需要安装PyPDF2库来读取PDF文件'
-        else:
-            return '不支持的文件格式'
+        return extract_text(file_path, max_chars=max_chars)
+    except ExtractionError as e:
+        return str(e)
     except Exception as e:
         return f'读取文件失败：{str(e)}'
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+长报告分段
+
+整篇论文一次放进评分提示词容易超出模型上下文，也慢、贵。split_report() 把提取出的全文切成
+不超过 max_chars 个字符的若干段，尽量保持章节完整：
+1. 先按标题行（Markdown #、“第一章”、“一、”、“（一）”、“1.2 ”、摘要/引言/结论等）切成章节；
+2. 章节放得下就与相邻的小章节合并成一段，放不下再按段落切；
+3. 单个段落仍然超长时按句子切，最后才按字符数硬切。
+切分不丢内容：各段去掉空白后依次拼接等于原文去掉空白。
+"""
+
+import re
+
+_HEADING_PATTERNS = [
+    re.compile(r'^#{1,6}\s+\S'),
+    re.compile(r'^第[一二三四五六七八九十百零〇\d]+[章节部分篇]'),
+    re.compile(r'^[一二三四五六七八九十]+[、.．]'),
+    re.compile(r'^[（(][一二三四五六七八九十]+[）)]'),
+    re.compile(r'^\d+(\.\d+)*[、.．\s]\s*\S'),
+    re.compile(r'^(摘\s*要|abstract|引\s*言|前\s*言|绪\s*论|结\s*论|总\s*结|参考文献|致\s*谢)\s*[:：]?$', re.IGNORECASE),
+]
+
+# 超过这个长度的行不当作标题
+_MAX_HEADING_LENGTH = 50
+
+_SENTENCE_END = re.compile(r'(?<=[。！？；!?;])|(?<=\.\s)')
+
+
+def is_heading(line):
+    line = line.strip()
+    return 0 < len(line) <= _MAX_HEADING_LENGTH and any(p.match(line) for p in _HEADING_PATTERNS)
+
+
+def _sections(text):
+    """按标题行切成章节，每个章节是以标题开头的一串行"""
+    sections, current = [], []
+    for line in text.splitlines():
+        if is_heading(line) and any(l.strip() for l in current):
+            sections.append('\n'.join(current).strip('\n'))
+            current = []
+        current.append(line)
+    if any(l.strip() for l in current):
+        sections.append('\n'.join(current).strip('\n'))
+    return sections
+
+
+def _paragraphs(section):
+    """章节内按空行切段落；没有空行时（PDF 提取的文本常见）按行切"""
+    paragraphs = [p for p in re.split(r'\n\s*\n', section) if p.strip()]
+    if len(paragraphs) == 1:
+        paragraphs = [line for line in section.splitlines() if line.strip()]
+    return paragraphs
+
+
+def _split_long(piece, max_chars):
+    """按句子切超长段落，单句仍超长时按字符数硬切"""
+    parts = []
+    for sentence in _SENTENCE_END.split(piece):
+        while len(sentence) > max_chars:
+            parts.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if sentence:
+            parts.append(sentence)
+    return parts
+
+
+def _pack(pieces, max_chars, separator):
+    """把小块依次装进不超过 max_chars 的段"""
+    chunks, current = [], ''
+    for piece in pieces:
+        candidate = current + separator + piece if current else piece
+        if len(candidate) <= max_chars:
+            current = candidate
+            continue
+        if current:
+            chunks.append(current)
+        current = piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_report(text, max_chars):
+    """把报告全文切成不超过 max_chars 字符的若干段（列表），整篇放得下时只有一段"""
+    text = (text or '').strip()
+    if len(text) <= max_chars:
+        return [text] if text else []
+
+    pieces = []
+    for section in _sections(text):
+        if len(section) <= max_chars:
+            pieces.append(section)
+            continue
+        # 章节太长：按段落切，段落太长再按句子切
+        paragraphs = []
+        for paragraph in _paragraphs(section):
+            if len(paragraph) <= max_chars:
+                paragraphs.append(paragraph)
+            else:
+                paragraphs.extend(_pack(_split_long(paragraph, max_chars), max_chars, ''))
+        pieces.extend(_pack(paragraphs, max_chars, '\n\n'))
+    return _pack(pieces, max_chars, '\n\n')
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+报告文本提取服务
+
+批改、对比、评估接口会反复读取同一份报告，原来每次都重新解析 DOCX/PDF。这里：
+- 提取结果按文件内容的 SHA-256 缓存在进程内（LRU，按总字符数 EXTRACTION_CACHE_MAX_CHARS 淘汰），
+  同一份文件换了路径或文件名也能命中；
+- PDF 按页分段交给进程池并行提取（EXTRACTION_WORKERS，默认 min(4, CPU数)），
+  iter_text() 按页顺序逐段产出文本，调用方不再需要时停止迭代，尚未开始的分段直接取消；
+- extract_text(max_chars=N) 只需要开头 N 个字符时提前结束解析（部分结果不写缓存）；
+- 文本文件只读一次，再按编码依次尝试解码，换行符与原来按文本模式读取时一样统一为 \n。
+
+解析失败时抛出 ExtractionError，消息与原 read_file_content 返回的提示文字一致。
+"""
+
+import os
+import hashlib
+import threading
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# 依次尝试的文本文件编码
+TEXT_ENCODINGS = ['utf-8', 'gbk', 'gb2312', 'utf-16']
+
+# 页数少于这个值的 PDF 直接在当前进程提取，不值得分发到进程池
+PDF_PARALLEL_MIN_PAGES = 16
+
+# 每个进程池任务提取的页数
+PDF_CHUNK_PAGES = 8
+
+
+class ExtractionError(Exception):
+    """文件无法提取文本（格式不支持、编码无法识别、缺少解析库）"""
+
+
+def file_digest(file_path):
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+class ExtractionCache:
+    """按文件内容哈希缓存提取出的全文，总字符数超过 max_chars 时淘汰最久未使用的条目"""
+
+    def __init__(self, max_chars=20 * 1000 * 1000):
+        self.max_chars = max_chars
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._total_chars = 0
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        with self._lock:
+            text = self._entries.get(digest)
+            if text is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return text
+
+    def put(self, digest, text):
+        if len(text) > self.max_chars:
+            return
+        with self._lock:
+            old = self._entries.pop(digest, None)
+            if old is not None:
+                self._total_chars -= len(old)
+            self._entries[digest] = text
+            self._total_chars += len(text)
+            while self._total_chars > self.max_chars:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_chars -= len(evicted)
+
+    def clear(self):
+        """清空缓存和命中计数"""
+        with self._lock:
+            self._entries.clear()
+            self._total_chars = 0
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._entries), 'chars': self._total_chars}
+
+
+extraction_cache = ExtractionCache(int(os.environ.get('EXTRACTION_CACHE_MAX_CHARS', 20 * 1000 * 1000)))
+
+
+# ---------- 各格式的分段提取 ----------
+
+def _iter_plain_text(file_path):
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+    for encoding in TEXT_ENCODINGS:
+        try:
+            content = raw.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+        # 验证内容是否合理（至少包含一些中文字符或英文字符）
+        if any(char.isalpha() or char.isdigit() for char in content):
+            # 与文本模式读取一致：\r\n 和单独的 \r 都换成 \n
+            yield content.replace('\r\n', '\n').replace('\r', '\n')
+            return
+    raise ExtractionError('无法读取文件内容，可能是编码问题')
+
+
+def _iter_docx_paragraphs(file_path):
+    try:
+        from docx import Document
+    except ImportError:
+        raise ExtractionError('需要安装python-docx库来读取Word文件')
+    for para in Document(file_path).paragraphs:
+        yield para.text
+
+
+def _import_pypdf2():
+    try:
+        import PyPDF2
+        return PyPDF2
+    except ImportError:
+        raise ExtractionError('需要安装PyPDF2库来读取PDF文件')
+
+
+# 进程池中每个工作进程保留最近打开的一份 PDF，同一文件的后续分段不必重新解析文件结构
+_worker_reader = {}
+
+
+def _extract_pdf_pages(file_path, start, stop):
+    """在工作进程中提取 [start, stop) 页的文本"""
+    PyPDF2 = _import_pypdf2()
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_mtime_ns, stat.st_size)
+    reader = _worker_reader.get(key)
+    if reader is None:
+        _worker_reader.clear()
+        reader = _worker_reader[key] = PyPDF2.PdfReader(file_path)
+    return [reader.pages[i].extract_text() for i in range(start, stop)]
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def extraction_workers():
+    return int(os.environ.get('EXTRACTION_WORKERS', min(4, os.cpu_count() or 1)))
+
+
+def _get_pool(workers):
+    """长期复用的进程池；用 spawn 启动，避免在已有多个线程的 Web 进程里 fork"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+def iter_pdf_pages(file_path, workers=None):
+    """按页顺序产出 PDF 每页的文本；页数较多时分段并行提取，进行中的分段不超过 workers 的两倍"""
+    PyPDF2 = _import_pypdf2()
+    reader = PyPDF2.PdfReader(file_path)
+    page_count = len(reader.pages)
+    workers = workers or extraction_workers()
+    if workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+        for page in reader.pages:
+            yield page.extract_text()
+        return
+
+    pool = _get_pool(workers)
+    ranges = iter([(start, min(start + PDF_CHUNK_PAGES, page_count))
+                   for start in range(0, page_count, PDF_CHUNK_PAGES)])
+    in_flight = collections.deque()
+    try:
+        for start, stop in ranges:
+            in_flight.append(pool.submit(_extract_pdf_pages, file_path, start, stop))
+            if len(in_flight) >= workers * 2:
+                break
+        while in_flight:
+            pages = in_flight.popleft().result()
+            next_range = next(ranges, None)
+            if next_range is not None:
+                in_flight.append(pool.submit(_extract_pdf_pages, file_path, *next_range))
+            yield from pages
+    finally:
+        # 调用方提前停止时取消还没开始的分段
+        for future in in_flight:
+            future.cancel()
+
+
+def _piece_reader(file_path):
+    """按扩展名选择分段提取函数，不支持的格式在读缓存之前就报错"""
+    _, ext = os.path.splitext(file_path)
+    ext = ext.lower()
+    if ext in ['.txt', '.md']:
+        return lambda workers: _iter_plain_text(file_path)
+    if ext in ['.doc', '.docx']:
+        return lambda workers: _iter_docx_paragraphs(file_path)
+    if ext == '.pdf':
+        return lambda workers: iter_pdf_pages(file_path, workers)
+    raise ExtractionError('不支持的文件格式')
+
+
+# ---------- 对外接口 ----------
+
+def iter_text(file_path, workers=None):
+    """
+    逐段产出文件文本（PDF 每页一段、Word 每段落一段，文本文件整篇一段），段与段之间用换行连接即为全文。
+    已缓存的文件整篇作为一段返回；全部分段产出后把全文写入缓存，调用方中途停止时不写
+    """
+    read_pieces = _piece_reader(file_path)
+    digest = file_digest(file_path)
+    cached = extraction_cache.get(digest)
+    if cached is not None:
+        yield cached
+        return
+
+    pieces = []
+    generator = read_pieces(workers)
+    try:
+        for piece in generator:
+            pieces.append(piece)
+            yield piece
+    finally:
+        generator.close()
+    extraction_cache.put(digest, '\n'.join(pieces))
+
+
+def extract_text(file_path, max_chars=None, workers=None):
+    """返回文件全文；指定 max_chars 时只返回前 max_chars 个字符，凑够后立即停止解析"""
+    read_pieces = _piece_reader(file_path)
+    digest = file_digest(file_path)
+    cached = extraction_cache.get(digest)
+    if cached is not None:
+        return cached if max_chars is None else cached[:max_chars]
+
+    pieces, length = [], 0
+    generator = read_pieces(workers)
+    try:
+        for piece in generator:
+            pieces.append(piece)
+            length += len(piece) + 1
+            if max_chars is not None and length > max_chars:
+                return '\n'.join(pieces)[:max_chars]
+    finally:
+        generator.close()
+
+    text = '\n'.join(pieces)
+    extraction_cache.put(digest, text)
+    return text if max_chars is None else text[:max_chars]
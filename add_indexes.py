@@ -0,0 +1,15 @@
+from app import app, db, create_missing_indexes
+
+# 为常用查询路径补建模型中声明的复合索引（已存在的索引跳过，可重复执行）
+# 等同于 flask --app app migrate 中的建索引步骤
+
+with app.app_context():
+    # 确保所有表都已创建
+    db.create_all()
+    
+    created = create_missing_indexes()
+    for name in created:
+        print(f"已创建索引 {name}")
+    if not created:
+        print("所有索引已存在，无需创建")
+    print("索引迁移完成")
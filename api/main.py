@@ -1,12 +1,24 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from api.v1.validate_input import router as validate_router
+from api.v1.validate_input import api_v1_router as validate_router
+from api.tutor import router as tutor_router
+from llm_clients import aclose_llm_clients
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # 关闭时释放大模型客户端的长连接
+    await aclose_llm_clients()
+
 
 # 创建FastAPI应用
 app = FastAPI(
     title="Input Validation API",
-    description="设计学科文字/富文本输入校验接口",
-    version="1.0.0"
+    description="设计学科文字/富文本输入校验接口，AI 助教的异步对话、历史和 FAQ 接口",
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 配置CORS，允许前端访问
@@ -19,7 +31,9 @@ app.add_middleware(
 )
 
 # 注册路由
-app.include_router(validate_router, prefix="/api/v1")
+# 校验接口的路由自带 /api/v1 前缀
+app.include_router(validate_router)
+app.include_router(tutor_router)
 
 @app.get("/")
 async def root():
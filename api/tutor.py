@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+AI 助教的异步接口（ASGI）
+
+Flask 版的 /api/ai-tutor/chat 在整个生成过程中占着一个工作线程，60 个同时进行的对话就要 60 个线程。
+这里用 asyncio 提供同样的接口（路径、参数、SSE 事件格式都不变），由 api/main.py 的 FastAPI 应用注册：
+- 对话：异步 OpenAI 客户端流式请求上游，等待上游的过程不占线程；每个 SSE 数据块由 StreamingResponse
+  逐块发送，客户端读得慢时 send 会等待（背压），断开时生成器被取消；
+- 相同问题合并、问答缓存与 Flask 版相同（AsyncSingleFlight、tutor_cache），所有订阅者断开后停止请求上游；
+- 历史对话和 FAQ 的查询与 Flask 版共用 app.py 中的 tutor_history 等函数，在线程池中带应用上下文执行。
+
+登录状态从 Flask 的 session Cookie 中读取（同一个 secret_key），未登录时与 Flask 版一样按用户 1 处理。
+部署时把 /api/ai-tutor/ 反向代理到 uvicorn api.main:app，其余路径仍由 Flask 处理。
+"""
+
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app import (app as flask_app, TUTOR_BASE_URL, TUTOR_API_KEY, TUTOR_MODEL, TUTOR_PROMPT_VERSION,
+                 _lookup_tutor_cache, _save_tutor_cache, tutor_history, tutor_conversation, tutor_faq,
+                 tutor_faq_search, FAQ_SEARCH_PAGE_SIZE)
+from llm_clients import get_async_llm_client, acreate_with_retry
+from single_flight import AsyncSingleFlight
+from tutor_cache import replay_events, exact_question
+
+router = APIRouter()
+
+# 同时到达的相同问题只向大模型请求一次
+tutor_flights = AsyncSingleFlight('tutor-chat-async')
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',
+    'Access-Control-Allow-Origin': '*',
+}
+
+
+def _sse(event):
+    return f"data: {json.dumps(event)}\n\n"
+
+
+def session_user_id(request):
+    """从 Flask 的 session Cookie 中取 user_id，没有登录或 Cookie 无效时返回 1（与 Flask 版一致）"""
+    cookie = request.cookies.get(flask_app.config.get('SESSION_COOKIE_NAME', 'session'))
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if cookie and serializer is not None:
+        try:
+            data = serializer.loads(cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+            return data.get('user_id', 1)
+        except Exception:
+            pass
+    return 1
+
+
+def _with_app_context(func, *args):
+    with flask_app.app_context():
+        return func(*args)
+
+
+async def query_in_app_context(func, *args):
+    """在线程池中带 Flask 应用上下文执行数据库查询"""
+    return await run_in_threadpool(_with_app_context, func, *args)
+
+
+async def tutor_completion_events(question, cache_scope):
+    """app.tutor_completion_events 的异步版本：逐个产出 thinking/answer/error 事件，完整回答后写入问答缓存"""
+    thinking_parts, answer_parts = [], []
+    try:
+        client = get_async_llm_client(TUTOR_BASE_URL, TUTOR_API_KEY, 'chat')
+        messages = [
+            {"role": "system", "content": "你是一名专业的AI助教，帮助学生解答学习相关的问题。"},
+            {"role": "user", "content": question}
+        ]
+        completion = await acreate_with_retry(client, model=TUTOR_MODEL, messages=messages, stream=True)
+        async for chunk in completion:
+            delta = chunk.choices[0].delta
+            if getattr(delta, "reasoning_content", None) is not None:
+                thinking_parts.append(delta.reasoning_content)
+                yield {'type': 'thinking', 'content': delta.reasoning_content}
+            if getattr(delta, "content", None):
+                answer_parts.append(delta.content)
+                yield {'type': 'answer', 'content': delta.content}
+
+        # 完整回答完才写缓存，出错或中途断开的回答不缓存
+        await run_in_threadpool(_save_tutor_cache, question, ''.join(answer_parts), ''.join(thinking_parts),
+                                cache_scope)
+    except Exception as e:
+        print(f"阿里云百炼API请求错误: {type(e).__name__}: {str(e)}")
+        yield {'type': 'error', 'content': 'AI回答出错，请稍后重试。'}
+
+
+async def chat_events(question):
+    if not question:
+        yield _sse({'type': 'error', 'content': '问题不能为空'})
+        yield "data: [DONE]\n\n"
+        return
+
+    # 相似的问题已经回答过：按原来的事件格式重放缓存的回答
+    cache_scope = f"{TUTOR_MODEL}/{TUTOR_PROMPT_VERSION}"
+    cached = await run_in_threadpool(_lookup_tutor_cache, question, cache_scope)
+    if cached is not None:
+        for event in replay_events(cached):
+            yield _sse(event)
+        yield "data: [DONE]\n\n"
+        return
+
+    # 同一个问题正在回答：加入这次回答，先收到已产出的部分，再实时收到后续内容
+    flight_key = (cache_scope, exact_question(question))
+    async for event in tutor_flights.stream(flight_key, lambda: tutor_completion_events(question, cache_scope)):
+        yield _sse(event)
+    yield "data: [DONE]\n\n"
+
+
+@router.api_route('/api/ai-tutor/chat', methods=['GET', 'POST'])
+async def ai_tutor_chat(request: Request):
+    if request.method == 'POST':
+        try:
+            data = await request.json()
+        except ValueError:
+            data = {}
+        question = data.get('question') if isinstance(data, dict) else None
+    else:
+        question = request.query_params.get('question')
+    return StreamingResponse(chat_events(question), media_type='text/event-stream', headers=SSE_HEADERS)
+
+
+def _error_response(prefix, error):
+    print(f"{prefix}: {error}")
+    return JSONResponse({'error': str(error)}, status_code=500)
+
+
+@router.get('/api/ai-tutor/history')
+async def get_history(request: Request):
+    try:
+        return {'history': await query_in_app_context(tutor_history, session_user_id(request))}
+    except Exception as e:
+        return _error_response('获取历史对话错误', e)
+
+
+@router.get('/api/ai-tutor/history/{session_id}')
+async def get_history_detail(session_id: str, request: Request):
+    try:
+        return {'conversation': await query_in_app_context(tutor_conversation, session_user_id(request), session_id)}
+    except Exception as e:
+        return _error_response('获取对话详情错误', e)
+
+
+@router.get('/api/ai-tutor/faq')
+async def get_faq(request: Request, course_id: Optional[int] = None):
+    try:
+        return {'faq': await query_in_app_context(tutor_faq, session_user_id(request), course_id)}
+    except Exception as e:
+        return _error_response('获取FAQ错误', e)
+
+
+@router.get('/api/ai-tutor/faq/search')
+async def search_faq(request: Request, keyword: str = '', page: int = 1, per_page: int = FAQ_SEARCH_PAGE_SIZE):
+    keyword = keyword.strip()
+    if not keyword:
+        return JSONResponse({'error': '搜索关键词不能为空'}, status_code=400)
+    page, per_page = max(page, 1), min(max(per_page, 1), 100)
+    try:
+        faq, has_more = await query_in_app_context(tutor_faq_search, session_user_id(request), keyword, page, per_page)
+        return {'faq': faq, 'page': page, 'has_more': has_more}
+    except Exception as e:
+        return _error_response('搜索FAQ错误', e)
+
+
+@router.get('/api/ai-tutor/async/stats')
+async def tutor_async_stats():
+    """本进程相同问题的合并情况"""
+    return tutor_flights.stats()
@@ -1,5 +1,7 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, send_from_directory, jsonify, Response, after_this_request
+from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, send_from_directory, jsonify, Response, after_this_request, g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import joinedload, selectinload
+from functools import wraps
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
@@ -13,7 +15,17 @@ import time
 import argparse
 from datetime import datetime
 from AI_analysis.file_upload import read_file_content
-from openai import OpenAI
+from AI_analysis.report_chunking import split_report
+from message_hub import get_message_hub, user_channel, course_channel
+from db_profile import engine_options, apply_sqlite_pragmas
+from progress_buffer import ProgressBuffer, register_buffer
+from grading_queue import GradingQueue
+from grading_cache import get_grading_cache, grading_cache_key
+from llm_clients import get_llm_client, create_with_retry, metrics as llm_metrics
+from tutor_cache import get_tutor_cache, replay_events, normalize_question, exact_question
+from single_flight import SingleFlight
+import message_search
+from faq_builder import FaqIndex, FaqBuilder
 
 # 创建Flask应用
 app = Flask(__name__)
@@ -53,11 +65,31 @@ def fromjson_filter(s):
 
 # 配置数据库
 import os
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(os.path.dirname(__file__), 'instance', 'user_management.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'DATABASE_URL',
+    'sqlite:///' + os.path.join(os.path.dirname(__file__), 'instance', 'user_management.db')
+)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-# 初始化数据库
-db = SQLAlchemy(app)
+# 初始化数据库（在 create_app 中绑定到应用）
+db = SQLAlchemy()
+
+def create_app(config=None):
+    """
+    应用工厂：应用额外配置、绑定数据库、注册命令行命令，不建表也不写数据。
+    数据库在第一次调用时绑定，之后再调用只返回同一个应用；
+    部署时可用 gunicorn "app:create_app()"，脚本里 from app import app 得到的也是它
+    """
+    if config:
+        app.config.update(config)
+    if 'sqlalchemy' not in app.extensions:
+        # 连接池参数按数据库类型设置，SQLite 文件库在每个连接上启用 WAL 等 PRAGMA（见 db_profile.py）
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+        db.init_app(app)
+        with app.app_context():
+            apply_sqlite_pragmas(db.engine)
+        register_commands(app)
+    return app
 
 # 权限定义
 PERMISSIONS = {
@@ -209,6 +241,45 @@ class StudentQuiz(db.Model):
     # 关系
     student = db.relationship('User', backref=db.backref('student_quizzes', lazy=True))
     quiz = db.relationship('Quiz', backref=db.backref('student_quizzes', lazy=True))
+    
+    # 按测验+学生+状态查找答题记录（开始测验、成绩页）
+    __table_args__ = (db.Index('ix_student_quiz_quiz_student_status', 'quiz_id', 'student_id', 'status'),)
+
+# 测验成绩统计模型（学生交卷时增量更新，教师端直接读取）
+class QuizStatistics(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), unique=True, nullable=False)
+    attempt_count = db.Column(db.Integer, default=0, nullable=False)  # 已完成人次
+    mean_score = db.Column(db.Float, default=0.0)  # 平均分
+    min_score = db.Column(db.Float, nullable=True)
+    max_score = db.Column(db.Float, nullable=True)
+    median_score = db.Column(db.Float, nullable=True)  # 中位数（第50百分位）
+    p90_score = db.Column(db.Float, nullable=True)  # 第90百分位
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # 关系
+    quiz = db.relationship('Quiz', backref=db.backref('statistics', uselist=False, cascade='all, delete-orphan'))
+
+# 测验成绩排名模型（每条已完成的学生测验一行，dense_rank 为并列不跳号的名次）
+class QuizRanking(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
+    student_quiz_id = db.Column(db.Integer, db.ForeignKey('student_quiz.id'), unique=True, nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    total_score = db.Column(db.Float, default=0.0, nullable=False)
+    submit_time = db.Column(db.DateTime, nullable=True)
+    dense_rank = db.Column(db.Integer, nullable=False)
+    
+    # 关系
+    quiz = db.relationship('Quiz', backref=db.backref('rankings', lazy=True, cascade='all, delete-orphan'))
+    student_quiz = db.relationship('StudentQuiz', backref=db.backref('ranking', uselist=False, cascade='all, delete-orphan'))
+    student = db.relationship('User')
+    
+    # 按名次读取排名、按分数计算名次和百分位
+    __table_args__ = (
+        db.Index('ix_quiz_ranking_quiz_rank', 'quiz_id', 'dense_rank'),
+        db.Index('ix_quiz_ranking_quiz_score', 'quiz_id', 'total_score'),
+    )
 
 # 竞赛模型
 class Competition(db.Model):
@@ -330,6 +401,9 @@ class StudentAnswer(db.Model):
     # 关系
     student_quiz = db.relationship('StudentQuiz', backref=db.backref('student_answers', lazy=True))
     question = db.relationship('Question', backref=db.backref('student_answers', lazy=True))
+    
+    # 按答题记录取全部作答（交卷判分、查看结果）
+    __table_args__ = (db.Index('ix_student_answer_student_quiz_question', 'student_quiz_id', 'question_id'),)
 
 # 错题库模型
 class ErrorQuestionBank(db.Model):
@@ -344,6 +418,9 @@ class ErrorQuestionBank(db.Model):
     # 关系
     student = db.relationship('User', backref=db.backref('error_questions', lazy=True))
     question = db.relationship('Question', backref=db.backref('error_questions', lazy=True))
+    
+    # 交卷时按学生+题目判断是否已在错题库
+    __table_args__ = (db.Index('ix_error_question_bank_student_question', 'student_id', 'question_id'),)
 
 # 消息模型
 class Message(db.Model):
@@ -367,19 +444,127 @@ class Message(db.Model):
     sender = db.relationship('User', foreign_keys=[sender_id], backref=db.backref('sent_messages', lazy=True))
     receiver = db.relationship('User', foreign_keys=[receiver_id], backref=db.backref('received_messages', lazy=True))
     course = db.relationship('Course', backref=db.backref('messages', lazy=True, cascade='all, delete-orphan'))
+    
+    # 常用查询路径：AI助教会话历史、未读消息、群聊记录
+    __table_args__ = (
+        db.Index('ix_message_sender_type_session', 'sender_id', 'message_type', 'session_id'),
+        db.Index('ix_message_session_type', 'session_id', 'message_type'),
+        db.Index('ix_message_receiver_read', 'receiver_id', 'is_read'),
+        db.Index('ix_message_course_created', 'course_id', 'created_at'),
+    )
 
-# 创建数据库表和初始化数据
-from sqlalchemy import inspect, text
+# 会话模型（单聊的一对用户、课程群聊或AI助教对话），冗余保存最后一条消息
+class Conversation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    conversation_key = db.Column(db.String(50), unique=True, nullable=False)  # 如 p:3:7 / g:12 / ai:5
+    conversation_type = db.Column(db.String(20), nullable=False)  # 'private'、'group' 或 'ai_tutor'
+    user_low_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # 单聊双方中较小的用户ID
+    user_high_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # 单聊双方中较大的用户ID
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=True)  # 群聊所属课程ID
+    last_message_id = db.Column(db.Integer, db.ForeignKey('message.id'), nullable=True)
+    last_message_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # 关系
+    last_message = db.relationship('Message', foreign_keys=[last_message_id])
+    course = db.relationship('Course', backref=db.backref('conversations', lazy=True, cascade='all, delete-orphan'))
+    members = db.relationship('ConversationMember', backref=db.backref('conversation', lazy=True), cascade='all, delete-orphan')
 
-with app.app_context():
-    # 临时删除Message表以添加新字段
-    inspector = inspect(db.engine)
-    if inspector.has_table('message'):
-        with db.engine.connect() as connection:
-            connection.execute(text('DROP TABLE message'))
-            connection.commit()
-    db.create_all()
+# 会话参与者模型，保存每个参与者的未读数
+class ConversationMember(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    unread_count = db.Column(db.Integer, default=0, nullable=False)
     
+    # 关系
+    user = db.relationship('User', backref=db.backref('conversation_memberships', lazy=True))
+    
+    __table_args__ = (db.UniqueConstraint('conversation_id', 'user_id', name='_conversation_user_uc'),)
+
+# AI助教会话摘要（每个用户的每个会话一行），冗余保存第一条问答，历史对话列表只查这张表
+class TutorSession(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    session_id = db.Column(db.String(50), nullable=False)
+    first_question = db.Column(db.Text, nullable=False)
+    first_answer = db.Column(db.Text, nullable=True)
+    first_question_at = db.Column(db.DateTime, nullable=False)
+    last_activity_at = db.Column(db.DateTime, nullable=False)  # 最后一次提问的时间，历史列表按此倒序
+    question_count = db.Column(db.Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'session_id', name='_tutor_session_user_uc'),
+        db.Index('ix_tutor_session_user_activity', 'user_id', 'last_activity_at'),
+    )
+
+# 常见问题的类（全站或某门课程内相似的提问归为一类），由后台 FAQ 构建线程增量维护（见 faq_builder.py）
+class FaqCluster(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(30), nullable=False)  # 'site' 或 'course:<课程ID>'
+    question = db.Column(db.Text, nullable=False)  # 代表问题：类内被问次数最多的问法
+    answer = db.Column(db.Text, nullable=True)  # 代表问法最近一次正常的回答
+    frequency = db.Column(db.Integer, default=0, nullable=False)  # 类内全部提问次数
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # 读 FAQ：某个范围内按频率取前 N 个
+    __table_args__ = (db.Index('ix_faq_cluster_scope_frequency', 'scope', 'frequency'),)
+
+# 常见问题类中的一种问法（规范化后相同的提问）
+class FaqVariant(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    cluster_id = db.Column(db.Integer, db.ForeignKey('faq_cluster.id'), nullable=False)
+    scope = db.Column(db.String(30), nullable=False)
+    normalized = db.Column(db.Text, nullable=False)  # tutor_cache.normalize_question 的结果
+    question = db.Column(db.Text, nullable=False)  # 最近一次的原文
+    answer = db.Column(db.Text, nullable=True)  # 最近一次正常的回答
+    frequency = db.Column(db.Integer, default=0, nullable=False)
+    
+    cluster = db.relationship('FaqCluster', backref=db.backref('variants', lazy=True, cascade='all, delete-orphan'))
+    
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'normalized', name='_faq_variant_scope_normalized_uc'),
+        db.Index('ix_faq_variant_cluster', 'cluster_id'),
+    )
+
+# FAQ 构建进度：已处理到的提问消息ID（多进程时用条件 UPDATE 保证同一批提问只处理一次）
+class FaqBuilderState(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    last_message_id = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# AI报告批改任务模型，由后台工作线程执行（见 grading_queue.py）
+class GradingJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(32), unique=True, nullable=False)  # 对外暴露的任务ID（uuid4 十六进制）
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # 提交人，未登录提交时为空
+    file_path = db.Column(db.String(500), nullable=False)  # 待批改的报告文件
+    topic = db.Column(db.Text, default='')  # 报告主题
+    analysis_type = db.Column(db.String(20), default='standard')
+    with_comparison = db.Column(db.Boolean, default=False)  # 是否同时与范文对比
+    delete_file = db.Column(db.Boolean, default=False)  # 完成后是否删除上传的临时文件
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, completed, failed
+    result = db.Column(db.Text, nullable=True)  # 批改结果（JSON）
+    error = db.Column(db.Text, nullable=True)  # 失败原因
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    # 关系
+    student = db.relationship('User', backref=db.backref('grading_jobs', lazy=True))
+
+    # 恢复未完成任务、计算排队位置
+    __table_args__ = (db.Index('ix_grading_job_status_created', 'status', 'created_at'),)
+
+# ===================== 建表、迁移与初始化数据 =====================
+# 导入 app.py 不再建表或写数据（旧版本每次启动都会 DROP TABLE message 清空聊天记录），
+# 需要时通过命令行执行：
+#     flask --app app init-db    建表并写入默认老师、预设竞赛
+#     flask --app app migrate    为已有数据库补建新表、新列和索引，并回填会话摘要
+from sqlalchemy import inspect, text, event
+
+def seed_default_data():
+    """写入默认老师用户和预设竞赛（已存在则跳过）"""
     # 创建默认老师用户
     if not User.query.filter_by(username='default_teacher').first():
         default_teacher = User(
@@ -462,6 +647,170 @@ with app.app_context():
     
     db.session.commit()
 
+def add_missing_columns():
+    """为已有表补上模型中新增的列（只加可为空或带默认值的列），返回新增的列名列表"""
+    inspector = inspect(db.engine)
+    added = []
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable and column.default is None and column.server_default is None:
+                    print(f"跳过 {table.name}.{column.name}：非空列且没有默认值，需要手工迁移")
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                added.append(f'{table.name}.{column.name}')
+    return added
+
+def create_missing_indexes():
+    """创建模型中声明但数据库里还没有的索引，返回新建的索引名列表"""
+    inspector = inspect(db.engine)
+    created = []
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(connection)
+                    created.append(index.name)
+        # 更新统计信息，让查询优化器用上新索引
+        connection.execute(text('ANALYZE'))
+    return created
+
+def init_database():
+    """建表（不删除已有表）并写入初始化数据，可重复执行"""
+    db.create_all()
+    seed_default_data()
+
+def migrate_database():
+    """补建新表、新列和索引；会话摘要表、全文索引、常见问题聚类为空时从消息表回填。可重复执行"""
+    db.create_all()
+    for name in add_missing_columns():
+        print(f"已添加列 {name}")
+    for name in create_missing_indexes():
+        print(f"已创建索引 {name}")
+    if Conversation.query.first() is None and Message.query.first() is not None:
+        count = rebuild_conversations()
+        print(f"已回填会话摘要：{count} 个会话")
+    with db.engine.connect() as connection:
+        search_ready = message_search_ready(connection)
+    if not search_ready and db.engine.dialect.name == 'sqlite':
+        count = rebuild_message_search_index()
+        print(f"已建立消息全文索引：{count} 条消息")
+    if TutorSession.query.first() is None and Message.query.filter_by(message_type='question').first() is not None:
+        count = rebuild_tutor_sessions()
+        print(f"已回填AI助教会话摘要：{count} 个会话")
+    if FaqBuilderState.query.first() is None and Message.query.filter_by(message_type='question').first() is not None:
+        count = rebuild_faq_clusters()
+        print(f"已生成常见问题聚类：{count} 个问题类")
+    if QuizStatistics.query.first() is None and StudentQuiz.query.filter_by(status='completed').first() is not None:
+        count = rebuild_quiz_statistics()
+        print(f"已回填测验排名与统计：{count} 个测验")
+
+def register_commands(flask_app):
+    @flask_app.cli.command('init-db')
+    def init_db_command():
+        """建表并写入默认老师、预设竞赛"""
+        init_database()
+        print("数据库初始化完成")
+    
+    @flask_app.cli.command('migrate')
+    def migrate_command():
+        """为已有数据库补建新表、新列和索引"""
+        migrate_database()
+        print("数据库迁移完成")
+
+# ===================== 当前用户与权限装饰器 =====================
+# 当前登录用户每个请求只查询一次，缓存在 flask.g 上；路由用装饰器做登录和角色检查
+
+# current_user() 可以一并加载的关系
+CURRENT_USER_EAGER_OPTIONS = {
+    'enrolled_courses': lambda: selectinload(User.enrolled_courses).joinedload(StudentCourse.course),
+    'courses_taught': lambda: selectinload(User.courses_taught),
+}
+
+def current_user(*eager):
+    """
+    返回当前登录用户（未登录返回 None），同一请求内只查询一次。
+    eager 为 CURRENT_USER_EAGER_OPTIONS 中的关系名，例如 current_user('enrolled_courses')
+    """
+    user_id = session.get('user_id')
+    if user_id is None:
+        return None
+    user = g.get('current_user')
+    loaded = g.setdefault('current_user_eager', set())
+    missing = [name for name in eager if name not in loaded]
+    if user is None or missing:
+        options = [CURRENT_USER_EAGER_OPTIONS[name]() for name in missing]
+        user = User.query.options(*options).filter_by(id=user_id).first()
+        g.current_user = user
+        loaded.update(missing)
+    return user
+
+def login_required(view=None, *, api=False, eager=()):
+    """
+    要求已登录：页面跳转到登录页，api=True 时返回 401 JSON。
+    可直接 @login_required，也可 @login_required(eager=('enrolled_courses',)) 预加载关系
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            user = current_user(*eager)
+            if user is None:
+                if 'user_id' in session:
+                    # 会话里的用户已被删除
+                    session.clear()
+                if api:
+                    return jsonify({'success': False, 'message': '请先登录'}), 401
+                return redirect(url_for('login'))
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator(view) if view is not None else decorator
+
+def role_required(role, message=None, api=False, eager=()):
+    """要求已登录且为指定角色，否则提示并回到个人中心（api=True 时返回 403 JSON）"""
+    def decorator(func):
+        @login_required(api=api, eager=eager)
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if current_user().role != role:
+                text = message or f"只有{PERMISSIONS[role]['name']}角色可以访问此页面"
+                if api:
+                    return jsonify({'success': False, 'message': text}), 403
+                flash(text)
+                return redirect(url_for('dashboard'))
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# 调试模式下统计每个请求从数据库新加载的 ORM 对象数（身份映射未命中），
+# 通过响应头 X-Identity-Map-Misses 返回，超过阈值时打印警告，方便发现 N+1 查询
+IDENTITY_MAP_MISS_WARN = 200
+
+def _count_identity_map_miss(target, context):
+    if has_request_context() and 'identity_map_misses' in g:
+        g.identity_map_misses += 1
+
+event.listen(db.Model, 'load', _count_identity_map_miss, propagate=True)
+
+@app.before_request
+def start_identity_map_counter():
+    if app.debug or app.config.get('IDENTITY_MAP_STATS'):
+        g.identity_map_misses = 0
+
+@app.after_request
+def report_identity_map_misses(response):
+    if 'identity_map_misses' in g:
+        response.headers['X-Identity-Map-Misses'] = str(g.identity_map_misses)
+        if g.identity_map_misses > app.config.get('IDENTITY_MAP_MISS_WARN', IDENTITY_MAP_MISS_WARN):
+            print(f"[DEBUG] {request.method} {request.path} 加载了 {g.identity_map_misses} 个ORM对象，可能存在N+1查询")
+    return response
+
 # 登录页面
 @app.route('/')
 def login():
@@ -576,11 +925,9 @@ def register_process():
 
 # 个人中心页面
 @app.route('/dashboard')
+@login_required
 def dashboard():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    user = db.session.get(User, session['user_id'])
+    user = current_user()
     permissions = PERMISSIONS[user.role]['permissions']
     
     # 准备统计数据
@@ -588,30 +935,28 @@ def dashboard():
         stats = {
             'courses': len(user.enrolled_courses),
             'assignments': user.completed_assignments,
-            'messages': Message.query.filter_by(receiver_id=user.id, is_read=False).count()
+            'messages': unread_message_count(user.id)
         }
     elif user.role == 'teacher':
         stats = {
             'courses': len(user.courses_taught),
             'assignments': user.graded_assignments,
-            'messages': Message.query.filter_by(receiver_id=user.id, is_read=False).count()
+            'messages': unread_message_count(user.id)
         }
     else:  # ai-assistant
         stats = {
             'courses': user.courses,
             'assignments': user.questions_answered,
-            'messages': Message.query.filter_by(receiver_id=user.id, is_read=False).count()
+            'messages': unread_message_count(user.id)
         }
     
     return render_template('dashboard.html', user=user, permissions=permissions, stats=stats)
 
 # 更新用户名
 @app.route('/update_username', methods=['POST'])
+@login_required
 def update_username():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    user = db.session.get(User, session['user_id'])
+    user = current_user()
     new_username = request.form.get('new_username')
     
     if not new_username:
@@ -633,24 +978,16 @@ def update_username():
 
 # 智能教案整理页面（教师端）
 @app.route('/text2ppt')
+@role_required('teacher', message='只有教师角色可以使用此功能')
 def run_text2ppt():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'teacher':
-        flash('只有教师角色可以使用此功能')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     return render_template('text2ppt.html', user=user)
 
 # 智能学案整理页面（学生端）
 @app.route('/study_plan')
+@role_required('student', message='只有学生角色可以使用此功能')
 def study_plan():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以使用此功能')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     return render_template('students_html/study_plan.html', user=user)
 
 # 生成PPT接口
@@ -856,37 +1193,30 @@ def convert_ppt_to_video():
 
 # 学习课程页面
 @app.route('/courses')
+@login_required(eager=('enrolled_courses',))
 def courses():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
+    user = current_user()
     
-    # 获取用户已选课程
+    # 获取用户已选课程（选课记录和课程已随用户一起加载）
     enrolled_courses = [sc.course for sc in user.enrolled_courses]
     
     # 为每个课程添加观看进度信息
     course_progress = {}
+    progress_by_course = read_watch_progress_many(user.id, [course.id for course in enrolled_courses])
     for course in enrolled_courses:
-        progress = CourseWatchProgress.query.filter_by(student_id=user.id, course_id=course.id).first()
-        if progress:
-            course_progress[course.id] = {
-                'watch_progress': progress.watch_progress,
-                'last_watch_time': progress.last_watch_time
-            }
-        else:
-            course_progress[course.id] = {
-                'watch_progress': 0.0,
-                'last_watch_time': 0.0
-            }
+        progress = progress_by_course[course.id]
+        course_progress[course.id] = {
+            'watch_progress': progress['watch_progress'],
+            'last_watch_time': progress['last_watch_time']
+        }
     
     return render_template('students_html/courses.html', user=user, enrolled_courses=enrolled_courses, course_progress=course_progress)
 
 # 课程库页面
 @app.route('/course_library')
+@login_required
 def course_library():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
+    user = current_user()
     
     # 获取所有课程
     all_courses = Course.query.all()
@@ -898,10 +1228,9 @@ def course_library():
 
 # 选课功能
 @app.route('/enroll_course/<int:course_id>', methods=['POST'])
+@login_required
 def enroll_course(course_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
+    user = current_user()
     
     # 检查课程是否存在
     course = db.session.get(Course, course_id)
@@ -925,13 +1254,9 @@ def enroll_course(course_id):
 
 # 退课功能
 @app.route('/drop_course/<int:course_id>', methods=['POST'])
+@role_required('student')
 def drop_course(course_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 检查选课记录是否存在
     enrollment = StudentCourse.query.filter_by(student_id=user.id, course_id=course_id).first()
@@ -948,10 +1273,9 @@ def drop_course(course_id):
 
 # 观看课程视频页面
 @app.route('/watch_course/<int:course_id>')
+@login_required
 def watch_course(course_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
+    user = current_user()
     
     # 学生需要检查是否已选该课程，教师则不需要
     if user.role == 'student':
@@ -974,13 +1298,9 @@ def watch_course(course_id):
 
 # 提交作业页面
 @app.route('/assignments')
+@role_required('student')
 def assignments():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取学生已选课程
     enrolled_courses = StudentCourse.query.filter_by(student_id=user.id).all()
@@ -1004,13 +1324,9 @@ def assignments():
 
 # 提交作业处理
 @app.route('/submit_assignment', methods=['POST'])
+@role_required('student')
 def submit_assignment():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取表单数据
     assignment_id = request.form.get('assignment_id')
@@ -1113,26 +1429,94 @@ def submit_assignment():
 
 # AI助教独立页面
 @app.route('/ai_ta')
+@role_required('student')
 def ai_ta_page():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     return render_template('students_html/ai_ta_page.html', user=user)
 
 # AI助教答疑页面
 @app.route('/ai-tutor')
+@login_required
 def ai_tutor():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
+    user = current_user()
     return render_template('students_html/ai-tutor.html', user=user)
 
 # 导入DeepSeek配置
 from AI_analysis.config import DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, DEEPSEEK_MODEL, DASHSCOPE_API_KEY, DASHSCOPE_BASE_URL, DASHSCOPE_MODEL
 
+# AI 助教使用的大模型服务，默认阿里云百炼，可用环境变量切换（测试时指向本地的兼容服务）
+TUTOR_API_KEY = os.environ.get('TUTOR_API_KEY', DASHSCOPE_API_KEY)
+TUTOR_BASE_URL = os.environ.get('TUTOR_BASE_URL', DASHSCOPE_BASE_URL)
+TUTOR_MODEL = os.environ.get('TUTOR_MODEL', DASHSCOPE_MODEL)
+
+# 助教提示词版本：修改下面的系统提示词时改这个值，旧提示词缓存的回答不再命中
+TUTOR_PROMPT_VERSION = 'tutor-v1'
+
+def _lookup_tutor_cache(question, scope):
+    # 缓存出错时照常请求大模型，不影响答疑
+    try:
+        return get_tutor_cache().lookup(question, scope)
+    except Exception as e:
+        print(f"读取助教问答缓存失败: {e}")
+        return None
+
+def _save_tutor_cache(question, answer, thinking, scope):
+    try:
+        get_tutor_cache().put(question, answer, thinking, scope)
+    except Exception as e:
+        print(f"写入助教问答缓存失败: {e}")
+
+# 同时到达的相同问题只向大模型请求一次
+tutor_flights = SingleFlight('tutor-chat')
+
+def tutor_completion_events(question, cache_scope):
+    """向大模型请求一次流式回答，逐个产出 thinking/answer/error 事件；完整回答后写入问答缓存"""
+    thinking_parts, answer_parts = [], []
+    try:
+        # 共享的客户端（配置为阿里云百炼API），复用连接池中的长连接
+        client = get_llm_client(TUTOR_BASE_URL, TUTOR_API_KEY, 'chat')
+
+        # 构建消息列表
+        messages = [
+            {"role": "system", "content": "你是一名专业的AI助教，帮助学生解答学习相关的问题。"},
+            {"role": "user", "content": question}
+        ]
+
+        # 发送流式请求到阿里云百炼API（收到第一个数据块前失败会自动重试）
+        completion = create_with_retry(
+            client,
+            model=TUTOR_MODEL,
+            messages=messages,
+            stream=True
+        )
+
+        # 处理流式响应
+        for chunk in completion:
+            delta = chunk.choices[0].delta
+
+            # 处理思考内容
+            if hasattr(delta, "reasoning_content") and delta.reasoning_content is not None:
+                thinking_parts.append(delta.reasoning_content)
+                yield {'type': 'thinking', 'content': delta.reasoning_content}
+
+            # 处理回答内容
+            if hasattr(delta, "content") and delta.content:
+                answer_parts.append(delta.content)
+                yield {'type': 'answer', 'content': delta.content}
+
+        # 完整回答完才写缓存，出错或中途断开的回答不缓存
+        _save_tutor_cache(question, ''.join(answer_parts), ''.join(thinking_parts), cache_scope)
+
+    except Exception as e:
+        log_message = f"阿里云百炼API请求错误: {type(e).__name__}: {str(e)}\n"
+        import traceback
+        log_message += f"错误堆栈: {traceback.format_exc()}\n"
+        print(log_message)  # 打印到控制台
+
+        # 返回错误响应
+        error_message = "AI回答出错，请稍后重试。"
+        yield {'type': 'error', 'content': error_message}
+
 # AI对话API（流式）
 @app.route('/api/ai-tutor/chat', methods=['GET', 'POST'])
 def ai_tutor_chat():
@@ -1169,47 +1553,20 @@ def ai_tutor_chat():
         def generate_response():
             import json
             
-            try:
-                # 创建OpenAI客户端（配置为阿里云百炼API）
-                client = OpenAI(
-                    api_key=DASHSCOPE_API_KEY,
-                    base_url=DASHSCOPE_BASE_URL
-                )
-                
-                # 构建消息列表
-                messages = [
-                    {"role": "system", "content": "你是一名专业的AI助教，帮助学生解答学习相关的问题。"},
-                    {"role": "user", "content": question}
-                ]
-                
-                # 发送流式请求到阿里云百炼API
-                completion = client.chat.completions.create(
-                    model=DASHSCOPE_MODEL,
-                    messages=messages,
-                    stream=True
-                )
-                
-                # 处理流式响应
-                for chunk in completion:
-                    delta = chunk.choices[0].delta
-                    
-                    # 处理思考内容
-                    if hasattr(delta, "reasoning_content") and delta.reasoning_content is not None:
-                        yield f"data: {json.dumps({'type': 'thinking', 'content': delta.reasoning_content})}\n\n"
-                    
-                    # 处理回答内容
-                    if hasattr(delta, "content") and delta.content:
-                        yield f"data: {json.dumps({'type': 'answer', 'content': delta.content})}\n\n"
-                        
-            except Exception as e:
-                log_message = f"阿里云百炼API请求错误: {type(e).__name__}: {str(e)}\n"
-                import traceback
-                log_message += f"错误堆栈: {traceback.format_exc()}\n"
-                print(log_message)  # 打印到控制台
-                
-                # 返回错误响应
-                error_message = "AI回答出错，请稍后重试。"
-                yield f"data: {json.dumps({'type': 'error', 'content': error_message})}\n\n"
+            # 相似的问题已经回答过：按原来的事件格式重放缓存的回答
+            cache_scope = f"{TUTOR_MODEL}/{TUTOR_PROMPT_VERSION}"
+            cached = _lookup_tutor_cache(question, cache_scope)
+            if cached is not None:
+                print(f"助教问答缓存命中（相似度 {cached['similarity']}）: {cached['question']}")
+                for event in replay_events(cached):
+                    yield f"data: {json.dumps(event)}\n\n"
+                yield "data: [DONE]\n\n"
+                return
+            
+            # 同一个问题正在回答：加入这次回答，先收到已产出的部分，再实时收到后续内容
+            flight_key = (cache_scope, exact_question(question))
+            for event in tutor_flights.stream(flight_key, lambda: tutor_completion_events(question, cache_scope)):
+                yield f"data: {json.dumps(event)}\n\n"
             
             yield "data: [DONE]\n\n"
         
@@ -1276,8 +1633,13 @@ def save_conversation():
             message_type='answer'
         )
         db.session.add(answer_message)
+        db.session.flush()
         
+        # 同一事务内更新会话摘要和助教会话摘要
+        record_conversation_message(answer_message)
+        record_tutor_session(question_message, answer_message)
         db.session.commit()
+        faq_builder.notify()
         
         return jsonify({'success': True, 'message': '对话已保存'})
     except Exception as e:
@@ -1286,6 +1648,393 @@ def save_conversation():
         print(error_msg)
         return jsonify({'error': str(e)}), 500
 
+# ===================== AI助教会话摘要 =====================
+# TutorSession 冗余保存每个会话的第一条问答、最后提问时间和提问次数，由 save_conversation 在同一事务中维护
+
+def record_tutor_session(question_message, answer_message):
+    """在保存一轮问答的同一事务中更新助教会话摘要（调用前需 flush 以获得消息时间）"""
+    if not question_message.session_id:
+        return
+    tutor_session = TutorSession.query.filter_by(
+        user_id=question_message.sender_id,
+        session_id=question_message.session_id
+    ).first()
+    if tutor_session is None:
+        tutor_session = TutorSession(
+            user_id=question_message.sender_id,
+            session_id=question_message.session_id,
+            first_question=question_message.content,
+            first_question_at=question_message.created_at,
+            question_count=0
+        )
+        db.session.add(tutor_session)
+    tutor_session.question_count += 1
+    tutor_session.last_activity_at = question_message.created_at
+    if tutor_session.first_answer is None:
+        tutor_session.first_answer = answer_message.content
+    db.session.flush()
+
+def refresh_tutor_session(user_id, session_id):
+    """按消息表重新计算一个助教会话的摘要（删除消息后调用），会话里已没有问题时删除摘要"""
+    tutor_session = TutorSession.query.filter_by(user_id=user_id, session_id=session_id).first()
+    questions = Message.query.filter_by(sender_id=user_id, session_id=session_id, message_type='question')
+    first_question = questions.order_by(Message.created_at, Message.id).first()
+    if first_question is None:
+        if tutor_session is not None:
+            db.session.delete(tutor_session)
+        return
+    first_answer = Message.query.filter_by(
+        sender_id=user_id, session_id=session_id, message_type='answer'
+    ).order_by(Message.created_at, Message.id).first()
+    if tutor_session is None:
+        tutor_session = TutorSession(user_id=user_id, session_id=session_id)
+        db.session.add(tutor_session)
+    tutor_session.first_question = first_question.content
+    tutor_session.first_question_at = first_question.created_at
+    tutor_session.first_answer = first_answer.content if first_answer else None
+    tutor_session.last_activity_at = questions.with_entities(db.func.max(Message.created_at)).scalar()
+    tutor_session.question_count = questions.count()
+    db.session.flush()
+
+def rebuild_tutor_sessions(batch_size=5000):
+    """根据已有的问答消息重建助教会话摘要表，按ID分批读取，返回重建的会话数"""
+    TutorSession.query.delete()
+    db.session.commit()
+    
+    summaries = {}  # (用户ID, 会话ID) -> 第一条问题/回答的 (时间, ID)、最后提问时间、提问次数
+    last_id = 0
+    while True:
+        batch = db.session.query(
+            Message.id, Message.sender_id, Message.session_id, Message.message_type, Message.created_at
+        ).filter(
+            Message.id > last_id,
+            Message.message_type.in_(('question', 'answer'))
+        ).order_by(Message.id).limit(batch_size).all()
+        if not batch:
+            break
+        for row in batch:
+            if not row.session_id:
+                continue
+            summary = summaries.setdefault((row.sender_id, row.session_id),
+                                           {'question': None, 'answer': None, 'last': None, 'count': 0})
+            position = (row.created_at or datetime.min, row.id)
+            if row.message_type == 'question':
+                summary['count'] += 1
+                if summary['question'] is None or position < summary['question']:
+                    summary['question'] = position
+                if summary['last'] is None or position[0] > summary['last']:
+                    summary['last'] = position[0]
+            elif summary['answer'] is None or position < summary['answer']:
+                summary['answer'] = position
+        last_id = batch[-1].id
+        print(f"已扫描消息至ID {last_id}，助教会话数 {len(summaries)}")
+    
+    # 只有回答没有问题的会话不进入摘要
+    items = [(key, summary) for key, summary in summaries.items() if summary['question'] is not None]
+    for offset in range(0, len(items), batch_size):
+        chunk = items[offset:offset + batch_size]
+        message_ids = [summary['question'][1] for _, summary in chunk]
+        message_ids += [summary['answer'][1] for _, summary in chunk if summary['answer']]
+        contents = dict(db.session.query(Message.id, Message.content).filter(Message.id.in_(message_ids)))
+        db.session.execute(db.insert(TutorSession), [{
+            'user_id': user_id,
+            'session_id': session_id,
+            'first_question': contents[summary['question'][1]],
+            'first_answer': contents[summary['answer'][1]] if summary['answer'] else None,
+            'first_question_at': summary['question'][0],
+            'last_activity_at': summary['last'],
+            'question_count': summary['count']
+        } for (user_id, session_id), summary in chunk])
+        db.session.commit()
+    return len(items)
+
+# ===================== 常见问题聚类 =====================
+# 后台线程把新增的提问按规范化文本的相似度并入全站和所在课程的问题类（FaqCluster），读 FAQ 只查这张表（见 faq_builder.py）
+
+# 前端在调用出错时也会保存一轮问答，这些回答不能作为 FAQ 的答案
+TUTOR_ERROR_ANSWERS = ('AI回答出错，请稍后重试。', '会话已过期，请重新登录后再试。')
+
+faq_index = FaqIndex(threshold=float(os.environ.get('FAQ_CLUSTER_THRESHOLD', 0.7)))
+
+def build_faq_clusters(index=faq_index, batch_size=2000):
+    """
+    处理上次之后新增的一批提问（最多 batch_size 条），返回处理的提问数，没有新提问时返回 0。
+    进度保存在 FaqBuilderState，用条件 UPDATE 抢占，多个进程同时构建时同一批提问只会被处理一次
+    """
+    while True:
+        # 其他进程新建的问法先载入索引
+        last_variant_id = index.last_variant_id
+        while True:
+            variants = db.session.query(
+                FaqVariant.id, FaqVariant.scope, FaqVariant.normalized, FaqVariant.cluster_id
+            ).filter(FaqVariant.id > last_variant_id).order_by(FaqVariant.id).limit(batch_size).all()
+            if not variants:
+                break
+            for variant in variants:
+                index.add(variant.id, variant.scope, variant.normalized, variant.cluster_id)
+            last_variant_id = variants[-1].id
+        
+        state = db.session.get(FaqBuilderState, 1)
+        if state is None:
+            state = FaqBuilderState(id=1, last_message_id=0)
+            db.session.add(state)
+            db.session.commit()
+        watermark = state.last_message_id
+        questions = db.session.query(
+            Message.id, Message.sender_id, Message.session_id, Message.content
+        ).filter(
+            Message.id > watermark,
+            Message.message_type == 'question'
+        ).order_by(Message.id).limit(batch_size).all()
+        if not questions:
+            db.session.rollback()
+            return 0
+        
+        claimed = FaqBuilderState.query.filter_by(id=1, last_message_id=watermark).update(
+            {'last_message_id': questions[-1].id, 'updated_at': datetime.utcnow()}, synchronize_session=False
+        )
+        if claimed:
+            break
+        # 这批提问已被其他进程处理，索引可能缺少它们新建的问法，重新载入后再取下一批
+        db.session.rollback()
+        index.reset()
+    
+    # 每个提问配同一会话里它之后的第一条回答（save_conversation 把一轮问答写在同一事务中）
+    sender_ids = {question.sender_id for question in questions}
+    session_ids = {question.session_id for question in questions if question.session_id}
+    answers = {}
+    for answer in db.session.query(
+        Message.id, Message.sender_id, Message.session_id, Message.content
+    ).filter(
+        Message.session_id.in_(session_ids),
+        Message.message_type == 'answer',
+        Message.id > questions[0].id
+    ).order_by(Message.id) if session_ids else []:
+        answers.setdefault((answer.sender_id, answer.session_id), []).append(answer)
+    
+    # 学生的提问同时计入全站和所在课程
+    scopes = {user_id: ['site'] for user_id in sender_ids}
+    for student_id, course_id in db.session.query(StudentCourse.student_id, StudentCourse.course_id).filter(
+        StudentCourse.student_id.in_(sender_ids)
+    ):
+        scopes[student_id].append(f'course:{course_id}')
+    
+    # (范围, 规范化问题) -> 本批的提问次数、最近一次的原文和正常回答
+    counts = {}
+    for question in questions:
+        normalized = normalize_question(question.content)
+        if not normalized:
+            continue
+        answer = None
+        for candidate in answers.get((question.sender_id, question.session_id), ()):
+            if candidate.id > question.id:
+                answer = candidate.content
+                break
+        if answer in TUTOR_ERROR_ANSWERS:
+            answer = None
+        for scope in scopes[question.sender_id]:
+            entry = counts.setdefault((scope, normalized), {'count': 0, 'question': None, 'answer': None})
+            entry['count'] += 1
+            entry['question'] = question.content
+            if answer:
+                entry['answer'] = answer
+    
+    existing = {}
+    for key in counts:
+        found = index.get(*key)
+        if found is not None:
+            existing[found[0]] = key
+    touched = set()
+    for variant in FaqVariant.query.filter(FaqVariant.id.in_(existing)).all() if existing else []:
+        entry = counts[existing[variant.id]]
+        variant.frequency += entry['count']
+        variant.question = entry['question']
+        if entry['answer']:
+            variant.answer = entry['answer']
+        touched.add(variant.cluster_id)
+    
+    for (scope, normalized), entry in counts.items():
+        if index.get(scope, normalized) is not None:
+            continue
+        nearest = index.nearest(scope, normalized)
+        if nearest is None:
+            cluster = FaqCluster(scope=scope, question=entry['question'], frequency=0)
+            db.session.add(cluster)
+            db.session.flush()
+            cluster_id = cluster.id
+        else:
+            cluster_id = nearest[0]
+        variant = FaqVariant(cluster_id=cluster_id, scope=scope, normalized=normalized, question=entry['question'],
+                             answer=entry['answer'], frequency=entry['count'])
+        db.session.add(variant)
+        db.session.flush()
+        index.add(variant.id, scope, normalized, cluster_id)
+        touched.add(cluster_id)
+    
+    # 更新涉及的类：频率为各问法之和，代表问题取被问次数最多的问法，回答取有回答的问法中被问次数最多的
+    touched = sorted(touched)
+    for offset in range(0, len(touched), 500):
+        chunk = touched[offset:offset + 500]
+        variants = {}
+        for variant in FaqVariant.query.filter(FaqVariant.cluster_id.in_(chunk)).order_by(
+            FaqVariant.frequency.desc(), FaqVariant.id
+        ):
+            variants.setdefault(variant.cluster_id, []).append(variant)
+        for cluster in FaqCluster.query.filter(FaqCluster.id.in_(chunk)):
+            members = variants[cluster.id]
+            cluster.question = members[0].question
+            cluster.answer = next((variant.answer for variant in members if variant.answer), None)
+            cluster.frequency = sum(variant.frequency for variant in members)
+            cluster.updated_at = datetime.utcnow()
+    db.session.commit()
+    return len(questions)
+
+def _build_faq_clusters_in_app_context():
+    # 后台线程调用，需要自己的应用上下文；失败时索引里可能有已回滚的问法，清空后下次重新载入
+    with app.app_context():
+        try:
+            return build_faq_clusters()
+        except Exception:
+            db.session.rollback()
+            faq_index.reset()
+            raise
+
+faq_builder = FaqBuilder(
+    _build_faq_clusters_in_app_context,
+    interval=float(os.environ.get('FAQ_BUILD_INTERVAL', 30))
+)
+
+def rebuild_faq_clusters():
+    """清空常见问题聚类并从头处理全部提问，返回生成的类数"""
+    FaqVariant.query.delete()
+    FaqCluster.query.delete()
+    FaqBuilderState.query.delete()
+    db.session.commit()
+    faq_index.reset()
+    faq_builder.run_once()
+    return FaqCluster.query.count()
+
+# 助教历史对话和 FAQ 的查询：Flask 路由和异步服务（api/tutor.py）共用，需要在应用上下文中调用
+def tutor_history(user_id):
+    """用户的历史会话列表：每个会话的第一条问题和回答，按最后提问时间倒序（只查会话摘要表）"""
+    sessions = db.session.query(
+        TutorSession.session_id,
+        TutorSession.first_question,
+        TutorSession.first_answer,
+        TutorSession.first_question_at
+    ).filter(
+        TutorSession.user_id == user_id,
+        TutorSession.first_answer.isnot(None)
+    ).order_by(
+        TutorSession.last_activity_at.desc(),  # 按最后一次提问时间倒序
+        TutorSession.id.desc()
+    ).all()
+    
+    return [{
+        'session_id': tutor_session.session_id,
+        'question': tutor_session.first_question,
+        'answer': tutor_session.first_answer,
+        'time': tutor_session.first_question_at.strftime('%Y-%m-%d %H:%M')
+    } for tutor_session in sessions]
+
+def tutor_conversation(user_id, session_id):
+    """一个会话的全部消息，按时间排序"""
+    messages = Message.query.filter_by(
+        sender_id=user_id,
+        session_id=session_id
+    ).order_by(Message.created_at).all()
+    
+    conversation = []
+    for message in messages:
+        conversation.append({
+            'role': 'user' if message.message_type == 'question' else 'ai',
+            'content': message.content,
+            'time': message.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        })
+    return conversation
+
+def tutor_faq(user_id, course_id=None):
+    """
+    常见问题：后台聚类好的全站问题（指定 course_id 时为该课程学生的问题），按被问次数取前 20 个。
+    只读 FaqCluster 表；不是该课程的老师或学生时返回空列表
+    """
+    scope = 'site'
+    if course_id is not None:
+        is_member = Course.query.filter_by(id=course_id, teacher_id=user_id).first() is not None or \
+            StudentCourse.query.filter_by(course_id=course_id, student_id=user_id).first() is not None
+        if not is_member:
+            return []
+        scope = f'course:{course_id}'
+    # 后台线程启动后会先接着处理上次没处理完的提问
+    faq_builder.notify()
+    clusters = db.session.query(
+        FaqCluster.question, FaqCluster.answer, FaqCluster.frequency
+    ).filter(
+        FaqCluster.scope == scope,
+        FaqCluster.answer.isnot(None)
+    ).order_by(
+        FaqCluster.frequency.desc(), FaqCluster.id
+    ).limit(20).all()
+    return [{
+        'question': cluster.question,
+        'answer': cluster.answer,
+        'frequency': cluster.frequency
+    } for cluster in clusters]
+
+FAQ_SEARCH_PAGE_SIZE = 20
+
+def tutor_faq_search(user_id, keyword, page=1, per_page=FAQ_SEARCH_PAGE_SIZE):
+    """
+    问题或回答包含关键词的问答，每个会话一条（命中的问题配该会话的第一条回答，命中的回答配第一条问题），
+    按相关度排序分页，返回 (结果列表, 是否还有下一页)
+    """
+    use_index = message_search_ready(db.session.connection())
+    params = {'user_id': user_id, 'limit': per_page + 1, 'offset': (page - 1) * per_page}
+    if use_index:
+        ranked = ranked_message_hits(keyword, message_search.tutor_scope(user_id))
+        if ranked is None:
+            return [], False
+        hits_sql, hits_params = ranked
+        params.update(hits_params)
+        hits = f"""
+            SELECT message.session_id, message.message_type, message.content, hit.rank
+            FROM ({hits_sql}) AS hit JOIN message ON message.id = hit.message_id
+        """
+    else:
+        params['pattern'] = f'%{keyword}%'
+        hits = """
+            SELECT session_id, message_type, content, id AS rank
+            FROM message
+            WHERE sender_id = :user_id AND message_type IN ('question', 'answer') AND content LIKE :pattern
+        """
+    # 每个会话只取最相关的一条命中
+    rows = db.session.execute(text(f"""
+        SELECT ranked.session_id, ranked.message_type, ranked.content,
+               tutor_session.first_question, tutor_session.first_answer
+        FROM (
+            SELECT hit.*, ROW_NUMBER() OVER (PARTITION BY hit.session_id ORDER BY hit.rank) AS position
+            FROM ({hits}) AS hit
+        ) AS ranked
+        JOIN tutor_session ON tutor_session.user_id = :user_id AND tutor_session.session_id = ranked.session_id
+        WHERE ranked.position = 1 AND tutor_session.first_answer IS NOT NULL
+        ORDER BY ranked.rank, ranked.session_id
+        LIMIT :limit OFFSET :offset
+    """), params).all()
+    
+    result_list = []
+    for row in rows[:per_page]:
+        if row.message_type == 'question':
+            question, answer = row.content, row.first_answer
+        else:
+            question, answer = row.first_question, row.content
+        result_list.append({
+            'session_id': row.session_id,
+            'question': question,
+            'answer': answer,
+            'snippet': message_search.highlight(row.content, keyword)
+        })
+    return result_list, len(rows) > per_page
+
 # 获取历史对话列表API
 @app.route('/api/ai-tutor/history', methods=['GET'])
 def get_history():
@@ -1298,46 +2047,7 @@ def get_history():
         session['user_id'] = 1
     
     try:
-        user_id = session['user_id']
-        
-        # 获取所有唯一的会话ID及其最新消息
-        sessions = db.session.query(
-            Message.session_id,
-            db.func.max(Message.created_at).label('last_message_time')
-        ).filter(
-            Message.sender_id == user_id,
-            Message.message_type == 'question'
-        ).group_by(
-            Message.session_id
-        ).order_by(
-            db.func.max(Message.created_at).desc()  # 按最后一条消息时间倒序
-        ).all()
-        
-        history = []
-        for session_item in sessions:
-            if session_item.session_id:
-                # 获取该会话的第一条问题
-                first_question = Message.query.filter_by(
-                    sender_id=user_id,
-                    session_id=session_item.session_id,
-                    message_type='question'
-                ).order_by(Message.created_at).first()
-                
-                # 获取该会话的第一条回答
-                first_answer = Message.query.filter_by(
-                    session_id=session_item.session_id,
-                    message_type='answer'
-                ).order_by(Message.created_at).first()
-                
-                if first_question and first_answer:
-                    history.append({
-                        'session_id': session_item.session_id,
-                        'question': first_question.content,
-                        'answer': first_answer.content,
-                        'time': first_question.created_at.strftime('%Y-%m-%d %H:%M')
-                    })
-        
-        return jsonify({'history': history})
+        return jsonify({'history': tutor_history(session['user_id'])})
     except Exception as e:
         import traceback
         error_msg = f"获取历史对话错误: {str(e)}\n{traceback.format_exc()}"
@@ -1356,23 +2066,7 @@ def get_history_detail(session_id):
         session['user_id'] = 1
     
     try:
-        user_id = session['user_id']
-        
-        # 获取该会话的所有消息，按时间排序
-        messages = Message.query.filter_by(
-            sender_id=user_id,
-            session_id=session_id
-        ).order_by(Message.created_at).all()
-        
-        conversation = []
-        for message in messages:
-            conversation.append({
-                'role': 'user' if message.message_type == 'question' else 'ai',
-                'content': message.content,
-                'time': message.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            })
-        
-        return jsonify({'conversation': conversation})
+        return jsonify({'conversation': tutor_conversation(session['user_id'], session_id)})
     except Exception as e:
         import traceback
         error_msg = f"获取对话详情错误: {str(e)}\n{traceback.format_exc()}"
@@ -1387,54 +2081,7 @@ def get_faq():
         if 'user_id' not in session:
             session['user_id'] = 1
         
-        user_id = session['user_id']
-        
-        # 查询所有问题消息
-        questions = Message.query.filter_by(
-            sender_id=user_id,
-            message_type='question'
-        ).all()
-        
-        # 统计问题频率
-        question_frequency = {}
-        for question in questions:
-            # 简单匹配：使用问题内容作为键
-            # 实际应用中可能需要更智能的问题匹配（如语义匹配）
-            if question.content in question_frequency:
-                question_frequency[question.content] += 1
-            else:
-                question_frequency[question.content] = 1
-        
-        # 对问题按频率排序，取前20个
-        sorted_questions = sorted(question_frequency.items(), key=lambda x: x[1], reverse=True)[:20]
-        
-        # 获取每个问题对应的回答
-        faq_list = []
-        for question_content, count in sorted_questions:
-            # 获取该问题对应的回答
-            # 假设每个问题都有对应的回答，且回答是问题之后的第一条消息
-            question_message = Message.query.filter_by(
-                sender_id=user_id,
-                message_type='question',
-                content=question_content
-            ).order_by(Message.created_at).first()
-            
-            if question_message:
-                # 获取该会话中的回答消息
-                answer_message = Message.query.filter_by(
-                    sender_id=user_id,
-                    session_id=question_message.session_id,
-                    message_type='answer'
-                ).order_by(Message.created_at).first()
-                
-                if answer_message:
-                    faq_list.append({
-                        'question': question_content,
-                        'answer': answer_message.content,
-                        'frequency': count
-                    })
-        
-        return jsonify({'faq': faq_list})
+        return jsonify({'faq': tutor_faq(session['user_id'], request.args.get('course_id', type=int))})
     except Exception as e:
         import traceback
         error_msg = f"获取FAQ错误: {str(e)}\n{traceback.format_exc()}"
@@ -1454,61 +2101,10 @@ def search_faq():
         if 'user_id' not in session:
             session['user_id'] = 1
         
-        user_id = session['user_id']
-        
-        # 搜索包含关键词的问题
-        questions = Message.query.filter(
-            Message.sender_id == user_id,
-            Message.message_type == 'question',
-            Message.content.like(f'%{keyword}%')
-        ).all()
-        
-        # 搜索包含关键词的回答
-        answers = Message.query.filter(
-            Message.sender_id == user_id,
-            Message.message_type == 'answer',
-            Message.content.like(f'%{keyword}%')
-        ).all()
-        
-        # 合并结果并去重
-        result_set = set()
-        result_list = []
-        
-        # 处理问题搜索结果
-        for question in questions:
-            answer_message = Message.query.filter_by(
-                sender_id=user_id,
-                session_id=question.session_id,
-                message_type='answer'
-            ).order_by(Message.created_at).first()
-            
-            if answer_message:
-                # 使用会话ID作为唯一标识
-                if question.session_id not in result_set:
-                    result_set.add(question.session_id)
-                    result_list.append({
-                        'question': question.content,
-                        'answer': answer_message.content
-                    })
-        
-        # 处理回答搜索结果
-        for answer in answers:
-            question_message = Message.query.filter_by(
-                sender_id=user_id,
-                session_id=answer.session_id,
-                message_type='question'
-            ).order_by(Message.created_at).first()
-            
-            if question_message:
-                # 使用会话ID作为唯一标识
-                if answer.session_id not in result_set:
-                    result_set.add(answer.session_id)
-                    result_list.append({
-                        'question': question_message.content,
-                        'answer': answer.content
-                    })
-        
-        return jsonify({'faq': result_list})
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', FAQ_SEARCH_PAGE_SIZE, type=int), 1), 100)
+        faq, has_more = tutor_faq_search(session['user_id'], keyword, page, per_page)
+        return jsonify({'faq': faq, 'page': page, 'has_more': has_more})
     except Exception as e:
         import traceback
         error_msg = f"搜索FAQ错误: {str(e)}\n{traceback.format_exc()}"
@@ -1522,185 +2118,270 @@ import traceback
 import tempfile
 
 @app.route('/upload_report', methods=['POST'])
+@role_required('student')
 def upload_report():
-    # 设置整个函数的最大执行时间（秒）
-    MAX_EXECUTION_TIME = 30
-    start_time = time.time()
-    file_path = None
+    # 1. 文件检查
+    if 'report_file' not in request.files:
+        flash('未检测到上传文件')
+        return redirect(url_for('assignments'))
     
-    try:
-        # 1. 身份验证检查
-        if 'user_id' not in session:
-            return redirect(url_for('login'))
-        user = User.query.get(session['user_id'])
-        if user.role != 'student':
-            flash('只有学生角色可以访问此页面')
-            return redirect(url_for('dashboard'))
-        
-        # 2. 文件检查
-        if 'report_file' not in request.files:
-            flash('未检测到上传文件')
-            return redirect(url_for('assignments'))
-        
-        report_file = request.files['report_file']
-        
-        if report_file.filename == '':
-            flash('未选择上传文件')
-            return redirect(url_for('assignments'))
-        
-        # 3. 导入AI分析模块
-        from AI_analysis import file_upload, ai_grading, report_comparison
-        
-        # 4. 处理文件上传，设置临时文件路径
-        upload_result = file_upload.handle_file_upload(report_file)
-        
-        if not upload_result['success']:
-            flash(upload_result['error'])
-            return redirect(url_for('assignments'))
-        
-        file_path = upload_result['file_path']
-        
-        # 5. 读取文件内容
-        file_content = file_upload.read_file_content(file_path)
-        
-        # 检查执行时间，避免超时
-        if time.time() - start_time > MAX_EXECUTION_TIME:
-            flash('处理文件超时，请稍后重试')
-            return redirect(url_for('assignments'))
-        
-        # 6. 进行AI批改评分，设置默认值防止异常
-        topic = ""  # 可以根据实际情况修改获取主题的方式
-        try:
-            grading_result = ai_grading.grade_report(file_content, topic)
-        except Exception as e:
-            # 如果AI评分失败，使用本地降级方案
-            flash('AI评分服务暂时不可用，使用本地评分系统')
-            # 确保有基本的评分结果结构
-            grading_result = {
-                'total_score': 70.0,
-                'dimension_scores': [],
-                'suggestions': ['系统暂时无法提供详细建议，请稍后重试'],
-                'api_status': 'error',
-                'api_error': str(e)
-            }
-        
-        # 7. 进行报告对比分析，设置错误处理
-        try:
-            comparison_result = report_comparison.compare_reports(file_content)
-        except Exception as e:
-            # 如果对比分析失败，提供基本结果
-            comparison_result = {
-                'status': 'error',
-                'message': '报告对比分析暂时不可用',
-                'differences': []
-            }
-        
-        # 8. 确保返回数据结构完整
-        dimension_scores = grading_result.get('dimension_scores', [])
-        api_status = grading_result.get('api_status', 'unknown')
-        api_error = grading_result.get('api_error', None)
-        total_score = grading_result.get('total_score', 0.0)
-        suggestions = grading_result.get('suggestions', ['暂无建议'])
-        
-        # 渲染分析结果页面
-        return render_template(
-            'students_html/ai_analysis_result.html',
-            total_score=total_score,
-            scores=dimension_scores,
-            suggestions=suggestions,
-            comparison=comparison_result,
-            api_status=api_status,
-            api_error=api_error
-        )
-        
-    except Exception as e:
-        # 捕获所有其他未预期的异常
-        print(f"上传报告时发生错误: {str(e)}")
-        print(traceback.format_exc())  # 记录详细错误栈
-        flash(f'处理过程中发生错误: {str(e)}')
+    report_file = request.files['report_file']
+    
+    if report_file.filename == '':
+        flash('未选择上传文件')
         return redirect(url_for('assignments'))
     
-    finally:
-        # 清理资源，删除临时文件（如果存在）
-        try:
-            if file_path and os.path.exists(file_path):
-                # 使用try-except确保即使删除文件失败也不会影响响应
-                try:
-                    os.remove(file_path)
-                except:
-                    pass
-        except:
-            pass
+    # 2. 保存上传文件
+    from AI_analysis import file_upload
+    upload_result = file_upload.handle_file_upload(report_file)
+    
+    if not upload_result['success']:
+        flash(upload_result['error'])
+        return redirect(url_for('assignments'))
+    
+    # 3. AI批改和范文对比交给后台工作线程，完成后删除临时文件；页面轮询结果
+    topic = ""  # 可以根据实际情况修改获取主题的方式
+    job = submit_grading_job(upload_result['file_path'], topic, student_id=current_user().id,
+                             with_comparison=True, delete_file=True)
+    return redirect(url_for('upload_report_result', job_id=job.job_id))
+
+@app.route('/upload_report/<job_id>')
+@role_required('student')
+def upload_report_result(job_id):
+    job = find_grading_job(job_id)
+    if job is None:
+        flash('批改任务不存在')
+        return redirect(url_for('assignments'))
+    if job.status == 'failed':
+        flash(f'处理过程中发生错误: {job.error}')
+        return redirect(url_for('assignments'))
+    if job.status != 'completed':
+        # 批改中：页面定时刷新
+        grading_queue.start()
+        return render_template('students_html/ai_analysis_pending.html', job=grading_job_status(job))
+    
+    result = json.loads(job.result)
+    report_data = result['report_data']
+    # grade_report 调用失败时返回 0 分和错误说明
+    api_failed = str(report_data.get('analysis', '')).startswith('调用AI评分服务失败')
+    return render_template(
+        'students_html/ai_analysis_result.html',
+        total_score=report_data.get('score', 0.0),
+        scores=report_data.get('dimension_scores', []),
+        suggestions=report_data.get('suggestions') or ['暂无建议'],
+        comparison=result.get('comparison') or {},
+        api_status='failed' if api_failed else 'success',
+        api_error=report_data.get('analysis') if api_failed else None
+    )
+
+# ===================== 成绩册 =====================
+# 一名学生在所有已选课程中的测验、作业成绩：选课一次查询，
+# 测验 LEFT JOIN 学生测验记录、作业 LEFT JOIN 学生作业提交各一次查询，在内存中按课程分组
+
+def student_gradebook(student_id):
+    """
+    返回 {课程ID: {'course', 'quiz_grades', 'assignment_grades'}}，按选课顺序排列。
+    quiz_grades / assignment_grades 包含课程下的全部测验/作业，学生没有记录时
+    student_quiz / student_assignment 为 None（测验只取已完成的记录）
+    """
+    courses = Course.query.join(StudentCourse, StudentCourse.course_id == Course.id).filter(
+        StudentCourse.student_id == student_id
+    ).order_by(StudentCourse.id).all()
+    gradebook = {course.id: {'course': course, 'quiz_grades': [], 'assignment_grades': []} for course in courses}
+    if not gradebook:
+        return gradebook
+    course_ids = list(gradebook)
+    
+    quiz_rows = db.session.query(Quiz, StudentQuiz).outerjoin(StudentQuiz, db.and_(
+        StudentQuiz.quiz_id == Quiz.id,
+        StudentQuiz.student_id == student_id,
+        StudentQuiz.status == 'completed'
+    )).filter(Quiz.course_id.in_(course_ids)).order_by(Quiz.id, StudentQuiz.id).all()
+    seen_quizzes = set()
+    for quiz, student_quiz in quiz_rows:
+        # 同一测验有多条完成记录时取最早的一条
+        if quiz.id in seen_quizzes:
+            continue
+        seen_quizzes.add(quiz.id)
+        gradebook[quiz.course_id]['quiz_grades'].append({'quiz': quiz, 'student_quiz': student_quiz})
+    
+    assignment_rows = db.session.query(Assignment, StudentAssignment).outerjoin(StudentAssignment, db.and_(
+        StudentAssignment.assignment_id == Assignment.id,
+        StudentAssignment.student_id == student_id
+    )).filter(Assignment.course_id.in_(course_ids)).order_by(Assignment.id, StudentAssignment.id).all()
+    seen_assignments = set()
+    for assignment, student_assignment in assignment_rows:
+        if assignment.id in seen_assignments:
+            continue
+        seen_assignments.add(assignment.id)
+        gradebook[assignment.course_id]['assignment_grades'].append({
+            'assignment': assignment, 'student_assignment': student_assignment
+        })
+    return gradebook
+
+# ===================== 测验排名与统计 =====================
+# 学生交卷时在同一事务中维护 QuizRanking（密集排名）和 QuizStatistics（人次、平均分、百分位），
+# 教师端页面按名次直接读取，不再每次加载全部答卷在内存中排序。
+# 名次、最值和百分位都通过 (quiz_id, total_score) 索引上的有序查找得到
+
+def _quiz_score_at(quiz_id, offset):
+    """按分数升序第 offset 个（从0开始）成绩"""
+    return db.session.query(QuizRanking.total_score).filter(QuizRanking.quiz_id == quiz_id).order_by(
+        QuizRanking.total_score
+    ).offset(offset).limit(1).scalar()
+
+def _percentile_offset(count, percent):
+    """最近秩法：第 percent 百分位对应的升序下标"""
+    return max(0, -(-count * percent // 100) - 1)
+
+def _refresh_quiz_score_bounds(stats):
+    count = stats.attempt_count
+    if count == 0:
+        stats.min_score = stats.max_score = stats.median_score = stats.p90_score = None
+        return
+    stats.min_score = _quiz_score_at(stats.quiz_id, 0)
+    stats.max_score = _quiz_score_at(stats.quiz_id, count - 1)
+    stats.median_score = _quiz_score_at(stats.quiz_id, _percentile_offset(count, 50))
+    stats.p90_score = _quiz_score_at(stats.quiz_id, _percentile_offset(count, 90))
+
+def _remove_quiz_ranking(ranking):
+    """删除一条排名；没有同分记录时，分数更低的名次整体前移一位"""
+    still_tied = db.session.query(QuizRanking.id).filter(
+        QuizRanking.quiz_id == ranking.quiz_id,
+        QuizRanking.total_score == ranking.total_score,
+        QuizRanking.id != ranking.id
+    ).first() is not None
+    if not still_tied:
+        QuizRanking.query.filter(
+            QuizRanking.quiz_id == ranking.quiz_id,
+            QuizRanking.total_score < ranking.total_score
+        ).update({QuizRanking.dense_rank: QuizRanking.dense_rank - 1}, synchronize_session=False)
+    db.session.delete(ranking)
+    db.session.flush()
+
+def record_quiz_result(student_quiz):
+    """学生测验完成（或重新评分）后更新排名和统计，与交卷在同一事务中提交"""
+    quiz_id = student_quiz.quiz_id
+    score = student_quiz.total_score or 0.0
+    stats = QuizStatistics.query.filter_by(quiz_id=quiz_id).first()
+    if not stats:
+        stats = QuizStatistics(quiz_id=quiz_id, attempt_count=0, mean_score=0.0)
+        db.session.add(stats)
+    
+    ranking = QuizRanking.query.filter_by(student_quiz_id=student_quiz.id).first()
+    if ranking:
+        if ranking.total_score == score:
+            return ranking
+        # 重新评分：先按旧成绩移出排名和平均分
+        old_score = ranking.total_score
+        _remove_quiz_ranking(ranking)
+        if stats.attempt_count <= 1:
+            stats.attempt_count, stats.mean_score = 0, 0.0
+        else:
+            stats.mean_score = (stats.mean_score * stats.attempt_count - old_score) / (stats.attempt_count - 1)
+            stats.attempt_count -= 1
+    
+    # 同分沿用已有名次；否则名次 = 比它高的最低分的名次 + 1，分数更低的名次整体后移
+    tied_rank = db.session.query(QuizRanking.dense_rank).filter(
+        QuizRanking.quiz_id == quiz_id, QuizRanking.total_score == score
+    ).limit(1).scalar()
+    if tied_rank is None:
+        higher_rank = db.session.query(QuizRanking.dense_rank).filter(
+            QuizRanking.quiz_id == quiz_id, QuizRanking.total_score > score
+        ).order_by(QuizRanking.total_score).limit(1).scalar()
+        QuizRanking.query.filter(
+            QuizRanking.quiz_id == quiz_id, QuizRanking.total_score < score
+        ).update({QuizRanking.dense_rank: QuizRanking.dense_rank + 1}, synchronize_session=False)
+        tied_rank = (higher_rank or 0) + 1
+    ranking = QuizRanking(
+        quiz_id=quiz_id,
+        student_quiz_id=student_quiz.id,
+        student_id=student_quiz.student_id,
+        total_score=score,
+        submit_time=student_quiz.submit_time or student_quiz.end_time,
+        dense_rank=tied_rank
+    )
+    db.session.add(ranking)
+    
+    stats.attempt_count += 1
+    stats.mean_score += (score - stats.mean_score) / stats.attempt_count
+    db.session.flush()
+    _refresh_quiz_score_bounds(stats)
+    return ranking
+
+def rebuild_quiz_statistics(quiz_ids=None):
+    """根据已完成的学生测验全量重建排名和统计（迁移旧数据或校验时使用），返回处理的测验数"""
+    ranking_query = QuizRanking.query
+    stats_query = QuizStatistics.query
+    attempt_query = StudentQuiz.query.filter(StudentQuiz.status == 'completed')
+    if quiz_ids is not None:
+        ranking_query = ranking_query.filter(QuizRanking.quiz_id.in_(quiz_ids))
+        stats_query = stats_query.filter(QuizStatistics.quiz_id.in_(quiz_ids))
+        attempt_query = attempt_query.filter(StudentQuiz.quiz_id.in_(quiz_ids))
+    ranking_query.delete(synchronize_session=False)
+    stats_query.delete(synchronize_session=False)
+    
+    scores_by_quiz = {}
+    rankings = []
+    for attempt in attempt_query.order_by(StudentQuiz.quiz_id, StudentQuiz.total_score.desc()):
+        score = attempt.total_score or 0.0
+        scores = scores_by_quiz.setdefault(attempt.quiz_id, [])
+        if not scores:
+            rank = 1
+        elif score != scores[-1]:
+            rank = rankings[-1]['dense_rank'] + 1
+        else:
+            rank = rankings[-1]['dense_rank']
+        scores.append(score)
+        rankings.append({
+            'quiz_id': attempt.quiz_id,
+            'student_quiz_id': attempt.id,
+            'student_id': attempt.student_id,
+            'total_score': score,
+            'submit_time': attempt.submit_time or attempt.end_time,
+            'dense_rank': rank
+        })
+    if rankings:
+        db.session.execute(QuizRanking.__table__.insert(), rankings)
+    
+    statistics = []
+    for quiz_id, scores in scores_by_quiz.items():
+        ascending = scores[::-1]
+        count = len(ascending)
+        statistics.append({
+            'quiz_id': quiz_id,
+            'attempt_count': count,
+            'mean_score': sum(ascending) / count,
+            'min_score': ascending[0],
+            'max_score': ascending[-1],
+            'median_score': ascending[_percentile_offset(count, 50)],
+            'p90_score': ascending[_percentile_offset(count, 90)],
+            'updated_at': datetime.utcnow()
+        })
+    if statistics:
+        db.session.execute(QuizStatistics.__table__.insert(), statistics)
+    db.session.commit()
+    return len(scores_by_quiz)
 
 # 查看成绩页面
 @app.route('/grades')
+@role_required('student')
 def grades():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
-    # 获取学生已选课程
-    enrolled_courses = StudentCourse.query.filter_by(student_id=user.id).all()
-    course_ids = [sc.course_id for sc in enrolled_courses]
-    
-    # 准备成绩数据：按课程分组
-    course_grade_data = {}
-    
-    for course in [sc.course for sc in enrolled_courses]:
-        # 获取该课程下的所有测验成绩
-        course_quizzes = Quiz.query.filter_by(course_id=course.id).all()
-        quiz_grades = []
-        
-        for quiz in course_quizzes:
-            student_quiz = StudentQuiz.query.filter_by(
-                quiz_id=quiz.id,
-                student_id=user.id,
-                status='completed'
-            ).first()
-            
-            if student_quiz:
-                quiz_grades.append({
-                    'quiz': quiz,
-                    'student_quiz': student_quiz
-                })
-        
-        # 获取该课程下的所有作业成绩
-        course_assignments = Assignment.query.filter_by(course_id=course.id).all()
-        assignment_grades = []
-        
-        for assignment in course_assignments:
-            student_assignment = StudentAssignment.query.filter_by(
-                assignment_id=assignment.id,
-                student_id=user.id
-            ).first()
-            
-            if student_assignment:
-                assignment_grades.append({
-                    'assignment': assignment,
-                    'student_assignment': student_assignment
-                })
-        
-        # 按课程组织数据
-        course_grade_data[course.id] = {
-            'course': course,
-            'quiz_grades': quiz_grades,
-            'assignment_grades': assignment_grades
-        }
+    # 按课程分组的成绩，只显示学生已有记录的测验和作业
+    course_grade_data = student_gradebook(user.id)
+    for course_data in course_grade_data.values():
+        course_data['quiz_grades'] = [g for g in course_data['quiz_grades'] if g['student_quiz']]
+        course_data['assignment_grades'] = [g for g in course_data['assignment_grades'] if g['student_assignment']]
     
     return render_template('students_html/grades.html', user=user, course_grade_data=course_grade_data)
 
 # 竞赛投递页面
 @app.route('/portfolio', methods=['GET', 'POST'])
+@role_required('student')
 def portfolio():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 处理搜索功能
     search_query = request.args.get('search', '')
@@ -1716,13 +2397,9 @@ def portfolio():
 
 # 创建作品路由
 @app.route('/create_work', methods=['GET', 'POST'])
+@role_required('student', message='只有学生角色可以创建作品')
 def create_work():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以创建作品')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     if request.method == 'POST':
         title = request.form.get('title')
@@ -1797,13 +2474,9 @@ def create_work():
 
 # 编辑作品路由
 @app.route('/edit_work/<int:work_id>', methods=['GET', 'POST'])
+@role_required('student', message='只有学生角色可以编辑作品')
 def edit_work(work_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以编辑作品')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取作品信息
     work = Work.query.get_or_404(work_id)
@@ -1834,13 +2507,9 @@ def edit_work(work_id):
 
 # 删除作品路由
 @app.route('/delete_work/<int:work_id>', methods=['POST'])
+@role_required('student', message='只有学生角色可以删除作品')
 def delete_work(work_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以删除作品')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取作品信息
     work = Work.query.get_or_404(work_id)
@@ -1857,10 +2526,9 @@ def delete_work(work_id):
 
 # 添加文件路由
 @app.route('/add_file/<int:work_id>', methods=['POST'])
+@login_required
 def add_file(work_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
+    user = current_user()
     
     # 获取作品信息
     work = Work.query.get_or_404(work_id)
@@ -1916,10 +2584,9 @@ def add_file(work_id):
 
 # 创建功能组路由
 @app.route('/create_group/<int:work_id>', methods=['POST'])
+@login_required
 def create_group(work_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
+    user = current_user()
     
     # 获取作品信息
     work = Work.query.get_or_404(work_id)
@@ -1948,10 +2615,9 @@ def create_group(work_id):
 
 # 删除功能组路由
 @app.route('/delete_group/<int:group_id>', methods=['POST'])
+@login_required
 def delete_group(group_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
+    user = current_user()
     
     # 获取功能组信息
     group = FileGroup.query.get_or_404(group_id)
@@ -1975,10 +2641,9 @@ def delete_group(group_id):
 
 # 更新文件顺序路由
 @app.route('/update_file_order/<int:work_id>', methods=['POST'])
+@login_required
 def update_file_order(work_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
+    user = current_user()
     
     # 获取作品信息
     work = Work.query.get_or_404(work_id)
@@ -2002,10 +2667,9 @@ def update_file_order(work_id):
 
 # 更新文件功能组路由
 @app.route('/update_file_group/<int:file_id>', methods=['POST'])
+@login_required
 def update_file_group(file_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
+    user = current_user()
     
     # 获取文件信息
     work_file = WorkFile.query.get_or_404(file_id)
@@ -2024,10 +2688,9 @@ def update_file_group(file_id):
 
 # 删除文件路由
 @app.route('/delete_file/<int:file_id>', methods=['POST'])
+@login_required
 def delete_file(file_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
+    user = current_user()
     
     # 获取文件信息
     work_file = WorkFile.query.get_or_404(file_id)
@@ -2050,13 +2713,9 @@ def delete_file(file_id):
 
 # 竞赛投递路由
 @app.route('/competition_submit', methods=['GET', 'POST'])
+@role_required('student', message='只有学生角色可以投递竞赛')
 def competition_submit():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以投递竞赛')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取所有可用的竞赛
     competitions = Competition.query.all()
@@ -2156,13 +2815,9 @@ def competition_submit():
 
 # 取消竞赛投递路由
 @app.route('/cancel_submission/<int:submission_id>', methods=['POST'])
+@role_required('student', message='只有学生角色可以取消投递')
 def cancel_submission(submission_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以取消投递')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取投递记录
     submission = CompetitionSubmission.query.get_or_404(submission_id)
@@ -2301,13 +2956,9 @@ def download_assignment_file(submission_id):
 
 # 参与讨论页面
 @app.route('/discussions')
+@role_required('student')
 def discussions():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取学生所有课程
     student_courses = StudentCourse.query.filter_by(student_id=user.id).all()
@@ -2332,13 +2983,9 @@ def discussions():
 
 # 教师端-我的班级页面
 @app.route('/teacher_discussions')
+@role_required('teacher')
 def teacher_discussions():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'teacher':
-        flash('只有教师角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取教师教授的所有课程
     courses = Course.query.filter_by(teacher_id=user.id).all()
@@ -2357,12 +3004,537 @@ def teacher_discussions():
     
     return render_template('teacher_html/teacher_discussions.html', user=user, course_info=course_info)
 
+# ===================== 会话摘要 =====================
+# Conversation 表冗余保存每个会话的最后一条消息，ConversationMember 保存每个参与者的未读数；
+# 发消息时在同一事务里更新，收件箱、未读角标只需读 O(会话数) 行
+
+def private_conversation_key(user_a, user_b):
+    low, high = sorted((user_a, user_b))
+    return f'p:{low}:{high}'
+
+def conversation_key_for(message):
+    """根据消息确定所属会话的键"""
+    if message.course_id:
+        return f'g:{message.course_id}'
+    if message.message_type in ('question', 'answer'):
+        return f'ai:{message.sender_id}'
+    return private_conversation_key(message.sender_id, message.receiver_id)
+
+def conversation_message_filter(conversation):
+    """会话内全部消息的查询条件"""
+    if conversation.conversation_type == 'group':
+        return Message.course_id == conversation.course_id
+    if conversation.conversation_type == 'ai_tutor':
+        return (Message.sender_id == conversation.user_low_id) & Message.message_type.in_(['question', 'answer'])
+    low, high = conversation.user_low_id, conversation.user_high_id
+    return (
+        (((Message.sender_id == low) & (Message.receiver_id == high)) |
+         ((Message.sender_id == high) & (Message.receiver_id == low))) &
+        Message.course_id.is_(None) &
+        Message.message_type.is_(None)
+    )
+
+def get_or_create_conversation(conversation_key, conversation_type, **fields):
+    conversation = Conversation.query.filter_by(conversation_key=conversation_key).first()
+    if not conversation:
+        conversation = Conversation(conversation_key=conversation_key, conversation_type=conversation_type, **fields)
+        db.session.add(conversation)
+        db.session.flush()
+    return conversation
+
+def ensure_conversation_members(conversation, user_ids):
+    """补齐会话参与者记录，只插入缺少的"""
+    existing = {uid for (uid,) in db.session.query(ConversationMember.user_id).filter_by(conversation_id=conversation.id)}
+    for user_id in set(user_ids) - existing:
+        db.session.add(ConversationMember(conversation_id=conversation.id, user_id=user_id, unread_count=0))
+    db.session.flush()
+
+def record_conversation_message(message):
+    """在发送消息的同一事务中更新会话的最后一条消息和参与者未读数（调用前需 flush 以获得消息ID）"""
+    key = conversation_key_for(message)
+    if message.course_id:
+        conversation = get_or_create_conversation(key, 'group', course_id=message.course_id)
+        course = db.session.get(Course, message.course_id)
+        member_ids = [sid for (sid,) in db.session.query(StudentCourse.student_id).filter_by(course_id=message.course_id)]
+        if course:
+            member_ids.append(course.teacher_id)
+    elif message.message_type in ('question', 'answer'):
+        conversation = get_or_create_conversation(key, 'ai_tutor', user_low_id=message.sender_id, user_high_id=message.sender_id)
+        member_ids = []
+    else:
+        low, high = sorted((message.sender_id, message.receiver_id))
+        conversation = get_or_create_conversation(key, 'private', user_low_id=low, user_high_id=high)
+        member_ids = [low, high]
+    ensure_conversation_members(conversation, member_ids + [message.sender_id])
+    
+    # 最后一条消息只前进不后退，并发发送时也不会被较早的消息覆盖
+    Conversation.query.filter(
+        Conversation.id == conversation.id,
+        (Conversation.last_message_id.is_(None)) | (Conversation.last_message_id < message.id)
+    ).update({
+        Conversation.last_message_id: message.id,
+        Conversation.last_message_at: message.created_at or datetime.utcnow()
+    }, synchronize_session=False)
+    
+    # AI助教问答由用户本人产生，不计未读
+    if message.message_type is None:
+        ConversationMember.query.filter(
+            ConversationMember.conversation_id == conversation.id,
+            ConversationMember.user_id != message.sender_id
+        ).update({ConversationMember.unread_count: ConversationMember.unread_count + 1}, synchronize_session=False)
+    return conversation
+
+def refresh_conversation_last_message(conversation_key):
+    """删除消息后重新计算会话的最后一条消息"""
+    conversation = Conversation.query.filter_by(conversation_key=conversation_key).first()
+    if not conversation:
+        return
+    last_message = Message.query.filter(conversation_message_filter(conversation)).order_by(
+        Message.created_at.desc(), Message.id.desc()
+    ).first()
+    conversation.last_message_id = last_message.id if last_message else None
+    conversation.last_message_at = last_message.created_at if last_message else None
+
+def decrement_unread(message, user_id):
+    """单条消息被标记为已读时，同步减少该参与者在会话中的未读数"""
+    ConversationMember.query.filter(
+        ConversationMember.user_id == user_id,
+        ConversationMember.unread_count > 0,
+        ConversationMember.conversation_id == db.session.query(Conversation.id).filter_by(
+            conversation_key=conversation_key_for(message)
+        ).scalar_subquery()
+    ).update({ConversationMember.unread_count: ConversationMember.unread_count - 1}, synchronize_session=False)
+
+def mark_all_conversations_read(user_id):
+    ConversationMember.query.filter(
+        ConversationMember.user_id == user_id,
+        ConversationMember.unread_count > 0
+    ).update({ConversationMember.unread_count: 0}, synchronize_session=False)
+
+def unread_message_count(user_id):
+    """用户所有会话的未读总数（个人中心角标）"""
+    return db.session.query(db.func.coalesce(db.func.sum(ConversationMember.unread_count), 0)).filter(
+        ConversationMember.user_id == user_id
+    ).scalar()
+
+def mark_messages_read(user_id):
+    """
+    打开消息页时把用户收到的单聊消息全部标记为已读：
+    先读未读总数，没有未读时不写库；有未读时用两条集合 UPDATE 完成，不把消息逐条加载到内存
+    """
+    if not unread_message_count(user_id):
+        return False
+    Message.query.filter(
+        Message.receiver_id == user_id,
+        Message.is_read == False,
+        Message.course_id.is_(None),
+        Message.message_type.is_(None)
+    ).update({Message.is_read: True}, synchronize_session=False)
+    mark_all_conversations_read(user_id)
+    return True
+
+def latest_private_messages(user_id):
+    """返回 {对方用户ID: 最新单聊消息}，一次查询完成"""
+    rows = db.session.query(Conversation, Message).join(
+        Message, Message.id == Conversation.last_message_id
+    ).filter(
+        Conversation.conversation_type == 'private',
+        (Conversation.user_low_id == user_id) | (Conversation.user_high_id == user_id)
+    ).all()
+    result = {}
+    for conversation, message in rows:
+        peer_id = conversation.user_high_id if conversation.user_low_id == user_id else conversation.user_low_id
+        result[peer_id] = message
+    return result
+
+def latest_course_messages(course_ids):
+    """返回 {课程ID: 最新群聊消息}，一次查询完成"""
+    course_ids = list(course_ids)
+    if not course_ids:
+        return {}
+    rows = db.session.query(Conversation.course_id, Message).join(
+        Message, Message.id == Conversation.last_message_id
+    ).filter(
+        Conversation.conversation_type == 'group',
+        Conversation.course_id.in_(course_ids)
+    ).all()
+    return {course_id: message for course_id, message in rows}
+
+def rebuild_conversations(batch_size=5000):
+    """根据已有的 Message 记录重建会话摘要表，按ID分批读取，返回重建的会话数"""
+    ConversationMember.query.delete()
+    Conversation.query.delete()
+    db.session.commit()
+    
+    summaries = {}  # 会话键 -> 会话字段、最后一条消息、各参与者未读数
+    last_id = 0
+    while True:
+        batch = db.session.query(
+            Message.id, Message.sender_id, Message.receiver_id, Message.course_id,
+            Message.message_type, Message.is_read, Message.created_at
+        ).filter(Message.id > last_id).order_by(Message.id).limit(batch_size).all()
+        if not batch:
+            break
+        for row in batch:
+            if row.course_id:
+                key, fields = f'g:{row.course_id}', {'conversation_type': 'group', 'course_id': row.course_id}
+            elif row.message_type in ('question', 'answer'):
+                key, fields = f'ai:{row.sender_id}', {'conversation_type': 'ai_tutor', 'user_low_id': row.sender_id, 'user_high_id': row.sender_id}
+            elif row.receiver_id:
+                low, high = sorted((row.sender_id, row.receiver_id))
+                key, fields = private_conversation_key(low, high), {'conversation_type': 'private', 'user_low_id': low, 'user_high_id': high}
+            else:
+                continue
+            summary = summaries.setdefault(key, dict(fields, conversation_key=key, last=None, members={}))
+            created_at = row.created_at or datetime.min
+            if summary['last'] is None or (created_at, row.id) > summary['last']:
+                summary['last'] = (created_at, row.id)
+            summary['members'].setdefault(row.sender_id, 0)
+            if fields['conversation_type'] == 'private':
+                summary['members'].setdefault(row.receiver_id, 0)
+                if not row.is_read:
+                    summary['members'][row.receiver_id] += 1
+        last_id = batch[-1].id
+        print(f"已扫描消息至ID {last_id}，会话数 {len(summaries)}")
+    
+    # 群聊参与者补齐为课程老师和全部选课学生
+    course_members = {}
+    for course_id, teacher_id in db.session.query(Course.id, Course.teacher_id):
+        course_members.setdefault(course_id, set()).add(teacher_id)
+    for course_id, student_id in db.session.query(StudentCourse.course_id, StudentCourse.student_id):
+        course_members.setdefault(course_id, set()).add(student_id)
+    
+    items = list(summaries.values())
+    for offset in range(0, len(items), batch_size):
+        chunk = items[offset:offset + batch_size]
+        db.session.execute(db.insert(Conversation), [{
+            'conversation_key': item['conversation_key'],
+            'conversation_type': item['conversation_type'],
+            'user_low_id': item.get('user_low_id'),
+            'user_high_id': item.get('user_high_id'),
+            'course_id': item.get('course_id'),
+            'last_message_id': item['last'][1],
+            'last_message_at': item['last'][0],
+            'created_at': datetime.utcnow()
+        } for item in chunk])
+        ids = dict(db.session.query(Conversation.conversation_key, Conversation.id).filter(
+            Conversation.conversation_key.in_([item['conversation_key'] for item in chunk])
+        ))
+        member_rows = []
+        for item in chunk:
+            members = dict(item['members'])
+            if item['conversation_type'] == 'group':
+                for user_id in course_members.get(item['course_id'], ()):
+                    members.setdefault(user_id, 0)
+            member_rows.extend({
+                'conversation_id': ids[item['conversation_key']],
+                'user_id': user_id,
+                'unread_count': unread
+            } for user_id, unread in members.items())
+        if member_rows:
+            db.session.execute(db.insert(ConversationMember), member_rows)
+        db.session.commit()
+    return len(items)
+
+# ===================== 消息全文检索 =====================
+# message_fts（见 message_search.py）随 Message 的插入、删除在同一事务中维护，
+# 新建数据库时随 message 表一起创建；已有数据库通过 flask --app app migrate 建表并回填
+
+_message_search_ready = {}  # 数据库URL -> 是否已有全文索引
+
+def message_search_ready(connection):
+    """当前数据库是否可以用 FTS5 检索消息（非 SQLite 或尚未建索引时退回 LIKE 查询）"""
+    key = str(connection.engine.url)
+    if key not in _message_search_ready:
+        _message_search_ready[key] = connection.dialect.name == 'sqlite' and connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': message_search.FTS_TABLE}
+        ).first() is not None
+    return _message_search_ready[key]
+
+def _create_message_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(message_search.CREATE_FTS_SQL))
+        _message_search_ready[str(connection.engine.url)] = True
+
+def _drop_message_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(f'DROP TABLE IF EXISTS {message_search.FTS_TABLE}'))
+        _message_search_ready[str(connection.engine.url)] = False
+
+event.listen(Message.__table__, 'after_create', _create_message_search_index)
+event.listen(Message.__table__, 'before_drop', _drop_message_search_index)
+
+def _search_index_row(message):
+    return (message.id, message.content, message.sender_id, message.receiver_id, message.course_id, message.message_type)
+
+def _index_message(mapper, connection, target):
+    if message_search_ready(connection):
+        connection.execute(text(message_search.INSERT_SQL), message_search.search_index_rows([_search_index_row(target)]))
+
+def _unindex_message(mapper, connection, target):
+    if message_search_ready(connection):
+        connection.execute(text(message_search.DELETE_SQL), {'id': target.id})
+
+def _reindex_message(mapper, connection, target):
+    # 只有内容或可见范围变化时才需要重建这条消息的索引（已读状态等变化跳过）
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes()
+           for name in ('content', 'sender_id', 'receiver_id', 'course_id', 'message_type')):
+        _unindex_message(mapper, connection, target)
+        _index_message(mapper, connection, target)
+
+event.listen(Message, 'after_insert', _index_message)
+event.listen(Message, 'after_update', _reindex_message)
+event.listen(Message, 'after_delete', _unindex_message)
+
+def ranked_message_hits(keyword, scope):
+    """
+    某个检索范围内命中关键词的消息子查询 (message_id, rank) 及其参数，关键词中没有可检索的字符时返回 None。
+    命中超过 RANK_WINDOW 条时只对最近的 RANK_WINDOW 条排序
+    """
+    query = message_search.match_expression(keyword, scope)
+    if query is None:
+        return None
+    floor = db.session.execute(text(message_search.WINDOW_FLOOR_SQL), {
+        'query': query,
+        'offset': message_search.RANK_WINDOW - 1
+    }).scalar()
+    return message_search.RANKED_HITS_SQL, {'query': query, 'floor': floor or 0}
+
+def rebuild_message_search_index(batch_size=5000):
+    """根据 Message 表重建全文索引，按ID分批读取，返回索引的消息数（非 SQLite 数据库不建索引，返回 0）"""
+    if db.engine.dialect.name != 'sqlite':
+        return 0
+    with db.engine.begin() as connection:
+        connection.execute(text(f'DROP TABLE IF EXISTS {message_search.FTS_TABLE}'))
+        _create_message_search_index(None, connection)
+    
+    count, last_id = 0, 0
+    while True:
+        batch = db.session.query(
+            Message.id, Message.content, Message.sender_id, Message.receiver_id,
+            Message.course_id, Message.message_type
+        ).filter(Message.id > last_id).order_by(Message.id).limit(batch_size).all()
+        if not batch:
+            break
+        db.session.execute(text(message_search.INSERT_SQL), message_search.search_index_rows(batch))
+        db.session.commit()
+        count += len(batch)
+        last_id = batch[-1].id
+        print(f"已索引消息至ID {last_id}，共 {count} 条")
+    # 合并索引段，减少查询时读取的 b-tree 数量
+    db.session.execute(text(f"INSERT INTO {message_search.FTS_TABLE}({message_search.FTS_TABLE}) VALUES ('optimize')"))
+    db.session.commit()
+    return count
+
+# ===================== 聊天记录分页 =====================
+# 按 (created_at, id) 做键集分页，打开聊天只取最新一页，历史记录按需向前翻
+
+CHAT_PAGE_SIZE = 50
+
+def is_course_member(user_id, course_id):
+    """是否为该课程的老师或学生（可以查看该课程的群聊）"""
+    return Course.query.filter_by(id=course_id, teacher_id=user_id).first() is not None or \
+        StudentCourse.query.filter_by(course_id=course_id, student_id=user_id).first() is not None
+
+def chat_message_filter(user_id, chat_id, chat_type):
+    """当前用户与某个聊天对象（单聊用户ID或群聊课程ID）之间消息的查询条件"""
+    if chat_type == 'group':
+        return Message.course_id == chat_id
+    return (
+        ((Message.sender_id == user_id) & (Message.receiver_id == chat_id)) |
+        ((Message.sender_id == chat_id) & (Message.receiver_id == user_id))
+    ) & Message.course_id.is_(None)
+
+def encode_chat_cursor(message):
+    return f"{message.created_at.strftime('%Y-%m-%dT%H:%M:%S.%f')}_{message.id}"
+
+def decode_chat_cursor(cursor):
+    created_at, message_id = cursor.rsplit('_', 1)
+    return datetime.strptime(created_at, '%Y-%m-%dT%H:%M:%S.%f'), int(message_id)
+
+def fetch_chat_page(condition, before=None, since_id=None, limit=CHAT_PAGE_SIZE):
+    """
+    取一页聊天记录，按时间正序返回 (messages, has_more)
+    - before: (created_at, id) 游标，取该游标之前更早的一页
+    - since_id: 只取ID大于该值的新消息
+    """
+    query = Message.query.filter(condition).options(joinedload(Message.sender))
+    if since_id is not None:
+        rows = query.filter(Message.id > since_id).order_by(Message.id).limit(limit + 1).all()
+        return rows[:limit], len(rows) > limit
+    if before is not None:
+        before_time, before_id = before
+        query = query.filter(
+            (Message.created_at < before_time) |
+            ((Message.created_at == before_time) & (Message.id < before_id))
+        )
+    rows = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    return list(reversed(rows[:limit])), has_more
+
+def serialize_chat_message(message, user_id):
+    return {
+        'id': message.id,
+        'sender_id': message.sender_id,
+        'sender_name': message.sender.username if message.sender else None,
+        'is_mine': message.sender_id == user_id,
+        'content': message.content,
+        'created_at': message.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'reference_type': message.reference_type,
+        'reference_source': message.reference_source,
+        'reference_title': message.reference_title,
+        'reference_url': message.reference_url
+    }
+
+# 聊天记录分页API
+@app.route('/api/messages/history')
+@login_required(api=True)
+def api_chat_history():
+    user_id = current_user().id
+    
+    chat_id = request.args.get('with', type=int)
+    chat_type = request.args.get('type', 'private')
+    if not chat_id or chat_type not in ('private', 'group'):
+        return jsonify({'success': False, 'message': '请选择聊天对象'}), 400
+    if chat_type == 'group' and not is_course_member(user_id, chat_id):
+        return jsonify({'success': False, 'message': '您不是该课程的成员'}), 403
+    
+    limit = min(max(request.args.get('limit', CHAT_PAGE_SIZE, type=int), 1), 200)
+    since_id = request.args.get('since_id', type=int)
+    cursor = request.args.get('cursor')
+    try:
+        before = decode_chat_cursor(cursor) if cursor else None
+    except ValueError:
+        return jsonify({'success': False, 'message': '无效的分页游标'}), 400
+    
+    messages, has_more = fetch_chat_page(
+        chat_message_filter(user_id, chat_id, chat_type),
+        before=before, since_id=since_id, limit=limit
+    )
+    return jsonify({
+        'success': True,
+        'messages': [serialize_chat_message(m, user_id) for m in messages],
+        'has_more': has_more,
+        # 向前翻页用的游标（取更早的记录）
+        'next_cursor': encode_chat_cursor(messages[0]) if messages and has_more and since_id is None else None,
+        # 增量拉取用的最新消息ID
+        'last_id': messages[-1].id if messages else since_id
+    })
+
+# 聊天记录搜索API：在与某个聊天对象的记录中按关键词搜索，按相关度排序分页
+@app.route('/api/messages/search')
+@login_required(api=True)
+def api_search_messages():
+    user_id = current_user().id
+    
+    chat_id = request.args.get('with', type=int)
+    chat_type = request.args.get('type', 'private')
+    if not chat_id or chat_type not in ('private', 'group'):
+        return jsonify({'success': False, 'message': '请选择聊天对象'}), 400
+    if chat_type == 'group' and not is_course_member(user_id, chat_id):
+        return jsonify({'success': False, 'message': '您不是该课程的成员'}), 403
+    keyword = request.args.get('keyword', '').strip()
+    if not keyword:
+        return jsonify({'success': False, 'message': '搜索关键词不能为空'}), 400
+    
+    page = max(request.args.get('page', 1, type=int), 1)
+    limit = min(max(request.args.get('limit', CHAT_PAGE_SIZE, type=int), 1), 200)
+    offset = (page - 1) * limit
+    if message_search_ready(db.session.connection()):
+        ranked = ranked_message_hits(keyword, message_search.chat_scope(user_id, chat_id, chat_type))
+        ids = []
+        if ranked is not None:
+            hits_sql, params = ranked
+            ids = [row[0] for row in db.session.execute(text(f"""
+                SELECT message_id FROM ({hits_sql}) AS hit ORDER BY rank, message_id DESC
+                LIMIT :limit OFFSET :offset
+            """), dict(params, limit=limit + 1, offset=offset))]
+        found = {m.id: m for m in Message.query.options(joinedload(Message.sender)).filter(Message.id.in_(ids[:limit]))}
+        messages = [found[message_id] for message_id in ids[:limit] if message_id in found]
+        has_more = len(ids) > limit
+    else:
+        rows = Message.query.filter(
+            chat_message_filter(user_id, chat_id, chat_type),
+            Message.content.like(f'%{keyword}%')
+        ).options(joinedload(Message.sender)).order_by(
+            Message.created_at.desc(), Message.id.desc()
+        ).offset(offset).limit(limit + 1).all()
+        messages, has_more = rows[:limit], len(rows) > limit
+    
+    results = []
+    for message in messages:
+        item = serialize_chat_message(message, user_id)
+        item['snippet'] = message_search.highlight(message.content, keyword)
+        results.append(item)
+    return jsonify({'success': True, 'messages': results, 'page': page, 'has_more': has_more})
+
+# ===================== 新消息推送（SSE） =====================
+
+def chat_event(message):
+    """推送给客户端的新消息事件，is_mine 由客户端根据自己的用户ID判断"""
+    event = serialize_chat_message(message, None)
+    event.update({
+        'type': 'message',
+        'receiver_id': message.receiver_id,
+        'course_id': message.course_id
+    })
+    return event
+
+def publish_chat_message(message):
+    """消息提交后发布到相关频道：群聊发到课程频道，单聊发给双方（发送方的其他页面也能同步）"""
+    hub = get_message_hub()
+    event = chat_event(message)
+    if message.course_id:
+        hub.publish(course_channel(message.course_id), event)
+    else:
+        hub.publish(user_channel(message.receiver_id), event)
+        if message.sender_id != message.receiver_id:
+            hub.publish(user_channel(message.sender_id), event)
+
+# 新消息推送API（SSE）
+@app.route('/api/messages/stream')
+@login_required(api=True)
+def api_message_stream():
+    user = current_user()
+    
+    # 订阅自己的私信频道和所在班级的群聊频道
+    if user.role == 'teacher':
+        course_ids = [cid for (cid,) in db.session.query(Course.id).filter_by(teacher_id=user.id)]
+    else:
+        course_ids = [cid for (cid,) in db.session.query(StudentCourse.course_id).filter_by(student_id=user.id)]
+    channels = [user_channel(user.id)] + [course_channel(cid) for cid in course_ids]
+    subscription = get_message_hub().subscribe(channels)
+    heartbeat_interval = app.config.get('MESSAGE_STREAM_HEARTBEAT', 15)
+    
+    def generate_events():
+        try:
+            # 断线后浏览器3秒后自动重连
+            yield "retry: 3000\n\n"
+            while True:
+                event = subscription.get(timeout=heartbeat_interval)
+                if subscription.dropped:
+                    # 消费太慢被推送中心断开，通知客户端重连并用 since_id 补齐
+                    yield f"data: {json.dumps({'type': 'reconnect'})}\n\n"
+                    return
+                if event is None:
+                    yield ": ping\n\n"
+                    continue
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            subscription.close()
+    
+    response = Response(generate_events(), content_type='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 # 消息列表页面
 @app.route('/messages')
+@login_required
 def messages():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
+    user = current_user()
     
     # 获取当前聊天对象ID
     current_chat_id = request.args.get('with', type=int)
@@ -2378,196 +3550,137 @@ def messages():
     if chat_name:
         current_chat_name = chat_name
     
+    # 标记所有未读消息为已读（先于加载页面数据，避免提交后已加载的对象失效再逐条刷新）
+    if mark_messages_read(user.id):
+        db.session.commit()
+    
     # 1. 获取课程信息（用于班级筛选）
-    courses_info = []
     if user.role == 'student':
-        # 学生获取所有已选课程
-        student_courses = StudentCourse.query.filter_by(student_id=user.id).all()
-        for sc in student_courses:
-            course = sc.course
-            # 获取群聊最后一条消息
-            last_message = Message.query.filter_by(course_id=course.id).order_by(Message.created_at.desc()).first()
-            courses_info.append({
-                'id': course.id,
-                'title': course.title,
-                'teacher': course.teacher,
-                'students': course.students,
-                'last_message': last_message.content if last_message else None,
-                'last_message_time': last_message.created_at if last_message else None
-            })
+        # 学生获取所有已选课程（连带授课老师一起加载）
+        courses = Course.query.join(StudentCourse, StudentCourse.course_id == Course.id).filter(
+            StudentCourse.student_id == user.id
+        ).options(joinedload(Course.teacher)).all()
     elif user.role == 'teacher':
         # 教师获取所有教授课程
         courses = Course.query.filter_by(teacher_id=user.id).all()
-        for course in courses:
-            # 获取群聊最后一条消息
-            last_message = Message.query.filter_by(course_id=course.id).order_by(Message.created_at.desc()).first()
-            courses_info.append({
-                'id': course.id,
-                'title': course.title,
-                'students': course.students,
-                'last_message': last_message.content if last_message else None,
-                'last_message_time': last_message.created_at if last_message else None
-            })
+    else:
+        courses = []
+    course_ids = [course.id for course in courses]
+    
+    # 一次查询所有班级的成员关系
+    course_members = {cid: [] for cid in course_ids}
+    if course_ids:
+        memberships = db.session.query(StudentCourse.course_id, StudentCourse.student_id).filter(
+            StudentCourse.course_id.in_(course_ids)
+        ).all()
+        for member_course_id, member_id in memberships:
+            course_members[member_course_id].append(member_id)
+    
+    # 一次查询所有群聊的最后一条消息
+    last_course_messages = latest_course_messages(course_ids)
+    
+    courses_info = []
+    for course in courses:
+        last_message = last_course_messages.get(course.id)
+        course_info = {
+            'id': course.id,
+            'title': course.title,
+            'student_ids': course_members[course.id],
+            'last_message': last_message.content if last_message else None,
+            'last_message_time': last_message.created_at if last_message else None
+        }
+        if user.role == 'student':
+            course_info['teacher'] = course.teacher
+        courses_info.append(course_info)
     
     # 2. 获取联系人列表（按角色区分）
+    # 学生联系人：所有课程的老师和同学；教师联系人：所有课程的学生
+    contact_courses = {}
+    for course_info in courses_info:
+        if user.role == 'student' and course_info['teacher']:
+            contact_courses.setdefault(course_info['teacher'].id, []).append(str(course_info['id']))
+        for student_id in course_info['student_ids']:
+            if student_id != user.id:  # 排除自己
+                contact_courses.setdefault(student_id, []).append(str(course_info['id']))
+    
+    # 一次查询所有单聊的最新消息
+    last_private_messages = latest_private_messages(user.id)
+    
+    # 一次加载联系人以及最近聊天对象
+    user_ids = set(contact_courses) | set(last_private_messages)
+    users_by_id = {}
+    if user_ids:
+        users_by_id = {u.id: u for u in User.query.filter(User.id.in_(user_ids)).all()}
+    
     contacts = []
-    if user.role == 'student':
-        # 学生联系人：所有课程的老师和同学
-        contact_ids = set()
-        for course_info in courses_info:
-            # 添加课程老师（检查teacher是否存在）
-            if course_info['teacher']:
-                contact_ids.add(course_info['teacher'].id)
-            # 添加课程同学（检查student是否存在）
-            for student in course_info['students']:
-                if student and student.id != user.id:  # 排除自己
-                    contact_ids.add(student.id)
-        
-        # 获取联系人详细信息
-        for contact_id in contact_ids:
-            contact = User.query.get(contact_id)
-            if contact:
-                # 获取最新消息
-                last_message = Message.query.filter(
-                    ((Message.sender_id == user.id) & (Message.receiver_id == contact_id)) |
-                    ((Message.sender_id == contact_id) & (Message.receiver_id == user.id))
-                ).order_by(Message.created_at.desc()).first()
-                
-                # 确定联系人所属班级
-                contact_courses = []
-                for course_info in courses_info:
-                    # 检查teacher是否存在
-                    if course_info['teacher'] and contact.id == course_info['teacher'].id:
-                        contact_courses.append(str(course_info['id']))
-                    else:
-                        for student in course_info['students']:
-                            if student and student.id == contact.id:
-                                contact_courses.append(str(course_info['id']))
-                
-                contacts.append({
-                    'id': contact.id,
-                    'username': contact.username,
-                    'role': contact.role,
-                    'courses': contact_courses or [],  # 确保courses是列表
-                    'last_message': last_message.content if last_message else None,
-                    'last_message_time': last_message.created_at if last_message else None
-                })
-    elif user.role == 'teacher':
-        # 教师联系人：所有课程的学生
-        contact_ids = set()
-        for course_info in courses_info:
-            # 添加课程同学（检查student是否存在）
-            for student in course_info['students']:
-                if student:
-                    contact_ids.add(student.id)
-        
-        # 获取联系人详细信息
-        for contact_id in contact_ids:
-            contact = User.query.get(contact_id)
-            if contact:
-                # 获取最新消息
-                last_message = Message.query.filter(
-                    ((Message.sender_id == user.id) & (Message.receiver_id == contact_id)) |
-                    ((Message.sender_id == contact_id) & (Message.receiver_id == user.id))
-                ).order_by(Message.created_at.desc()).first()
-                
-                # 确定联系人所属班级
-                contact_courses = []
-                for course_info in courses_info:
-                    for student in course_info['students']:
-                        if student and student.id == contact.id:
-                            contact_courses.append(str(course_info['id']))
-                
-                contacts.append({
-                    'id': contact.id,
-                    'username': contact.username,
-                    'role': contact.role,
-                    'courses': contact_courses,
-                    'last_message': last_message.content if last_message else None,
-                    'last_message_time': last_message.created_at if last_message else None
-                })
+    for contact_id, contact_course_ids in contact_courses.items():
+        contact = users_by_id.get(contact_id)
+        if contact:
+            last_message = last_private_messages.get(contact_id)
+            contacts.append({
+                'id': contact.id,
+                'username': contact.username,
+                'role': contact.role,
+                'courses': contact_course_ids,
+                'last_message': last_message.content if last_message else None,
+                'last_message_time': last_message.created_at if last_message else None
+            })
     
-    # 3. 获取最近聊天记录（包含单聊和群聊）
+    # 3. 获取最近聊天记录（包含单聊和群聊），只保留最近的10个
     recent_chats = []
+    for peer_id, msg in last_private_messages.items():
+        other_user = users_by_id.get(peer_id)
+        if other_user:
+            recent_chats.append({
+                'id': other_user.id,
+                'name': other_user.username,
+                'type': 'private',
+                'last_message': msg.content,
+                'last_message_time': msg.created_at
+            })
+    for course in courses:
+        msg = last_course_messages.get(course.id)
+        if msg:
+            recent_chats.append({
+                'id': course.id,
+                'name': course.title,
+                'type': 'group',
+                'last_message': msg.content,
+                'last_message_time': msg.created_at
+            })
+    recent_chats.sort(key=lambda chat: chat['last_message_time'], reverse=True)
+    recent_chats = recent_chats[:10]
     
-    # 获取所有与当前用户相关的消息
-    all_messages = Message.query.filter(
-        (Message.sender_id == user.id) | (Message.receiver_id == user.id)
-    ).order_by(Message.created_at.desc()).all()
-    
-    # 提取最近聊天的唯一标识（用户ID或课程ID）
-    chat_ids = set()
-    for msg in all_messages:
-        if msg.course_id:  # 群聊
-            if msg.course_id not in chat_ids:
-                chat_ids.add(msg.course_id)
-                course = Course.query.get(msg.course_id)
-                recent_chats.append({
-                    'id': course.id,
-                    'name': course.title,
-                    'type': 'group',
-                    'last_message': msg.content,
-                    'last_message_time': msg.created_at
-                })
-        else:  # 单聊
-            other_user_id = msg.receiver_id if msg.sender_id == user.id else msg.sender_id
-            if other_user_id not in chat_ids:
-                chat_ids.add(other_user_id)
-                other_user = User.query.get(other_user_id)
-                recent_chats.append({
-                    'id': other_user.id,
-                    'name': other_user.username,
-                    'type': 'private',
-                    'last_message': msg.content,
-                    'last_message_time': msg.created_at
-                })
-        
-        # 只保留最近的10个聊天
-        if len(recent_chats) >= 10:
-            break
-    
-    # 4. 获取当前聊天记录
+    # 4. 获取当前聊天记录（只取最新一页，更早的记录通过 /api/messages/history 按需加载）
     chat_messages = []
+    chat_has_more = False
     if current_chat_id:
         if current_chat_type == 'group':
             # 群聊消息
-            course = Course.query.get(current_chat_id)
+            course = next((c for c in courses if c.id == current_chat_id), None) or db.session.get(Course, current_chat_id)
             if course:
                 current_chat_name = course.title
-                chat_messages = Message.query.filter_by(course_id=current_chat_id).order_by(Message.created_at).all()
+                chat_messages, chat_has_more = fetch_chat_page(chat_message_filter(user.id, current_chat_id, 'group'))
         else:
             # 单聊消息
-            current_user = User.query.get(current_chat_id)
-            if current_user:
-                current_chat_name = current_user.username
-                chat_messages = Message.query.filter(
-                    ((Message.sender_id == user.id) & (Message.receiver_id == current_chat_id)) |
-                    ((Message.sender_id == current_chat_id) & (Message.receiver_id == user.id))
-                ).order_by(Message.created_at).all()
-        
-        # 标记收到的消息为已读
-        for msg in chat_messages:
-            if msg.receiver_id == user.id and not msg.is_read:
-                msg.is_read = True
-        db.session.commit()
-    
-    # 标记所有未读消息为已读
-    received_messages = Message.query.filter_by(receiver_id=user.id, is_read=False).all()
-    for msg in received_messages:
-        msg.is_read = True
-    db.session.commit()
+            chat_user = users_by_id.get(current_chat_id) or db.session.get(User, current_chat_id)
+            if chat_user:
+                current_chat_name = chat_user.username
+                chat_messages, chat_has_more = fetch_chat_page(chat_message_filter(user.id, current_chat_id, 'private'))
     
     return render_template('messages.html', user=user, contacts=contacts, 
                          courses_info=courses_info, recent_chats=recent_chats,
                          current_chat_id=current_chat_id, current_chat_type=current_chat_type,
-                         current_chat_name=current_chat_name, chat_messages=chat_messages)
+                         current_chat_name=current_chat_name, chat_messages=chat_messages,
+                         chat_has_more=chat_has_more,
+                         chat_cursor=encode_chat_cursor(chat_messages[0]) if chat_messages else None,
+                         chat_last_id=chat_messages[-1].id if chat_messages else 0)
 
 # 消息详情页面
 @app.route('/message/<int:message_id>')
+@login_required
 def message_detail(message_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
+    user = current_user()
     
     # 获取消息详情
     message = db.session.get(Message, message_id)
@@ -2578,16 +3691,16 @@ def message_detail(message_id):
     # 标记消息为已读
     if not message.is_read:
         message.is_read = True
+        decrement_unread(message, user.id)
         db.session.commit()
     
     return render_template('message_detail.html', user=user, message=message)
 
 # 删除消息
 @app.route('/delete_message/<int:message_id>', methods=['POST'])
+@login_required
 def delete_message(message_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
+    user = current_user()
     
     # 获取消息
     message = Message.query.get(message_id)
@@ -2595,8 +3708,16 @@ def delete_message(message_id):
         flash('消息不存在或无权限操作')
         return redirect(url_for('messages'))
     
-    # 删除消息
+    # 删除消息，并同步会话摘要
+    if not message.is_read:
+        decrement_unread(message, user.id)
+    conversation_key = conversation_key_for(message)
+    tutor_session_key = (message.sender_id, message.session_id) if message.message_type in ('question', 'answer') and message.session_id else None
     db.session.delete(message)
+    db.session.flush()
+    refresh_conversation_last_message(conversation_key)
+    if tutor_session_key:
+        refresh_tutor_session(*tutor_session_key)
     db.session.commit()
     
     flash('消息已删除')
@@ -2768,25 +3889,121 @@ def send_message():
         return jsonify({'success': False, 'message': '请选择消息接收对象'})
     
     db.session.add(new_message)
+    db.session.flush()
+    # 同一事务内更新会话摘要
+    record_conversation_message(new_message)
     db.session.commit()
     
-    return jsonify({'success': True, 'message': '消息发送成功'})
+    # 提交后推送给在线的接收方
+    publish_chat_message(new_message)
+    
+    return jsonify({'success': True, 'message': '消息发送成功', 'message_id': new_message.id})
 
 # 教师端-AI智能测验管理页面
 @app.route('/teacher_ai_test_management')
+@role_required('teacher')
 def teacher_ai_test_management():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'teacher':
-        flash('只有教师角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取教师创建的所有测验
     quizzes = Quiz.query.filter_by(teacher_id=user.id).all()
     
     return render_template('teacher_html/teacher_ai_test_management.html', user=user, quizzes=quizzes)
 
+# ===================== 观看进度写缓冲 =====================
+# /save_progress 心跳先进入内存缓冲，同一学生同一课程只保留最新进度、累加观看时长，
+# 每隔 PROGRESS_FLUSH_INTERVAL 秒（默认5秒）批量 upsert 一次，进程退出时再写一次
+
+def flush_watch_progress(entries):
+    """把缓冲项批量写入 CourseWatchProgress：进度取较新的一次心跳，观看时长累加"""
+    table = CourseWatchProgress.__table__
+    rows = [{
+        'student_id': student_id,
+        'course_id': course_id,
+        'watch_progress': entry['watch_progress'],
+        'last_watch_time': entry['last_watch_time'],
+        'total_watch_duration': entry['watch_duration'],
+        'updated_at': entry['updated_at'],
+    } for (student_id, course_id), entry in entries.items()]
+    
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        stmt = upsert(table)
+        # 多进程部署时不同进程的缓冲可能乱序写入，只用更新的心跳覆盖进度
+        newer = table.c.updated_at.is_(None) | (stmt.excluded.updated_at >= table.c.updated_at)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['student_id', 'course_id'],
+            set_={
+                'watch_progress': db.case((newer, stmt.excluded.watch_progress), else_=table.c.watch_progress),
+                'last_watch_time': db.case((newer, stmt.excluded.last_watch_time), else_=table.c.last_watch_time),
+                'updated_at': db.case((newer, stmt.excluded.updated_at), else_=table.c.updated_at),
+                'total_watch_duration': db.func.coalesce(table.c.total_watch_duration, 0) + stmt.excluded.total_watch_duration,
+            }
+        )
+        db.session.execute(stmt, rows)
+    else:
+        # 其他数据库逐条合并
+        for row in rows:
+            progress = CourseWatchProgress.query.filter_by(student_id=row['student_id'], course_id=row['course_id']).first()
+            if progress:
+                if progress.updated_at is None or row['updated_at'] >= progress.updated_at:
+                    progress.watch_progress = row['watch_progress']
+                    progress.last_watch_time = row['last_watch_time']
+                    progress.updated_at = row['updated_at']
+                progress.total_watch_duration = (progress.total_watch_duration or 0.0) + row['total_watch_duration']
+            else:
+                db.session.add(CourseWatchProgress(**row))
+    db.session.commit()
+
+def _flush_watch_progress_in_app_context(entries):
+    # 后台线程和退出时调用，需要自己的应用上下文
+    with app.app_context():
+        try:
+            flush_watch_progress(entries)
+        except Exception:
+            db.session.rollback()
+            raise
+
+watch_progress_buffer = register_buffer(ProgressBuffer(
+    _flush_watch_progress_in_app_context,
+    flush_interval=float(os.environ.get('PROGRESS_FLUSH_INTERVAL', 5))
+))
+
+def _merge_watch_progress(student_id, course_id, progress):
+    result = {
+        'watch_progress': progress.watch_progress if progress else 0.0,
+        'last_watch_time': progress.last_watch_time if progress else 0.0,
+        'total_watch_duration': (progress.total_watch_duration or 0.0) if progress else 0.0
+    }
+    pending = watch_progress_buffer.pending(student_id, course_id)
+    if pending:
+        result['watch_progress'] = pending['watch_progress']
+        result['last_watch_time'] = pending['last_watch_time']
+        result['total_watch_duration'] += pending['watch_duration']
+    return result
+
+def read_watch_progress(student_id, course_id):
+    """读取观看进度：数据库记录叠加缓冲中尚未写库的心跳"""
+    with watch_progress_buffer.snapshot():
+        progress = CourseWatchProgress.query.filter_by(student_id=student_id, course_id=course_id).first()
+        return _merge_watch_progress(student_id, course_id, progress)
+
+def read_watch_progress_many(student_id, course_ids):
+    """一次查询读取多门课程的观看进度，返回 {课程ID: 进度}"""
+    course_ids = list(course_ids)
+    records = {}
+    with watch_progress_buffer.snapshot():
+        if course_ids:
+            records = {p.course_id: p for p in CourseWatchProgress.query.filter(
+                CourseWatchProgress.student_id == student_id,
+                CourseWatchProgress.course_id.in_(course_ids)
+            )}
+        return {cid: _merge_watch_progress(student_id, cid, records.get(cid)) for cid in course_ids}
+
 # 保存课程观看进度API
 @app.route('/save_progress', methods=['POST'])
 def save_progress():
@@ -2804,31 +4021,12 @@ def save_progress():
         return jsonify({'success': False, 'message': '课程ID不能为空'})
     
     try:
-        # 查询是否已有进度记录
-        progress = CourseWatchProgress.query.filter_by(student_id=user_id, course_id=course_id).first()
-        
-        if progress:
-            # 更新现有记录
-            progress.watch_progress = watch_progress
-            progress.last_watch_time = last_watch_time
-            # 累加观看时长
-            progress.total_watch_duration += watch_duration
-            progress.updated_at = datetime.utcnow()
-        else:
-            # 创建新记录
-            progress = CourseWatchProgress(
-                student_id=user_id,
-                course_id=course_id,
-                watch_progress=watch_progress,
-                last_watch_time=last_watch_time,
-                total_watch_duration=watch_duration  # 初始化为当前观看时长
-            )
-            db.session.add(progress)
-        
-        db.session.commit()
+        # 只写入内存缓冲，由后台线程定期批量写库（见 flush_watch_progress）
+        watch_progress_buffer.record(
+            user_id, int(course_id), float(watch_progress), float(last_watch_time), float(watch_duration)
+        )
         return jsonify({'success': True, 'message': '进度保存成功'})
     except Exception as e:
-        db.session.rollback()
         return jsonify({'success': False, 'message': f'保存失败：{str(e)}'})
 
 # 获取课程观看进度API
@@ -2840,40 +4038,19 @@ def get_progress(course_id):
     user_id = session['user_id']
     
     try:
-        # 查询进度记录
-        progress = CourseWatchProgress.query.filter_by(student_id=user_id, course_id=course_id).first()
-        
-        if progress:
-            return jsonify({
-                'success': True,
-                'data': {
-                    'watch_progress': progress.watch_progress,
-                    'last_watch_time': progress.last_watch_time,
-                    'total_watch_duration': progress.total_watch_duration
-                }
-            })
-        else:
-            # 返回默认进度
-            return jsonify({
-                'success': True,
-                'data': {
-                    'watch_progress': 0.0,
-                    'last_watch_time': 0.0,
-                    'total_watch_duration': 0.0
-                }
-            })
+        # 数据库记录叠加尚未写库的缓冲，没有记录时返回默认进度
+        return jsonify({
+            'success': True,
+            'data': read_watch_progress(user_id, course_id)
+        })
     except Exception as e:
         return jsonify({'success': False, 'message': f'获取失败：{str(e)}'})
 
 # 教师端-创建测验页面
 @app.route('/teacher_create_quiz', methods=['GET', 'POST'])
+@role_required('teacher')
 def teacher_create_quiz():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'teacher':
-        flash('只有教师角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取所有课程供教师选择
     courses = Course.query.all()
@@ -3069,13 +4246,9 @@ def teacher_create_quiz():
 
 # 教师端-查看测验详情页面
 @app.route('/teacher_view_quiz/<int:quiz_id>')
+@role_required('teacher')
 def teacher_view_quiz(quiz_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'teacher':
-        flash('只有教师角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取测验信息
     quiz = db.session.get(Quiz, quiz_id)
@@ -3108,13 +4281,9 @@ def teacher_view_quiz(quiz_id):
 
 # 教师端-删除测验功能
 @app.route('/teacher_delete_quiz/<int:quiz_id>', methods=['POST'])
+@role_required('teacher')
 def teacher_delete_quiz(quiz_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'teacher':
-        flash('只有教师角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取测验信息
     quiz = Quiz.query.get(quiz_id)
@@ -3150,13 +4319,9 @@ def teacher_delete_quiz(quiz_id):
 
 # 教师端-上传题目页面
 @app.route('/teacher_upload_question', methods=['GET', 'POST'])
+@role_required('teacher')
 def teacher_upload_question():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'teacher':
-        flash('只有教师角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     if request.method == 'POST':
         # 检查是否是文件上传
@@ -3534,13 +4699,9 @@ def api_upload_question():
 
 # 教师端-查看班级学生答题情况
 @app.route('/teacher_view_student_answers/<int:quiz_id>')
+@role_required('teacher')
 def teacher_view_student_answers(quiz_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'teacher':
-        flash('只有教师角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取测验信息
     quiz = Quiz.query.get(quiz_id)
@@ -3555,13 +4716,9 @@ def teacher_view_student_answers(quiz_id):
 
 # 教师端-查看错题库
 @app.route('/teacher_view_error_bank')
+@role_required('teacher')
 def teacher_view_error_bank():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'teacher':
-        flash('只有教师角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取所有错题库记录
     error_bank = ErrorQuestionBank.query.all()
@@ -3570,13 +4727,9 @@ def teacher_view_error_bank():
 
 # 学生端-AI智能测验列表页面
 @app.route('/student_ai_quizzes')
+@role_required('student')
 def student_ai_quizzes():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取课程ID参数
     course_id = request.args.get('course_id')
@@ -3605,28 +4758,20 @@ def student_ai_quizzes():
 
 # 学生端-独立AI测验入口
 @app.route('/student_self_quiz')
+@role_required('student', eager=('enrolled_courses',))
 def student_self_quiz():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
-    # 获取学生已选课程
+    # 获取学生已选课程（选课记录和课程已随用户一起加载）
     enrolled_courses = [sc.course for sc in user.enrolled_courses]
     
     return render_template('students_html/student_self_quiz.html', user=user, courses=enrolled_courses)
 
 # 学生端-生成独立AI测验
 @app.route('/student_generate_self_quiz', methods=['POST'])
+@role_required('student')
 def student_generate_self_quiz():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取表单数据
     knowledge_points = request.form.get('knowledge_points', 'Python基础')
@@ -3721,13 +4866,9 @@ def student_generate_self_quiz():
 
 # 学生端-开始测验页面
 @app.route('/student_start_quiz/<int:quiz_id>')
+@role_required('student')
 def student_start_quiz(quiz_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取测验信息
     quiz = Quiz.query.get(quiz_id)
@@ -3781,13 +4922,9 @@ def student_start_quiz(quiz_id):
 
 # 学生端-提交答案
 @app.route('/student_submit_answer', methods=['POST'])
+@role_required('student')
 def student_submit_answer():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取提交的数据
     student_quiz_id = int(request.form['student_quiz_id'])
@@ -3810,13 +4947,9 @@ def student_submit_answer():
 
 # 学生端-结束测验
 @app.route('/student_end_quiz/<int:student_quiz_id>', methods=['GET', 'POST'])
+@role_required('student')
 def student_end_quiz(student_quiz_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取学生测验记录
     student_quiz = db.session.get(StudentQuiz, student_quiz_id)
@@ -3897,6 +5030,10 @@ def student_end_quiz(student_quiz_id):
     
     # 更新测验总分
     student_quiz.total_score = total_score
+    db.session.flush()
+    
+    # 更新测验排名和成绩统计
+    record_quiz_result(student_quiz)
     
     db.session.commit()
     
@@ -3904,13 +5041,9 @@ def student_end_quiz(student_quiz_id):
 
 # 学生端-测验结果页面
 @app.route('/student_quiz_result/<int:student_quiz_id>')
+@role_required('student')
 def student_quiz_result(student_quiz_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取学生测验记录
     student_quiz = StudentQuiz.query.get(student_quiz_id)
@@ -4000,13 +5133,9 @@ def set_utf8_content_type(response):
 
 # AI报告模块路由
 @app.route('/ai_report', methods=['GET', 'POST'])
+@role_required('student')
 def ai_report():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取学生信息以显示在页面上
     student_info = {
@@ -4019,29 +5148,132 @@ def ai_report():
     return render_template('students_html/ai_report.html', student_info=student_info)
 
 # 导入必要的库
-from openai import OpenAI
 import os
 import logging
 import json
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
+
+# 报告评分使用的大模型服务，可用环境变量切换（测试时指向本地的兼容服务）
+GRADING_API_KEY = os.environ.get('GRADING_API_KEY', "sk-71b1ae400f794e0c919e23d556f9052f")
+GRADING_BASE_URL = os.environ.get('GRADING_BASE_URL', "https://dashscope.aliyuncs.com/compatible-mode/v1")
+GRADING_MODEL = os.environ.get('GRADING_MODEL', "deepseek-v3.2")
+
+# 本进程同时发往评分大模型的请求数上限，批改工作线程和直接调用 grade_report 的脚本共用
+grading_llm_slots = threading.BoundedSemaphore(int(os.environ.get('GRADING_LLM_CONCURRENCY', 4)))
+
+# 评分提示词版本：修改下面的提示词或评分标准时改这个值，旧提示词的缓存结果随之失效
+GRADING_PROMPT_VERSION = 'report-v1'
+
+def _read_grading_cache(cache_key):
+    # 缓存出错时照常调用大模型，不影响评分
+    try:
+        return get_grading_cache().get(cache_key)
+    except Exception as e:
+        logging.warning(f"读取评分缓存失败: {e}")
+        return None
+
+def _write_grading_cache(cache_key, result):
+    try:
+        get_grading_cache().put(cache_key, result)
+    except Exception as e:
+        logging.warning(f"写入评分缓存失败: {e}")
+
+# 超过这个字符数的报告先分段评阅（map）再汇总评分（reduce），每次请求的提示词长度都在这个范围内
+GRADING_CHUNK_CHARS = int(os.environ.get('GRADING_CHUNK_CHARS', 12000))
+
+# 一份长报告同时评阅的分段数，实际发往大模型的并发仍受 grading_llm_slots 限制
+GRADING_MAP_WORKERS = int(os.environ.get('GRADING_MAP_WORKERS', 4))
+
+def _request_grading_completion(client, messages):
+    """发送一次评分请求（超过并发上限时排队），返回 (原始响应, 去掉代码块标记后的响应)"""
+    with grading_llm_slots:
+        completion = create_with_retry(
+            client,
+            model=GRADING_MODEL,
+            messages=messages,
+            temperature=0.7,
+            response_format={"type": "json_object"}
+        )
+    
+    # 获取API响应
+    response_content = completion.choices[0].message.content
+    logging.info(f"成功获取API响应，内容长度: {len(response_content)}字符")
+    
+    # 清理响应内容（处理可能存在的markdown代码块标记）
+    cleaned_content = response_content.strip()
+    if cleaned_content.startswith('```json') and cleaned_content.endswith('```'):
+        cleaned_content = cleaned_content[7:-3].strip()
+    elif cleaned_content.startswith('```') and cleaned_content.endswith('```'):
+        cleaned_content = cleaned_content[3:-3].strip()
+    return response_content, cleaned_content
+
+def _review_report_chunk(client, topic, index, total, chunk, summary_limit):
+    """map：评阅长报告的一个分段，返回这一段的要点；评阅失败时改用这一段开头的原文"""
+    chunk_prompt = f"下面是一份较长报告的第{index}/{total}部分，请分段评阅，提炼这一部分的内容要点、亮点和不足，供之后给整篇报告评分使用。\n\n"
+    chunk_prompt += "报告主题: " + str(topic) + "\n\n"
+    chunk_prompt += f"报告内容（第{index}部分）: " + chunk + "\n\n"
+    chunk_prompt += "请严格按照以下JSON格式输出，不要包含任何额外的文字说明或格式标记：\n"
+    chunk_prompt += "{\"summary\":\"不超过" + str(summary_limit) + "字的内容要点\",\"strengths\":[\"亮点\"],\"issues\":[\"不足\"]}\n"
+    messages = [
+        {"role": "system", "content": "你是一位专业的学术报告分析专家，正在分段阅读一篇较长的报告。请只返回JSON字符串，不要包含任何markdown代码块标记或其他额外内容。"},
+        {"role": "user", "content": chunk_prompt}
+    ]
+    try:
+        _, cleaned_content = _request_grading_completion(client, messages)
+        review = json.loads(cleaned_content)
+        lines = [f"【第{index}部分】{review.get('summary', '')}"]
+        if review.get('strengths'):
+            lines.append("亮点：" + "；".join(str(item) for item in review['strengths']))
+        if review.get('issues'):
+            lines.append("不足：" + "；".join(str(item) for item in review['issues']))
+        return "\n".join(lines)
+    except Exception as e:
+        logging.warning(f"第{index}部分分段评阅失败，改用原文节选: {e}")
+        return f"【第{index}部分（原文节选）】{chunk[:summary_limit]}"
+
+def review_report_chunks(client, chunks, topic):
+    """map：最多 GRADING_MAP_WORKERS 个分段同时评阅，按原顺序返回各段要点；要点总长约为 GRADING_CHUNK_CHARS 的一半"""
+    from concurrent.futures import ThreadPoolExecutor
+    summary_limit = max(80, min(400, GRADING_CHUNK_CHARS // (2 * len(chunks))))
+    with ThreadPoolExecutor(max_workers=min(GRADING_MAP_WORKERS, len(chunks))) as executor:
+        futures = [executor.submit(_review_report_chunk, client, topic, index, len(chunks), chunk, summary_limit)
+                   for index, chunk in enumerate(chunks, start=1)]
+        return [future.result() for future in futures]
+
 def grade_report(file_content, topic):
-    """调用阿里云百炼API进行报告评分的函数"""
+    """
+    调用阿里云百炼API进行报告评分的函数。
+    超过 GRADING_CHUNK_CHARS 的长报告按章节/段落分段，先并发评阅各段，再用各段要点汇总评出总分。
+    报告文本（规范化空白后）、主题、提示词版本和模型都相同时直接返回缓存的结果，不再请求大模型
+    """
+    chunks = split_report(str(file_content), GRADING_CHUNK_CHARS)
+    # 分段评分的结果与分段大小有关，分段大小不同的结果不共用缓存
+    prompt_version = GRADING_PROMPT_VERSION if len(chunks) <= 1 else f"{GRADING_PROMPT_VERSION}/chunks-{GRADING_CHUNK_CHARS}"
+    cache_key = grading_cache_key(file_content, topic, prompt_version, GRADING_MODEL)
+    cached_result = _read_grading_cache(cache_key)
+    if cached_result is not None:
+        logging.info(f"评分缓存命中，主题: {topic}")
+        return cached_result
+    
     try:
         logging.info(f"开始分析报告，主题: {topic}")
         
-        # 初始化OpenAI客户端，连接阿里云百炼API
-        client = OpenAI(
-            # 使用用户提供的API密钥
-            api_key="sk-71b1ae400f794e0c919e23d556f9052f",
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-        )
+        # 共享的客户端，连接阿里云百炼API（读超时由环境变量 GRADING_TIMEOUT 配置）
+        client = get_llm_client(GRADING_BASE_URL, GRADING_API_KEY, 'grading')
+        
+        if len(chunks) > 1:
+            logging.info(f"报告较长（{len(str(file_content))}字符），分{len(chunks)}段评阅后汇总评分")
+            report_body = "（报告较长，以下是按章节分段评阅得到的各部分要点，请据此对整篇报告评分）\n" + "\n\n".join(
+                review_report_chunks(client, chunks, topic))
+        else:
+            report_body = str(file_content)
         
         # 构建详细的提示词模板，使用字符串连接方式避免格式问题
         report_analysis_prompt = "你是一位专业的报告分析专家，请对以下报告内容进行全面的评估和分析。\n\n"
         report_analysis_prompt += "报告主题: " + str(topic) + "\n\n"
-        report_analysis_prompt += "报告内容: " + str(file_content) + "\n\n"
+        report_analysis_prompt += "报告内容: " + report_body + "\n\n"
         report_analysis_prompt += "请严格按照以下JSON格式输出分析结果，不要包含任何额外的文字说明或格式标记：\n"
         report_analysis_prompt += "{\"score\":分数,\"grade\":\"等级\",\"analysis\":\"详细分析\",\"suggestions\":[\"改进建议1\",\"改进建议2\",\"改进建议3\"]}\n\n"
         report_analysis_prompt += "评分标准：\n"
@@ -4059,24 +5291,8 @@ def grade_report(file_content, topic):
         
         logging.info("向阿里云百炼API发送报告分析请求")
         
-        # 调用API生成分析结果
-        completion = client.chat.completions.create(
-            model="deepseek-v3.2",
-            messages=messages,
-            temperature=0.7,
-            response_format={"type": "json_object"}
-        )
-        
-        # 获取API响应
-        response_content = completion.choices[0].message.content
-        logging.info(f"成功获取API响应，内容长度: {len(response_content)}字符")
-        
-        # 清理响应内容（处理可能存在的markdown代码块标记）
-        cleaned_content = response_content.strip()
-        if cleaned_content.startswith('```json') and cleaned_content.endswith('```'):
-            cleaned_content = cleaned_content[7:-3].strip()
-        elif cleaned_content.startswith('```') and cleaned_content.endswith('```'):
-            cleaned_content = cleaned_content[3:-3].strip()
+        # 调用API生成分析结果，超过并发上限时在这里排队
+        response_content, cleaned_content = _request_grading_completion(client, messages)
         logging.info(f"清理后响应内容: {cleaned_content[:50]}...")
         
         # 解析JSON响应
@@ -4109,6 +5325,8 @@ def grade_report(file_content, topic):
             # 注：如果API明确返回空列表，我们尊重这个结果，不使用本地默认值
             
             logging.info(f"成功解析并标准化分析结果: {standardized_result.get('score', 0.0)}分, 等级: {standardized_result.get('grade', '未评级')}")
+            # 只缓存大模型正常返回的结果，调用失败和格式异常时的兜底结果不缓存
+            _write_grading_cache(cache_key, standardized_result)
             return standardized_result
             
         except json.JSONDecodeError as e:
@@ -4190,6 +5408,236 @@ def extract_structured_result(text, file_content):
         "analysis": analysis,
         "suggestions": suggestions[:3]  # 只取前3条建议
     }
+
+# ===================== 报告批改任务队列 =====================
+# 提交报告只登记一条 GradingJob 就返回 202 和任务ID，读取文件、调用大模型评分由后台工作线程完成，
+# 前端轮询 /api/grading/jobs/<任务ID> 取状态和结果。工作线程数 GRADING_WORKERS（默认4），
+# 发往大模型的并发数由 grading_llm_slots 限制
+
+# 工作线程超过这个时间（秒）还没做完的任务视为进程已退出，重新排队
+GRADING_JOB_STALE_SECONDS = int(os.environ.get('GRADING_JOB_STALE_SECONDS', 600))
+
+def resolve_report_path(file_path):
+    """把请求中的报告路径（相对路径相对于 app.root_path）转成绝对路径，文件不存在时返回 None"""
+    if not os.path.isabs(file_path):
+        file_path = os.path.join(app.root_path, file_path)
+    if not os.path.exists(file_path) or not os.path.isfile(file_path):
+        return None
+    return file_path
+
+# 按路径提交批改时只接受直接放在这些目录中的文件：/api/upload_report_file 和 AI_analysis/file_upload 的保存目录。
+# 与其他上传目录一样按 app.root_path 取，不随进程启动时的工作目录变化
+REPORT_UPLOAD_FOLDERS = [os.path.join(app.root_path, 'uploads'), os.path.join(app.root_path, 'AI_analysis', 'uploads')]
+# 作业提交目录中的文件只能由提交作业的学生或该课程的教师提交批改
+ASSIGNMENT_UPLOAD_FOLDER = os.path.join(app.root_path, 'uploads', 'assignments')
+
+def check_report_access(file_path, user):
+    """user 不能批改该文件时返回错误信息，否则返回 None。路径先解析符号链接和 ..，不能借此跳出上传目录"""
+    folder = os.path.dirname(os.path.realpath(file_path))
+    if folder in [os.path.realpath(path) for path in REPORT_UPLOAD_FOLDERS]:
+        return None
+    if folder != os.path.realpath(ASSIGNMENT_UPLOAD_FOLDER):
+        return '只能批改上传目录中的报告文件'
+    submission = StudentAssignment.query.filter_by(file_path=os.path.basename(file_path)).first()
+    if user is None or submission is None:
+        return '无权批改该作业文件'
+    if submission.student_id != user.id and submission.assignment.course.teacher_id != user.id:
+        return '无权批改该作业文件'
+    return None
+
+def report_read_error(file_content):
+    """read_file_content 的结果不可用时返回错误信息，否则返回 None"""
+    if not file_content or '无法读取文件内容' in file_content or '不支持的文件格式' in file_content:
+        return f"文件读取失败或格式不支持: {file_content}"
+    return None
+
+def check_report_readable(file_path):
+    """提交前只解析开头一小段（PDF 通常只到第一页）确认文件能读出文字，不能时返回错误信息"""
+    return report_read_error(read_file_content(file_path, max_chars=200))
+
+def submit_grading_job(file_path, topic='', student_id=None, analysis_type='standard',
+                       with_comparison=False, delete_file=False):
+    """登记一条批改任务并交给工作线程，返回 GradingJob"""
+    import uuid
+    job = GradingJob(
+        job_id=uuid.uuid4().hex,
+        student_id=student_id,
+        file_path=file_path,
+        topic=topic or '',
+        analysis_type=analysis_type or 'standard',
+        with_comparison=with_comparison,
+        delete_file=delete_file
+    )
+    db.session.add(job)
+    db.session.commit()
+    grading_queue.submit(job.job_id)
+    return job
+
+def run_grading_job(job_id):
+    """工作线程执行一条批改任务：抢占任务 -> 读取文件 -> 大模型评分（可选范文对比）-> 保存结果"""
+    with app.app_context():
+        # 条件更新抢占任务，多个进程或重复入队时只有一个能执行
+        claimed = GradingJob.query.filter_by(job_id=job_id, status='queued').update(
+            {'status': 'running', 'started_at': datetime.utcnow()}, synchronize_session=False
+        )
+        db.session.commit()
+        if not claimed:
+            return
+        job = GradingJob.query.filter_by(job_id=job_id).one()
+        try:
+            file_content = read_file_content(job.file_path)
+            read_error = report_read_error(file_content)
+            if read_error:
+                raise ValueError(read_error)
+            result = {'report_data': grade_report(file_content, job.topic)}
+            if job.with_comparison:
+                from AI_analysis import report_comparison
+                try:
+                    result['comparison'] = report_comparison.compare_reports(file_content)
+                except Exception as e:
+                    print(f"报告对比分析失败: {e}")
+                    result['comparison'] = {'status': 'error', 'message': '报告对比分析暂时不可用', 'differences': []}
+            job.result = json.dumps(result, ensure_ascii=False)
+            job.status = 'completed'
+        except Exception as e:
+            db.session.rollback()
+            job = GradingJob.query.filter_by(job_id=job_id).one()
+            job.status = 'failed'
+            job.error = str(e)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        if job.delete_file and os.path.exists(job.file_path):
+            try:
+                os.remove(job.file_path)
+            except OSError:
+                pass
+
+def recover_grading_jobs():
+    """工作线程启动时调用：超时未完成的任务改回排队，返回所有排队中的任务ID"""
+    from datetime import timedelta
+    with app.app_context():
+        stale_before = datetime.utcnow() - timedelta(seconds=GRADING_JOB_STALE_SECONDS)
+        GradingJob.query.filter(
+            GradingJob.status == 'running', GradingJob.started_at < stale_before
+        ).update({'status': 'queued', 'started_at': None}, synchronize_session=False)
+        db.session.commit()
+        rows = db.session.query(GradingJob.job_id).filter_by(status='queued').order_by(GradingJob.created_at).all()
+        return [job_id for job_id, in rows]
+
+grading_queue = GradingQueue(
+    run_grading_job,
+    workers=int(os.environ.get('GRADING_WORKERS', 4)),
+    recover=recover_grading_jobs
+)
+
+def find_grading_job(job_id):
+    """按任务ID取任务；登录用户提交的任务只有本人能查看"""
+    job = GradingJob.query.filter_by(job_id=job_id).first()
+    if job is None or (job.student_id is not None and job.student_id != session.get('user_id')):
+        return None
+    return job
+
+def grading_job_status(job):
+    data = {
+        'job_id': job.job_id,
+        'status': job.status,
+        'created_at': job.created_at.strftime('%Y-%m-%d %H:%M:%S') if job.created_at else None,
+        'started_at': job.started_at.strftime('%Y-%m-%d %H:%M:%S') if job.started_at else None,
+        'finished_at': job.finished_at.strftime('%Y-%m-%d %H:%M:%S') if job.finished_at else None,
+        'status_url': url_for('api_grading_job_status', job_id=job.job_id),
+        'result_url': url_for('api_grading_job_result', job_id=job.job_id),
+    }
+    if job.status == 'queued':
+        # 排在它前面的任务数 + 1
+        data['position'] = GradingJob.query.filter(
+            GradingJob.status == 'queued', GradingJob.created_at < job.created_at
+        ).count() + 1
+    if job.status == 'failed':
+        data['error'] = job.error
+    return data
+
+@app.route('/api/grading/jobs', methods=['POST'])
+@login_required(api=True)
+def api_submit_grading_job():
+    """提交批改任务：multipart 上传 file，或 JSON 传入已上传文件的 file_path；立即返回 202"""
+    if 'file' in request.files:
+        from AI_analysis import file_upload
+        upload_result = file_upload.handle_file_upload(request.files['file'])
+        if not upload_result['success']:
+            return jsonify({'error': upload_result['error']}), 400
+        file_path, delete_file = upload_result['file_path'], True
+        data = request.form
+    else:
+        data = request.get_json(silent=True) or {}
+        if not data.get('file_path'):
+            return jsonify({'error': '缺少必填参数: file 或 file_path'}), 400
+        file_path, delete_file = resolve_report_path(data['file_path']), False
+        if file_path is None:
+            return jsonify({'error': f"文件不存在: {data['file_path']}"}), 404
+        access_error = check_report_access(file_path, current_user())
+        if access_error:
+            return jsonify({'error': access_error}), 403
+    
+    read_error = check_report_readable(file_path)
+    if read_error:
+        if delete_file:
+            os.remove(file_path)
+        return jsonify({'error': read_error}), 400
+    
+    job = submit_grading_job(file_path, data.get('topic', ''), student_id=current_user().id,
+                             analysis_type=data.get('analysis_type', 'standard'), delete_file=delete_file)
+    return jsonify(grading_job_status(job)), 202
+
+@app.route('/api/grading/jobs/<job_id>', methods=['GET'])
+def api_grading_job_status(job_id):
+    job = find_grading_job(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    if job.status == 'queued':
+        # 进程重启后第一次查询时启动工作线程，接着处理没做完的任务
+        grading_queue.start()
+    return jsonify(grading_job_status(job))
+
+@app.route('/api/grading/jobs/<job_id>/result', methods=['GET'])
+def api_grading_job_result(job_id):
+    """任务完成返回 200 和批改结果（与原 /api/evaluation/report 的响应格式相同），未完成返回 202，失败返回 500"""
+    job = find_grading_job(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    if job.status == 'failed':
+        return jsonify({'error': job.error, 'job_id': job.job_id, 'status': 'failed'}), 500
+    if job.status != 'completed':
+        grading_queue.start()
+        return jsonify(grading_job_status(job)), 202
+    result = json.loads(job.result)
+    return jsonify({
+        'status': 'success',
+        'message': '文件已成功处理',
+        'job_id': job.job_id,
+        'file_path': job.file_path,
+        'analysis_type': job.analysis_type,
+        'report_data': result['report_data'],
+        'comparison': result.get('comparison')
+    })
+
+@app.route('/api/grading/cache/stats', methods=['GET'])
+@role_required('teacher', api=True)
+def api_grading_cache_stats():
+    """评分缓存命中情况：本进程的命中/未命中次数、命中率、淘汰条数和库中条目数"""
+    return jsonify(get_grading_cache().stats())
+
+@app.route('/api/llm/metrics', methods=['GET'])
+@role_required('teacher', api=True)
+def api_llm_metrics():
+    """大模型调用指标：首 token 时间、连接池等待、请求耗时的分位数，以及重试、失败、新建连接次数"""
+    return jsonify(llm_metrics.snapshot())
+
+@app.route('/api/ai-tutor/cache/stats', methods=['GET'])
+@role_required('teacher', api=True)
+def api_tutor_cache_stats():
+    """助教问答缓存命中情况：本进程的命中/未命中次数、命中率、淘汰条数、缓存的问题数和相似度阈值，以及相同问题的合并情况和 FAQ 构建情况"""
+    return jsonify(dict(get_tutor_cache().stats(), coalescing=tutor_flights.stats(), faq_builder=faq_builder.stats()))
+
 import io
 
 # API端点：上传报告文件到后台
@@ -4209,7 +5657,7 @@ def api_upload_report_file():
             return jsonify({'success': False, 'message': '未选择文件'}), 400
         
         # 确保上传文件夹存在
-        UPLOAD_FOLDER = 'uploads'
+        UPLOAD_FOLDER = os.path.join(app.root_path, 'uploads')
         if not os.path.exists(UPLOAD_FOLDER):
             os.makedirs(UPLOAD_FOLDER)
         
@@ -4221,10 +5669,10 @@ def api_upload_report_file():
         # 保存文件
         file.save(filepath)
         
-        # 返回文件路径
+        # 返回相对于 app.root_path 的文件路径
         return jsonify({
             'success': True, 
-            'file_path': filepath.replace('\\', '/'),  # 统一使用正斜杠
+            'file_path': os.path.relpath(filepath, app.root_path).replace('\\', '/'),  # 统一使用正斜杠
             'filename': filename
         }), 200
         
@@ -4236,6 +5684,7 @@ def api_upload_report_file():
 
 @app.route('/api/evaluation/report', methods=['POST'])
 def api_evaluation_report():
+    """提交报告评分：只登记批改任务并返回 202，结果从 result_url 轮询获取"""
     try:
         # 检查Content-Type
         content_type = request.headers.get('Content-Type')
@@ -4251,45 +5700,29 @@ def api_evaluation_report():
         if 'file_path' not in data:
             return jsonify({"error": "缺少必填参数: file_path"}), 400
             
-        file_path = data['file_path']
-        
-        # 确保文件路径是绝对路径或相对于当前目录的路径
-        if not os.path.isabs(file_path):
-            file_path = os.path.join(os.getcwd(), file_path)
-        
-        # 检查文件是否存在
-        if not os.path.exists(file_path) or not os.path.isfile(file_path):
-            return jsonify({"error": f"文件不存在: {file_path}"}), 404
-        
-        # 读取文件内容
-        try:
-            file_content = read_file_content(file_path)
-            # 检查文件内容是否有效
-            if not file_content or '无法读取文件内容' in file_content or '不支持的文件格式' in file_content:
-                return jsonify({"error": f"文件读取失败或格式不支持: {file_content}"}), 400
-        except Exception as e:
-            return jsonify({"error": f"读取文件失败: {str(e)}"}), 500
-        
-        # 确保有文件内容
-        if not file_content:
-            return jsonify({"error": "文件内容为空"}), 400
-        
-        # 提取主题（如果有）
-        topic = data.get('topic', '')
-        
-        # 调用真实的AI评分API
-        api_result = grade_report(file_content, topic)
-        
-        # 构建响应数据（简化版）
-        response_data = {
-            "status": "success",
-            "message": "文件已成功处理",
+        # 确保文件路径是绝对路径或相对于当前目录的路径，并检查文件是否存在
+        file_path = resolve_report_path(data['file_path'])
+        if file_path is None:
+            return jsonify({"error": f"文件不存在: {data['file_path']}"}), 404
+        access_error = check_report_access(file_path, current_user())
+        if access_error:
+            return jsonify({"error": access_error}), 403
+        
+        # 只读开头确认文件可用，完整读取和调用AI评分都在后台工作线程中进行
+        read_error = check_report_readable(file_path)
+        if read_error:
+            return jsonify({"error": read_error}), 400
+        
+        job = submit_grading_job(file_path, data.get('topic', ''), student_id=session.get('user_id'),
+                                 analysis_type=data.get('analysis_type', 'standard'))
+        
+        response_data = grading_job_status(job)
+        response_data.update({
+            "message": "报告已提交批改",
             "file_path": file_path,
-            "analysis_type": data.get('analysis_type', 'standard'),
-            "report_data": api_result
-        }
-        
-        return jsonify(response_data)
+            "analysis_type": job.analysis_type
+        })
+        return jsonify(response_data), 202
     except Exception as e:
         # 简单的错误处理
         return jsonify({"error": str(e)}), 500
@@ -4465,7 +5898,7 @@ def api_evaluation_compare():
     
     try:
         # 强制使用固定的uploads目录路径构建方式
-        uploads_dir = os.path.join(os.getcwd(), 'uploads')
+        uploads_dir = os.path.join(app.root_path, 'uploads')
         os.makedirs(uploads_dir, exist_ok=True)
         
         print(f"固定上传目录: {uploads_dir}")
@@ -4953,13 +6386,9 @@ def serve_course_file(filename):
 
 # 教师端-创建课程页面
 @app.route('/teacher_create_course', methods=['GET', 'POST'])
+@role_required('teacher')
 def teacher_create_course():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'teacher':
-        flash('只有教师角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取当前老师创建的所有课程
     created_courses = Course.query.filter_by(teacher_id=user.id).all()
@@ -5021,13 +6450,9 @@ def teacher_create_course():
 
 # 教师端-删除课程功能
 @app.route('/delete_course/<int:course_id>', methods=['POST'])
+@role_required('teacher', message='只有教师角色可以执行此操作')
 def delete_course(course_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'teacher':
-        flash('只有教师角色可以执行此操作')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 找到要删除的课程
     course = Course.query.filter_by(id=course_id, teacher_id=user.id).first()
@@ -5049,13 +6474,9 @@ def delete_course(course_id):
 # 教师端-编辑课程页面
 @app.route('/teacher_edit_course', methods=['GET', 'POST'])
 @app.route('/teacher_edit_course/<int:course_id>', methods=['GET', 'POST'])
+@role_required('teacher')
 def teacher_edit_course(course_id=None):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'teacher':
-        flash('只有教师角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取当前老师创建的所有课程
     created_courses = Course.query.filter_by(teacher_id=user.id).all()
@@ -5171,14 +6592,10 @@ def teacher_edit_course(course_id=None):
 
 # 教师端-批改作业页面
 @app.route('/teacher_grade_assignments')
+@role_required('teacher')
 def teacher_grade_assignments():
     selected_course_id = request.args.get('course_id', type=int)  # 获取筛选的课程ID
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'teacher':
-        flash('只有教师角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取教师授课的所有课程
     if selected_course_id:
@@ -5188,23 +6605,29 @@ def teacher_grade_assignments():
         # 获取所有课程
         courses = user.courses_taught
     
+    course_ids = [course.id for course in courses]
+    
     # ===================== 测验相关数据 =====================
-    # 获取所有相关测验
-    quizzes = Quiz.query.filter_by(teacher_id=user.id).all()
+    # 所选课程下的测验，一次查询后按课程分组
+    course_quizzes = {course_id: [] for course_id in course_ids}
+    if course_ids:
+        for quiz in Quiz.query.filter(Quiz.course_id.in_(course_ids), Quiz.teacher_id == user.id).order_by(Quiz.id):
+            course_quizzes[quiz.course_id].append(quiz)
     
-    # 获取需要批改的学生测验（已提交但未批改的测验）
+    # 获取需要批改的学生测验（已完成的测验），连同测验和学生一起加载
     student_quizzes = StudentQuiz.query.join(Quiz).filter(
         Quiz.teacher_id == user.id,
         StudentQuiz.status == 'completed'  # 已完成的测验
+    ).options(
+        joinedload(StudentQuiz.quiz), joinedload(StudentQuiz.student)
     ).order_by(StudentQuiz.submit_time.desc()).all()
     
     # 准备数据：按课程分组的测验记录
     course_quiz_data = {}
     for course in courses:
-        course_quizzes = Quiz.query.filter_by(course_id=course.id, teacher_id=user.id).all()
         course_quiz_data[course.id] = {
             'course': course,
-            'quizzes': course_quizzes,
+            'quizzes': course_quizzes[course.id],
             'student_records': []
         }
     
@@ -5215,76 +6638,73 @@ def teacher_grade_assignments():
             course_quiz_data[course_id]['student_records'].append(student_quiz)
     
     # ===================== 作业相关数据 =====================
-    # 获取所有相关作业
-    assignments = Assignment.query.join(Course).filter(Course.teacher_id == user.id).all()
+    # 作业、提交记录、班级学生各一次查询
+    course_assignments = {course_id: [] for course_id in course_ids}
+    course_students = {course_id: [] for course_id in course_ids}
+    submissions_by_assignment = {}
+    if course_ids:
+        for assignment in Assignment.query.filter(Assignment.course_id.in_(course_ids)).order_by(Assignment.id):
+            course_assignments[assignment.course_id].append(assignment)
+            submissions_by_assignment[assignment.id] = []
+        if submissions_by_assignment:
+            for submission in StudentAssignment.query.filter(
+                StudentAssignment.assignment_id.in_(list(submissions_by_assignment))
+            ).options(joinedload(StudentAssignment.student)).order_by(StudentAssignment.id):
+                submissions_by_assignment[submission.assignment_id].append(submission)
+        for member_course_id, student in db.session.query(StudentCourse.course_id, User).join(
+            User, User.id == StudentCourse.student_id
+        ).filter(StudentCourse.course_id.in_(course_ids), User.role == 'student').order_by(User.id):
+            course_students[member_course_id].append(student)
     
     # 准备数据：按课程分组的作业记录
     course_assignment_data = {}
     for course in courses:
-        course_assignments = Assignment.query.filter_by(course_id=course.id).all()
-        
-        # 获取该课程的所有学生
-        course_students = User.query.join(StudentCourse).filter(
-            StudentCourse.course_id == course.id,
-            User.role == 'student'
-        ).all()
-        
-        course_assignment_data[course.id] = {
+        course_data = {
             'course': course,
-            'assignments': course_assignments,
+            'assignments': course_assignments[course.id],
             'submissions': [],
-            'students': course_students
+            'students': course_students[course.id]
         }
-    
-    # 为每个课程添加学生作业提交记录
-    for assignment in assignments:
-        submissions = StudentAssignment.query.filter_by(assignment_id=assignment.id).all()
-        if assignment.course_id in course_assignment_data:
+        for assignment in course_assignments[course.id]:
+            submissions = submissions_by_assignment[assignment.id]
             # 添加提交记录
             for submission in submissions:
-                course_assignment_data[assignment.course_id]['submissions'].append({
+                course_data['submissions'].append({
                     'assignment': assignment,
                     'submission': submission
                 })
-            
             # 计算缺交学生
-            course_data = course_assignment_data[assignment.course_id]
             submitted_student_ids = {submission.student_id for submission in submissions}
-            missing_students = [student for student in course_data['students'] 
-                               if student.id not in submitted_student_ids]
-            
-            # 为该作业添加缺交学生列表
-            if not hasattr(assignment, 'missing_students'):
-                assignment.missing_students = []
-            assignment.missing_students = missing_students
+            assignment.missing_students = [student for student in course_data['students']
+                                           if student.id not in submitted_student_ids]
+        course_assignment_data[course.id] = course_data
     
     # ===================== 成绩排名数据 =====================
+    # 直接读取交卷时维护好的名次和统计，按 (测验, 名次) 索引顺序返回，无需排序
+    all_quiz_ids = [quiz.id for quiz_list in course_quizzes.values() for quiz in quiz_list]
+    rankings_by_quiz = {quiz_id: [] for quiz_id in all_quiz_ids}
+    statistics_by_quiz = {}
+    if all_quiz_ids:
+        for ranking in QuizRanking.query.filter(QuizRanking.quiz_id.in_(all_quiz_ids)).options(
+            joinedload(QuizRanking.student)
+        ).order_by(QuizRanking.quiz_id, QuizRanking.dense_rank, QuizRanking.id):
+            rankings_by_quiz[ranking.quiz_id].append(ranking)
+        statistics_by_quiz = {stats.quiz_id: stats for stats in QuizStatistics.query.filter(
+            QuizStatistics.quiz_id.in_(all_quiz_ids)
+        )}
+    
     course_rank_data = {}
     for course in courses:
-        # 获取课程下的所有测验
-        course_quizzes = Quiz.query.filter_by(course_id=course.id, teacher_id=user.id).all()
-        
-        # 按测验分组的学生成绩
-        quiz_rank_data = {}
-        for quiz in course_quizzes:
-            # 获取该测验所有学生的成绩
-            student_scores = StudentQuiz.query.filter_by(quiz_id=quiz.id).all()
-            
-            # 按成绩排序（降序）
-            ranked_scores = sorted(student_scores, key=lambda x: x.total_score, reverse=True)
-            
-            # 添加排名
-            for i, score in enumerate(ranked_scores):
-                score.rank = i + 1  # 排名从1开始
-            
-            quiz_rank_data[quiz.id] = {
-                'quiz': quiz,
-                'ranked_scores': ranked_scores
-            }
-        
         course_rank_data[course.id] = {
             'course': course,
-            'quiz_rankings': quiz_rank_data
+            'quiz_rankings': {
+                quiz.id: {
+                    'quiz': quiz,
+                    'ranked_scores': rankings_by_quiz[quiz.id],
+                    'statistics': statistics_by_quiz.get(quiz.id)
+                }
+                for quiz in course_quizzes[course.id]
+            }
         }
     
     return render_template('teacher_html/teacher_grade_assignments.html', 
@@ -5297,75 +6717,59 @@ def teacher_grade_assignments():
 
 # 教师端-管理学生页面
 @app.route('/teacher_manage_students')
+@role_required('teacher')
 def teacher_manage_students():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'teacher':
-        flash('只有教师角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     return render_template('teacher_html/teacher_manage_students.html', user=user)
 
 # 教师端-发布成绩页面
 @app.route('/teacher_publish_grades')
+@role_required('teacher')
 def teacher_publish_grades():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'teacher':
-        flash('只有教师角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取教师授课的所有课程
     courses = user.courses_taught
-    
-    # 获取所有相关测验
-    quizzes = Quiz.query.filter_by(teacher_id=user.id).all()
-    
-    # 获取所有学生测验成绩
-    student_quizzes = StudentQuiz.query.join(Quiz).filter(
-        Quiz.teacher_id == user.id,
-        StudentQuiz.status == 'completed'  # 已完成的测验
-    ).order_by(StudentQuiz.submit_time.desc()).all()
+    course_ids = [course.id for course in courses]
+    
+    # 所有课程的测验一次查询
+    course_quizzes = {course_id: [] for course_id in course_ids}
+    if course_ids:
+        for quiz in Quiz.query.filter(Quiz.course_id.in_(course_ids), Quiz.teacher_id == user.id).order_by(Quiz.id):
+            course_quizzes[quiz.course_id].append(quiz)
+    
+    # 已完成测验的成绩来自排名表：只取仍在班级中的学生，按课程、学生分组
+    student_grades_by_course = {course_id: {} for course_id in course_ids}
+    if course_ids:
+        rows = db.session.query(Quiz.course_id, QuizRanking).join(
+            QuizRanking, QuizRanking.quiz_id == Quiz.id
+        ).join(
+            StudentCourse, db.and_(StudentCourse.course_id == Quiz.course_id,
+                                   StudentCourse.student_id == QuizRanking.student_id)
+        ).filter(
+            Quiz.course_id.in_(course_ids), Quiz.teacher_id == user.id
+        ).options(
+            joinedload(QuizRanking.student), joinedload(QuizRanking.quiz)
+        ).order_by(QuizRanking.student_id, QuizRanking.id).all()
+        for course_id, ranking in rows:
+            grades_by_student = student_grades_by_course[course_id]
+            if ranking.student_id not in grades_by_student:
+                grades_by_student[ranking.student_id] = {'student': ranking.student, 'quizzes': []}
+            grades_by_student[ranking.student_id]['quizzes'].append(ranking)
     
     # 准备数据：按课程分组的成绩记录
     course_grade_data = {}
     for course in courses:
-        # 获取该课程下的所有学生
-        students = User.query.join(StudentCourse).filter(
-            StudentCourse.course_id == course.id,
-            User.role == 'student'
-        ).all()
-        
-        # 获取该课程下的所有测验
-        course_quizzes = Quiz.query.filter_by(course_id=course.id, teacher_id=user.id).all()
-        
-        # 为每个学生获取该课程下的测验成绩
-        student_grades = []
-        for student in students:
-            student_course_quizzes = StudentQuiz.query.join(Quiz).filter(
-                StudentQuiz.student_id == student.id,
-                Quiz.course_id == course.id,
-                Quiz.teacher_id == user.id
-            ).all()
-            
-            if student_course_quizzes:
-                student_grades.append({
-                    'student': student,
-                    'quizzes': student_course_quizzes
-                })
-        
         course_grade_data[course.id] = {
             'course': course,
-            'quizzes': course_quizzes,
-            'student_grades': student_grades
+            'quizzes': course_quizzes[course.id],
+            'student_grades': list(student_grades_by_course[course.id].values())
         }
     
     return render_template('teacher_html/teacher_publish_grades.html', 
                            user=user, 
                            courses=courses, 
-                           course_grade_data=course_grade_data, 
-                           student_quizzes=student_quizzes)
+                           course_grade_data=course_grade_data)
 
 # 竞赛投递文件下载路由
 @app.route('/download_competition_file/<int:submission_id>')
@@ -5469,13 +6873,9 @@ def download_competition_file(submission_id):
 
 # 教师端-查看竞赛投递情况页面
 @app.route('/teacher_view_portfolios')
+@role_required('teacher')
 def teacher_view_portfolios():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'teacher':
-        flash('只有教师角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     
     # 获取教师的所有课程
     courses = Course.query.filter_by(teacher_id=user.id).all()
@@ -5503,13 +6903,9 @@ def teacher_view_portfolios():
 
 # 学生端-项目组聊天室
 @app.route('/project_group_chat/<int:group_id>')
+@role_required('student')
 def project_group_chat(group_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     # 模拟项目组数据
     group = {
         'id': group_id,
@@ -5525,13 +6921,9 @@ def project_group_chat(group_id):
 
 # 学生端-项目组任务管理
 @app.route('/project_group_tasks/<int:group_id>')
+@role_required('student')
 def project_group_tasks(group_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     # 模拟项目组数据
     group = {
         'id': group_id,
@@ -5541,13 +6933,9 @@ def project_group_tasks(group_id):
 
 # 学生端-项目组进度看板
 @app.route('/project_group_dashboard/<int:group_id>')
+@role_required('student')
 def project_group_dashboard(group_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
-    if user.role != 'student':
-        flash('只有学生角色可以访问此页面')
-        return redirect(url_for('dashboard'))
+    user = current_user()
     # 模拟项目组数据
     group = {
         'id': group_id,
@@ -5569,8 +6957,13 @@ def text_input():
         return redirect(url_for('login'))
     return render_template('text_input.html')
 
+create_app()
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Flask Server')
     parser.add_argument('--port', type=int, default=5001, help='Server port')
     args = parser.parse_args()
+    # 本地直接运行时顺便建表（不删除已有数据）；生产环境请单独执行 flask --app app init-db / migrate
+    with app.app_context():
+        init_database()
     app.run(debug=True, port=args.port, threaded=True)
\ No newline at end of file
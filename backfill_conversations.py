@@ -0,0 +1,15 @@
+import argparse
+
+from app import app, db, Conversation, rebuild_conversations
+
+# 根据已有的 Message 记录重建会话摘要表（Conversation / ConversationMember）
+parser = argparse.ArgumentParser(description='重建会话摘要表')
+parser.add_argument('--batch-size', type=int, default=5000, help='每批读取/写入的记录数')
+args = parser.parse_args()
+
+with app.app_context():
+    # 确保会话表已创建
+    db.create_all()
+    count = rebuild_conversations(batch_size=args.batch_size)
+    print(f"会话摘要重建完成：共 {count} 个会话")
+    print(f"Conversation 表记录数: {Conversation.query.count()}")
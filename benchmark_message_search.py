@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+消息全文检索压测脚本：
+造 --messages 条消息（约一半是 AI 助教问答，分属 --users 个用户，其余为单聊），建立 FTS5 索引后比较
+  - FAQ 搜索（tutor_faq_search）走全文索引 与 退回 LIKE '%关键词%' 的耗时；
+  - 单聊记录搜索（/api/messages/search）的耗时；
+并断言全文索引的 FAQ 搜索在 --budget-ms 毫秒内返回。
+
+用法：
+    python benchmark_message_search.py
+    python benchmark_message_search.py --messages 200000 --users 200
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+TOPICS = ['栈', '队列', '递归', '二叉树', '哈希表', '排序算法', '动态规划', '图的遍历', '链表', '指针',
+          '数据库索引', '事务', '进程和线程', '网络协议', '操作系统', '编译原理', '面向对象', '设计模式']
+TEMPLATES = ['请问{}是什么意思？', '{}和{}有什么区别', '能举个{}的例子吗', '{}的时间复杂度怎么算',
+             '为什么要用{}', '{}在实际项目中怎么用']
+KEYWORDS = ['栈', '二叉树', '时间复杂度', '动态规划 例子', 'python']
+
+
+def sentence(rng):
+    template = rng.choice(TEMPLATES)
+    return template.format(*(rng.choice(TOPICS) for _ in range(template.count('{}'))))
+
+
+def seed(db, user_ids, messages, rng):
+    """用原生 executemany 批量造消息，一半是助教问答，一半是单聊"""
+    raw = db.engine.raw_connection()
+    cursor = raw.cursor()
+    sql = ("INSERT INTO message (sender_id, receiver_id, content, is_read, created_at, session_id, message_type) "
+           "VALUES (?, ?, ?, ?, ?, ?, ?)")
+    start = datetime(2025, 1, 1)
+    batch = []
+    hot_user = user_ids[0]
+    for i in range(0, messages, 2):
+        # 第一个用户是"活跃学生"，约 10% 的消息是他发的
+        user_id = hot_user if rng.random() < 0.1 else rng.choice(user_ids)
+        created_at = start + timedelta(seconds=i)
+        if i % 4 == 0:
+            session_id = f'session-{user_id}-{i // 40}'
+            question = sentence(rng)
+            batch.append((user_id, None, question, 0, created_at, session_id, 'question'))
+            batch.append((user_id, user_id, f'关于“{question}”：{sentence(rng)}。{sentence(rng)}。Python 示例见课件。',
+                          0, created_at + timedelta(seconds=1), session_id, 'answer'))
+        else:
+            peer = rng.choice(user_ids)
+            batch.append((user_id, peer, sentence(rng), 1, created_at, None, None))
+            batch.append((peer, user_id, f'我也不太懂，{sentence(rng)}', 1, created_at + timedelta(seconds=1), None, None))
+        if len(batch) >= 50000:
+            cursor.executemany(sql, batch)
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+    raw.commit()
+    raw.close()
+
+
+def timed(func, *args, repeat=5):
+    """多次执行取中位数耗时（毫秒）"""
+    samples, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, sorted(samples)[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='消息全文检索压测')
+    parser.add_argument('--messages', type=int, default=2000000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--budget-ms', type=float, default=50.0, help='全文索引 FAQ 搜索的耗时上限（毫秒）')
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench_message_search.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+
+    from app import (app, db, User, tutor_faq_search, rebuild_tutor_sessions, rebuild_message_search_index,
+                     _message_search_ready)
+
+    rng = random.Random(42)
+    print(f"=== 造数据：{args.users} 个用户，{args.messages} 条消息 ===")
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(User), [
+            {'username': f'bench_search_{i}', 'password': 'x', 'role': 'student', 'student_id': f'BMS{i}'}
+            for i in range(args.users)])
+        db.session.commit()
+        user_ids = [user.id for user in User.query.filter(User.username.like('bench_search_%'))]
+        seed(db, user_ids, args.messages, rng)
+        rebuild_tutor_sessions(batch_size=50000)
+        start = time.perf_counter()
+        rebuild_message_search_index(batch_size=50000)
+        print(f"建立全文索引耗时 {time.perf_counter() - start:.1f}s，"
+              f"数据库大小 {os.path.getsize(db_path) / 1024 / 1024:.0f}MB")
+
+    failures = []
+    for label, user_id in (('活跃学生', user_ids[0]), ('普通学生', user_ids[-1])):
+        peer_id = user_ids[1]
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+        print(f"--- {label} ---")
+        print(f"{'关键词':<10}{'FTS5':>10}{'LIKE':>10}{'命中':>6}{'单聊搜索':>10}")
+        for keyword in KEYWORDS:
+            with app.app_context():
+                url = str(db.engine.url)
+                (hits, _), fts_ms = timed(tutor_faq_search, user_id, keyword)
+                _message_search_ready[url] = False
+                try:
+                    _, like_ms = timed(tutor_faq_search, user_id, keyword, repeat=1)
+                finally:
+                    _message_search_ready[url] = True
+            _, chat_ms = timed(client.get, f'/api/messages/search?with={peer_id}&keyword={keyword}')
+            print(f"{keyword:<10}{fts_ms:>8.1f}ms{like_ms:>8.1f}ms{len(hits):>6}{chat_ms:>8.1f}ms")
+            if fts_ms > args.budget_ms:
+                failures.append(f"{label} {keyword}: FAQ 搜索 {fts_ms:.1f}ms 超过 {args.budget_ms}ms")
+
+    assert not failures, '\n'.join(failures)
+    print(f"✓ 全文索引的 FAQ 搜索均在 {args.budget_ms:.0f}ms 内返回")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+/messages 页面压测脚本：
+造 5000 个用户、100 万条消息，统计页面渲染时的 SQL 查询次数和耗时，
+并断言查询次数是固定值，不随联系人数量、课程数量、消息数量增长。
+
+用法：
+    python benchmark_messages_page.py
+    python benchmark_messages_page.py --users 500 --messages 50000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# 每个页面允许的SQL查询次数（与数据规模无关）
+EXPECTED_QUERY_COUNTS = {
+    'inbox': 7,
+    'private_chat': 8,
+    'group_chat': 8,
+}
+
+STUDENTS_PER_COURSE = 200
+COURSES_PER_STUDENT = 5
+
+
+def seed(db, users, messages):
+    """用原生 executemany 批量造数据，返回 (学生ID列表, 课程ID列表)"""
+    raw = db.engine.raw_connection()
+    cursor = raw.cursor()
+    now = datetime(2025, 1, 1)
+
+    teacher_count = max(1, users // 100)
+    student_count = users - teacher_count
+    cursor.executemany(
+        "INSERT INTO user (username, password, role, student_id) VALUES (?, ?, ?, ?)",
+        [(f'bench_t{i}', 'x', 'teacher', f'BT{i}') for i in range(teacher_count)] +
+        [(f'bench_s{i}', 'x', 'student', f'BS{i}') for i in range(student_count)]
+    )
+    cursor.execute("SELECT id, role FROM user WHERE username LIKE 'bench_%'")
+    rows = cursor.fetchall()
+    teacher_ids = [r[0] for r in rows if r[1] == 'teacher']
+    student_ids = [r[0] for r in rows if r[1] == 'student']
+
+    course_count = max(1, student_count * COURSES_PER_STUDENT // STUDENTS_PER_COURSE)
+    cursor.executemany(
+        "INSERT INTO course (course_code, title, teacher_id, credit, created_at) VALUES (?, ?, ?, ?, ?)",
+        [(f'BENCH{i}', f'压测课程{i}', teacher_ids[i % len(teacher_ids)], 2.0, now) for i in range(course_count)]
+    )
+    cursor.execute("SELECT id FROM course WHERE course_code LIKE 'BENCH%'")
+    course_ids = [r[0] for r in cursor.fetchall()]
+
+    enrollments = []
+    for index, student_id in enumerate(student_ids):
+        for k in range(COURSES_PER_STUDENT):
+            enrollments.append((student_id, course_ids[(index + k * 7) % len(course_ids)], now))
+    cursor.executemany(
+        "INSERT INTO student_course (student_id, course_id, enrolled_at) VALUES (?, ?, ?)",
+        list({(s, c): (s, c, t) for s, c, t in enrollments}.values())
+    )
+
+    everyone = teacher_ids + student_ids
+    hot_user = student_ids[0]
+    batch = []
+    sql = ("INSERT INTO message (sender_id, receiver_id, course_id, content, is_read, created_at) "
+           "VALUES (?, ?, ?, ?, ?, ?)")
+    for i in range(messages):
+        created_at = now + timedelta(seconds=i)
+        roll = random.random()
+        if roll < 0.3:
+            batch.append((random.choice(everyone), None, random.choice(course_ids), f'群聊消息{i}', 0, created_at))
+        else:
+            sender = hot_user if roll < 0.32 else random.choice(everyone)
+            receiver = random.choice(everyone)
+            if receiver == sender:
+                receiver = everyone[(everyone.index(sender) + 1) % len(everyone)]
+            batch.append((sender, receiver, None, f'私聊消息{i}', 1, created_at))
+        if len(batch) >= 50000:
+            cursor.executemany(sql, batch)
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+    raw.commit()
+    raw.close()
+    return student_ids, course_ids
+
+
+def measure(client, counter, url):
+    counter['n'] = 0
+    start = time.perf_counter()
+    response = client.get(url)
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 200, f'{url} 返回 {response.status_code}'
+    return counter['n'], elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='/messages 页面查询次数压测')
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--messages', type=int, default=1000000)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench_messages.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+
+    from sqlalchemy import event
+    from app import app, db, rebuild_conversations
+
+    print(f"=== 造数据：{args.users} 用户，{args.messages} 条消息 ===")
+    start = time.perf_counter()
+    with app.app_context():
+        db.create_all()
+        student_ids, course_ids = seed(db, args.users, args.messages)
+        rebuild_conversations(batch_size=50000)
+        counter = {'n': 0}
+
+        def count_query(conn, cursor, statement, parameters, context, executemany):
+            counter['n'] += 1
+        event.listen(db.engine, 'before_cursor_execute', count_query)
+    print(f"造数据耗时: {time.perf_counter() - start:.1f}s")
+
+    # 分别用"消息很多"的学生和普通学生测试，查询次数必须一致
+    hot_user, quiet_user = student_ids[0], student_ids[-1]
+    failures = []
+    for label, user_id in (('活跃学生', hot_user), ('普通学生', quiet_user)):
+        with app.app_context():
+            # 打开自己所在班级的群聊，以及该班级里一位同学的单聊
+            own_course = db.session.execute(db.text(
+                "SELECT course_id FROM student_course WHERE student_id = :sid LIMIT 1"), {'sid': user_id}).scalar()
+            classmate = db.session.execute(db.text(
+                "SELECT student_id FROM student_course WHERE course_id = :cid AND student_id != :sid LIMIT 1"),
+                {'cid': own_course, 'sid': user_id}).scalar()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+        pages = {
+            'inbox': '/messages',
+            'private_chat': f'/messages?with={classmate}&type=private',
+            'group_chat': f'/messages?course={own_course}',
+        }
+        for page, url in pages.items():
+            queries, elapsed = measure(client, counter, url)
+            print(f"{label} {page:<13} 查询次数: {queries:>3}  耗时: {elapsed * 1000:8.1f}ms")
+            if queries != EXPECTED_QUERY_COUNTS[page]:
+                failures.append(f"{label} {page}: 期望 {EXPECTED_QUERY_COUNTS[page]} 次查询，实际 {queries} 次")
+
+    assert not failures, '\n'.join(failures)
+    print("✓ 查询次数固定，与数据规模无关")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite 并发写入压测脚本：
+N 个写线程同时向 StudentAnswer 插入答题记录（每条一个事务，与 /student/submit_answer 相同），
+并在每次写入前读一次答题记录，模拟真实请求中的读写交错。
+分别用 SQLite 默认设置（baseline）和 db_profile 中的生产配置（tuned）运行，输出吞吐量和锁冲突次数。
+
+用法：
+    python benchmark_sqlite_writes.py
+    python benchmark_sqlite_writes.py --threads 16 --inserts 500 --profile tuned
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine, select, insert, func
+from sqlalchemy.exc import OperationalError
+
+from db_profile import engine_options, apply_sqlite_pragmas
+
+
+def make_engine(db_path, profile):
+    uri = 'sqlite:///' + db_path
+    if profile == 'baseline':
+        # 与原来的配置一致：回滚日志模式、sqlite3 默认 5 秒锁等待、默认连接池
+        return create_engine(uri)
+    engine = create_engine(uri, **engine_options(uri))
+    apply_sqlite_pragmas(engine)
+    return engine
+
+
+def prepare(engine, db):
+    """建表；SQLite 默认不检查外键，答题记录直接挂在固定的测验记录和题目ID上"""
+    db.metadata.create_all(engine)
+    return 1, 1
+
+
+def run(profile, threads, inserts):
+    from app import db, StudentAnswer
+
+    db_path = os.path.join(tempfile.mkdtemp(), f'bench_writes_{profile}.db')
+    engine = make_engine(db_path, profile)
+    student_quiz_id, question_id = prepare(engine, db)
+    table = StudentAnswer.__table__
+
+    lock_errors = [0]
+    written = [0]
+    counter_lock = threading.Lock()
+
+    def writer(index):
+        for i in range(inserts):
+            try:
+                with engine.begin() as conn:
+                    conn.execute(select(func.count()).select_from(table).where(table.c.student_quiz_id == student_quiz_id))
+                    conn.execute(insert(table).values(
+                        student_quiz_id=student_quiz_id, question_id=question_id,
+                        student_answer=f'{index}-{i}', score=1.0, submit_time=datetime.utcnow()))
+                with counter_lock:
+                    written[0] += 1
+            except OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                with counter_lock:
+                    lock_errors[0] += 1
+
+    workers = [threading.Thread(target=writer, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    with engine.connect() as conn:
+        journal_mode = conn.exec_driver_sql('PRAGMA journal_mode').scalar()
+        stored = conn.execute(select(func.count()).select_from(table)).scalar()
+    engine.dispose()
+    assert stored == written[0], f'写入成功 {written[0]} 条，表中只有 {stored} 条'
+
+    print(f"{profile:<9} 日志模式: {journal_mode:<8} 线程: {threads:>3}  成功写入: {written[0]:>6}  "
+          f"锁冲突: {lock_errors[0]:>5}  耗时: {elapsed:6.2f}s  吞吐量: {written[0] / elapsed:8.1f} 条/秒")
+    return lock_errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite 并发写入压测')
+    parser.add_argument('--threads', type=int, default=8, help='写线程数')
+    parser.add_argument('--inserts', type=int, default=200, help='每个线程插入的记录数')
+    parser.add_argument('--profile', choices=['baseline', 'tuned', 'both'], default='both')
+    args = parser.parse_args()
+
+    # 导入 app 只是为了使用模型的表结构，不连接正式数据库
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'unused.db'))
+
+    profiles = ['baseline', 'tuned'] if args.profile == 'both' else [args.profile]
+    print(f"=== {args.threads} 个线程 × 每线程 {args.inserts} 条 StudentAnswer 插入 ===")
+    results = {profile: run(profile, args.threads, args.inserts) for profile in profiles}
+    if 'tuned' in results:
+        assert results['tuned'] == 0, f"生产配置下仍出现 {results['tuned']} 次锁冲突"
+        print("✓ 生产配置下没有锁冲突")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+幻灯片配音合成压测脚本：用 test_tts_pool.FakeTTSEngine 模拟 pyttsx3（初始化 FAKE_TTS_INIT 秒，
+每个字 FAKE_TTS_PER_CHAR 秒），为 --slides 页讲稿生成音频，比较
+  - 旧实现：逐页写临时脚本、启动新的解释器初始化引擎再合成（15 秒超时）；
+  - 新实现：TTSExecutor 用 --workers 个常驻工作进程并行合成（包含工作进程启动和引擎初始化）；
+的端到端耗时，并核对两种实现生成的音频一致。
+假引擎的耗时是等待而不是计算，单核机器上也能并行；真实的 pyttsx3 合成占用 CPU，加速比受 CPU 核数限制。
+
+用法：
+    python benchmark_tts.py
+    python benchmark_tts.py --slides 40 --workers 8 --min-speedup 4
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from tts_pool import TTSExecutor, clean_tts_text
+
+# 旧实现每页运行的脚本（与原来 generate_audio_with_timeout 相同的流程：新解释器 -> 初始化引擎 -> 合成）
+LEGACY_SCRIPT = '''
+import sys
+sys.path.insert(0, {root!r})
+from test_tts_pool import FakeTTSEngine
+engine = FakeTTSEngine()
+engine.synthesize({text!r}, {filename!r}, {rate!r})
+'''
+
+TOPICS = ['栈', '队列', '链表', '二叉树', '堆', '哈希表', '图的遍历', '最短路径', '排序', '动态规划']
+
+
+def make_scripts(slides):
+    """造讲稿：每页 40~100 个字"""
+    random.seed(slides)
+    scripts = []
+    for i in range(slides):
+        topic = TOPICS[i % len(TOPICS)]
+        sentence = f'这一页讲解{topic}的基本概念、常见操作和时间复杂度，并结合例题说明使用场景。'
+        scripts.append(f'第{i + 1}页，' + sentence * random.randint(1, 3))
+    return scripts
+
+
+def legacy_generate(scripts, folder, rate):
+    root = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for i, text in enumerate(scripts):
+        filename = os.path.join(folder, f'audio_{i + 1:02d}.wav')
+        script = os.path.join(folder, f'tts_{i + 1:02d}.py')
+        with open(script, 'w', encoding='utf-8') as f:
+            f.write(LEGACY_SCRIPT.format(root=root, text=clean_tts_text(text), filename=filename, rate=rate))
+        process = subprocess.run([sys.executable, script], capture_output=True, timeout=15)
+        os.unlink(script)
+        results.append(process.returncode == 0 and os.path.getsize(filename) > 1024)
+    return results
+
+
+def pooled_generate(scripts, folder, rate, workers):
+    executor = TTSExecutor('test_tts_pool:FakeTTSEngine', workers=workers, timeout=15)
+    try:
+        filenames = [os.path.join(folder, f'audio_{i + 1:02d}.wav') for i in range(len(scripts))]
+        return [success for success, _ in executor.map(list(zip(scripts, filenames)), rate=rate)]
+    finally:
+        executor.close()
+
+
+def audio_files(folder):
+    names = sorted(name for name in os.listdir(folder) if name.endswith('.wav'))
+    contents = []
+    for name in names:
+        with open(os.path.join(folder, name), 'rb') as f:
+            contents.append(f.read())
+    return names, contents
+
+
+def main():
+    parser = argparse.ArgumentParser(description='幻灯片配音合成压测')
+    parser.add_argument('--slides', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--init', type=float, default=0.3, help='假引擎初始化耗时（秒）')
+    parser.add_argument('--per-char', type=float, default=0.005, help='假引擎每个字的合成耗时（秒）')
+    parser.add_argument('--min-speedup', type=float, default=2.0, help='新实现至少要达到的加速比')
+    args = parser.parse_args()
+
+    os.environ['FAKE_TTS_INIT'] = str(args.init)
+    os.environ['FAKE_TTS_PER_CHAR'] = str(args.per_char)
+    scripts = make_scripts(args.slides)
+    print(f"=== {args.slides} 页讲稿，共 {sum(len(clean_tts_text(text)) for text in scripts)} 字，"
+          f"引擎初始化 {args.init}s，每字 {args.per_char}s ===")
+
+    legacy_folder, pooled_folder = tempfile.mkdtemp(), tempfile.mkdtemp()
+    start = time.perf_counter()
+    legacy = legacy_generate(scripts, legacy_folder, 150)
+    legacy_elapsed = time.perf_counter() - start
+    print(f"{'旧实现（逐页启动解释器）':<18}耗时: {legacy_elapsed:7.2f}s  成功 {sum(legacy)}/{len(legacy)} 页")
+
+    start = time.perf_counter()
+    pooled = pooled_generate(scripts, pooled_folder, 150, args.workers)
+    pooled_elapsed = time.perf_counter() - start
+    print(f"{f'新实现（{args.workers} 个常驻工作进程）':<18}耗时: {pooled_elapsed:7.2f}s  成功 {sum(pooled)}/{len(pooled)} 页")
+
+    speedup = legacy_elapsed / pooled_elapsed
+    print(f"加速比: {speedup:.1f}x")
+    assert all(legacy) and all(pooled), '有页面生成失败'
+    assert audio_files(legacy_folder) == audio_files(pooled_folder), '两种实现生成的音频不一致'
+    assert speedup >= args.min_speedup, f'加速比 {speedup:.1f}x 低于 {args.min_speedup}x'
+    print("✓ 并行合成结果与逐页合成一致")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI 助教历史对话 / FAQ 压测脚本：
+每个用户造 --messages 条助教消息（问答各一半，每个会话若干轮），比较
+  - 旧实现：历史列表每个会话再查两次、FAQ 把全部问题读进内存后每个问题再查两次；
+  - 新实现：历史列表只查 TutorSession 摘要表，FAQ 只查后台聚类好的 FaqCluster 表；
+的 SQL 查询次数和耗时，并核对历史列表结果一致（FAQ 改为全站问题聚类，结果与旧实现的单用户计数不再可比，只比较耗时），
+另外报告从头聚类全部提问的耗时。
+
+用法：
+    python benchmark_tutor_history.py
+    python benchmark_tutor_history.py --users 3 --messages 100000 --skip-legacy
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# 新实现允许的SQL查询次数（与消息数量无关）
+EXPECTED_QUERY_COUNTS = {
+    'history': 1,
+    'faq': 1,
+}
+
+QUESTION_POOL = 2000
+
+
+def seed(db, user_ids, messages):
+    """用原生 executemany 批量造助教问答，问题按幂律分布从题库中抽取"""
+    raw = db.engine.raw_connection()
+    cursor = raw.cursor()
+    sql = ("INSERT INTO message (sender_id, receiver_id, content, is_read, created_at, session_id, message_type) "
+           "VALUES (?, ?, ?, ?, ?, ?, ?)")
+    weights = [1 / (rank + 1) for rank in range(QUESTION_POOL)]
+    start = datetime(2025, 1, 1)
+    for user_id in user_ids:
+        questions = random.choices(range(QUESTION_POOL), weights, k=messages // 2)
+        batch = []
+        session_index, turns_left = 0, 0
+        for i, question in enumerate(questions):
+            if turns_left == 0:
+                session_index, turns_left = session_index + 1, random.randint(1, 8)
+            turns_left -= 1
+            session_id = f'session-{user_id}-{session_index}'
+            created_at = start + timedelta(seconds=2 * i)
+            batch.append((user_id, None, f'第{question}题应该怎么理解？', 0, created_at, session_id, 'question'))
+            batch.append((user_id, user_id, f'关于第{question}题的讲解（会话{session_index}）', 0,
+                          created_at + timedelta(seconds=1), session_id, 'answer'))
+            if len(batch) >= 50000:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+    raw.commit()
+    raw.close()
+
+
+def legacy_history(db, Message, user_id):
+    sessions = db.session.query(
+        Message.session_id, db.func.max(Message.created_at)
+    ).filter(
+        Message.sender_id == user_id, Message.message_type == 'question'
+    ).group_by(Message.session_id).order_by(db.func.max(Message.created_at).desc()).all()
+    history = []
+    for session_id, _ in sessions:
+        if not session_id:
+            continue
+        first_question = Message.query.filter_by(sender_id=user_id, session_id=session_id,
+                                                 message_type='question').order_by(Message.created_at).first()
+        first_answer = Message.query.filter_by(session_id=session_id,
+                                               message_type='answer').order_by(Message.created_at).first()
+        if first_question and first_answer:
+            history.append({'session_id': session_id, 'question': first_question.content,
+                            'answer': first_answer.content,
+                            'time': first_question.created_at.strftime('%Y-%m-%d %H:%M')})
+    return history
+
+
+def legacy_faq(db, Message, user_id):
+    frequency = {}
+    for question in Message.query.filter_by(sender_id=user_id, message_type='question'):
+        frequency[question.content] = frequency.get(question.content, 0) + 1
+    faq = []
+    for content, count in sorted(frequency.items(), key=lambda x: x[1], reverse=True)[:20]:
+        question = Message.query.filter_by(sender_id=user_id, message_type='question',
+                                           content=content).order_by(Message.created_at).first()
+        answer = Message.query.filter_by(sender_id=user_id, session_id=question.session_id,
+                                         message_type='answer').order_by(Message.created_at).first()
+        if answer:
+            faq.append({'question': content, 'answer': answer.content, 'frequency': count})
+    return faq
+
+
+def measure(counter, func, *args):
+    counter['n'] = 0
+    start = time.perf_counter()
+    result = func(*args)
+    return result, counter['n'], time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AI 助教历史对话 / FAQ 查询压测')
+    parser.add_argument('--users', type=int, default=3)
+    parser.add_argument('--messages', type=int, default=100000, help='每个用户的助教消息数（问答合计）')
+    parser.add_argument('--skip-legacy', action='store_true', help='不运行旧实现（数据量大时很慢）')
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench_tutor_history.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+
+    from sqlalchemy import event
+    from app import app, db, User, Message, tutor_history, tutor_faq, rebuild_tutor_sessions, rebuild_faq_clusters
+
+    print(f"=== 造数据：{args.users} 个用户，每人 {args.messages} 条助教消息 ===")
+    random.seed(42)
+    with app.app_context():
+        db.create_all()
+        users = [User(username=f'bench_tutor_{i}', password='x', role='student', student_id=f'BTH{i}')
+                 for i in range(args.users)]
+        db.session.add_all(users)
+        db.session.commit()
+        user_ids = [user.id for user in users]
+        seed(db, user_ids, args.messages)
+        start = time.perf_counter()
+        sessions = rebuild_tutor_sessions(batch_size=50000)
+        print(f"回填会话摘要 {sessions} 个会话，耗时 {time.perf_counter() - start:.1f}s")
+        start = time.perf_counter()
+        clusters = rebuild_faq_clusters()
+        print(f"聚类 {args.users * args.messages // 2} 个提问得到 {clusters} 个问题类，耗时 {time.perf_counter() - start:.1f}s")
+
+        counter = {'n': 0}
+        def count_query(conn, cursor, statement, parameters, context, executemany):
+            counter['n'] += 1
+        event.listen(db.engine, 'before_cursor_execute', count_query)
+
+    failures = []
+    user_id = user_ids[0]
+    with app.app_context():
+        history, history_queries, history_elapsed = measure(counter, tutor_history, user_id)
+        faq, faq_queries, faq_elapsed = measure(counter, tutor_faq, user_id)
+    print(f"新实现 history  查询次数: {history_queries:>6}  耗时: {history_elapsed * 1000:9.1f}ms  ({len(history)} 个会话)")
+    print(f"新实现 faq      查询次数: {faq_queries:>6}  耗时: {faq_elapsed * 1000:9.1f}ms")
+    for page, queries in (('history', history_queries), ('faq', faq_queries)):
+        if queries != EXPECTED_QUERY_COUNTS[page]:
+            failures.append(f"{page}: 期望 {EXPECTED_QUERY_COUNTS[page]} 次查询，实际 {queries} 次")
+
+    if not args.skip_legacy:
+        with app.app_context():
+            old_history, queries, elapsed = measure(counter, legacy_history, db, Message, user_id)
+            print(f"旧实现 history  查询次数: {queries:>6}  耗时: {elapsed * 1000:9.1f}ms")
+            _, queries, elapsed = measure(counter, legacy_faq, db, Message, user_id)
+            print(f"旧实现 faq      查询次数: {queries:>6}  耗时: {elapsed * 1000:9.1f}ms")
+        if history != old_history:
+            failures.append("history: 与旧实现结果不一致")
+
+    assert not failures, '\n'.join(failures)
+    print("✓ 查询次数固定，与消息数量无关")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI 助教 SSE 压测：启动一个本地的 OpenAI 兼容假上游（每个 token 间隔 --token-interval 秒），
+在子进程中启动被测服务，同时打开 N 个 /api/ai-tutor/chat 流（问题各不相同，不走缓存和合并），报告
+  - 首字节时间（TTFB）的 p50 / p99；
+  - 所有流都在进行时被测进程的内存增量 / N（每个流的内存）和线程数。
+
+  --server asgi  —— uvicorn api.main:app（异步接口，默认）
+  --server wsgi  —— Flask 自带的多线程服务器（每个流占一个线程，用于对比）
+
+用法: python benchmark_tutor_sse.py [--streams 60] [--server asgi|wsgi] [--tokens 50] [--token-interval 0.04]
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+
+# 添加项目根目录到Python路径
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(ROOT)
+
+import httpx
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def handle_upstream(reader, writer, tokens, interval):
+    """假上游：HTTP/1.1 长连接，按分块传输逐个发送 SSE 数据块"""
+    try:
+        while True:
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = 0
+            for line in head.decode('latin-1').split('\r\n'):
+                if line.lower().startswith('content-length:'):
+                    length = int(line.split(':', 1)[1])
+            await reader.readexactly(length)
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n')
+            for i in range(tokens):
+                await asyncio.sleep(interval)
+                chunk = {'id': 'chatcmpl-bench', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'bench',
+                         'choices': [{'index': 0, 'delta': {'content': f'第{i}个字'}, 'finish_reason': None}]}
+                data = f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'.encode('utf-8')
+                writer.write(b'%x\r\n%s\r\n' % (len(data), data))
+                await writer.drain()
+            data = b'data: [DONE]\n\n'
+            writer.write(b'%x\r\n%s\r\n0\r\n\r\n' % (len(data), data))
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def start_upstream(port, tokens, interval):
+    loop = asyncio.new_event_loop()
+    async def serve():
+        server = await asyncio.start_server(lambda r, w: handle_upstream(r, w, tokens, interval), '127.0.0.1', port,
+                                            backlog=1024)
+        async with server:
+            await server.serve_forever()
+    threading.Thread(target=loop.run_until_complete, args=(serve(),), daemon=True).start()
+
+
+def start_server(kind, port, env):
+    if kind == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'api.main:app', '--port', str(port), '--log-level', 'warning',
+                   '--backlog', '1024']
+    else:
+        command = [sys.executable, '-c',
+                   f'from app import app; app.run(port={port}, threaded=True)']
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('被测服务未能启动')
+
+
+def process_status(pid):
+    """被测进程的 (常驻内存 KB, 线程数)"""
+    values = {}
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            values[key] = value.split()
+    return int(values['VmRSS'][0]), int(values['Threads'][0])
+
+
+async def open_stream(client, url, question, first_byte_times, finished):
+    started = time.perf_counter()
+    async with client.stream('POST', url, json={'question': question}) as response:
+        first = True
+        body = b''
+        async for chunk in response.aiter_bytes():
+            if first:
+                first_byte_times.append(time.perf_counter() - started)
+                first = False
+            body += chunk
+    assert body.endswith(b'data: [DONE]\n\n'), body[-200:]
+    finished.append(1)
+
+
+async def run_streams(base_url, streams, pid):
+    url = base_url + '/api/ai-tutor/chat'
+    first_byte_times, finished = [], []
+    limits = httpx.Limits(max_connections=streams + 10, max_keepalive_connections=streams + 10)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        # 预热：建立上游连接、加载模块
+        await open_stream(client, url, '预热问题', [], [])
+        baseline_rss, baseline_threads = process_status(pid)
+
+        started = time.perf_counter()
+        tasks = [asyncio.ensure_future(open_stream(client, url, f'压测问题 {i} 号', first_byte_times, finished))
+                 for i in range(streams)]
+        # 所有流都收到首字节后、结束前采样内存和线程数
+        peak_rss, peak_threads = baseline_rss, baseline_threads
+        while len(finished) < streams:
+            rss, threads = process_status(pid)
+            peak_rss, peak_threads = max(peak_rss, rss), max(peak_threads, threads)
+            await asyncio.sleep(0.05)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+    return first_byte_times, elapsed, baseline_rss, peak_rss, baseline_threads, peak_threads
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AI 助教 SSE 压测')
+    parser.add_argument('--streams', type=int, default=60)
+    parser.add_argument('--server', choices=['asgi', 'wsgi'], default='asgi')
+    parser.add_argument('--tokens', type=int, default=50)
+    parser.add_argument('--token-interval', type=float, default=0.04)
+    args = parser.parse_args()
+
+    upstream_port, server_port = free_port(), free_port()
+    start_upstream(upstream_port, args.tokens, args.token_interval)
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ,
+               DATABASE_URL='sqlite:///' + os.path.join(workdir, 'benchmark.db'),
+               TUTOR_BASE_URL=f'http://127.0.0.1:{upstream_port}/v1',
+               TUTOR_MODEL='bench',
+               TUTOR_CACHE_PATH=os.path.join(workdir, 'tutor_cache.db'),
+               # 相似度不可能超过 1：关闭问答缓存，每个流都请求上游
+               TUTOR_CACHE_THRESHOLD='1.01',
+               LLM_MAX_CONNECTIONS=str(args.streams + 10),
+               LLM_MAX_KEEPALIVE=str(args.streams + 10))
+    process = start_server(args.server, server_port, env)
+    try:
+        first_byte_times, elapsed, baseline_rss, peak_rss, baseline_threads, peak_threads = asyncio.run(
+            run_streams(f'http://127.0.0.1:{server_port}', args.streams, process.pid))
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+    print(f"服务: {args.server}, 并发流: {args.streams}, 每个流 {args.tokens} 个 token × {args.token_interval * 1000:.0f}ms")
+    print(f"TTFB p50 {percentile(first_byte_times, 0.5) * 1000:.1f}ms, p99 {percentile(first_byte_times, 0.99) * 1000:.1f}ms, "
+          f"总耗时 {elapsed:.2f}s")
+    print(f"内存 {baseline_rss / 1024:.1f}MB -> {peak_rss / 1024:.1f}MB, "
+          f"每个流约 {(peak_rss - baseline_rss) / args.streams:.0f}KB; 线程 {baseline_threads} -> {peak_threads}")
+
+
+if __name__ == '__main__':
+    main()
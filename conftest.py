@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+pytest 公共配置：每个测试模块使用一个新的空临时数据库（见 database 夹具），不影响 instance 下的正式数据，
+模块之间的数据互不影响；根目录下手动运行的调试脚本不作为测试收集。
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# 必须在测试模块导入 app 之前设置。导入 app 时先绑定到临时数据库，各模块开始前再由 database 夹具改绑到自己的数据库；
+# 评分和助教问答缓存也放在临时目录
+TEST_DIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(TEST_DIR, 'test.db')
+os.environ['GRADING_CACHE_PATH'] = os.path.join(TEST_DIR, 'grading_cache.db')
+os.environ['TUTOR_CACHE_PATH'] = os.path.join(TEST_DIR, 'tutor_cache.db')
+# 关闭观看进度的定时写库和 FAQ 的定时聚类，由测试手动 flush / run_once；大模型请求失败后快速重试
+os.environ['PROGRESS_FLUSH_INTERVAL'] = '3600'
+os.environ['FAQ_BUILD_INTERVAL'] = '3600'
+os.environ['LLM_RETRY_BASE_DELAY'] = '0.05'
+
+# 手动运行的调试脚本（需要 moviepy、pyttsx3、PowerPoint、正在运行的服务器或正式数据库）不作为测试收集
+collect_ignore = [
+    'audio_test.py', 'basic_test.py', 'comprehensive_ppt_test.py', 'comprehensive_test.py',
+    'diagnostic_test.py', 'direct_core_test.py', 'direct_test.py', 'direct_video_test.py',
+    'final_verification_test.py', 'integration_audio_test.py', 'minimal_audio_test.py', 'minimal_test.py',
+    'ppt_export_test.py', 'ppt_integration_test.py', 'simple_audio_test.py', 'simple_call_test.py',
+    'simple_direct_test.py', 'simple_ppt_test.py', 'simple_synthesis_test.py', 'simple_test.py',
+    'simple_tts_test.py', 'simple_write_test.py', 'super_simple_test.py', 'test_ai_fix.py',
+    'test_ai_grading.py', 'test_ai_tutor_api.py', 'test_api.py', 'test_api_content_type.py', 'test_api_key.py',
+    'test_api_key_verification.py', 'test_assignment_download.py', 'test_audio.py', 'test_audio_basic.py',
+    'test_audio_fix.py', 'test_audio_generation.py', 'test_audio_simple.py', 'test_audio_sync.py',
+    'test_audio_video.py', 'test_audio_video_complete.py', 'test_audio_video_debug.py',
+    'test_browser_courses.py', 'test_content_type_fix.py', 'test_conversion.py', 'test_convert_ppt.py',
+    'test_courses_route.py', 'test_download_browser.py', 'test_download_fix.py', 'test_download_request.py',
+    'test_encoding.py', 'test_env.py', 'test_export.py', 'test_fixes.py', 'test_flask.py',
+    'test_full_convert.py', 'test_full_ppt2video.py', 'test_generate_audio.py', 'test_generate_audio_fix.py',
+    'test_grade_report_api.py', 'test_integration.py', 'test_issue.py', 'test_kg_generator.py',
+    'test_login_and_courses.py', 'test_ppt2video.py', 'test_ppt2video_core.py', 'test_ppt_conversion.py',
+    'test_python.py', 'test_python_basic.py', 'test_quiz_submission.py', 'test_range_request.py',
+    'test_report_compare.py', 'test_report_compare_comprehensive.py', 'test_requests_courses.py',
+    'test_send_from_directory_fix.py', 'test_server_access.py', 'test_simple_download.py',
+    'test_simple_server.py', 'test_specific_fixes.py', 'test_sse.py', 'test_sse_blender.py',
+    'test_student_quiz_fix.py', 'test_suggestions.py', 'test_unit_update.py', 'test_user_ppt.py',
+    'test_video_access.py', 'test_video_conversion.py', 'test_video_synthesis.py', 'test_with_content_type.py',
+    'ultra_minimal_test.py', 'ultra_simple_test.py'
+]
+# test*.txt 是测试报告和上传的样例文件，不是 doctest
+collect_ignore_glob = ['*.txt']
+
+
+def bind_database(database_uri):
+    """
+    把 app 的数据库换成 database_uri。应用处理过请求后不能再调用 db.init_app，这里直接替换
+    Flask-SQLAlchemy 为应用保存的引擎（db.engines，默认数据库的键为 None）。换库前把缓冲的观看进度
+    写进原来的数据库，换库后清空按数据库保存在内存里的 FAQ 索引
+    """
+    from sqlalchemy import create_engine
+    from app import app, db, watch_progress_buffer, faq_index
+    from db_profile import engine_options, apply_sqlite_pragmas
+    watch_progress_buffer.flush()
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database_uri)
+    with app.app_context():
+        db.session.remove()
+        engine = create_engine(database_uri, **app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+        apply_sqlite_pragmas(engine)
+        db.engines[None].dispose()
+        db.engines[None] = engine
+    faq_index.reset()
+
+
+@pytest.fixture(scope='module', autouse=True)
+def database(tmp_path_factory):
+    """改绑到新的空数据库并建表（导入 app 不会建表），返回数据库文件路径"""
+    from app import app, db
+    path = str(tmp_path_factory.mktemp('db') / 'test.db')
+    bind_database('sqlite:///' + path)
+    with app.app_context():
+        db.create_all()
+    return path
+
+
+@pytest.fixture
+def switch_database():
+    """返回 bind_database，测试用它改绑到自己准备的数据库（例如旧版本的数据库）"""
+    return bind_database
+
+
+@pytest.fixture
+def fake_tutor_service(monkeypatch):
+    """
+    AI 助教改用 test_llm_clients 中的本地流式假服务。app 和 api.tutor 在导入时读取 TUTOR_* 配置
+    （可能已被其他测试模块导入），这里直接替换，测试结束后恢复
+    """
+    import app
+    import test_llm_clients
+    for module in (app, sys.modules.get('api.tutor')):
+        if module is not None:
+            monkeypatch.setattr(module, 'TUTOR_BASE_URL', test_llm_clients.FAKE_BASE_URL)
+            monkeypatch.setattr(module, 'TUTOR_MODEL', 'fake-tutor')
+    return test_llm_clients.FAKE_BASE_URL
+
+
+@pytest.fixture
+def create_user():
+    """返回创建用户的函数 create_user(username, student_id, role='student')，返回新用户的 id"""
+    from app import app, db, User
+
+    def create(username, student_id, role='student'):
+        with app.app_context():
+            user = User(username=username, password='x', role=role, student_id=student_id)
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+    return create
+
+
+@pytest.fixture
+def login():
+    """返回 login(user_id)：得到一个会话中已登录为该用户的测试客户端"""
+    from app import app
+
+    def client_for(user_id):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+        return client
+    return client_for
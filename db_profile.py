@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+数据库引擎配置
+
+SQLite 文件库（默认 instance/user_management.db）：
+- 每个连接建立时设置 WAL 日志、synchronous=NORMAL、busy_timeout、mmap_size、cache_size，
+  读写不再互相阻塞，写锁冲突时等待而不是立刻报 "database is locked"
+- 连接池按线程化服务器的并发量设置大小
+
+DATABASE_URL 指向 MySQL / PostgreSQL 等服务器数据库时不设置 PRAGMA，只使用连接池参数，
+并开启 pool_pre_ping / pool_recycle 以应对服务器主动断开的空闲连接。
+
+所有参数都可以用环境变量覆盖：
+    DB_POOL_SIZE（默认 10）、DB_MAX_OVERFLOW（默认 20）、DB_POOL_TIMEOUT（秒，默认 30）、
+    SQLITE_BUSY_TIMEOUT_MS（默认 5000）、SQLITE_SYNCHRONOUS（默认 NORMAL）、
+    SQLITE_MMAP_SIZE（字节，默认 256MB）、SQLITE_CACHE_SIZE（负数表示 KB，默认 -65536 即 64MB）
+"""
+
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def sqlite_pragmas():
+    """每个 SQLite 连接建立时执行的 PRAGMA"""
+    return [
+        ('journal_mode', 'WAL'),
+        ('synchronous', os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')),
+        ('busy_timeout', _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        ('mmap_size', _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        ('cache_size', _env_int('SQLITE_CACHE_SIZE', -65536)),
+    ]
+
+
+def is_sqlite_file(database_uri):
+    url = make_url(database_uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def engine_options(database_uri):
+    """根据数据库地址返回 SQLALCHEMY_ENGINE_OPTIONS"""
+    url = make_url(database_uri)
+    pool_options = {
+        'pool_size': _env_int('DB_POOL_SIZE', 10),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+    }
+    if url.get_backend_name() == 'sqlite':
+        if not is_sqlite_file(database_uri):
+            # 内存库由 Flask-SQLAlchemy 使用单连接池，不需要额外设置
+            return {}
+        # sqlite3 模块自身的锁等待（秒）与 busy_timeout 保持一致；连接会在线程之间复用
+        pool_options['connect_args'] = {
+            'timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000,
+            'check_same_thread': False,
+        }
+        return pool_options
+    pool_options['pool_pre_ping'] = True
+    pool_options['pool_recycle'] = _env_int('DB_POOL_RECYCLE', 1800)
+    return pool_options
+
+
+def apply_sqlite_pragmas(engine, pragmas=None):
+    """为 SQLite 引擎注册连接事件，新连接建立时设置 PRAGMA；其他数据库直接返回"""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = sqlite_pragmas() if pragmas is None else pragmas
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+全站 / 课程常见问题（FAQ）的后台聚类
+
+原来的 /api/ai-tutor/faq 每次请求都把当前用户的全部问题读出来按原文计数。这里由后台线程增量构建：
+- 问题按 tutor_cache.normalize_question 规范化（保留数字和运算符），规范化后相同的算同一种问法（FaqVariant）；
+- 新的问法与同一范围（全站 site，或学生所在课程 course:<课程ID>）内已有问法比较相似度，
+  向量化方式与助教问答缓存相同（字符 1~2-gram 哈希 + TF-IDF 余弦，只用 NumPy），
+  不低于阈值（且问题里的数字和运算符相同）就并入最相似问法所在的类，否则新建一个类（FaqCluster）；
+- 每个类的代表问题是被问次数最多的问法，回答取该问法最近一次正常的回答，频率是类内全部提问次数；
+- FaqBuilder 的线程在有新提问时（notify）等 interval 秒，再处理上次之后新增的全部提问；
+  读 FAQ 只查 FaqCluster 表，进程重启后第一次读 FAQ 时也会 notify，接上没处理完的提问。
+
+FaqIndex 保存全部问法的稀疏向量（内存中），进程启动后第一次构建时从数据库载入；
+数据库读写由 app.py 的 build_faq_clusters 完成，这里只有相似度计算和线程调度。
+"""
+
+import time
+import zlib
+import threading
+
+import numpy as np
+
+from tutor_cache import question_features, symbol_key
+
+
+def number_key(normalized):
+    """
+    问题里出现的数字和运算符（题号、章节号、2+3 与 2*3 等），
+    不同的问题即使其余文字相同也不合并
+    """
+    return zlib.crc32(symbol_key(normalized).encode('utf-8'))
+
+
+class _ScopeVectors:
+    """一个范围内全部问法的稀疏向量，按行追加到容量翻倍的数组中（COO 格式：行号、下标、权重）"""
+
+    def __init__(self, dim):
+        self.rows = 0
+        self.size = 0
+        self.clusters = []
+        self.numbers = np.zeros(64, dtype=np.int64)
+        self.row_ids = np.zeros(64, dtype=np.int64)
+        self.indexes = np.zeros(64, dtype=np.int64)
+        self.weights = np.zeros(64)
+        self.df = np.zeros(dim)
+
+    def append(self, features, numbers, cluster_id):
+        if self.rows == len(self.numbers):
+            self.numbers = np.concatenate([self.numbers, np.zeros(self.rows, dtype=np.int64)])
+        self.numbers[self.rows] = numbers
+        count = len(features)
+        if self.size + count > len(self.indexes):
+            capacity = max(2 * len(self.indexes), self.size + count)
+            for name in ('row_ids', 'indexes', 'weights'):
+                grown = np.zeros(capacity, dtype=getattr(self, name).dtype)
+                grown[:self.size] = getattr(self, name)[:self.size]
+                setattr(self, name, grown)
+        end = self.size + count
+        self.row_ids[self.size:end] = self.rows
+        self.indexes[self.size:end] = np.fromiter(features.keys(), dtype=np.int64, count=count)
+        self.weights[self.size:end] = np.fromiter(features.values(), dtype=np.float64, count=count)
+        self.df[self.indexes[self.size:end]] += 1
+        self.size = end
+        self.rows += 1
+        self.clusters.append(cluster_id)
+
+
+class FaqIndex:
+    """全部问法的向量索引：按 (范围, 规范化问题) 精确查找，或在同一范围内找最相似的问法"""
+
+    def __init__(self, threshold=0.7, dim=1 << 16):
+        self.threshold = threshold
+        self.dim = dim
+        self.reset()
+
+    def reset(self):
+        """清空索引（数据库回滚或重建后调用，下次构建时重新载入）"""
+        self.last_variant_id = 0
+        self._variants = {}  # (范围, 规范化问题) -> (问法ID, 类ID)
+        self._scopes = {}  # 范围 -> _ScopeVectors
+
+    def __len__(self):
+        return len(self._variants)
+
+    def get(self, scope, normalized):
+        """已有问法的 (问法ID, 类ID)，没有时返回 None"""
+        return self._variants.get((scope, normalized))
+
+    def add(self, variant_id, scope, normalized, cluster_id):
+        self.last_variant_id = max(self.last_variant_id, variant_id)
+        if (scope, normalized) in self._variants:
+            return
+        self._variants[(scope, normalized)] = (variant_id, cluster_id)
+        vectors = self._scopes.get(scope)
+        if vectors is None:
+            vectors = self._scopes[scope] = _ScopeVectors(self.dim)
+        vectors.append(question_features(normalized, self.dim), number_key(normalized), cluster_id)
+
+    def nearest(self, scope, normalized):
+        """同一范围内最相似且相似度不低于阈值的问法所在的 (类ID, 相似度)，没有时返回 None"""
+        vectors = self._scopes.get(scope)
+        if vectors is None or not normalized:
+            return None
+        # IDF 按范围内的问法计算，模板化的字词（"什么是"、"怎么"）权重低
+        features = question_features(normalized, self.dim)
+        query_indexes = np.fromiter(features.keys(), dtype=np.int64, count=len(features))
+        idf = np.log((1 + vectors.rows) / (1 + vectors.df[query_indexes])) + 1
+        query = np.zeros(self.dim)
+        query[query_indexes] = np.fromiter(features.values(), dtype=np.float64, count=len(features)) * idf
+        row_ids, indexes = vectors.row_ids[:vectors.size], vectors.indexes[:vectors.size]
+        row_weights = vectors.weights[:vectors.size] * (np.log((1 + vectors.rows) / (1 + vectors.df[indexes])) + 1)
+        scores = np.bincount(row_ids, weights=row_weights * query[indexes], minlength=vectors.rows)
+        norms = np.sqrt(np.bincount(row_ids, weights=row_weights ** 2, minlength=vectors.rows)) * np.linalg.norm(query)
+        similarity = np.divide(scores, norms, out=np.zeros_like(scores), where=norms > 0)
+        similarity[vectors.numbers[:vectors.rows] != number_key(normalized)] = -1
+        best = int(np.argmax(similarity))
+        if similarity[best] < self.threshold:
+            return None
+        return vectors.clusters[best], round(float(similarity[best]), 4)
+
+
+class FaqBuilder:
+    def __init__(self, build, interval=30.0):
+        """
+        build(): 处理一批新增的提问，返回处理的提问数（返回 0 表示已处理完）
+        interval: 有新提问时两次构建之间至少间隔的秒数
+        """
+        self.build = build
+        self.interval = interval
+        self.runs = 0
+        self.questions = 0
+        self.last_run_at = None
+        self.last_error = None
+        self._dirty = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()  # 同一时间只有一个线程在构建
+        self._thread = None
+
+    def notify(self):
+        """有新的提问保存后调用，不访问数据库"""
+        self._dirty.set()
+        self._ensure_thread()
+
+    def run_once(self):
+        """处理完目前所有新增的提问，返回处理的提问数（后台线程、测试和脚本调用）"""
+        with self._build_lock:
+            total = 0
+            while True:
+                count = self.build()
+                total += count
+                if not count:
+                    break
+            self.runs += 1
+            self.questions += total
+            self.last_run_at = time.time()
+            return total
+
+    def stop(self):
+        self._stopped.set()
+        self._dirty.set()
+
+    def stats(self):
+        return {
+            'runs': self.runs,
+            'questions': self.questions,
+            'last_run_at': self.last_run_at,
+            'last_error': self.last_error,
+            'pending': self._dirty.is_set(),
+        }
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name='faq-builder', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._dirty.wait()
+            # 攒一段时间的新提问再一起处理
+            self._stopped.wait(self.interval)
+            if self._stopped.is_set():
+                return
+            self._dirty.clear()
+            try:
+                self.run_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"FAQ 聚类构建失败，稍后重试: {e}")
+                self._dirty.set()
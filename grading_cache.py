@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+AI 报告评分结果缓存（按内容寻址）
+
+学生经常反复上传同一份报告，每次都调用一次大模型（temperature=0.7，分数还会浮动）。
+缓存键是 (规范化后的报告文本, 主题, 提示词版本, 模型名) 的 SHA-256：
+同一份内容换个文件名、多几个空格或换行都命中同一条缓存；改了提示词或换了模型则自然失效。
+
+结果存在独立的 SQLite 文件里，多进程共享、重启不丢：
+- 超过 ttl_seconds 的条目视为过期，读到时删除；
+- 条目数超过 max_entries 时按最近使用时间淘汰最久未用的（LRU）；
+- hits / misses 计数本进程的命中情况，stats() 同时返回库中条目数。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import contextlib
+import unicodedata
+
+
+def normalize_report_text(text):
+    """全角/半角统一、去掉首尾空白、连续空白压成一个空格"""
+    text = unicodedata.normalize('NFKC', text or '')
+    return ' '.join(text.split())
+
+
+def grading_cache_key(text, topic, prompt_version, model):
+    payload = json.dumps([normalize_report_text(text), normalize_report_text(topic), prompt_version, model],
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class GradingCache:
+    def __init__(self, db_path, ttl_seconds=30 * 24 * 3600, max_entries=10000):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS grading_cache ("
+                "cache_key TEXT PRIMARY KEY, result TEXT NOT NULL, "
+                "created_at REAL NOT NULL, last_used_at REAL NOT NULL, hit_count INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_grading_cache_last_used ON grading_cache (last_used_at)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """打开一个连接：正常退出时提交、出错时回滚，最后都关闭连接"""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        """命中返回评分结果（dict），未命中或已过期返回 None"""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT result, created_at FROM grading_cache WHERE cache_key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM grading_cache WHERE cache_key = ?", (key,))
+                row = None
+            if row is not None:
+                conn.execute(
+                    "UPDATE grading_cache SET last_used_at = ?, hit_count = hit_count + 1 WHERE cache_key = ?",
+                    (now, key)
+                )
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, key, result):
+        """保存评分结果，超出容量时淘汰最久未使用的条目"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO grading_cache (cache_key, result, created_at, last_used_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(result, ensure_ascii=False), now, now)
+            )
+            evicted = conn.execute("DELETE FROM grading_cache WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+            overflow = conn.execute("SELECT COUNT(*) FROM grading_cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                evicted += conn.execute(
+                    "DELETE FROM grading_cache WHERE cache_key IN ("
+                    "SELECT cache_key FROM grading_cache ORDER BY last_used_at LIMIT ?)",
+                    (overflow,)
+                ).rowcount
+        if evicted:
+            with self._lock:
+                self.evictions += evicted
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM grading_cache")
+
+    def stats(self):
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM grading_cache").fetchone()[0]
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': entries,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_grading_cache():
+    """
+    获取当前进程的评分缓存，第一次调用时创建。环境变量：
+    GRADING_CACHE_PATH（默认 instance/grading_cache.db）、GRADING_CACHE_TTL（秒，默认30天）、
+    GRADING_CACHE_MAX_ENTRIES（默认10000）
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            db_path = os.environ.get(
+                'GRADING_CACHE_PATH',
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'grading_cache.db')
+            )
+            _cache = GradingCache(
+                db_path,
+                ttl_seconds=float(os.environ.get('GRADING_CACHE_TTL', 30 * 24 * 3600)),
+                max_entries=int(os.environ.get('GRADING_CACHE_MAX_ENTRIES', 10000))
+            )
+        return _cache
+
+
+def set_grading_cache(cache):
+    """替换当前进程的评分缓存（测试使用；传入 None 时下次按环境变量重新创建）"""
+    global _cache
+    with _cache_lock:
+        _cache = cache
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+AI 报告批改任务队列
+
+上传报告的请求只在 GradingJob 表里登记一条任务（status=queued）就返回任务ID，
+读取文件、调用大模型评分都交给后台工作线程，前端轮询任务状态取结果，不占用 Web 请求线程。
+
+- 工作线程数 workers 决定同时处理的任务数，排队的任务只占一个任务ID，不占线程；
+- 任务状态存在数据库里，第一次启动工作线程时调用 recover() 把上次没做完的任务重新入队；
+- 多进程部署时各进程的内存队列互不相通，run_job 需要先用条件 UPDATE 抢占任务，保证同一任务只执行一次。
+
+批改本身是等待大模型响应的 I/O，用线程即可；发往大模型的并发数由调用方的信号量另行限制。
+"""
+
+import queue
+import threading
+
+
+class GradingQueue:
+    def __init__(self, run_job, workers=4, recover=None):
+        """
+        run_job(job_id): 执行一条任务，异常只记录日志，不会让工作线程退出
+        recover(): 返回需要重新入队的任务ID列表，工作线程启动时调用一次
+        """
+        self.run_job = run_job
+        self.workers = workers
+        self.recover = recover
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, job_id):
+        """任务入队，立即返回"""
+        self.start()
+        self._queue.put(job_id)
+
+    def queued_count(self):
+        """本进程中等待工作线程处理的任务数"""
+        return self._queue.qsize()
+
+    def start(self):
+        """启动工作线程（只启动一次），并把 recover() 返回的任务重新入队"""
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            if self.recover is not None:
+                try:
+                    for job_id in self.recover():
+                        self._queue.put(job_id)
+                except Exception as e:
+                    print(f"恢复未完成的批改任务失败: {e}")
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'grading-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def join(self):
+        """等待已入队的任务全部处理完（测试和脚本使用）"""
+        self._queue.join()
+
+    def stop(self, timeout=None):
+        """处理完已入队的任务后停止工作线程"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+            for _ in threads:
+                self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                if job_id is None:
+                    return
+                self.run_job(job_id)
+            except Exception as e:
+                print(f"批改任务 {job_id} 执行失败: {e}")
+            finally:
+                self._queue.task_done()
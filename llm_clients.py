@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""
+共享的大模型（OpenAI 兼容接口）客户端
+
+ai_tutor_chat 和 grade_report 原来每个请求都新建一个 OpenAI 客户端，也就是新建一个 httpx 连接池，
+每次都要重新做 TCP/TLS 握手。这里按 (base_url, api_key, 超时配置) 缓存客户端，整个进程共用：
+- httpx 连接池保持长连接（keep-alive），最大连接数 LLM_MAX_CONNECTIONS、空闲长连接数 LLM_MAX_KEEPALIVE；
+  一个客户端只连一个 base_url，这两个上限也就是对该主机的连接数上限；流式响应读到 [DONE] 后把结束标记读完，
+  连接才能放回连接池（见 _DrainingStream）；
+- 超时按用途分组（TIMEOUT_PROFILES），流式答疑的读超时是两个 token 之间的最长间隔，评分要等完整结果；
+- SDK 自带的重试关闭，由 create_with_retry 统一重试：连接失败、超时、429 和 5xx 按指数退避，
+  等待时间加全量随机抖动（full jitter），避免大量请求同时重试；流式请求只在收到第一个数据块前重试；
+- metrics 记录首 token 时间（TTFT）、连接池等待时间、请求耗时和重试次数，snapshot() 给出分位数。
+
+异步服务（api/tutor.py）用 get_async_llm_client / acreate_with_retry，配置和重试规则相同；
+异步客户端绑定在创建它的事件循环上，所以按事件循环分别缓存。
+"""
+
+import os
+import time
+import asyncio
+import random
+import threading
+import collections
+
+import httpx
+
+# 超时配置：名称 -> (读超时的环境变量, 默认秒数)
+TIMEOUT_PROFILES = {
+    'chat': ('LLM_CHAT_TIMEOUT', 60),
+    'grading': ('GRADING_TIMEOUT', 120),
+}
+
+# 建立连接、等待连接池空闲连接的超时（秒）
+CONNECT_TIMEOUT = 10
+POOL_TIMEOUT = 30
+
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMMetrics:
+    """各项耗时保留最近 max_samples 个样本，snapshot() 计算次数、平均值和分位数（毫秒）"""
+
+    def __init__(self, max_samples=1000):
+        self.max_samples = max_samples
+        self._samples = collections.defaultdict(lambda: collections.deque(maxlen=self.max_samples))
+        self._counters = collections.Counter()
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            self._samples[name].append(seconds)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def snapshot(self):
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items()}
+            counters = dict(self._counters)
+        result = {'counters': counters}
+        for name, values in samples.items():
+            if not values:
+                continue
+            def percentile(p):
+                return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 2)
+            result[name] = {
+                'count': len(values),
+                'avg_ms': round(sum(values) / len(values) * 1000, 2),
+                'p50_ms': percentile(0.5),
+                'p95_ms': percentile(0.95),
+                'max_ms': round(values[-1] * 1000, 2),
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counters.clear()
+
+
+metrics = LLMMetrics()
+
+
+def _trace_pool_wait(request):
+    """httpx 请求钩子：从发出请求到连接池交出连接（开始建连或开始写请求头）的时间记为连接池等待"""
+    started = time.perf_counter()
+    recorded = []
+
+    def trace(event_name, info):
+        if not recorded and event_name.endswith('.started'):
+            recorded.append(True)
+            metrics.observe('pool_wait', time.perf_counter() - started)
+            if event_name.startswith('connection.connect_tcp'):
+                metrics.increment('connections_opened')
+
+    request.extensions['trace'] = trace
+
+
+async def _atrace_pool_wait(request):
+    """异步客户端的请求钩子，同 _trace_pool_wait（异步接口的 trace 回调必须是协程函数）"""
+    started = time.perf_counter()
+    recorded = []
+
+    async def trace(event_name, info):
+        if not recorded and event_name.endswith('.started'):
+            recorded.append(True)
+            metrics.observe('pool_wait', time.perf_counter() - started)
+            if event_name.startswith('connection.connect_tcp'):
+                metrics.increment('connections_opened')
+
+    request.extensions['trace'] = trace
+
+
+class _DrainingStream(httpx.SyncByteStream):
+    """
+    SDK 读到 SSE 的 data: [DONE] 就关闭响应，这时响应体的结束标记往往还没读，httpcore 只能断开这条连接。
+    已经收到 [DONE] 时先把剩下的字节读完再关闭，连接就能放回连接池；没收到时（调用方中途放弃）直接关闭
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._tail = b''
+
+    def __iter__(self):
+        for chunk in self._stream:
+            self._tail = (self._tail + chunk)[-32:]
+            yield chunk
+
+    def close(self):
+        try:
+            if b'[DONE]' in self._tail:
+                for _ in self._stream:
+                    pass
+        finally:
+            self._stream.close()
+
+
+class _KeepAliveTransport(httpx.HTTPTransport):
+    def handle_request(self, request):
+        response = super().handle_request(request)
+        response.stream = _DrainingStream(response.stream)
+        return response
+
+
+def _client_settings(profile):
+    """超时配置 profile 对应的 (httpx.Timeout, httpx.Limits)"""
+    env_name, default_read = TIMEOUT_PROFILES[profile]
+    timeout = httpx.Timeout(float(os.environ.get(env_name, default_read)), connect=CONNECT_TIMEOUT, pool=POOL_TIMEOUT)
+    limits = httpx.Limits(
+        max_connections=int(os.environ.get('LLM_MAX_CONNECTIONS', 20)),
+        max_keepalive_connections=int(os.environ.get('LLM_MAX_KEEPALIVE', 10)),
+        keepalive_expiry=float(os.environ.get('LLM_KEEPALIVE_EXPIRY', 60)),
+    )
+    return timeout, limits
+
+
+def _build_client(base_url, api_key, profile):
+    from openai import OpenAI
+    timeout, limits = _client_settings(profile)
+    http_client = httpx.Client(
+        timeout=timeout,
+        transport=_KeepAliveTransport(limits=limits),
+        event_hooks={'request': [_trace_pool_wait]},
+    )
+    return OpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0, http_client=http_client)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_llm_client(base_url, api_key, profile='chat'):
+    """取 (base_url, api_key, profile) 对应的共享客户端，第一次使用时创建"""
+    key = (base_url, api_key, profile)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = _build_client(base_url, api_key, profile)
+    return client
+
+
+def close_llm_clients():
+    """关闭所有共享客户端（测试或进程退出前调用）"""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+def _build_async_client(base_url, api_key, profile):
+    from openai import AsyncOpenAI
+    timeout, limits = _client_settings(profile)
+    http_client = httpx.AsyncClient(timeout=timeout, limits=limits, event_hooks={'request': [_atrace_pool_wait]})
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0, http_client=http_client)
+
+
+_async_clients = {}
+
+
+def get_async_llm_client(base_url, api_key, profile='chat'):
+    """在事件循环中调用：取当前事件循环上 (base_url, api_key, profile) 对应的共享异步客户端"""
+    key = (asyncio.get_running_loop(), base_url, api_key, profile)
+    client = _async_clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _async_clients.get(key)
+            if client is None:
+                client = _async_clients[key] = _build_async_client(base_url, api_key, profile)
+    return client
+
+
+async def aclose_llm_clients():
+    """关闭当前事件循环上的共享异步客户端（ASGI 应用关闭时调用）"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        keys = [key for key in _async_clients if key[0] is loop]
+        clients = [_async_clients.pop(key) for key in keys]
+    for client in clients:
+        await client.close()
+
+
+def _should_retry(error):
+    import openai
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRY_STATUS_CODES
+
+
+def _backoff(attempt):
+    """第 attempt 次重试前的等待：指数增长、有上限，在 [0, 上限] 内随机取值"""
+    base = float(os.environ.get('LLM_RETRY_BASE_DELAY', 0.5))
+    cap = float(os.environ.get('LLM_RETRY_MAX_DELAY', 8))
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def create_with_retry(client, max_retries=None, **kwargs):
+    """
+    client.chat.completions.create 加上重试。stream=True 时返回一个生成器，
+    收到第一个数据块前失败会重试，之后的错误直接抛给调用方（已经输出给用户的内容无法撤回）
+    """
+    if max_retries is None:
+        max_retries = int(os.environ.get('LLM_MAX_RETRIES', 2))
+    if kwargs.get('stream'):
+        return _stream_with_retry(client, max_retries, kwargs)
+
+    for attempt in range(max_retries + 1):
+        started = time.perf_counter()
+        try:
+            completion = client.chat.completions.create(**kwargs)
+        except Exception as e:
+            if attempt >= max_retries or not _should_retry(e):
+                metrics.increment('failures')
+                raise
+            metrics.increment('retries')
+            time.sleep(_backoff(attempt))
+            continue
+        metrics.observe('request', time.perf_counter() - started)
+        return completion
+
+
+def _has_token(chunk):
+    if not chunk.choices:
+        return False
+    delta = chunk.choices[0].delta
+    return bool(getattr(delta, 'content', None) or getattr(delta, 'reasoning_content', None))
+
+
+def _stream_with_retry(client, max_retries, kwargs):
+    for attempt in range(max_retries + 1):
+        started = time.perf_counter()
+        stream = None
+        try:
+            stream = client.chat.completions.create(**kwargs)
+            iterator = iter(stream)
+            first_chunk = next(iterator, None)
+        except Exception as e:
+            if stream is not None:
+                stream.close()
+            if attempt >= max_retries or not _should_retry(e):
+                metrics.increment('failures')
+                raise
+            metrics.increment('retries')
+            time.sleep(_backoff(attempt))
+            continue
+        break
+
+    # 调用方提前停止（如浏览器断开）时也要关闭响应，把连接还给连接池
+    try:
+        waiting_first_token = True
+        chunk = first_chunk
+        while chunk is not None:
+            if waiting_first_token and _has_token(chunk):
+                # 首 token 时间：从发出请求到收到第一个带内容的数据块
+                metrics.observe('ttft', time.perf_counter() - started)
+                waiting_first_token = False
+            yield chunk
+            chunk = next(iterator, None)
+        metrics.observe('request', time.perf_counter() - started)
+    finally:
+        stream.close()
+
+
+async def acreate_with_retry(client, max_retries=None, **kwargs):
+    """create_with_retry 的异步版本；stream=True 时返回异步生成器"""
+    if max_retries is None:
+        max_retries = int(os.environ.get('LLM_MAX_RETRIES', 2))
+    if kwargs.get('stream'):
+        return _astream_with_retry(client, max_retries, kwargs)
+
+    for attempt in range(max_retries + 1):
+        started = time.perf_counter()
+        try:
+            completion = await client.chat.completions.create(**kwargs)
+        except Exception as e:
+            if attempt >= max_retries or not _should_retry(e):
+                metrics.increment('failures')
+                raise
+            metrics.increment('retries')
+            await asyncio.sleep(_backoff(attempt))
+            continue
+        metrics.observe('request', time.perf_counter() - started)
+        return completion
+
+
+async def _astream_with_retry(client, max_retries, kwargs):
+    for attempt in range(max_retries + 1):
+        started = time.perf_counter()
+        stream = None
+        try:
+            stream = await client.chat.completions.create(**kwargs)
+            iterator = stream.__aiter__()
+            first_chunk = await anext(iterator, None)
+        except Exception as e:
+            if stream is not None:
+                await stream.close()
+            if attempt >= max_retries or not _should_retry(e):
+                metrics.increment('failures')
+                raise
+            metrics.increment('retries')
+            await asyncio.sleep(_backoff(attempt))
+            continue
+        break
+
+    # 调用方提前停止（客户端断开时任务被取消）也要关闭响应，把连接还给连接池
+    try:
+        waiting_first_token = True
+        chunk = first_chunk
+        while chunk is not None:
+            if waiting_first_token and _has_token(chunk):
+                metrics.observe('ttft', time.perf_counter() - started)
+                waiting_first_token = False
+            yield chunk
+            chunk = await anext(iterator, None)
+        metrics.observe('request', time.perf_counter() - started)
+    finally:
+        await stream.close()
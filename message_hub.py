@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+聊天消息推送中心（发布/订阅）
+
+send_message 提交后把新消息发布到频道（user:<用户ID> / course:<课程ID>），
+/api/messages/stream 的每个 SSE 连接订阅自己关心的频道。
+
+- InMemoryMessageHub: 进程内实现，单进程部署使用
+- SQLiteMessageHub: 多进程部署时的本地替代中转，各进程通过同一个 SQLite 文件交换事件
+
+新的中转实现提供 publish(channel, event)、subscribe(channels)、unsubscribe(subscription) 三个方法即可。
+
+订阅队列有上限，消费太慢（队列写满）的订阅会被直接断开，客户端重连后用 since_id 补齐即可，
+不会拖慢发布方。
+"""
+
+import os
+import json
+import time
+import queue
+import sqlite3
+import threading
+import contextlib
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def course_channel(course_id):
+    return f'course:{course_id}'
+
+
+class Subscription:
+    """一个订阅者（对应一个 SSE 连接）"""
+
+    def __init__(self, hub, channels, max_queue_size):
+        self.hub = hub
+        self.channels = set(channels)
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.dropped = False  # 因消费过慢被断开
+
+    def get(self, timeout=None):
+        """取下一条事件，超时返回 None"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class InMemoryMessageHub:
+    """进程内推送中心，按频道分发到各订阅者的有界队列"""
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._subscribers = {}  # 频道 -> 订阅集合
+        self._lock = threading.Lock()
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                # 慢消费者直接断开，避免无限堆积内存
+                subscription.dropped = True
+                self.unsubscribe(subscription)
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels, self.max_queue_size)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({s for subscribers in self._subscribers.values() for s in subscribers})
+
+
+class SQLiteMessageHub:
+    """
+    多进程部署用的本地中转：publish 写入共享 SQLite 文件中的事件表，
+    每个进程一个后台线程轮询新事件，再交给进程内的 InMemoryMessageHub 分发
+    """
+
+    def __init__(self, db_path, poll_interval=0.5, retention_seconds=300, max_queue_size=100):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._local = InMemoryMessageHub(max_queue_size=max_queue_size)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS hub_event ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, "
+                "payload TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            # 只投递启动之后发布的事件
+            self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM hub_event").fetchone()[0]
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """打开一个连接：正常退出时提交、出错时回滚，最后都关闭连接"""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def publish(self, channel, event):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO hub_event (channel, payload, created_at) VALUES (?, ?, ?)",
+                (channel, json.dumps(event, ensure_ascii=False), time.time())
+            )
+
+    def subscribe(self, channels):
+        self._ensure_poller()
+        return self._local.subscribe(channels)
+
+    def unsubscribe(self, subscription):
+        self._local.unsubscribe(subscription)
+
+    def stop(self):
+        self._stopped.set()
+
+    def _ensure_poller(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._poll_loop, daemon=True)
+                self._thread.start()
+
+    def _poll_loop(self):
+        last_cleanup = 0.0
+        while not self._stopped.is_set():
+            try:
+                self.poll_once()
+                if time.time() - last_cleanup > self.retention_seconds:
+                    self._cleanup()
+                    last_cleanup = time.time()
+            except sqlite3.Error as e:
+                print(f"消息推送轮询出错: {e}")
+            self._stopped.wait(self.poll_interval)
+
+    def poll_once(self):
+        """读取并分发上次之后的新事件"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, channel, payload FROM hub_event WHERE id > ? ORDER BY id",
+                (self._last_id,)
+            ).fetchall()
+        for event_id, channel, payload in rows:
+            self._last_id = event_id
+            self._local.publish(channel, json.loads(payload))
+
+    def _cleanup(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM hub_event WHERE created_at < ?", (time.time() - self.retention_seconds,))
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_message_hub():
+    """
+    获取当前进程的推送中心，由环境变量选择实现：
+    MESSAGE_HUB_BACKEND=memory（默认）或 sqlite；sqlite 时用 MESSAGE_HUB_SQLITE_PATH 指定共享文件
+    """
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            backend = os.environ.get('MESSAGE_HUB_BACKEND', 'memory')
+            max_queue_size = int(os.environ.get('MESSAGE_HUB_QUEUE_SIZE', 100))
+            if backend == 'sqlite':
+                db_path = os.environ.get(
+                    'MESSAGE_HUB_SQLITE_PATH',
+                    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'message_hub.db')
+                )
+                _hub = SQLiteMessageHub(db_path, max_queue_size=max_queue_size)
+            else:
+                _hub = InMemoryMessageHub(max_queue_size=max_queue_size)
+        return _hub
+
+
+def set_message_hub(hub):
+    """替换当前进程的推送中心（测试或自定义中转使用）"""
+    global _hub
+    with _hub_lock:
+        _hub = hub
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+消息全文检索（SQLite FTS5）
+
+FAQ 搜索原来对 Message.content 做两次 LIKE '%关键词%' 扫描，每个命中再各查一次对应的问题或回答。
+这里把每条消息的内容切成检索词写入 FTS5 虚拟表 message_fts（rowid 与 message.id 相同）：
+- 中文按相邻两个字切成二元词（bigram），每段中文的最后一个字单独再作为一个词，
+  这样任意长度的中文关键词都能匹配：两个字以上按连续的二元词组成短语查询，单个字按前缀查询；
+- 英文单词、数字转成小写后整词索引，查询时按前缀匹配；
+- 每个检索词前加上消息所属范围的前缀（AI助教问答 t<用户ID>x、单聊 p<较小用户ID>y<较大用户ID>x、
+  群聊 c<课程ID>x），同一个词在不同用户、不同聊天中是不同的词，查询只读当前范围的倒排表，
+  不随全站消息总数变慢。
+
+结果按 bm25 排序；一个范围内命中很多时（活跃学生搜常见词），只对最近的 RANK_WINDOW 条命中打分排序，
+耗时与命中总数无关。高亮摘要在 Python 中根据原文生成。
+索引随 Message 的插入、删除在同一事务中维护（见 app.py），非 SQLite 数据库或尚未建索引时退回 LIKE 查询。
+"""
+
+import re
+import unicodedata
+
+from markupsafe import escape
+
+FTS_TABLE = 'message_fts'
+
+CREATE_FTS_SQL = f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(terms, tokenize='unicode61')"
+
+# 按相关度排序时最多只看最近的这么多条命中
+RANK_WINDOW = 2000
+
+# 中日文字符按二元词切分，其余只保留字母和数字组成的单词
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_TOKEN_RE = re.compile(f'[{_CJK}]+|[0-9a-z]+')
+_CJK_RE = re.compile(f'^[{_CJK}]')
+
+
+def _runs(text):
+    return _TOKEN_RE.findall(unicodedata.normalize('NFKC', text or '').lower())
+
+
+def tutor_scope(user_id):
+    """某个用户的 AI助教问答"""
+    return f't{user_id}x'
+
+
+def chat_scope(user_id, chat_id, chat_type):
+    """课程群聊，或两个用户之间的单聊"""
+    if chat_type == 'group':
+        return f'c{chat_id}x'
+    low, high = sorted((user_id, chat_id))
+    return f'p{low}y{high}x'
+
+
+def message_scope(sender_id, receiver_id, course_id, message_type):
+    """消息所属的检索范围，没有明确范围的消息（如没有接收人的系统消息）返回 None，不建索引"""
+    if course_id:
+        return f'c{course_id}x'
+    if message_type in ('question', 'answer'):
+        return tutor_scope(sender_id)
+    if sender_id and receiver_id:
+        return chat_scope(sender_id, receiver_id, 'private')
+    return None
+
+
+def index_terms(text, scope=''):
+    """消息内容 -> 写入 FTS5 的检索词（空格分隔），每个词带上范围前缀"""
+    terms = []
+    for run in _runs(text):
+        if _CJK_RE.match(run):
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+            terms.append(run[-1])
+        else:
+            terms.append(run)
+    return ' '.join(scope + term for term in terms)
+
+
+def match_expression(keyword, scope=''):
+    """搜索关键词 -> 某个范围内的 FTS5 查询表达式，各段之间为 AND；关键词里没有可检索的字符时返回 None"""
+    parts = []
+    for run in _runs(keyword):
+        if _CJK_RE.match(run) and len(run) > 1:
+            parts.append('"' + ' '.join(scope + run[i:i + 2] for i in range(len(run) - 1)) + '"')
+        else:
+            parts.append(f'"{scope}{run}"*')
+    if not parts:
+        return None
+    return ' AND '.join(parts)
+
+
+def search_index_rows(rows):
+    """(id, content, sender_id, receiver_id, course_id, message_type) -> 写入 FTS5 的参数（跳过没有范围的消息）"""
+    params = []
+    for row in rows:
+        scope = message_scope(row[2], row[3], row[4], row[5])
+        if scope is not None:
+            params.append({'id': row[0], 'terms': index_terms(row[1], scope)})
+    return params
+
+
+INSERT_SQL = f"INSERT INTO {FTS_TABLE} (rowid, terms) VALUES (:id, :terms)"
+DELETE_SQL = f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"
+
+# 第 RANK_WINDOW 新的命中的 rowid（FTS5 按 rowid 倒序遍历命中，代价与窗口大小成正比）
+WINDOW_FLOOR_SQL = f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :query ORDER BY rowid DESC LIMIT 1 OFFSET :offset"
+
+# 窗口内的命中及其 bm25 得分（rank 越小越相关）
+RANKED_HITS_SQL = f"SELECT rowid AS message_id, rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :query AND rowid >= :floor"
+
+
+def highlight(content, keyword, width=80):
+    """
+    原文中关键词附近最多 width 个字的摘要，HTML 转义后用 <mark> 标出关键词（大小写不敏感），
+    找不到关键词时返回开头一段
+    """
+    content = content or ''
+    lowered = content.lower()
+    fragments = sorted({run for run in _TOKEN_RE.findall(unicodedata.normalize('NFKC', keyword or '').lower())},
+                       key=len, reverse=True)
+    spans = []
+    for fragment in fragments:
+        start = lowered.find(fragment)
+        while start != -1:
+            spans.append((start, start + len(fragment)))
+            start = lowered.find(fragment, start + len(fragment))
+    spans.sort()
+
+    if spans:
+        first = spans[0][0]
+        begin = max(0, min(first - width // 4, len(content) - width))
+    else:
+        begin = 0
+    end = min(len(content), begin + width)
+
+    parts = ['…' if begin > 0 else '']
+    position = begin
+    for start, stop in spans:
+        if start < position or stop > end:
+            continue
+        parts.append(str(escape(content[position:start])))
+        parts.append(f'<mark>{escape(content[start:stop])}</mark>')
+        position = stop
+    parts.append(str(escape(content[position:end])))
+    parts.append('…' if end < len(content) else '')
+    return ''.join(parts)
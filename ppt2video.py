@@ -1,13 +1,18 @@
-import pythoncom  # <--- 必须加这个
-import tkinter as tk
-from tkinter import ttk, filedialog, scrolledtext, messagebox
 import threading
 import os
 import sys
 import json
+import time
 import shutil
-import win32com.client
+# 图形界面只在桌面上直接运行本文件时使用，服务器上可以没有 tkinter
+try:
+    import tkinter as tk
+    from tkinter import ttk, filedialog, scrolledtext, messagebox
+except ImportError:
+    tk = None
 from pptx import Presentation
+from slide_renderers import get_slide_renderer
+from tts_pool import get_tts_executor, clean_tts_text
 # 直接导入所需的组件，避免使用不存在的moviepy.editor模块
 from moviepy.video.io.VideoFileClip import VideoFileClip
 from moviepy.audio.io.AudioFileClip import AudioFileClip
@@ -52,145 +57,20 @@ except Exception as e:
 # 核心逻辑类
 # ===========================
 class ConverterLogic:
-    def __init__(self, logger_func):
+    def __init__(self, logger_func, renderer=None):
         self.log = logger_func  # 用于向界面输出日志
+        self.renderer = renderer  # 幻灯片渲染器，默认用 get_slide_renderer()
 
     def export_images(self, ppt_path, temp_folder):
-        # 导入必要的模块
-        import os
-        if not os.path.exists(temp_folder):
-            os.makedirs(temp_folder)
-
-        self.log(f"正在启动 PowerPoint 导出图片...")
+        # 导出图片由可替换的渲染器完成（见 slide_renderers.py）：
+        # Linux 上默认用 headless LibreOffice，Windows 上没有 LibreOffice 时用 PowerPoint COM
+        renderer = self.renderer or get_slide_renderer()
+        self.log("正在导出幻灯片图片...")
         self.log(f"PPT文件路径: {ppt_path}")
-        self.log(f"PPT文件是否存在: {os.path.exists(ppt_path)}")
-        if os.path.exists(ppt_path):
-            self.log(f"PPT文件大小: {os.path.getsize(ppt_path)} 字节")
-        
-        abs_ppt_path = os.path.abspath(ppt_path)
-        abs_output_folder = os.path.abspath(temp_folder)
-
-        try:
-            self.log(f"创建PowerPoint COM对象...")
-            powerpoint = win32com.client.Dispatch("PowerPoint.Application")
-            self.log(f"PowerPoint COM对象创建成功")
-            
-            # 设置PowerPoint可见性，方便调试
-            powerpoint.Visible = 1
-            
-            self.log(f"打开PPT文件: {abs_ppt_path}")
-            # 增加文件存在性和权限检查
-            if not os.path.exists(abs_ppt_path):
-                self.log(f"[错误] PPT文件不存在: {abs_ppt_path}")
-                return []
-            
-            if not os.access(abs_ppt_path, os.R_OK):
-                self.log(f"[错误] 无读取权限: {abs_ppt_path}")
-                return []
-            
-            # 打开PPT文件，增加超时和错误处理
-            try:
-                self.log(f"[DEBUG] 准备调用PowerPoint.Open: {abs_ppt_path}")
-                # 先尝试检查文件的二进制签名，确保是有效的PPT文件
-                with open(abs_ppt_path, 'rb') as f:
-                    header = f.read(8)
-                    self.log(f"[DEBUG] 文件头8字节: {header.hex()}")
-                    # PPTX文件以PK开头 (zip文件)
-                    if header.startswith(b'PK'):
-                        self.log(f"[DEBUG] 确认是PPTX文件 (ZIP格式)")
-                    # PPT文件的魔术数字
-                    elif header.startswith(b'\xd0\xcf\x11\xe0'):
-                        self.log(f"[DEBUG] 确认是PPT文件 (OLE格式)")
-                    else:
-                        self.log(f"[警告] 可能不是标准PPT/PPTX文件")
-                
-                presentation = powerpoint.Presentations.Open(abs_ppt_path, WithWindow=False)
-                self.log(f"PPT文件打开成功")
-            except Exception as e:
-                self.log(f"[错误] 打开PPT文件失败: {e}")
-                import traceback
-                traceback.print_exc()
-                return []
-            
-            # 检查演示文稿属性
-            self.log(f"PPT文件名: {presentation.Name}")
-            self.log(f"PPT完整路径: {presentation.FullName}")
-            self.log(f"PPT标题: {presentation.Title if hasattr(presentation, 'Title') else 'N/A'}")
-            self.log(f"PPT创建时间: {presentation.CreationDate if hasattr(presentation, 'CreationDate') else 'N/A'}")
-            self.log(f"PPT最后修改时间: {presentation.LastSaveTime if hasattr(presentation, 'LastSaveTime') else 'N/A'}")
-            
-            # 检查幻灯片集合
-            try:
-                slides_count = len(presentation.Slides)
-                self.log(f"PPT幻灯片数量: {slides_count}")
-                
-                if slides_count == 0:
-                    self.log(f"[警告] PPT中没有幻灯片")
-                    return []
-            except Exception as e:
-                self.log(f"[错误] 获取幻灯片数量失败: {e}")
-                return []
-
-            # 导出幻灯片图片
-            exported_images = []
-            for i, slide in enumerate(presentation.Slides):
-                img_path = os.path.join(abs_output_folder, f"slide_{i + 1:02d}.jpg")
-                self.log(f"  - 导出第 {i + 1} 页幻灯片到: {img_path}")
-                
-                try:
-                    # 导出高清图 (高度 1080)
-                    slide.Export(img_path, "JPG", 0, 1080)
-                    
-                    # 验证图片是否成功导出
-                    if os.path.exists(img_path):
-                        img_size = os.path.getsize(img_path)
-                        if img_size > 1024:  # 大于1KB才视为有效
-                            self.log(f"  - 第 {i + 1} 页幻灯片导出成功，文件大小: {img_size} 字节")
-                            exported_images.append(img_path)
-                        else:
-                            self.log(f"  - [警告] 第 {i + 1} 页幻灯片导出文件太小: {img_size} 字节")
-                    else:
-                        self.log(f"  - [错误] 第 {i + 1} 页幻灯片导出失败，文件不存在")
-                except Exception as e:
-                    self.log(f"  - [错误] 导出第 {i + 1} 页幻灯片失败: {e}")
-                    continue
-            
-            self.log(f"共尝试导出 {len(presentation.Slides)} 张幻灯片")
-            self.log(f"成功导出并验证 {len(exported_images)} 张有效幻灯片图片")
-
-            presentation.Close()
-            self.log(f"PPT文件关闭成功")
-            
-            # 获取导出的图片列表
-            exported_images = sorted([os.path.join(temp_folder, f) for f in os.listdir(temp_folder) if f.endswith(".jpg")])
-            self.log(f"共导出 {len(exported_images)} 张幻灯片图片")
-            
-            # 验证每张图片的大小
-            valid_images = []
-            for img in exported_images:
-                if os.path.exists(img):
-                    img_size = os.path.getsize(img)
-                    if img_size > 1024:  # 大于1KB才视为有效
-                        valid_images.append(img)
-                        self.log(f"  - 有效图片: {os.path.basename(img)}，大小: {img_size} 字节")
-                    else:
-                        self.log(f"  - [警告] 图片太小: {os.path.basename(img)}，大小: {img_size} 字节")
-                else:
-                    self.log(f"  - [错误] 图片不存在: {os.path.basename(img)}")
-            
-            self.log(f"有效图片数量: {len(valid_images)}")
-            
-            # 如果没有有效图片，明确返回错误
-            if not valid_images:
-                self.log("[错误] 没有成功导出任何有效幻灯片图片")
-                return []
-                
-            return valid_images
-        except Exception as e:
-            self.log(f"[错误] PPT导出失败: {e}")
-            import traceback
-            traceback.print_exc()
-            return []
+        images = renderer.render(ppt_path, temp_folder, self.log)
+        if not images:
+            self.log("[错误] 没有成功导出任何有效幻灯片图片")
+        return images
 
     def extract_text(self, ppt_path):
         import os
@@ -296,179 +176,10 @@ class ConverterLogic:
             except Exception as e:
                 self.log(f"[调试] ✗ 安装gTTS时发生异常: {e}")
         
-        # 导入所需库
         import numpy as np
-        import pyttsx3
-        import threading
-        import queue
-        import re
-        import subprocess
-        import time
-        import tempfile
-        import json
-        import sys
         
         self.log(f"    设置语速: {rate or 150}")
-        self.log(f"    使用语音生成系统: pyttsx3 + 超时保护")
-        
-        # 创建临时脚本内容模板 (定义在函数顶部，解决作用域问题)
-        script_template = '''
-import pyttsx3
-import os
-import sys
-import json
-import threading
-import re
-import time
-
-# 获取参数
-text = {text}
-filename = {filename}
-rate = {rate}
-
-result = {result_init}
-
-# 详细的语音信息记录
-voice_info = []
-
-# 进一步清理文本，移除过多的标点和省略号
-cleaned_text = text
-# 移除重复的标点符号
-cleaned_text = re.sub(r'[，。、；："\'\n\r]+', '，', cleaned_text)
-# 移除重复的顿号
-cleaned_text = re.sub(r'[，]+', '，', cleaned_text)
-# 移除省略号
-cleaned_text = re.sub(r'[.]+', '', cleaned_text)
-# 移除特殊符号
-cleaned_text = re.sub(r'[•●■◆]', '', cleaned_text)
-# 限制文本长度
-if len(cleaned_text) > 100:
-    cleaned_text = cleaned_text[:100] + "..."
-
-if not cleaned_text.strip():
-    cleaned_text = "空白幻灯片"
-
-# 子进程内部的超时处理
-class TimeoutError(Exception):
-    pass
-
-# 超时处理函数
-timeout_occurred = False
-def timeout_handler():
-    global timeout_occurred
-    timeout_occurred = True
-    raise TimeoutError("音频生成超时")
-
-def audio_generation_thread():
-    """在单独的线程中生成音频"""
-    global result
-    
-    try:
-        # 初始化引擎
-        engine = pyttsx3.init()
-        engine.setProperty('rate', rate)
-        
-        # 设置中文语音 - 增强的中文语音检测逻辑
-        voices = engine.getProperty('voices')
-        
-        # 记录所有可用语音信息
-        for voice in voices:
-            voice_info.append({
-                "id": voice.id,
-                "name": voice.name,
-                "languages": voice.languages if hasattr(voice, 'languages') else [],
-                "gender": voice.gender if hasattr(voice, 'gender') else "unknown",
-                "age": voice.age if hasattr(voice, 'age') else "unknown"
-            })
-        
-        # 增强的中文语音检测
-        chinese_voice_found = False
-        best_voice = None
-        
-        # 优先匹配中文语音
-        for voice in voices:
-            voice_id_lower = voice.id.lower()
-            voice_name_lower = voice.name.lower()
-            
-            # 中文语音关键词匹配
-            if any(keyword in voice_id_lower or keyword in voice_name_lower 
-                   for keyword in ['chinese', 'zh', 'mandarin', '中文', '普通话', 'cantonese', 'yue']):
-                best_voice = voice
-                chinese_voice_found = True
-                break
-        
-        if not chinese_voice_found and voices:
-            # 如果没有找到中文语音，使用第一个可用语音
-            best_voice = voices[0]
-            result["warning"] = "未找到中文语音包，使用默认语音: " + best_voice.name
-        
-        if best_voice:
-            engine.setProperty('voice', best_voice.id)
-            result["voice_used"] = best_voice.name
-        
-        # 生成音频
-        engine.save_to_file(cleaned_text, filename)
-        engine.runAndWait()
-        
-        # 验证文件
-        if os.path.exists(filename):
-            file_size = os.path.getsize(filename)
-            if file_size > 1024:
-                result["success"] = True
-                result["message"] = "生成成功，大小: " + str(file_size) + " 字节"
-                result["voice_info"] = voice_info
-            else:
-                result["success"] = False
-                result["message"] = "文件太小 (" + str(file_size) + " 字节)"
-        else:
-            result["success"] = False
-            result["message"] = "文件未生成"
-            
-    except Exception as e:
-        result["success"] = False
-        result["message"] = "生成错误: " + str(e)
-        result["voice_info"] = voice_info
-
-try:
-    
-    # 使用threading.Timer实现超时
-    timeout_timer = threading.Timer(10.0, timeout_handler)
-    timeout_timer.start()
-    
-    try:
-        # 启动音频生成线程
-        audio_thread = threading.Thread(target=audio_generation_thread)
-        audio_thread.start()
-        
-        # 等待音频生成完成
-        audio_thread.join(10.0)
-        
-        if audio_thread.is_alive():
-            # 线程仍在运行，说明超时
-            result["success"] = False
-            result["message"] = "子进程生成超时"
-            # 无法强制终止线程，只能返回错误
-    except TimeoutError:
-        result["success"] = False
-        result["message"] = "子进程生成超时"
-    finally:
-        # 取消超时计时器
-        timeout_timer.cancel()
-    
-except Exception as e:
-    result["success"] = False
-    result["message"] = "生成错误: " + str(e)
-    result["voice_info"] = voice_info
-    # 确保引擎被正确关闭
-    try:
-        if 'engine' in locals():
-            engine.stop()
-    except:
-        pass
-
-# 输出结果
-print(json.dumps(result, ensure_ascii=False))
-'''
+        self.log(f"    使用语音生成系统: pyttsx3 常驻进程池并行合成 + 超时保护")
         
         def generate_audio_with_gtts(text, filename):
             """使用gTTS生成中文语音"""
@@ -478,14 +189,7 @@ print(json.dumps(result, ensure_ascii=False))
                 import tempfile
                 
                 # 清理文本
-                cleaned_text = re.sub(r'[，。、；："\'\n\r]+', '，', text)
-                cleaned_text = re.sub(r'[•●■◆]', '', cleaned_text)
-                cleaned_text = re.sub(r'[，]+', '，', cleaned_text)
-                cleaned_text = re.sub(r'^[，]+|[，]+$', '', cleaned_text)
-                if not cleaned_text.strip():
-                    cleaned_text = "空白幻灯片"
-                if len(cleaned_text) > 100:
-                    cleaned_text = cleaned_text[:97] + "..."
+                cleaned_text = clean_tts_text(text)
                 
                 # 使用gTTS生成语音
                 tts = gTTS(text=cleaned_text, lang='zh-cn', slow=False)
@@ -533,237 +237,50 @@ print(json.dumps(result, ensure_ascii=False))
             except Exception as e:
                 return False, f"gTTS生成失败: {str(e)}"
         
-        def generate_audio_with_timeout(text, filename, rate, timeout=15):
-            """带超时的音频生成函数 - 使用进程级保护"""
-            try:
-                # 清理文本
-                cleaned_text = re.sub(r'[，。、；："\'\n\r]+', '，', text)
-                cleaned_text = re.sub(r'[•●■◆]', '', cleaned_text)
-                cleaned_text = re.sub(r'[，]+', '，', cleaned_text)
-                cleaned_text = re.sub(r'^[，]+|[，]+$', '', cleaned_text)
-                if not cleaned_text.strip():
-                    cleaned_text = "空白幻灯片"
-                if len(cleaned_text) > 100:
-                    cleaned_text = cleaned_text[:97] + "..."
-                
-                # 使用更简单的方式生成临时脚本，避免JSON转义问题
-                temp_script = tempfile.mktemp(suffix='.py')
-                
-                # 直接构建脚本内容
-                with open(temp_script, 'w', encoding='utf-8') as f:
-                    f.write('''
-import pyttsx3
-import os
-import sys
-import json
-
-# 获取参数
-text = ''' + json.dumps(cleaned_text) + '''
-filename = ''' + json.dumps(filename) + '''
-rate = ''' + str(rate or 150) + '''
-
-result = {"success": False, "message": "未知错误"}
-
-# 清理文本
-cleaned_text = text
-cleaned_text = cleaned_text.replace('\\n', '')
-
-# 初始化引擎
-try:
-    engine = pyttsx3.init()
-    engine.setProperty('rate', rate)
-    
-    # 设置语音
-    voices = engine.getProperty('voices')
-    for voice in voices:
-        if any(keyword in voice.id.lower() for keyword in ['chinese', 'zh', 'mandarin', '中文', '普通话']):
-            engine.setProperty('voice', voice.id)
-            break
-    
-    # 生成音频
-    engine.save_to_file(cleaned_text, filename)
-    engine.runAndWait()
-    
-    # 验证文件
-    if os.path.exists(filename) and os.path.getsize(filename) > 1024:
-        result["success"] = True
-        result["message"] = "生成成功"
-    else:
-        result["success"] = False
-        result["message"] = "文件无效"
-except Exception as e:
-    result["success"] = False
-    result["message"] = str(e)
-
-# 输出结果
-print(json.dumps(result, ensure_ascii=False))
-''')
-                
-                try:
-                    # 运行临时脚本
-                    process = subprocess.Popen(
-                        [sys.executable, temp_script],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        encoding='utf-8',
-                        errors='replace'
-                    )
-                    
-                    # 等待超时
-                    stdout, stderr = process.communicate(timeout=timeout)
-                    
-                    # 检查stdout是否为空
-                    if not stdout:
-                        # 尝试使用gTTS作为备选
-                        self.log(f"    pyttsx3失败，尝试使用gTTS备选方案...")
-                        return generate_audio_with_gtts(text, filename)
-                            
-                    # 确保输出是有效的JSON
-                    try:
-                        result = json.loads(stdout)
-                        if result["success"]:
-                            return result["success"], result["message"]
-                        else:
-                            # pyttsx3失败，尝试使用gTTS
-                            self.log(f"    pyttsx3失败: {result['message']}，尝试使用gTTS备选方案...")
-                            return generate_audio_with_gtts(text, filename)
-                    except json.JSONDecodeError:
-                        # JSON解析失败，尝试使用gTTS
-                        self.log(f"    pyttsx3输出解析失败，尝试使用gTTS备选方案...")
-                        return generate_audio_with_gtts(text, filename)
-                        
-                except subprocess.TimeoutExpired:
-                    process.kill()
-                    # 超时，尝试使用gTTS
-                    self.log(f"    pyttsx3超时，尝试使用gTTS备选方案...")
-                    return generate_audio_with_gtts(text, filename)
-                except Exception as e:
-                    # 执行错误，尝试使用gTTS
-                    self.log(f"    pyttsx3执行错误: {str(e)}，尝试使用gTTS备选方案...")
-                    return generate_audio_with_gtts(text, filename)
-                finally:
-                    # 清理临时脚本
-                    if os.path.exists(temp_script):
-                        try:
-                            os.unlink(temp_script)
-                        except:
-                            pass
-            except Exception as e:
-                # 内部错误，尝试使用gTTS
-                self.log(f"    音频生成内部错误: {str(e)}，尝试使用gTTS备选方案...")
-                return generate_audio_with_gtts(text, filename)
-
-        # 使用带超时的音频生成
-        for i, text in enumerate(scripts):
-            filename = os.path.join(temp_folder, f"audio_{i + 1:02d}.wav")
-            self.log(f"  - 处理第 {i + 1} 页音频...")
-            self.log(f"    原始文本: {text[:50]}..." if len(text) > 50 else f"    原始文本: {text}")
-            self.log(f"    文本长度: {len(text)} 字符")
-
+        def generate_fallback_audio(text, filename):
+            """降级方案：按文字长度生成提示音"""
+            estimated_duration = max(2.0, len(text) * 0.33)
+            self.log(f"    生成 {estimated_duration:.1f} 秒的音频...")
+            samples = int(estimated_duration * 44100)
+            t = np.linspace(0, estimated_duration, samples)
+            audio_array = np.sin(2 * np.pi * 440 * t)
+            audio_array = np.column_stack((audio_array, audio_array)).astype(np.float32)
+            audio_clip = AudioArrayClip(audio_array, fps=44100)
+            audio_clip.write_audiofile(filename, fps=44100)
+            return os.path.exists(filename) and os.path.getsize(filename) > 1024
+        
+        try:
+            from gtts import gTTS
+            gtts_available = True
+        except ImportError:
+            gtts_available = False
+        
+        # 各页同时交给常驻的 pyttsx3 工作进程合成（见 tts_pool.py），结果按页序返回
+        filenames = [os.path.join(temp_folder, f"audio_{i + 1:02d}.wav") for i in range(len(scripts))]
+        self.log(f"  - 并行合成 {len(scripts)} 页音频...")
+        started = time.time()
+        results = get_tts_executor().map(list(zip(scripts, filenames)), rate=rate or 150)
+        self.log(f"  - pyttsx3 合成完成，耗时 {time.time() - started:.1f} 秒")
+        
+        for i, (text, filename, (success, message)) in enumerate(zip(scripts, filenames, results)):
+            self.log(f"  - 第 {i + 1} 页音频: {text[:50]}..." if len(text) > 50 else f"  - 第 {i + 1} 页音频: {text}")
             try:
-                # 检查gTTS是否可用
-                self.log(f"    [调试] 检查gTTS模块是否可用...")
-                try:
-                    from gtts import gTTS
-                    self.log(f"    [调试] ✓ gTTS模块已安装")
-                    gtts_available = True
-                except ImportError:
-                    self.log(f"    [调试] ✗ gTTS模块未安装")
-                    gtts_available = False
-                    # 尝试安装gTTS
-                    self.log(f"    [调试] 尝试安装gTTS...")
-                    try:
-                        import subprocess
-                        install_result = subprocess.run(
-                            [sys.executable, '-m', 'pip', 'install', 'gtts'],
-                            capture_output=True,
-                            text=True,
-                            timeout=30
-                        )
-                        if install_result.returncode == 0:
-                            self.log(f"    [调试] ✓ 成功安装gTTS")
-                            gtts_available = True
-                        else:
-                            self.log(f"    [调试] ✗ 安装gTTS失败: {install_result.stderr[:100]}...")
-                    except Exception as e:
-                        self.log(f"    [调试] ✗ 安装gTTS异常: {e}")
-                
-                # 优先使用pyttsx3离线生成音频
-                self.log(f"    开始生成语音...")
-                success, message = generate_audio_with_timeout(text, filename, rate)
-                
-                # 如果pyttsx3失败，且gTTS可用，则尝试gTTS
+                # pyttsx3 失败时依次尝试 gTTS 和降级方案
                 if not success and gtts_available:
-                    self.log(f"    pyttsx3失败，尝试使用gTTS备选方案...")
+                    self.log(f"    pyttsx3失败: {message}，尝试使用gTTS备选方案...")
                     success, message = generate_audio_with_gtts(text, filename)
-                    if not success:
-                        self.log(f"    gTTS也失败，尝试使用降级方案...")
+                if not success:
+                    self.log(f"    [错误] 生成失败: {message}，尝试使用降级方案生成音频...")
+                    success = generate_fallback_audio(text, filename)
+                    message = "降级方案生成成功" if success else "降级方案生成的文件无效"
                 
                 if success:
-                    file_size = os.path.getsize(filename)
-                    self.log(f"    ✓ 音频生成成功: {message}")
-                    self.log(f"    ✓ 文件路径: {filename}")
-                    self.log(f"    ✓ 文件大小: {file_size / 1024:.2f} KB")
+                    self.log(f"    ✓ 音频生成成功: {message}，文件大小: {os.path.getsize(filename) / 1024:.2f} KB")
                     audio_paths.append(filename)
-                    self.log(f"    ✓ 音频已添加到列表")
                 else:
-                    self.log(f"    [警告] 首次生成失败: {message}")
-                    
-                    # 尝试重新生成一次
-                    self.log(f"    尝试重新生成...")
-                    success, message = generate_audio_with_timeout(text, filename, rate)
-                    
-                    if success:
-                        file_size = os.path.getsize(filename)
-                        self.log(f"    ✓ 重新生成成功: {message}")
-                        self.log(f"    ✓ 文件大小: {file_size / 1024:.2f} KB")
-                        audio_paths.append(filename)
-                    else:
-                        self.log(f"    [错误] 重新生成失败: {message}")
-                        self.log(f"    尝试使用降级方案生成音频...")
-                        # 降级方案
-                        try:
-                            from moviepy.audio.AudioClip import AudioArrayClip
-                            estimated_duration = max(2.0, len(text) * 0.33)
-                            self.log(f"    生成 {estimated_duration:.1f} 秒的音频...")
-                            samples = int(estimated_duration * 44100)
-                            t = np.linspace(0, estimated_duration, samples)
-                            audio_array = np.sin(2 * np.pi * 440 * t)
-                            audio_array = np.column_stack((audio_array, audio_array)).astype(np.float32)
-                            audio_clip = AudioArrayClip(audio_array, fps=44100)
-                            audio_clip.write_audiofile(filename, fps=44100)
-                            
-                            if os.path.exists(filename) and os.path.getsize(filename) > 1024:
-                                file_size = os.path.getsize(filename)
-                                self.log(f"    ✓ 降级方案生成成功")
-                                self.log(f"    ✓ 文件大小: {file_size / 1024:.2f} KB")
-                                audio_paths.append(filename)
-                            else:
-                                self.log(f"    [错误] 降级方案生成的文件无效")
-                        except Exception as e3:
-                            self.log(f"    [错误] 降级方案执行失败: {e3}")
+                    self.log(f"    [错误] {message}")
             except Exception as e:
                 self.log(f"    [错误] 音频生成过程发生异常: {e}")
-                import traceback
-                self.log(f"    异常详情: {traceback.format_exc()[:200]}...")
-                # 降级方案
-                self.log(f"    [降级方案] 使用简单音频生成替代")
-                try:
-                    from moviepy.audio.AudioClip import AudioArrayClip
-                    estimated_duration = max(2.0, len(text) * 0.33)
-                    samples = int(estimated_duration * 44100)
-                    t = np.linspace(0, estimated_duration, samples)
-                    audio_array = np.sin(2 * np.pi * 440 * t)
-                    audio_array = np.column_stack((audio_array, audio_array)).astype(np.float32)
-                    audio_clip = AudioArrayClip(audio_array, fps=44100)
-                    audio_clip.write_audiofile(filename, fps=44100)
-                    
-                    if os.path.exists(filename) and os.path.getsize(filename) > 1024:
-                        self.log(f"    降级方案生成成功")
-                        audio_paths.append(filename)
-                except Exception as e2:
-                    self.log(f"    [错误] 降级方案也失败: {e2}")
-                    continue
         
         self.log(f"  音频生成完成，共生成 {len(audio_paths)} 个音频文件")
         return audio_paths
@@ -1371,8 +888,6 @@ class PPTtoVideoConverter:
     def convert_ppt_to_video(self, ppt_path, output_path, voice_id, rate, use_subtitle):
         """转换PPT到视频的核心逻辑"""
         try:
-            pythoncom.CoInitialize()  # <--- 必须加这个，解决COM对象初始化问题
-            
             # 临时目录
             temp_folder = os.path.join(os.path.dirname(ppt_path), "temp_ppt_converter")
             if os.path.exists(temp_folder):
@@ -1436,12 +951,6 @@ class PPTtoVideoConverter:
             self.is_converting = False
             self.root.nametowidget(".!frame2.!frame3.!button").configure(state=tk.NORMAL)
             self.root.nametowidget(".!frame2.!frame3.!button2").configure(state=tk.DISABLED)
-            
-            # 释放COM资源
-            try:
-                pythoncom.CoUninitialize()
-            except:
-                pass
 
 # 主程序入口
 if __name__ == "__main__":
@@ -1465,13 +974,9 @@ def convert_presentation_to_video(ppt_path, output_path, rate=150, timeout=None)
     返回:
         bool: 转换是否成功
     """
-    import pythoncom
     import shutil
     import os
     
-    # 初始化COM对象
-    pythoncom.CoInitialize()
-    
     # 简单的日志函数
     def simple_log(message):
         print(f"[PPT2VIDEO] {message}")
@@ -1531,10 +1036,4 @@ def convert_presentation_to_video(ppt_path, output_path, rate=150, timeout=None)
                 shutil.rmtree(temp_folder)
                 simple_log(f"已清理临时目录: {temp_folder}")
             except:
-                pass
-        
-        # 释放COM资源
-        try:
-            pythoncom.CoUninitialize()
-        except:
-            pass
\ No newline at end of file
+                pass
\ No newline at end of file
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+视频观看进度写缓冲（write-behind）
+
+watch_course.html 每 10 秒调用一次 /save_progress。心跳先写进内存缓冲，
+同一 (学生ID, 课程ID) 只保留最新的进度和播放位置，观看时长增量累加；
+后台线程每隔几秒把缓冲一次性交给 flush 回调批量写库，进程退出时再写一次。
+
+读进度时用 pending() 取出尚未写库的部分叠加到数据库记录上，保证读到的是最新值；
+正在写库的一批在写库成功前仍计入 pending()。写库（含提交）和把这一批移出 pending() 在同一把锁
+（snapshot()）内完成，读数据库记录和调用 pending() 也包在这把锁内，同一批心跳不会既在数据库记录里又在 pending() 里。
+"""
+
+import time
+import atexit
+import threading
+from datetime import datetime
+
+
+class ProgressBuffer:
+    def __init__(self, flush_callback, flush_interval=5.0, max_pending=5000):
+        """
+        flush_callback(entries): entries 为 {(学生ID, 课程ID): 缓冲项} 字典，负责写库；抛出异常时这批数据会放回缓冲
+        max_pending: 缓冲的记录数达到该值时立即触发一次写库
+        """
+        self.flush_callback = flush_callback
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._in_flight = {}  # 正在写库的一批，写库成功后才清空
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # 同一时间只有一个线程在写库
+        self._snapshot_lock = threading.Lock()  # 写库提交并清空 _in_flight 期间，读者不能读数据库记录和 pending()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def record(self, student_id, course_id, watch_progress, last_watch_time, watch_duration):
+        """记录一次心跳，不访问数据库"""
+        key = (student_id, course_id)
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = self._pending[key] = {'watch_duration': 0.0}
+            entry['watch_progress'] = watch_progress
+            entry['last_watch_time'] = last_watch_time
+            entry['watch_duration'] += watch_duration
+            entry['updated_at'] = datetime.utcnow()
+            pending_count = len(self._pending)
+        self._ensure_thread()
+        if pending_count >= self.max_pending:
+            self._wakeup.set()
+
+    def pending(self, student_id, course_id):
+        """返回尚未写库的缓冲项副本（正在写库的一批叠加之后的新心跳），没有则返回 None"""
+        key = (student_id, course_id)
+        with self._lock:
+            in_flight, entry = self._in_flight.get(key), self._pending.get(key)
+            if in_flight is None:
+                return dict(entry) if entry else None
+            merged = dict(in_flight)
+            if entry is not None:
+                merged.update(entry)
+                merged['watch_duration'] = in_flight['watch_duration'] + entry['watch_duration']
+            return merged
+
+    def snapshot(self):
+        """
+        读数据库记录并叠加 pending() 时包在 with buffer.snapshot(): 中，写库期间会等这一批写完。
+        flush_callback 中不能再进入 snapshot()
+        """
+        return self._snapshot_lock
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """把当前缓冲全部写库，返回写入的记录数"""
+        with self._flush_lock:
+            with self._lock:
+                entries, self._pending = self._pending, {}
+                self._in_flight = entries
+            if not entries:
+                return 0
+            with self._snapshot_lock:
+                try:
+                    self.flush_callback(entries)
+                except Exception:
+                    self._restore(entries)
+                    raise
+                with self._lock:
+                    self._in_flight = {}
+            return len(entries)
+
+    def _restore(self, entries):
+        """写库失败时把数据放回缓冲，与期间新到的心跳合并"""
+        with self._lock:
+            self._in_flight = {}
+            for key, old in entries.items():
+                new = self._pending.get(key)
+                if new is None:
+                    self._pending[key] = old
+                else:
+                    new['watch_duration'] += old['watch_duration']
+
+    def stop(self):
+        """停止后台线程并写入剩余数据"""
+        self._stopped.set()
+        self._wakeup.set()
+        self.flush()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"观看进度写库失败，稍后重试: {e}")
+                time.sleep(self.flush_interval)
+
+
+_buffers = []
+
+
+@atexit.register
+def _flush_all_on_exit():
+    for buffer in _buffers:
+        try:
+            buffer.stop()
+        except Exception as e:
+            print(f"退出时写入观看进度失败: {e}")
+
+
+def register_buffer(buffer):
+    """登记缓冲，进程退出时自动写入剩余数据"""
+    _buffers.append(buffer)
+    return buffer
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+相同请求合并（single-flight）
+
+老师把一道题投到大屏上时，几十名学生会在几秒内向 /api/ai-tutor/chat 发同一个问题，
+每个请求都各自向大模型开一个流。SingleFlight 按键合并同时进行的相同请求：
+- 第一个请求启动生产线程，由它驱动唯一一次上游调用，产出的事件依次追加到这次调用（Flight）的缓冲里；
+- 之后到达的相同请求作为订阅者加入：先拿到缓冲里已有的事件（重放），再等待后续事件实时推送；
+- 上游结束后这次调用从表中移除，之后的请求重新发起（助教接口此时会先命中问答缓存）。
+
+生产在独立线程中进行，发起请求的学生断开连接不影响其他订阅者收到完整回答。
+
+AsyncSingleFlight 是给异步服务（api/tutor.py）用的同一套逻辑：生产是事件循环上的一个任务，
+不占线程；所有订阅者都断开后取消生产任务，不再为没人接收的回答继续请求上游。
+"""
+
+import asyncio
+import threading
+
+
+class Flight:
+    """一次进行中的上游调用：已产出的事件和是否结束"""
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.subscribers = 0
+        self.condition = threading.Condition()
+
+    def publish(self, event):
+        with self.condition:
+            self.events.append(event)
+            self.condition.notify_all()
+
+    def finish(self):
+        with self.condition:
+            self.done = True
+            self.condition.notify_all()
+
+    def subscribe(self):
+        """从第一个事件开始依次产出，已缓冲的立即返回，之后的等生产线程推送"""
+        position = 0
+        while True:
+            with self.condition:
+                while position >= len(self.events) and not self.done:
+                    self.condition.wait()
+                pending = self.events[position:]
+                finished = self.done
+            position += len(pending)
+            yield from pending
+            if finished and position >= len(self.events):
+                return
+
+
+class SingleFlight:
+    def __init__(self, name='single-flight'):
+        self.name = name
+        self.started = 0
+        self.joined = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def stream(self, key, produce):
+        """
+        返回键 key 对应调用产出的事件（生成器）。没有进行中的调用时在新线程里执行 produce()
+        （返回事件的可迭代对象），否则加入进行中的调用
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = Flight()
+                self.started += 1
+                leader = True
+            else:
+                self.joined += 1
+                leader = False
+            flight.subscribers += 1
+        if leader:
+            threading.Thread(target=self._run, args=(key, flight, produce), name=self.name, daemon=True).start()
+        return self._subscribe(flight)
+
+    def _subscribe(self, flight):
+        """产出 flight 的事件；订阅者读完或中途断开时都减少订阅计数"""
+        try:
+            yield from flight.subscribe()
+        finally:
+            with self._lock:
+                flight.subscribers -= 1
+
+    def _run(self, key, flight, produce):
+        try:
+            for event in produce():
+                flight.publish(event)
+        except Exception as e:
+            print(f"{self.name} 生产事件出错: {type(e).__name__}: {e}")
+        finally:
+            # 先从表中移除再结束，之后到达的请求不会再加入一个已经结束的调用
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.finish()
+
+    def stats(self):
+        with self._lock:
+            requests = self.started + self.joined
+            return {
+                'started': self.started,
+                'joined': self.joined,
+                'coalesced_rate': round(self.joined / requests, 4) if requests else 0.0,
+                'in_flight': len(self._flights),
+                'subscribers': sum(flight.subscribers for flight in self._flights.values()),
+            }
+
+
+class AsyncFlight:
+    """AsyncSingleFlight 中一次进行中的上游调用"""
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.subscribers = 0
+        self.task = None
+        self.condition = asyncio.Condition()
+
+    async def publish(self, event):
+        async with self.condition:
+            self.events.append(event)
+            self.condition.notify_all()
+
+    async def finish(self):
+        async with self.condition:
+            self.done = True
+            self.condition.notify_all()
+
+    async def subscribe(self):
+        position = 0
+        while True:
+            async with self.condition:
+                await self.condition.wait_for(lambda: position < len(self.events) or self.done)
+                pending = self.events[position:]
+                finished = self.done
+            position += len(pending)
+            for event in pending:
+                yield event
+            if finished and position >= len(self.events):
+                return
+
+
+class AsyncSingleFlight:
+    def __init__(self, name='async-single-flight'):
+        self.name = name
+        self.started = 0
+        self.joined = 0
+        self.cancelled = 0
+        self._flights = {}
+
+    async def stream(self, key, produce):
+        """
+        异步生成器：产出键 key 对应调用的事件。没有进行中的调用时创建任务执行 produce()
+        （返回异步可迭代对象），否则加入进行中的调用
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = AsyncFlight()
+            flight.task = asyncio.get_running_loop().create_task(self._run(key, flight, produce))
+            self.started += 1
+        else:
+            self.joined += 1
+        flight.subscribers += 1
+        try:
+            async for event in flight.subscribe():
+                yield event
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # 所有订阅者都断开了：停止请求上游，之后的相同请求重新发起
+                self.cancelled += 1
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+    async def _run(self, key, flight, produce):
+        try:
+            async for event in produce():
+                await flight.publish(event)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"{self.name} 生产事件出错: {type(e).__name__}: {e}")
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            await flight.finish()
+
+    def stats(self):
+        requests = self.started + self.joined
+        return {
+            'started': self.started,
+            'joined': self.joined,
+            'coalesced_rate': round(self.joined / requests, 4) if requests else 0.0,
+            'cancelled': self.cancelled,
+            'in_flight': len(self._flights),
+            'subscribers': sum(flight.subscribers for flight in self._flights.values()),
+        }
@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+"""
+PPT 幻灯片导出为图片（ppt2video 的第一步），渲染后端可替换
+
+原来 ConverterLogic.export_images 通过 win32com 驱动 PowerPoint，只能在装了 Office 的 Windows 桌面上运行，
+整个转换还要先 pythoncom.CoInitialize。这里把导出图片抽成渲染器接口 render(ppt_path, output_folder, log)，
+返回按页序排列的图片路径（slide_01.jpg、slide_02.jpg ……，高 1080 像素）：
+- LibreOfficeRenderer（Linux 服务器默认）：headless soffice 把演示文稿转成 PDF，
+  再把 PDF 每页栅格化成 JPG（pdftoppm，没有时用 PyMuPDF）；
+- PowerPointRenderer（可选，Windows）：原来的 PowerPoint COM 导出，COM 初始化在渲染器内部完成；
+- PptxTextRenderer：只用 python-pptx 和 Pillow，把每页的文本框和图片画到白底图片上，
+  没有 soffice 也没有 Office 时兜底，效果简陋。
+
+soffice 冷启动（加载程序、初始化用户配置目录）每次要好几秒。SofficePool 维护 SOFFICE_POOL_SIZE 个常驻 soffice 进程，
+每个进程有自己的用户配置目录并监听一个本机端口；转换时取一个空闲进程，用它的配置目录执行 soffice --convert-to，
+请求会交给已经在运行的进程处理，不再冷启动。进程退出或转换超时后，下次使用时重新启动。
+
+get_slide_renderer() 按环境变量 PPT2VIDEO_RENDERER（libreoffice / powerpoint / pptx）选择后端，
+未设置时依次尝试 LibreOffice、PowerPoint、python-pptx。
+"""
+
+import os
+import re
+import sys
+import glob
+import time
+import queue
+import atexit
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import subprocess
+import importlib.util
+from pathlib import Path
+
+# 导出图片的高度（像素），与原来 PowerPoint 导出的尺寸相同
+SLIDE_HEIGHT = 1080
+
+# 小于这个大小的图片视为导出失败
+MIN_IMAGE_BYTES = 1024
+
+
+def slide_image_path(folder, number):
+    """第 number 页（从 1 开始）的图片路径"""
+    return os.path.join(folder, f"slide_{number:02d}.jpg")
+
+
+class SlideRenderer:
+    """渲染器基类：子类实现 _render，返回图片路径列表；失败时抛出异常"""
+
+    name = ''
+
+    def render(self, ppt_path, output_folder, log=print):
+        """把演示文稿的每一页导出为图片，返回有效图片的路径（按页序）；失败时记录日志并返回空列表"""
+        os.makedirs(output_folder, exist_ok=True)
+        abs_ppt_path = os.path.abspath(ppt_path)
+        if not os.path.exists(abs_ppt_path):
+            log(f"[错误] PPT文件不存在: {abs_ppt_path}")
+            return []
+        log(f"使用 {self.name} 导出幻灯片图片: {abs_ppt_path}")
+        started = time.perf_counter()
+        try:
+            images = self._render(abs_ppt_path, os.path.abspath(output_folder), log)
+        except Exception as e:
+            log(f"[错误] PPT导出失败: {e}")
+            return []
+
+        valid_images = []
+        for image in images:
+            size = os.path.getsize(image) if os.path.exists(image) else 0
+            if size > MIN_IMAGE_BYTES:
+                valid_images.append(image)
+            else:
+                log(f"  - [警告] 图片无效: {os.path.basename(image)}，大小: {size} 字节")
+        log(f"成功导出 {len(valid_images)} 张有效幻灯片图片，耗时 {time.perf_counter() - started:.1f} 秒")
+        return valid_images
+
+    def _render(self, ppt_path, output_folder, log):
+        raise NotImplementedError
+
+    def close(self):
+        """释放渲染器占用的进程等资源"""
+
+
+# ===========================
+# LibreOffice（headless soffice）
+# ===========================
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class _SofficeInstance:
+    """一个常驻的 soffice 进程及其用户配置目录"""
+
+    def __init__(self, soffice, profile_dir):
+        self.soffice = soffice
+        self.profile_dir = profile_dir
+        self.process = None
+        self.port = None
+
+    @property
+    def profile_args(self):
+        return [f'-env:UserInstallation={Path(self.profile_dir).as_uri()}']
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self, timeout):
+        """启动 soffice 并等到它开始监听端口（此时程序和用户配置目录都已加载完）"""
+        os.makedirs(self.profile_dir, exist_ok=True)
+        self.port = _free_port()
+        self.process = subprocess.Popen(
+            [self.soffice, *self.profile_args, '--headless', '--invisible', '--nologo', '--norestore',
+             '--nodefault', '--nolockcheck', f'--accept=socket,host=127.0.0.1,port={self.port};urp;'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            start_new_session=(os.name == 'posix')
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"soffice 启动后退出，返回码 {self.process.returncode}")
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError(f"soffice 在 {timeout} 秒内没有启动完成")
+
+    def convert(self, source, outdir, target, timeout):
+        """用同一个配置目录执行 --convert-to，转换由常驻进程完成，返回生成的文件路径"""
+        result = subprocess.run(
+            [self.soffice, *self.profile_args, '--headless', '--convert-to', target, '--outdir', outdir, source],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout
+        )
+        extension = target.split(':')[0]
+        output = os.path.join(outdir, f"{os.path.splitext(os.path.basename(source))[0]}.{extension}")
+        if not os.path.exists(output):
+            message = (result.stderr or result.stdout).decode('utf-8', 'replace').strip()[-300:]
+            raise RuntimeError(f"soffice 没有生成 {os.path.basename(output)}（返回码 {result.returncode}）: {message}")
+        return output
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            try:
+                if os.name == 'posix':
+                    os.killpg(self.process.pid, signal.SIGTERM)
+                else:
+                    self.process.terminate()
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+
+class SofficePool:
+    def __init__(self, soffice='soffice', size=2, workdir=None, startup_timeout=60.0, convert_timeout=120.0):
+        """
+        soffice: soffice 可执行文件
+        size: 常驻进程数，也就是同时进行的转换数
+        workdir: 各进程用户配置目录的上级目录，默认新建一个临时目录（进程重启时沿用，不再重新初始化）
+        startup_timeout / convert_timeout: 启动、单次转换的超时（秒），转换超时的进程会被结束，下次使用时重启
+        """
+        self.soffice = soffice
+        self.size = size
+        self.startup_timeout = startup_timeout
+        self.convert_timeout = convert_timeout
+        self.workdir = workdir or tempfile.mkdtemp(prefix='soffice_pool_')
+        self.starts = 0
+        self.conversions = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._instances = [_SofficeInstance(soffice, os.path.join(self.workdir, f'profile_{i}')) for i in range(size)]
+        self._idle = queue.Queue()
+        for instance in self._instances:
+            self._idle.put(instance)
+
+    def convert(self, source, outdir, target='pdf', log=print):
+        """取一个空闲的 soffice 进程把 source 转换为 target 格式，返回生成的文件路径；没有空闲进程时等待"""
+        instance = self._idle.get()
+        try:
+            if not instance.alive():
+                log("启动常驻 soffice 进程...")
+                started = time.perf_counter()
+                instance.start(self.startup_timeout)
+                with self._lock:
+                    self.starts += 1
+                log(f"soffice 启动完成，耗时 {time.perf_counter() - started:.1f} 秒")
+            output = instance.convert(source, outdir, target, self.convert_timeout)
+            with self._lock:
+                self.conversions += 1
+            return output
+        except Exception:
+            # 进程可能已经卡住，结束后下次使用时重启
+            instance.stop()
+            with self._lock:
+                self.failures += 1
+            raise
+        finally:
+            self._idle.put(instance)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'running': sum(1 for instance in self._instances if instance.alive()),
+                'starts': self.starts,
+                'conversions': self.conversions,
+                'failures': self.failures,
+            }
+
+    def close(self):
+        """结束全部常驻进程"""
+        for instance in self._instances:
+            instance.stop()
+
+
+def _page_number(path):
+    return int(re.search(r'-(\d+)\.jpg$', path).group(1))
+
+
+def rasterize_pdf(pdf_path, output_folder, height=SLIDE_HEIGHT, timeout=120):
+    """PDF 每页栅格化为 slide_XX.jpg，返回图片路径。优先用 pdftoppm（PDFTOPPM_BINARY），没有时用 PyMuPDF"""
+    pdftoppm = os.environ.get('PDFTOPPM_BINARY') or shutil.which('pdftoppm')
+    images = []
+    if pdftoppm:
+        prefix = os.path.join(output_folder, 'page')
+        subprocess.run(
+            [pdftoppm, '-jpeg', '-jpegopt', 'quality=90', '-scale-to-x', '-1', '-scale-to-y', str(height),
+             pdf_path, prefix],
+            check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout
+        )
+        # pdftoppm 按总页数补零（page-1.jpg 或 page-01.jpg），按页码排序后改名
+        for number, page in enumerate(sorted(glob.glob(prefix + '-*.jpg'), key=_page_number), 1):
+            image = slide_image_path(output_folder, number)
+            os.replace(page, image)
+            images.append(image)
+        return images
+
+    try:
+        import fitz
+    except ImportError:
+        raise RuntimeError("栅格化 PDF 需要 pdftoppm（poppler-utils）或 PyMuPDF")
+    from PIL import Image
+    with fitz.open(pdf_path) as document:
+        for number, page in enumerate(document, 1):
+            zoom = height / page.rect.height
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            image = slide_image_path(output_folder, number)
+            Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples).save(image, quality=90)
+            images.append(image)
+    return images
+
+
+class LibreOfficeRenderer(SlideRenderer):
+    name = 'LibreOffice'
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def _render(self, ppt_path, output_folder, log):
+        pdf_folder = tempfile.mkdtemp(prefix='pdf_', dir=output_folder)
+        try:
+            started = time.perf_counter()
+            pdf_path = self.pool.convert(ppt_path, pdf_folder, 'pdf', log)
+            log(f"已转换为PDF，耗时 {time.perf_counter() - started:.1f} 秒")
+            return rasterize_pdf(pdf_path, output_folder)
+        finally:
+            shutil.rmtree(pdf_folder, ignore_errors=True)
+
+    def close(self):
+        self.pool.close()
+
+
+# ===========================
+# PowerPoint（Windows COM）
+# ===========================
+
+class PowerPointRenderer(SlideRenderer):
+    name = 'PowerPoint'
+
+    def _render(self, ppt_path, output_folder, log):
+        import pythoncom
+        import win32com.client
+
+        # COM 需要在调用它的线程里初始化
+        pythoncom.CoInitialize()
+        try:
+            powerpoint = win32com.client.Dispatch("PowerPoint.Application")
+            powerpoint.Visible = 1
+            presentation = powerpoint.Presentations.Open(ppt_path, WithWindow=False)
+            try:
+                log(f"PPT幻灯片数量: {len(presentation.Slides)}")
+                images = []
+                for i, slide in enumerate(presentation.Slides):
+                    image = slide_image_path(output_folder, i + 1)
+                    try:
+                        # 导出高清图 (高度 1080)
+                        slide.Export(image, "JPG", 0, SLIDE_HEIGHT)
+                        images.append(image)
+                    except Exception as e:
+                        log(f"  - [错误] 导出第 {i + 1} 页幻灯片失败: {e}")
+                return images
+            finally:
+                presentation.Close()
+        finally:
+            pythoncom.CoUninitialize()
+
+
+# ===========================
+# python-pptx + Pillow（兜底）
+# ===========================
+
+# 依次尝试的中文字体，都没有时用 Pillow 自带字体（不能显示中文）
+FONT_CANDIDATES = [
+    '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',
+    '/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc',
+    'C:/Windows/Fonts/msyh.ttc',
+    'C:/Windows/Fonts/simhei.ttf',
+]
+
+
+class PptxTextRenderer(SlideRenderer):
+    name = 'python-pptx'
+
+    def __init__(self, font_path=None):
+        self.font_path = font_path or os.environ.get('SLIDE_FONT_PATH') or next(
+            (path for path in FONT_CANDIDATES if os.path.exists(path)), None)
+
+    def _font(self, size):
+        from PIL import ImageFont
+        if self.font_path:
+            return ImageFont.truetype(self.font_path, size)
+        return ImageFont.load_default()
+
+    def _render(self, ppt_path, output_folder, log):
+        import io
+        from pptx import Presentation
+        from pptx.util import Pt
+        from PIL import Image, ImageDraw
+
+        if os.path.splitext(ppt_path)[1].lower() != '.pptx':
+            raise RuntimeError("python-pptx 只能读取 .pptx 文件")
+        presentation = Presentation(ppt_path)
+        scale = SLIDE_HEIGHT / presentation.slide_height
+        size = (round(presentation.slide_width * scale), SLIDE_HEIGHT)
+
+        images = []
+        for number, slide in enumerate(presentation.slides, 1):
+            canvas = Image.new('RGB', size, 'white')
+            draw = ImageDraw.Draw(canvas)
+            for shape in slide.shapes:
+                if shape.left is None or shape.top is None:
+                    continue
+                box = (round(shape.left * scale), round(shape.top * scale),
+                       round((shape.width or 0) * scale), round((shape.height or 0) * scale))
+                if getattr(shape, 'image', None) is not None and box[2] and box[3]:
+                    try:
+                        picture = Image.open(io.BytesIO(shape.image.blob)).convert('RGB')
+                        canvas.paste(picture.resize(box[2:]), box[:2])
+                    except Exception as e:
+                        log(f"  - [警告] 第 {number} 页图片无法绘制: {e}")
+                    continue
+                if not shape.has_text_frame:
+                    continue
+                y = box[1]
+                for paragraph in shape.text_frame.paragraphs:
+                    text = ''.join(run.text for run in paragraph.runs)
+                    point = next((run.font.size for run in paragraph.runs if run.font.size), None) or Pt(18)
+                    font_size = max(12, round(point * scale))
+                    draw.text((box[0], y), text, fill='black', font=self._font(font_size))
+                    y += round(font_size * 1.3)
+            image = slide_image_path(output_folder, number)
+            canvas.save(image, quality=90)
+            images.append(image)
+        return images
+
+
+# ===========================
+# 选择渲染器
+# ===========================
+
+def powerpoint_available():
+    return sys.platform == 'win32' and importlib.util.find_spec('win32com') is not None
+
+
+def create_slide_renderer(name=None):
+    """
+    按名称创建渲染器：libreoffice / powerpoint / pptx；name 为空时依次尝试 LibreOffice、PowerPoint、python-pptx。
+    环境变量：SOFFICE_BINARY（默认在 PATH 中查找 soffice / libreoffice）、SOFFICE_POOL_SIZE（默认 2）、
+    SOFFICE_CONVERT_TIMEOUT（秒，默认 120）
+    """
+    soffice = os.environ.get('SOFFICE_BINARY') or shutil.which('soffice') or shutil.which('libreoffice')
+    if not name:
+        name = 'libreoffice' if soffice else 'powerpoint' if powerpoint_available() else 'pptx'
+    if name == 'libreoffice':
+        if not soffice:
+            raise ValueError("找不到 soffice，请安装 LibreOffice 或设置 SOFFICE_BINARY")
+        return LibreOfficeRenderer(SofficePool(
+            soffice,
+            size=int(os.environ.get('SOFFICE_POOL_SIZE', 2)),
+            convert_timeout=float(os.environ.get('SOFFICE_CONVERT_TIMEOUT', 120))
+        ))
+    if name == 'powerpoint':
+        return PowerPointRenderer()
+    if name == 'pptx':
+        return PptxTextRenderer()
+    raise ValueError(f"未知的幻灯片渲染器: {name}")
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_slide_renderer():
+    """获取当前进程的幻灯片渲染器，第一次调用时按环境变量 PPT2VIDEO_RENDERER 创建，进程退出时释放"""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = create_slide_renderer(os.environ.get('PPT2VIDEO_RENDERER'))
+            atexit.register(_renderer.close)
+        return _renderer
+
+
+def set_slide_renderer(renderer):
+    """替换当前进程的幻灯片渲染器（测试使用；传入 None 时下次按环境变量重新创建）"""
+    global _renderer
+    with _renderer_lock:
+        _renderer = renderer
@@ -334,6 +334,7 @@ async function handleFAQSearch() {
                         <div class="card-body">
                             <p class="card-text"><strong>Q:</strong> ${item.question}</p>
                             <p class="card-text"><strong>A:</strong> ${item.answer}</p>
+                            <p class="card-text text-muted small">${item.snippet}</p>
                         </div>
                     </div>
                 `;
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+聊天记录分页API测试：按 (created_at, id) 游标向前翻页不重不漏，since_id 只返回新消息；
+课程群聊只有该课程的老师和学生能查看
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from app import app, db, Message, Course, StudentCourse
+
+
+def setup_chat(create_user, total):
+    alice_id, bob_id = create_user('hist_alice', 'HS1'), create_user('hist_bob', 'HS2')
+    with app.app_context():
+        start = datetime(2025, 1, 1)
+        for i in range(total):
+            sender, receiver = (alice_id, bob_id) if i % 2 == 0 else (bob_id, alice_id)
+            # 每两条消息共用同一时间戳，验证游标在时间相同时按ID区分
+            db.session.add(Message(sender_id=sender, receiver_id=receiver, content=f'消息{i}',
+                                   created_at=start + timedelta(seconds=i // 2)))
+        db.session.commit()
+    return alice_id, bob_id
+
+
+def test_chat_history_pagination(create_user, login):
+    total = 125
+    alice_id, bob_id = setup_chat(create_user, total)
+    client = login(alice_id)
+
+    # 从最新一页开始向前翻，直到没有更多记录
+    seen = []
+    data = client.get(f'/api/messages/history?with={bob_id}&limit=50').get_json()
+    newest_id = data['last_id']
+    while True:
+        assert data['success']
+        seen = [m['content'] for m in data['messages']] + seen
+        if not data['has_more']:
+            break
+        data = client.get(f'/api/messages/history?with={bob_id}&limit=50&cursor={data["next_cursor"]}').get_json()
+    assert seen == [f'消息{i}' for i in range(total)]
+
+    # since_id：没有新消息时返回空列表
+    data = client.get(f'/api/messages/history?with={bob_id}&since_id={newest_id}').get_json()
+    assert data['messages'] == [] and data['last_id'] == newest_id
+
+    # 对方发来新消息后只返回这一条
+    bob = login(bob_id)
+    bob.post('/send_message', data={'receiver_id': alice_id, 'content': '新消息'})
+    data = client.get(f'/api/messages/history?with={bob_id}&since_id={newest_id}').get_json()
+    assert [m['content'] for m in data['messages']] == ['新消息']
+    assert data['messages'][0]['sender_name'] == 'hist_bob'
+
+    # 消息页只渲染最新一页
+    page = client.get(f'/messages?with={bob_id}&type=private').get_data(as_text=True)
+    assert '新消息' in page and page.count('data-id=') == 50
+    assert '加载更早的消息' in page
+    print("✓ 聊天记录分页API测试通过")
+
+
+def test_group_history_requires_membership(create_user, login):
+    user_ids = teacher_id, member_id, _ = (create_user('hist_teacher', 'HST', role='teacher'),
+                                           create_user('hist_member', 'HS3'), create_user('hist_outsider', 'HS4'))
+    with app.app_context():
+        course = Course(course_code='HS101', title='群聊课程', teacher_id=teacher_id)
+        db.session.add(course)
+        db.session.flush()
+        db.session.add(StudentCourse(student_id=member_id, course_id=course.id))
+        db.session.add(Message(sender_id=teacher_id, course_id=course.id, content='群聊消息'))
+        db.session.commit()
+        course_id = course.id
+
+    responses = []
+    for user_id in user_ids:
+        client = login(user_id)
+        responses.append(client.get(f'/api/messages/history?with={course_id}&type=group'))
+    for response in responses[:2]:
+        assert [m['content'] for m in response.get_json()['messages']] == ['群聊消息']
+    assert responses[2].status_code == 403 and not responses[2].get_json()['success']
+    assert app.test_client().get(f'/api/messages/history?with={course_id}&type=group').status_code == 401
+    print("✓ 非课程成员不能查看群聊记录")
+
+
+if __name__ == '__main__':
+    # 通过 pytest 运行，使用 conftest.py 中的临时数据库
+    sys.exit(pytest.main([__file__, '-q', '-s']))
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+会话摘要表测试：发送消息后 Conversation 的最后一条消息、参与者未读数是否正确，
+以及 rebuild_conversations 从 Message 表重建的结果是否与增量维护一致
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy import event
+from app import app, db, Message, Course, StudentCourse, Conversation, ConversationMember, rebuild_conversations
+
+
+def setup_users(create_user):
+    teacher_id = create_user('conv_teacher', 'CT1', role='teacher')
+    alice_id = create_user('conv_alice', 'CS1')
+    bob_id = create_user('conv_bob', 'CS2')
+    with app.app_context():
+        course = Course(course_code='CONV1', title='会话测试课程', teacher_id=teacher_id)
+        db.session.add(course)
+        db.session.flush()
+        db.session.add_all([
+            StudentCourse(student_id=alice_id, course_id=course.id),
+            StudentCourse(student_id=bob_id, course_id=course.id),
+        ])
+        db.session.commit()
+        return teacher_id, alice_id, bob_id, course.id
+
+
+def member_unread(conversation_key):
+    with app.app_context():
+        conversation = Conversation.query.filter_by(conversation_key=conversation_key).first()
+        return {m.user_id: m.unread_count for m in conversation.members}
+
+
+def snapshot():
+    """会话键、最后一条消息、参与者及未读数（群聊消息没有逐人已读状态，重建后未读数为0，不参与比较）"""
+    with app.app_context():
+        return sorted(
+            (c.conversation_key, c.last_message_id, tuple(sorted(
+                (m.user_id, m.unread_count if c.conversation_type == 'private' else None) for m in c.members
+            )))
+            for c in Conversation.query.all()
+        )
+
+
+def test_conversation_summary(create_user, login):
+    teacher_id, alice_id, bob_id, course_id = setup_users(create_user)
+    alice, bob = login(alice_id), login(bob_id)
+
+    # 单聊：alice 给 bob 发两条，bob 回一条
+    alice.post('/send_message', data={'receiver_id': bob_id, 'content': '你好'})
+    alice.post('/send_message', data={'receiver_id': bob_id, 'content': '在吗'})
+    bob.post('/send_message', data={'receiver_id': alice_id, 'content': '在'})
+    private_key = f'p:{min(alice_id, bob_id)}:{max(alice_id, bob_id)}'
+    assert member_unread(private_key) == {alice_id: 1, bob_id: 2}
+
+    # 群聊：老师和另一名同学的未读数各加一
+    alice.post('/send_message', data={'course_id': course_id, 'content': '大家好'})
+    assert member_unread(f'g:{course_id}') == {teacher_id: 1, alice_id: 0, bob_id: 1}
+
+    with app.app_context():
+        conversation = Conversation.query.filter_by(conversation_key=private_key).first()
+        assert conversation.last_message.content == '在'
+
+    # 增量维护的结果与全量重建一致
+    before = snapshot()
+    with app.app_context():
+        rebuild_conversations(batch_size=2)
+    assert snapshot() == before
+
+    # 打开消息页后未读清零
+    bob.get('/messages')
+    assert member_unread(private_key)[bob_id] == 0
+    assert member_unread(f'g:{course_id}')[bob_id] == 0
+    print("✓ 会话摘要测试通过")
+
+
+
+def test_mark_read_is_set_based(create_user, login):
+    alice_id, bob_id = create_user('read_alice', 'RS1'), create_user('read_bob', 'RS2')
+    alice, bob = login(alice_id), login(bob_id)
+    for i in range(30):
+        alice.post('/send_message', data={'receiver_id': bob_id, 'content': f'未读{i}'})
+
+    writes = []
+    def count_write(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('UPDATE', 'INSERT', 'DELETE')):
+            writes.append(statement)
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count_write)
+    try:
+        # 30 条未读：写库语句条数固定（消息表、参与者表各一条 UPDATE）
+        bob.get('/messages')
+        assert len(writes) == 2, writes
+        # 没有未读时打开消息页不写库
+        writes.clear()
+        bob.get('/messages')
+        assert writes == []
+    finally:
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', count_write)
+
+    with app.app_context():
+        assert Message.query.filter_by(receiver_id=bob_id, is_read=False).count() == 0
+    assert member_unread(f'p:{min(alice_id, bob_id)}:{max(alice_id, bob_id)}')[bob_id] == 0
+    print("✓ 批量标记已读测试通过")
+
+
+if __name__ == '__main__':
+    # 通过 pytest 运行，使用 conftest.py 中的临时数据库
+    sys.exit(pytest.main([__file__, '-q', '-s']))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+当前用户缓存与权限装饰器测试：未登录跳转/401、角色不符提示、每个请求只查询一次用户，
+选课列表随用户一起加载（查询次数不随课程数增长），调试模式下返回身份映射未命中数
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy import event
+from app import app, db, Course, StudentCourse
+
+
+@pytest.fixture
+def setup_student(create_user):
+    """返回 setup_student(course_count)：创建一名选了 course_count 门课的学生，返回学生 id"""
+    def setup(course_count):
+        teacher_id = create_user(f'cu_teacher{course_count}', f'CUT{course_count}', role='teacher')
+        student_id = create_user(f'cu_student{course_count}', f'CUS{course_count}')
+        with app.app_context():
+            for i in range(course_count):
+                course = Course(course_code=f'CU{course_count}_{i}', title=f'课程{i}', teacher_id=teacher_id)
+                db.session.add(course)
+                db.session.flush()
+                db.session.add(StudentCourse(student_id=student_id, course_id=course.id))
+            db.session.commit()
+        return student_id
+    return setup
+
+
+def test_decorators(setup_student, login):
+    anonymous = app.test_client()
+    assert anonymous.get('/courses').headers['Location'].endswith('/')
+    assert anonymous.get('/api/messages/stream').status_code == 401
+
+    # 学生访问教师页面：提示后回到个人中心
+    student = login(setup_student(1))
+    response = student.get('/teacher_publish_grades')
+    assert response.status_code == 302 and response.headers['Location'].endswith('/dashboard')
+    with student.session_transaction() as sess:
+        assert ('message', '只有教师角色可以访问此页面') in sess['_flashes']
+
+    # 会话中的用户已被删除：清空会话并跳转登录页
+    ghost = login(999999)
+    assert ghost.get('/courses').headers['Location'].endswith('/')
+    print("✓ 登录与角色装饰器测试通过")
+
+
+def test_courses_page_query_count(setup_student, login):
+    counts = {}
+    counter = {'n': 0, 'user': 0, 'user_id': None}
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        counter['n'] += 1
+        if 'FROM user' in statement and counter['user_id'] in tuple(parameters):
+            counter['user'] += 1
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count_query)
+    try:
+        for course_count in (2, 20):
+            student_id = setup_student(course_count)
+            client = login(student_id)
+            counter.update(n=0, user=0, user_id=student_id)
+            assert client.get('/courses').status_code == 200
+            counts[course_count] = counter['n']
+            # 装饰器和视图函数共用同一次用户查询
+            assert counter['user'] == 1, counter
+    finally:
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', count_query)
+    assert counts[2] == counts[20], counts
+    print(f"✓ 课程页查询次数与选课数量无关（{counts[20]} 次）")
+
+
+def test_identity_map_miss_header(setup_student, login):
+    client = login(setup_student(5))
+    assert 'X-Identity-Map-Misses' not in client.get('/courses').headers
+    app.config['IDENTITY_MAP_STATS'] = True
+    try:
+        misses = int(client.get('/courses').headers['X-Identity-Map-Misses'])
+    finally:
+        app.config['IDENTITY_MAP_STATS'] = False
+    # 用户 1 + 选课记录 5 + 课程 5 + 授课老师 1
+    assert misses >= 11, misses
+    print(f"✓ 身份映射未命中计数：{misses}")
+
+
+if __name__ == '__main__':
+    # 通过 pytest 运行，使用 conftest.py 中的临时数据库
+    sys.exit(pytest.main([__file__, '-q', '-s']))
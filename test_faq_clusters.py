@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+常见问题聚类测试：不同用户相似的问法并入同一个问题类，代表问题取被问次数最多的问法，只差运算符的问题不合并；
+出错时保存的回答不作为答案；课程范围只统计该课程学生的提问，非课程成员看不到；
+增量构建只处理新提问，换一个进程（新的内存索引）接着构建结果不变；读 FAQ 只用 1 次查询
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy import event
+from faq_builder import FaqIndex
+from app import (app, db, Course, StudentCourse, FaqCluster, FaqVariant, FaqBuilderState, tutor_faq,
+                 build_faq_clusters, rebuild_faq_clusters, faq_builder, TUTOR_ERROR_ANSWERS)
+
+
+def ask(client, question, answer, session_id):
+    response = client.post('/api/ai-tutor/save-conversation', json={
+        'question': question, 'answer': answer, 'session_id': session_id})
+    assert response.get_json()['success']
+
+
+def clusters():
+    return sorted((c.scope, c.question, c.answer, c.frequency) for c in FaqCluster.query.all())
+
+
+def test_similar_questions_cluster_across_users(create_user, login):
+    alice, bob, carol = (login(create_user(name, f'FC{i}')) for i, name in enumerate(('fc_alice', 'fc_bob', 'fc_carol')))
+    ask(alice, '二叉树的前序遍历怎么写', '先访问根节点', 'a1')
+    ask(alice, '请问二叉树的前序遍历怎么写？', '根、左、右', 'a2')
+    ask(bob, '二叉树前序遍历怎么写', '递归或用栈', 'b1')
+    ask(carol, '什么是队列', '队列是先进先出的结构', 'c1')
+    # 只有题号不同的问题不合并；出错时保存的回答不作为答案
+    ask(carol, '第1题怎么做', '先画出递归树', 'c2')
+    ask(carol, '第2题怎么做', TUTOR_ERROR_ANSWERS[0], 'c3')
+    assert faq_builder.run_once() == 6
+
+    faq = alice.get('/api/ai-tutor/faq').get_json()['faq']
+    # 规范化后相同的问法被问 2 次（另一种问法 1 次），是代表问题，回答取它最近一次的回答
+    assert faq[0] == {'question': '请问二叉树的前序遍历怎么写？', 'answer': '根、左、右', 'frequency': 3}
+    assert {item['question'] for item in faq[1:]} == {'什么是队列', '第1题怎么做'}
+    with app.app_context():
+        assert FaqCluster.query.filter_by(question='第2题怎么做').one().answer is None
+
+    # 之后有了正常回答，问题出现在 FAQ 中
+    ask(bob, '第2题怎么做？', '按定义展开即可', 'b2')
+    assert faq_builder.run_once() == 1
+    faq = {item['question']: item for item in bob.get('/api/ai-tutor/faq').get_json()['faq']}
+    assert faq['第2题怎么做？'] == {'question': '第2题怎么做？', 'answer': '按定义展开即可', 'frequency': 2}
+    print("✓ 不同用户相似的问法归为一类，出错的回答不作为答案")
+
+
+def test_operators_keep_questions_apart(create_user, login):
+    client = login(create_user('fc_operators', 'FC30'))
+    answers = {'2+3等于几': '5', '2*3等于几': '6', '2-3等于几': '-1', 'C++的指针怎么用': '和 C 一样，另有引用',
+               'C的指针怎么用': '声明时加 *'}
+    for i, (question, answer) in enumerate(answers.items()):
+        ask(client, question, answer, f'op-{i}')
+    assert faq_builder.run_once() == 5
+    # 只差运算符的问题各自成为一类，各自保留自己的回答
+    with app.app_context():
+        for question, answer in answers.items():
+            cluster = FaqCluster.query.filter_by(scope='site', question=question).one()
+            assert (cluster.answer, cluster.frequency) == (answer, 1)
+            assert FaqVariant.query.filter_by(cluster_id=cluster.id).count() == 1
+    print("✓ 只差运算符的问题不合并为同一个 FAQ")
+
+
+def test_course_scope(create_user, login):
+    teacher_id = create_user('fc_teacher', 'FCT', role='teacher')
+    student_id = create_user('fc_student', 'FC10')
+    outsider_id = create_user('fc_outsider', 'FC11')
+    with app.app_context():
+        course = Course(course_code='FC101', title='数据结构', teacher_id=teacher_id)
+        db.session.add(course)
+        db.session.flush()
+        db.session.add(StudentCourse(student_id=student_id, course_id=course.id))
+        db.session.commit()
+        course_id = course.id
+    ask(login(student_id), '链表和数组的区别', '链表插入快，数组随机访问快', 'fc10')
+    ask(login(outsider_id), '链表和数组区别', '别的课程的回答', 'fc11')
+    faq_builder.run_once()
+
+    expected = [{'question': '链表和数组的区别', 'answer': '链表插入快，数组随机访问快', 'frequency': 1}]
+    for user_id in (teacher_id, student_id):
+        assert login(user_id).get(f'/api/ai-tutor/faq?course_id={course_id}').get_json()['faq'] == expected
+    assert login(outsider_id).get(f'/api/ai-tutor/faq?course_id={course_id}').get_json()['faq'] == []
+    site = {item['question']: item['frequency'] for item in login(outsider_id).get('/api/ai-tutor/faq').get_json()['faq']}
+    assert site.get('链表和数组的区别', site.get('链表和数组区别')) == 2
+    print("✓ 课程 FAQ 只统计该课程学生的提问，非课程成员看不到")
+
+
+def test_incremental_build_and_new_process(create_user, login):
+    user_id = create_user('fc_incremental', 'FC20')
+    client = login(user_id)
+    for i in range(5):
+        ask(client, f'递归的终止条件怎么写{"？" * (i % 2)}', f'第{i}次回答', f'inc-{i}')
+    with app.app_context():
+        assert build_faq_clusters(batch_size=2) == 2
+        assert build_faq_clusters(batch_size=2) == 2
+        assert build_faq_clusters(batch_size=2) == 1
+        assert build_faq_clusters(batch_size=2) == 0
+        watermark = db.session.get(FaqBuilderState, 1).last_message_id
+        cluster = FaqCluster.query.filter_by(question='递归的终止条件怎么写').one()
+        assert (cluster.answer, cluster.frequency) == ('第4次回答', 5)
+        before = clusters()
+
+        # 另一个进程（空的内存索引）先载入已有问法，新的相似提问并入已有的类
+        ask(client, '递归的终止条件应该怎么写', '新进程的回答', 'inc-5')
+        other = FaqIndex()
+        assert build_faq_clusters(other) == 1 and len(other) == FaqVariant.query.count()
+        assert db.session.get(FaqBuilderState, 1).last_message_id > watermark
+        assert FaqCluster.query.filter_by(question='递归的终止条件怎么写').one().frequency == 6
+        assert len(clusters()) == len(before)
+
+        # 从头重建结果相同；读 FAQ 只查一次 FaqCluster 表
+        after = clusters()
+        rebuild_faq_clusters()
+        assert clusters() == after
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            faq = tutor_faq(user_id)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert len(statements) == 1 and faq
+    print("✓ 增量构建只处理新提问，换进程接着构建和从头重建结果一致，读 FAQ 只用 1 次查询")
+
+
+if __name__ == '__main__':
+    # 通过 pytest 运行，使用 conftest.py 中的临时数据库
+    sys.exit(pytest.main([__file__, '-q', '-s']))
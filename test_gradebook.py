@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+成绩册测试：student_gradebook 的结果与逐门课程、逐个测验查询的结果一致，
+/grades 页面的查询次数不随课程数、测验数、作业数增长
+"""
+
+import os
+import sys
+from datetime import datetime
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy import event
+from app import (app, db, User, Course, StudentCourse, Quiz, StudentQuiz, Assignment, StudentAssignment,
+                 student_gradebook)
+
+
+def setup_student(tag, course_count, items_per_course):
+    """学生选 course_count 门课，每门课 items_per_course 个测验和作业，隔一个完成/提交一个"""
+    with app.app_context():
+        teacher = User(username=f'gb_teacher_{tag}', password='x', role='teacher', student_id=f'GBT{tag}')
+        student = User(username=f'gb_student_{tag}', password='x', role='student', student_id=f'GBS{tag}')
+        db.session.add_all([teacher, student])
+        db.session.flush()
+        for c in range(course_count):
+            course = Course(course_code=f'GB{tag}_{c}', title=f'课程{c}', teacher_id=teacher.id)
+            db.session.add(course)
+            db.session.flush()
+            db.session.add(StudentCourse(student_id=student.id, course_id=course.id))
+            for i in range(items_per_course):
+                quiz = Quiz(quiz_id=f'GBQ{tag}_{c}_{i}', title=f'测验{i}', teacher_id=teacher.id, course_id=course.id,
+                            knowledge_points='[]', difficulty='easy', time_limit=10)
+                assignment = Assignment(course_id=course.id, title=f'作业{i}')
+                db.session.add_all([quiz, assignment])
+                db.session.flush()
+                if i % 2 == 0:
+                    db.session.add(StudentQuiz(student_id=student.id, quiz_id=quiz.id, start_time=datetime.utcnow(),
+                                               status='completed', total_score=80 + i))
+                    db.session.add(StudentAssignment(student_id=student.id, assignment_id=assignment.id,
+                                                     status='graded', grade=90 - i))
+                else:
+                    # 未完成的测验不计入成绩
+                    db.session.add(StudentQuiz(student_id=student.id, quiz_id=quiz.id, start_time=datetime.utcnow(),
+                                               status='in_progress'))
+        db.session.commit()
+        return student.id
+
+
+def legacy_grades(student_id):
+    """原来的逐条查询写法，用来核对结果"""
+    result = {}
+    for sc in StudentCourse.query.filter_by(student_id=student_id).all():
+        quiz_grades = []
+        for quiz in Quiz.query.filter_by(course_id=sc.course_id).all():
+            sq = StudentQuiz.query.filter_by(quiz_id=quiz.id, student_id=student_id, status='completed').first()
+            if sq:
+                quiz_grades.append((quiz.id, sq.id))
+        assignment_grades = []
+        for assignment in Assignment.query.filter_by(course_id=sc.course_id).all():
+            sa = StudentAssignment.query.filter_by(assignment_id=assignment.id, student_id=student_id).first()
+            if sa:
+                assignment_grades.append((assignment.id, sa.id))
+        result[sc.course_id] = (quiz_grades, assignment_grades)
+    return result
+
+
+def test_gradebook_matches_legacy():
+    student_id = setup_student('match', 3, 4)
+    with app.app_context():
+        gradebook = student_gradebook(student_id)
+        # 成绩矩阵包含全部测验和作业
+        assert all(len(data['quiz_grades']) == 4 and len(data['assignment_grades']) == 4 for data in gradebook.values())
+        compact = {
+            course_id: (
+                [(g['quiz'].id, g['student_quiz'].id) for g in data['quiz_grades'] if g['student_quiz']],
+                [(g['assignment'].id, g['student_assignment'].id) for g in data['assignment_grades'] if g['student_assignment']],
+            )
+            for course_id, data in gradebook.items()
+        }
+        assert compact == legacy_grades(student_id)
+    print("✓ 成绩册与逐条查询结果一致")
+
+
+def test_grades_page_query_count(login):
+    counter = {'n': 0}
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        counter['n'] += 1
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count_query)
+    counts = {}
+    try:
+        for tag, course_count, items in (('small', 1, 1), ('large', 8, 6)):
+            client = login(setup_student(tag, course_count, items))
+            counter['n'] = 0
+            page = client.get('/grades').get_data(as_text=True)
+            counts[tag] = counter['n']
+            assert '测验0' in page and '作业0' in page
+    finally:
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', count_query)
+    assert counts['small'] == counts['large'], counts
+    print(f"✓ 成绩页查询次数固定（{counts['large']} 次）")
+
+
+if __name__ == '__main__':
+    # 通过 pytest 运行，使用 conftest.py 中的临时数据库
+    sys.exit(pytest.main([__file__, '-q', '-s']))
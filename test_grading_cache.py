@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+评分结果缓存测试：规范化后相同的报告命中同一条缓存，主题/提示词版本/模型不同则不命中，
+过期条目读不到，超出容量时淘汰最久未使用的条目，命中/未命中计数正确，换一个进程（新实例）仍能读到，
+每次读写后关闭数据库连接
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from grading_cache import GradingCache, grading_cache_key
+
+
+def new_cache(**kwargs):
+    return GradingCache(os.path.join(tempfile.mkdtemp(), 'grading_cache.db'), **kwargs)
+
+
+def test_cache_key():
+    key = grading_cache_key('第一章  引言\n\n人工智能', '人工智能', 'report-v1', 'deepseek-v3.2')
+    # 空白和全角字符规范化后相同
+    assert key == grading_cache_key(' 第一章 引言 人工智能\n', '人工智能 ', 'report-v1', 'deepseek-v3.2')
+    assert key == grading_cache_key('第一章　引言 人工智能', '人工智能', 'report-v1', 'deepseek-v3.2')
+    assert key != grading_cache_key('第一章 引言 人工智能', '机器学习', 'report-v1', 'deepseek-v3.2')
+    assert key != grading_cache_key('第一章 引言 人工智能', '人工智能', 'report-v2', 'deepseek-v3.2')
+    assert key != grading_cache_key('第一章 引言 人工智能', '人工智能', 'report-v1', 'deepseek-r1')
+    print("✓ 缓存键测试通过")
+
+
+def test_hit_miss_and_persistence():
+    cache = new_cache()
+    result = {'score': 88.0, 'grade': '良好', 'analysis': '结构清晰', 'suggestions': ['补充数据']}
+    assert cache.get('k1') is None
+    cache.put('k1', result)
+    assert cache.get('k1') == result
+    assert cache.get('k2') is None
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'hit_rate': 0.3333, 'evictions': 0, 'entries': 1}
+
+    # 同一个缓存文件，新进程（新实例）也能命中
+    assert GradingCache(cache.db_path).get('k1') == result
+    print("✓ 命中计数与持久化测试通过")
+
+
+def test_ttl_and_lru():
+    cache = new_cache(ttl_seconds=0.2)
+    cache.put('old', {'score': 1})
+    time.sleep(0.3)
+    assert cache.get('old') is None
+
+    cache = new_cache(max_entries=3)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, {'score': key})
+        time.sleep(0.01)
+    cache.get('a')  # a 最近用过，b 成为最久未使用
+    cache.put('d', {'score': 'd'})
+    assert cache.get('b') is None
+    assert all(cache.get(key) is not None for key in ('a', 'c', 'd'))
+    assert cache.stats()['entries'] == 3 and cache.stats()['evictions'] == 1
+    print("✓ 过期与 LRU 淘汰测试通过")
+
+
+def test_connections_closed():
+    cache, opened = new_cache(), []
+    connect = sqlite3.connect
+    def tracking_connect(database, *args, **kwargs):
+        conn = connect(database, *args, **kwargs)
+        if database == cache.db_path:
+            opened.append(conn)
+        return conn
+    sqlite3.connect = tracking_connect
+    try:
+        cache.put('k1', {'score': 90.0})
+        assert cache.get('k1') == {'score': 90.0}
+        assert cache.stats()['entries'] == 1
+    finally:
+        sqlite3.connect = connect
+    # 每次读写用一个连接，用完都已关闭
+    assert len(opened) == 3
+    for conn in opened:
+        try:
+            conn.execute('SELECT 1')
+        except sqlite3.ProgrammingError:
+            continue
+        raise AssertionError('连接没有关闭')
+    print("✓ 缓存读写后关闭连接")
+
+
+if __name__ == '__main__':
+    test_cache_key()
+    test_hit_miss_and_persistence()
+    test_ttl_and_lru()
+    test_connections_closed()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+报告批改任务队列测试：用本地的 OpenAI 兼容假服务代替大模型，
+10 名学生同时提交时请求立即返回 202，后台任务全部完成，发往大模型的并发数不超过上限；
+读取失败的任务标记为失败；进程重启后未完成的任务会被重新执行；相同内容的报告再次提交时命中评分缓存，不再请求大模型；
+长报告分段并发评阅后再汇总评分，每次请求的提示词都不超过分段上限；
+按路径提交时只接受上传目录（按 app.root_path，不随工作目录变化）中的文件，作业文件只有提交的学生和课程教师能提交批改
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeChatCompletions(BaseHTTPRequestHandler):
+    """
+    OpenAI 兼容的 /chat/completions：每次请求耗时 0.3 秒，记录同时在处理的请求数和收到的提示词；
+    长报告的分段评阅请求返回该段要点，其余请求返回评分结果
+    """
+    active = 0
+    max_active = 0
+    calls = 0
+    prompts = []
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        system, prompt = body['messages'][0]['content'], body['messages'][-1]['content']
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.calls += 1
+            cls.max_active = max(cls.max_active, cls.active)
+            cls.prompts.append(prompt)
+        try:
+            time.sleep(0.3)
+            if '分段阅读' in system:
+                part = prompt.split('部分', 1)[0].split('第')[-1]
+                content = json.dumps({'summary': f'要点{part}', 'strengths': ['论证充分'], 'issues': ['缺少数据']},
+                                     ensure_ascii=False)
+            else:
+                content = json.dumps({'score': 88, 'grade': '良好', 'analysis': '结构清晰',
+                                      'suggestions': ['补充数据'], 'model': body['model']}, ensure_ascii=False)
+            payload = json.dumps({
+                'id': 'chatcmpl-test', 'object': 'chat.completion', 'created': int(time.time()), 'model': body['model'],
+                'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+                'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2}
+            }).encode('utf-8')
+        finally:
+            with cls.lock:
+                cls.active -= 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+fake_server = ThreadingHTTPServer(('127.0.0.1', 0), FakeChatCompletions)
+threading.Thread(target=fake_server.serve_forever, daemon=True).start()
+
+import app as app_module
+from app import (app, db, User, Course, Assignment, StudentAssignment, GradingJob, GradingQueue, grading_queue,
+                 run_grading_job, recover_grading_jobs, get_grading_cache, submit_grading_job, grading_job_status,
+                 grade_report)
+
+
+# 实际的报告上传目录（夹具会换成临时目录）
+UPLOAD_FOLDERS = list(app_module.REPORT_UPLOAD_FOLDERS)
+REPORT_DIR = tempfile.mkdtemp()
+ASSIGNMENT_DIR = tempfile.mkdtemp()
+
+
+@pytest.fixture(autouse=True)
+def fake_grading_service(monkeypatch):
+    """
+    使用假的大模型服务；同时最多 2 个大模型请求，超过 2000 字的报告分段评分。
+    app 在导入时读取这些配置（可能已被其他测试模块导入），这里直接替换，测试结束后恢复
+    """
+    monkeypatch.setattr(app_module, 'GRADING_BASE_URL', f'http://127.0.0.1:{fake_server.server_port}/v1')
+    monkeypatch.setattr(app_module, 'GRADING_MODEL', 'fake-grader')
+    monkeypatch.setattr(app_module, 'grading_llm_slots', threading.BoundedSemaphore(2))
+    monkeypatch.setattr(app_module, 'GRADING_CHUNK_CHARS', 2000)
+    monkeypatch.setattr(app_module, 'GRADING_MAP_WORKERS', 4)
+    # 报告写在临时的上传目录中
+    monkeypatch.setattr(app_module, 'REPORT_UPLOAD_FOLDERS', [REPORT_DIR])
+    monkeypatch.setattr(app_module, 'ASSIGNMENT_UPLOAD_FOLDER', ASSIGNMENT_DIR)
+
+
+@pytest.fixture
+def create_student(create_user, login):
+    """返回 create_student(tag)：创建一名学生，返回已登录为该学生的测试客户端"""
+    return lambda tag: login(create_user(f'grading_{tag}', f'GJ{tag}'))
+
+
+def write_report(text, folder=REPORT_DIR):
+    fd, path = tempfile.mkstemp(suffix='.txt', dir=folder)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return path
+
+
+def wait_for(client, status_url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        data = client.get(status_url).get_json()
+        if data['status'] in ('completed', 'failed'):
+            return data
+        time.sleep(0.05)
+    raise AssertionError(f'任务未在 {timeout} 秒内完成: {data}')
+
+
+def test_concurrent_submissions(create_student):
+    clients = [create_student(i) for i in range(10)]
+    paths = [write_report(f'第{i}份报告：人工智能的发展与挑战。') for i in range(10)]
+
+    # 10 名学生同时提交：每个请求只登记任务，不等待大模型
+    responses, elapsed = [None] * 10, [None] * 10
+    def submit(i):
+        start = time.time()
+        responses[i] = clients[i].post('/api/evaluation/report', json={'file_path': paths[i], 'topic': '人工智能'})
+        elapsed[i] = time.time() - start
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(r.status_code == 202 for r in responses), [r.status_code for r in responses]
+    assert max(elapsed) < 0.3 * 10 / 2, elapsed
+
+    jobs = [r.get_json() for r in responses]
+    for client, job in zip(clients, jobs):
+        assert wait_for(client, job['status_url'])['status'] == 'completed'
+        result = client.get(job['result_url'])
+        assert result.status_code == 200
+        assert result.get_json()['report_data']['score'] == 88.0
+
+    # 别人的任务查不到
+    assert clients[0].get(jobs[1]['status_url']).status_code == 404
+    assert 1 < FakeChatCompletions.max_active <= 2, FakeChatCompletions.max_active
+    print(f"✓ 10 个并发提交最慢 {max(elapsed) * 1000:.0f}ms 返回，大模型最大并发 {FakeChatCompletions.max_active}")
+
+
+def test_upload_and_failure(create_student):
+    client = create_student('upload')
+    # multipart 上传后由任务删除临时文件
+    with open(write_report('一份通过表单上传的报告。'), 'rb') as f:
+        response = client.post('/api/grading/jobs', data={'file': (f, 'report.txt'), 'topic': '测试'})
+    assert response.status_code == 202
+    job = response.get_json()
+    assert job['status'] == 'queued'
+    assert wait_for(client, job['status_url'])['status'] == 'completed'
+    with app.app_context():
+        assert not os.path.exists(GradingJob.query.filter_by(job_id=job['job_id']).one().file_path)
+
+    # 读不出文字的文件提交时就拒绝
+    bad_path = write_report('')
+    os.rename(bad_path, bad_path + '.xyz')
+    response = client.post('/api/grading/jobs', json={'file_path': bad_path + '.xyz'})
+    assert response.status_code == 400 and '不支持的文件格式' in response.get_json()['error']
+
+    # 排队期间文件变得不可读：任务失败，结果接口返回错误
+    with app.test_request_context():
+        job = grading_job_status(submit_grading_job(bad_path + '.xyz'))
+    status = wait_for(client, job['status_url'])
+    assert status['status'] == 'failed' and '不支持的文件格式' in status['error']
+    assert client.get(job['result_url']).status_code == 500
+    print("✓ 表单上传与失败任务测试通过")
+
+
+def test_report_path_access(create_student, create_user, login):
+    owner, other = create_student('owner'), create_student('other')
+    teacher_id = create_user('grading_teacher', 'GJT', role='teacher')
+    with app.app_context():
+        owner_id = User.query.filter_by(username='grading_owner').one().id
+        course = Course(course_code='GJ101', title='批改权限课程', teacher_id=teacher_id)
+        db.session.add(course)
+        db.session.flush()
+        assignment = Assignment(course_id=course.id, title='实验报告')
+        db.session.add(assignment)
+        db.session.flush()
+        path = write_report('提交到课程的作业报告。', folder=ASSIGNMENT_DIR)
+        db.session.add(StudentAssignment(student_id=owner_id, assignment_id=assignment.id,
+                                         file_path=os.path.basename(path), status='submitted'))
+        db.session.commit()
+
+    teacher_client = login(teacher_id)
+
+    # 上传目录以外的文件，以及借 .. 跳出上传目录的路径都拒绝
+    outside = write_report('上传目录以外的文件。', folder=tempfile.mkdtemp())
+    escaped = os.path.join(REPORT_DIR, '..', os.path.relpath(outside, os.path.dirname(REPORT_DIR)))
+    for file_path in (outside, escaped):
+        response = owner.post('/api/grading/jobs', json={'file_path': file_path})
+        assert response.status_code == 403, file_path
+        assert owner.post('/api/evaluation/report', json={'file_path': file_path}).status_code == 403
+
+    # 作业文件：别的学生不能提交，提交作业的学生和课程教师可以
+    assert other.post('/api/grading/jobs', json={'file_path': path}).status_code == 403
+    for client in (owner, teacher_client):
+        response = client.post('/api/grading/jobs', json={'file_path': path})
+        assert response.status_code == 202
+        assert wait_for(client, response.get_json()['status_url'])['status'] == 'completed'
+    print("✓ 按路径提交只接受上传目录中的文件和自己（或本课程）的作业")
+
+
+def test_upload_folders_ignore_working_directory(monkeypatch, create_student):
+    monkeypatch.setattr(app_module, 'REPORT_UPLOAD_FOLDERS', UPLOAD_FOLDERS)
+    client = create_student('cwd')
+    # 进程从别的目录启动：上传、按路径提交都按 app.root_path 找文件，工作目录下的 uploads 不算上传目录
+    workdir = tempfile.mkdtemp()
+    monkeypatch.chdir(workdir)
+    report = io.BytesIO('从别的目录启动时上传的报告。'.encode('utf-8'))
+    response = client.post('/api/upload_report_file', data={'file': (report, 'cwd.txt')})
+    file_path = response.get_json()['file_path']
+    uploaded = os.path.join(app.root_path, file_path)
+    try:
+        assert file_path.startswith('uploads/') and os.path.isfile(uploaded)
+        response = client.post('/api/grading/jobs', json={'file_path': file_path})
+        assert response.status_code == 202
+        assert wait_for(client, response.get_json()['status_url'])['status'] == 'completed'
+    finally:
+        os.remove(uploaded)
+    os.makedirs('uploads')
+    stray = write_report('工作目录下的文件。', folder=os.path.join(workdir, 'uploads'))
+    assert client.post('/api/grading/jobs', json={'file_path': stray}).status_code == 403
+    print("✓ 报告上传目录按 app.root_path 确定，与工作目录无关")
+
+
+def test_recover_unfinished_jobs():
+    path = write_report('进程重启前没批改完的报告。')
+    with app.app_context():
+        # 一条排队中、一条“运行中”但早已超时（进程在批改途中退出）
+        db.session.add(GradingJob(job_id='recover-queued', file_path=path))
+        db.session.add(GradingJob(job_id='recover-stale', file_path=path, status='running',
+                                  started_at=datetime.utcnow() - timedelta(hours=1)))
+        db.session.commit()
+
+    restarted = GradingQueue(run_grading_job, workers=2, recover=recover_grading_jobs)
+    restarted.start()
+    restarted.join()
+    restarted.stop()
+    with app.app_context():
+        statuses = {job.job_id: job.status for job in GradingJob.query.filter(GradingJob.job_id.like('recover-%'))}
+    assert statuses == {'recover-queued': 'completed', 'recover-stale': 'completed'}, statuses
+
+    # 已完成的任务重复入队不会再执行一次
+    calls = FakeChatCompletions.calls
+    run_grading_job('recover-queued')
+    assert FakeChatCompletions.calls == calls
+    print("✓ 未完成任务恢复测试通过")
+
+
+def test_identical_report_hits_cache(create_student):
+    client = create_student('cache')
+    first = client.post('/api/evaluation/report', json={'file_path': write_report('缓存测试报告\n\n第一段内容。'),
+                                                        'topic': '缓存'}).get_json()
+    assert wait_for(client, first['status_url'])['status'] == 'completed'
+
+    # 重新上传同一份内容（另存为新文件、空白略有不同）：直接用缓存结果，不再请求大模型
+    calls, hits = FakeChatCompletions.calls, get_grading_cache().stats()['hits']
+    start = time.time()
+    second = client.post('/api/evaluation/report', json={'file_path': write_report('缓存测试报告 第一段内容。 '),
+                                                         'topic': '缓存'}).get_json()
+    assert wait_for(client, second['status_url'])['status'] == 'completed'
+    elapsed = time.time() - start
+    assert FakeChatCompletions.calls == calls
+    assert get_grading_cache().stats()['hits'] == hits + 1
+    assert client.get(second['result_url']).get_json()['report_data'] == \
+        client.get(first['result_url']).get_json()['report_data']
+
+    # 换了主题就是另一次评分
+    third = client.post('/api/evaluation/report', json={'file_path': write_report('缓存测试报告 第一段内容。'),
+                                                        'topic': '其他主题'}).get_json()
+    wait_for(client, third['status_url'])
+    assert FakeChatCompletions.calls == calls + 1
+    print(f"✓ 相同报告命中评分缓存，{elapsed * 1000:.0f}ms 完成")
+
+
+def test_long_report_map_reduce():
+    sections = [f"第{i}章 研究内容{i}\n\n" + f"本章讨论第{i}个问题，给出实验设计与结果分析。" * 60 for i in range(1, 9)]
+    report = '\n\n'.join(sections)
+    assert len(report) > 4 * 2000
+
+    calls = FakeChatCompletions.calls
+    del FakeChatCompletions.prompts[:]
+    start = time.time()
+    result = grade_report(report, '长报告')
+    elapsed = time.time() - start
+    assert result['score'] == 88.0
+
+    map_prompts, reduce_prompts = FakeChatCompletions.prompts[:-1], FakeChatCompletions.prompts[-1:]
+    assert FakeChatCompletions.calls == calls + len(map_prompts) + 1 and len(map_prompts) >= 4
+    # 每次请求的提示词长度可控；汇总请求只带各段要点，按原顺序排列
+    assert all(len(prompt) < 2000 + 500 for prompt in FakeChatCompletions.prompts)
+    reduce_prompt = reduce_prompts[0]
+    assert '本章讨论' not in reduce_prompt
+    positions = [reduce_prompt.index(f'【第{i}部分】要点{i}') for i in range(1, len(map_prompts) + 1)]
+    assert positions == sorted(positions)
+    # 分段并发评阅：总耗时明显少于逐段串行
+    assert elapsed < 0.3 * (len(map_prompts) + 1) * 0.8, elapsed
+
+    # 同一份长报告再次评分命中缓存
+    assert grade_report(report, '长报告') == result
+    assert FakeChatCompletions.calls == calls + len(map_prompts) + 1
+    print(f"✓ 长报告分 {len(map_prompts)} 段评阅后汇总，耗时 {elapsed * 1000:.0f}ms")
+
+
+if __name__ == '__main__':
+    # 通过 pytest 运行，使用 conftest.py 中的临时数据库
+    sys.exit(pytest.main([__file__, '-q', '-s']))
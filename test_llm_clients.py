@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享大模型客户端测试：用本地的 OpenAI 兼容流式假服务（SSE，HTTP/1.1 长连接）代替大模型，
+同一配置取到同一个客户端，连续请求复用同一条 TCP 连接；503 时退避重试；
+记录首 token 时间和连接池等待时间；AI 助教接口的流式输出与原来一致
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeStreamingChat(BaseHTTPRequestHandler):
+    """
+    OpenAI 兼容的流式 /chat/completions：先等 first_token_delay 秒再逐块返回“思考”和“回答”；
+    fail_next 大于 0 时当前请求返回 503。记录收到请求的不同连接（客户端端口）
+    """
+    protocol_version = 'HTTP/1.1'
+    first_token_delay = 0.2
+    fail_next = 0
+    requests = 0
+    client_ports = set()
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        cls = type(self)
+        with cls.lock:
+            cls.requests += 1
+            cls.client_ports.add(self.client_address[1])
+            fail = cls.fail_next > 0
+            if fail:
+                cls.fail_next -= 1
+        if fail:
+            payload = json.dumps({'error': {'message': 'overloaded', 'type': 'server_error'}}).encode('utf-8')
+            self.send_response(503)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        time.sleep(cls.first_token_delay)
+        deltas = [{'role': 'assistant', 'content': ''}, {'reasoning_content': '想一想'},
+                  {'content': '你好'}, {'content': '，同学'}]
+        events = []
+        for delta in deltas:
+            chunk = {'id': 'chatcmpl-test', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                     'model': body['model'], 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]}
+            events.append(f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n')
+        events.append('data: [DONE]\n\n')
+        payload = ''.join(events).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+fake_server = ThreadingHTTPServer(('127.0.0.1', 0), FakeStreamingChat)
+threading.Thread(target=fake_server.serve_forever, daemon=True).start()
+FAKE_BASE_URL = f'http://127.0.0.1:{fake_server.server_port}/v1'
+
+from llm_clients import get_llm_client, create_with_retry, close_llm_clients, metrics
+from app import app
+
+# AI 助教改用上面的假服务（见 conftest.py）
+pytestmark = pytest.mark.usefixtures('fake_tutor_service')
+
+
+def reset_server():
+    FakeStreamingChat.requests = 0
+    FakeStreamingChat.fail_next = 0
+    FakeStreamingChat.client_ports = set()
+    close_llm_clients()
+    metrics.reset()
+
+
+def stream_answer(client, **kwargs):
+    chunks = create_with_retry(client, model='fake-tutor', messages=[{'role': 'user', 'content': '你好'}],
+                               stream=True, **kwargs)
+    return ''.join(chunk.choices[0].delta.content or '' for chunk in chunks)
+
+
+def test_shared_client_keeps_connection_alive():
+    reset_server()
+    client = get_llm_client(FAKE_BASE_URL, 'sk-test', 'chat')
+    assert get_llm_client(FAKE_BASE_URL, 'sk-test', 'chat') is client
+    assert get_llm_client(FAKE_BASE_URL, 'sk-test', 'grading') is not client
+
+    for _ in range(5):
+        assert stream_answer(client) == '你好，同学'
+    # 5 次请求只建了一条连接
+    assert FakeStreamingChat.requests == 5
+    assert len(FakeStreamingChat.client_ports) == 1
+    snapshot = metrics.snapshot()
+    assert snapshot['counters']['connections_opened'] == 1
+    assert snapshot['pool_wait']['count'] == 5
+    # 首 token 时间包含服务端的等待
+    assert snapshot['ttft']['count'] == 5 and snapshot['ttft']['p50_ms'] >= 200
+    print(f"✓ 连续 5 次请求复用 1 条连接，TTFT p50 {snapshot['ttft']['p50_ms']}ms")
+
+
+def test_retry_on_unavailable():
+    reset_server()
+    client = get_llm_client(FAKE_BASE_URL, 'sk-test', 'chat')
+    FakeStreamingChat.fail_next = 2
+    assert stream_answer(client) == '你好，同学'
+    assert FakeStreamingChat.requests == 3
+    assert metrics.snapshot()['counters']['retries'] == 2
+
+    # 超过重试次数时把错误抛给调用方
+    import openai
+    FakeStreamingChat.fail_next = 5
+    try:
+        stream_answer(client, max_retries=1)
+        raise AssertionError('应当抛出 503 错误')
+    except openai.APIStatusError as e:
+        assert e.status_code == 503
+    assert metrics.snapshot()['counters']['failures'] == 1
+    print("✓ 503 退避重试测试通过")
+
+
+def test_tutor_chat_stream():
+    reset_server()
+    client = app.test_client()
+    for question in ('什么是栈？', '二叉树怎么遍历？'):
+        response = client.post('/api/ai-tutor/chat', json={'question': question})
+        events = [line[len('data: '):] for line in response.get_data(as_text=True).split('\n\n') if line]
+        assert events[-1] == '[DONE]'
+        messages = [json.loads(event) for event in events[:-1]]
+        assert messages == [{'type': 'thinking', 'content': '想一想'},
+                            {'type': 'answer', 'content': '你好'},
+                            {'type': 'answer', 'content': '，同学'}]
+    assert len(FakeStreamingChat.client_ports) == 1
+    print("✓ AI 助教流式接口测试通过")
+
+
+def test_metrics_route(create_user, login):
+    client = login(create_user('llm_metrics_teacher', 'LLMT1', role='teacher'))
+    data = client.get('/api/llm/metrics').get_json()
+    assert 'counters' in data and 'ttft' in data
+    print("✓ 大模型调用指标接口测试通过")
+
+
+if __name__ == '__main__':
+    # 通过 pytest 运行，使用 conftest.py 中的临时数据库和假服务
+    sys.exit(pytest.main([__file__, '-q', '-s']))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+消息推送中心测试：按频道分发、慢消费者断开、SQLite 多进程中转（每次读写后关闭连接），以及 /api/messages/stream 推送
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from message_hub import InMemoryMessageHub, SQLiteMessageHub, set_message_hub, user_channel, course_channel
+
+
+def test_in_memory_hub():
+    hub = InMemoryMessageHub(max_queue_size=2)
+    alice = hub.subscribe([user_channel(1), course_channel(9)])
+    bob = hub.subscribe([user_channel(2)])
+
+    hub.publish(course_channel(9), {'id': 1})
+    hub.publish(user_channel(2), {'id': 2})
+    assert alice.get(timeout=0.1) == {'id': 1}
+    assert bob.get(timeout=0.1) == {'id': 2}
+    assert alice.get(timeout=0.01) is None
+
+    # 队列写满后继续发布：慢消费者被断开，其他订阅不受影响
+    for i in range(3):
+        hub.publish(user_channel(1), {'id': 10 + i})
+    assert alice.dropped
+    hub.publish(user_channel(2), {'id': 3})
+    assert bob.get(timeout=0.1) == {'id': 3}
+    assert hub.subscriber_count() == 1
+
+    bob.close()
+    assert hub.subscriber_count() == 0
+    print("✓ 进程内推送中心测试通过")
+
+
+def test_sqlite_hub_between_processes():
+    # 两个实例共用一个文件，模拟两个工作进程
+    path = os.path.join(tempfile.mkdtemp(), 'hub.db')
+    worker_a = SQLiteMessageHub(path, poll_interval=0.05)
+    worker_b = SQLiteMessageHub(path, poll_interval=0.05)
+    subscription = worker_b.subscribe([user_channel(5)])
+
+    worker_a.publish(user_channel(5), {'content': '跨进程消息'})
+    worker_a.publish(user_channel(6), {'content': '其他用户'})
+    assert subscription.get(timeout=2) == {'content': '跨进程消息'}
+    assert subscription.get(timeout=0.2) is None
+    worker_a.stop()
+    worker_b.stop()
+    print("✓ SQLite 中转测试通过")
+
+
+def test_sqlite_hub_closes_connections(monkeypatch):
+    path, opened = os.path.join(tempfile.mkdtemp(), 'hub.db'), []
+    connect = sqlite3.connect
+    def tracking_connect(database, *args, **kwargs):
+        conn = connect(database, *args, **kwargs)
+        if database == path:
+            opened.append(conn)
+        return conn
+    monkeypatch.setattr(sqlite3, 'connect', tracking_connect)
+
+    hub = SQLiteMessageHub(path)
+    hub.publish(user_channel(1), {'id': 1})
+    hub.poll_once()
+    hub._cleanup()
+    # 建表、发布、轮询、清理各用一个连接，用完都已关闭
+    assert len(opened) == 4
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute('SELECT 1')
+    print("✓ SQLite 中转每次读写后关闭连接")
+
+
+def test_message_stream_endpoint(create_user, login):
+    set_message_hub(InMemoryMessageHub())
+
+    alice_id, bob_id = create_user('hub_alice', 'HB1'), create_user('hub_bob', 'HB2')
+
+    bob_client = login(bob_id)
+    stream = bob_client.get('/api/messages/stream', buffered=False)
+    assert stream.mimetype == 'text/event-stream'
+    events = iter(stream.response)
+    assert next(events).startswith(b'retry:')
+
+    alice_client = login(alice_id)
+    alice_client.post('/send_message', data={'receiver_id': bob_id, 'content': '实时消息'})
+
+    chunk = next(events).decode('utf-8')
+    event = json.loads(chunk[len('data: '):])
+    assert event['type'] == 'message'
+    assert event['content'] == '实时消息' and event['sender_id'] == alice_id
+    stream.close()
+    print("✓ 消息推送接口测试通过")
+
+
+if __name__ == '__main__':
+    # 通过 pytest 运行，使用 conftest.py 中的临时数据库
+    sys.exit(pytest.main([__file__, '-q', '-s']))
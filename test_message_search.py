@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+消息全文检索测试：中文二元词切分和查询表达式；FAQ 搜索走 FTS5 索引，按相关度排序、分页、每个会话一条、
+带高亮摘要，结果与 LIKE 查询一致；索引随消息的插入、删除同步；聊天记录搜索只返回当前聊天的消息，
+课程群聊只有课程成员能搜索
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy import text
+import message_search
+from app import (app, db, Message, Course, StudentCourse, tutor_faq_search, rebuild_message_search_index, _message_search_ready)
+
+
+def test_tokenizer():
+    assert message_search.index_terms('什么是栈？Python 的 List') == '什么 么是 是栈 栈 python 的 list'
+    assert message_search.index_terms('栈和Python', 't7x') == 't7x栈和 t7x和 t7xpython'
+    assert message_search.match_expression('是栈') == '"是栈"'
+    assert message_search.match_expression('什么是栈', 't7x') == '"t7x什么 t7x么是 t7x是栈"'
+    assert message_search.match_expression('栈 PY') == '"栈"* AND "py"*'
+    assert message_search.match_expression('？！') is None
+    # 单聊的范围与双方顺序无关，与助教问答、群聊互不相同
+    assert message_search.message_scope(7, 3, None, None) == message_search.chat_scope(3, 7, 'private') == 'p3y7x'
+    assert message_search.message_scope(7, 7, None, 'answer') == 't7x'
+    assert message_search.message_scope(7, None, 5, None) == 'c5x'
+    snippet = message_search.highlight('请问<b>栈</b>和队列有什么区别', '队列')
+    assert snippet == '请问&lt;b&gt;栈&lt;/b&gt;和<mark>队列</mark>有什么区别'
+    assert message_search.highlight('甲' * 100 + '队列' + '乙' * 100, '队列', width=20).startswith('…甲甲甲甲甲<mark>')
+    print("✓ 中文二元词切分、查询表达式和高亮摘要")
+
+
+def test_faq_search_ranked_and_paginated(create_user, login):
+    user_id = create_user('search_student', 'MS1')
+    other_id = create_user('search_other', 'MS2')
+    client, other = login(user_id), login(other_id)
+    conversations = [
+        ('s1', '什么是栈', '栈是一种后进先出的数据结构'),
+        ('s2', '队列和栈有什么区别', '队列先进先出，栈后进先出'),
+        ('s3', '什么是队列', '队列是一种先进先出的数据结构'),
+        ('s4', '递归怎么写', '递归函数要有终止条件'),
+    ]
+    for session_id, question, answer in conversations:
+        client.post('/api/ai-tutor/save-conversation', json={'question': question, 'answer': answer,
+                                                             'session_id': session_id})
+    # 同一会话的追问和其他用户的问答都不应出现在结果中
+    client.post('/api/ai-tutor/save-conversation', json={'question': '栈溢出是什么', 'answer': '递归太深',
+                                                         'session_id': 's1'})
+    other.post('/api/ai-tutor/save-conversation', json={'question': '什么是栈', 'answer': '别人的回答',
+                                                        'session_id': 'o1'})
+
+    result = client.get('/api/ai-tutor/faq/search?keyword=栈').get_json()
+    assert sorted(item['session_id'] for item in result['faq']) == ['s1', 's2'] and result['has_more'] is False
+    faq = {item['session_id']: item for item in result['faq']}
+    assert faq['s1']['question'] in ('什么是栈', '栈溢出是什么')
+    assert faq['s1']['answer'] in ('栈是一种后进先出的数据结构', '递归太深')
+    assert all('<mark>栈</mark>' in item['snippet'] for item in result['faq'])
+
+    # 命中回答时配该会话的第一条问题；两个字以上按短语匹配
+    result = client.get('/api/ai-tutor/faq/search?keyword=终止条件').get_json()
+    assert [(item['question'], item['answer']) for item in result['faq']] == [('递归怎么写', '递归函数要有终止条件')]
+    assert client.get('/api/ai-tutor/faq/search?keyword=止终').get_json()['faq'] == []
+
+    # 分页：每页 1 条
+    pages = [client.get(f'/api/ai-tutor/faq/search?keyword=先进先出&per_page=1&page={page}').get_json()
+             for page in (1, 2, 3)]
+    assert [len(page['faq']) for page in pages] == [1, 1, 0]
+    assert [page['has_more'] for page in pages] == [True, False, False]
+    assert {pages[0]['faq'][0]['session_id'], pages[1]['faq'][0]['session_id']} == {'s2', 's3'}
+
+    # 命中超过排序窗口时只看最近的命中
+    message_search.RANK_WINDOW = 1
+    try:
+        result = client.get('/api/ai-tutor/faq/search?keyword=先进先出').get_json()
+    finally:
+        message_search.RANK_WINDOW = 2000
+    assert [item['session_id'] for item in result['faq']] == ['s3']
+
+    # 退回 LIKE 查询时命中的会话相同
+    with app.app_context():
+        url = str(db.engine.url)
+        indexed = {item['session_id'] for item in tutor_faq_search(user_id, '先进先出')[0]}
+        _message_search_ready[url] = False
+        try:
+            fallback = {item['session_id'] for item in tutor_faq_search(user_id, '先进先出')[0]}
+        finally:
+            _message_search_ready[url] = True
+    assert indexed == fallback == {'s2', 's3'}
+    print("✓ FAQ 搜索按相关度排序、分页，结果与 LIKE 查询一致")
+
+
+def test_index_follows_inserts_and_deletes(create_user, login):
+    alice_id = create_user('search_alice', 'MS3')
+    bob_id = create_user('search_bob', 'MS4')
+    carol_id = create_user('search_carol', 'MS5')
+    alice, bob = login(alice_id), login(bob_id)
+    alice.post('/send_message', data={'receiver_id': bob_id, 'content': '明天的数据结构作业交了吗'})
+    alice.post('/send_message', data={'receiver_id': carol_id, 'content': '数据结构作业借我看看'})
+    bob.post('/send_message', data={'receiver_id': alice_id, 'content': '还没写完'})
+
+    result = alice.get(f'/api/messages/search?with={bob_id}&keyword=作业').get_json()
+    assert [item['content'] for item in result['messages']] == ['明天的数据结构作业交了吗']
+    assert result['messages'][0]['snippet'] == '明天的数据结构<mark>作业</mark>交了吗'
+    assert alice.get(f'/api/messages/search?with={bob_id}&keyword=').status_code == 400
+
+    # 删除消息后索引同步删除；重建索引结果不变
+    with app.app_context():
+        message_id = Message.query.filter_by(content='明天的数据结构作业交了吗').first().id
+    bob.post(f'/delete_message/{message_id}')
+    assert alice.get(f'/api/messages/search?with={bob_id}&keyword=作业').get_json()['messages'] == []
+    with app.app_context():
+        before = db.session.execute(text('SELECT rowid, terms FROM message_fts ORDER BY rowid')).all()
+        rebuild_message_search_index(batch_size=2)
+        after = db.session.execute(text('SELECT rowid, terms FROM message_fts ORDER BY rowid')).all()
+        assert before == after and len(after) == Message.query.count()
+    print("✓ 全文索引随消息插入、删除同步，聊天记录搜索只返回当前聊天")
+
+
+def test_group_search_requires_membership(create_user, login):
+    teacher_id = create_user('search_teacher', 'MST')
+    member_id = create_user('search_member', 'MS6')
+    outsider_id = create_user('search_outsider', 'MS7')
+    with app.app_context():
+        course = Course(course_code='MS101', title='检索课程', teacher_id=teacher_id)
+        db.session.add(course)
+        db.session.flush()
+        db.session.add(StudentCourse(student_id=member_id, course_id=course.id))
+        db.session.add(Message(sender_id=teacher_id, course_id=course.id, content='期中考试范围是前五章'))
+        db.session.commit()
+        course_id = course.id
+
+    url = f'/api/messages/search?with={course_id}&type=group&keyword=考试'
+    for user_id in (teacher_id, member_id):
+        assert [item['content'] for item in login(user_id).get(url).get_json()['messages']] == ['期中考试范围是前五章']
+    assert login(outsider_id).get(url).status_code == 403
+    assert app.test_client().get(url).status_code == 401
+    print("✓ 非课程成员不能搜索群聊记录")
+
+
+if __name__ == '__main__':
+    # 通过 pytest 运行，使用 conftest.py 中的临时数据库
+    sys.exit(pytest.main([__file__, '-q', '-s']))
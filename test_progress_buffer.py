@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+观看进度写缓冲测试：心跳不直接写库，/get_progress 读到缓冲中的最新值，
+批量写库后观看时长正确累加，写库失败时数据放回缓冲不丢失，写库提交后读进度不重复计入同一批
+"""
+
+import os
+import sys
+import time
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy import event
+from app import app, db, CourseWatchProgress, watch_progress_buffer
+from progress_buffer import ProgressBuffer
+
+
+def heartbeat(client, course_id, progress, position, duration):
+    data = client.post('/save_progress', json={
+        'course_id': course_id, 'watch_progress': progress,
+        'last_watch_time': position, 'watch_duration': duration
+    }).get_json()
+    assert data['success'], data
+
+
+def test_save_progress_is_buffered(create_user, login):
+    student_id = create_user('progress_student', 'PB1')
+    client = login(student_id)
+
+    writes = []
+    def count_write(conn, cursor, statement, parameters, context, executemany):
+        if 'course_watch_progress' in statement and not statement.lstrip().upper().startswith('SELECT'):
+            writes.append(statement)
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count_write)
+
+    # 30 次心跳不写库，读进度时能看到最新值和累计时长
+    for i in range(1, 31):
+        heartbeat(client, 7, i, i * 10.0, 10.0)
+    assert writes == []
+    data = client.get('/get_progress/7').get_json()['data']
+    assert data == {'watch_progress': 30, 'last_watch_time': 300.0, 'total_watch_duration': 300.0}
+
+    # 一次批量写库
+    assert watch_progress_buffer.flush() == 1
+    assert len(writes) == 1
+    with app.app_context():
+        progress = CourseWatchProgress.query.filter_by(student_id=student_id, course_id=7).one()
+        assert (progress.watch_progress, progress.total_watch_duration) == (30, 300.0)
+
+    # 写库后继续观看：读到的是库中记录加上缓冲增量，再次写库时时长累加
+    heartbeat(client, 7, 31, 310.0, 10.0)
+    assert client.get('/get_progress/7').get_json()['data']['total_watch_duration'] == 310.0
+    watch_progress_buffer.flush()
+    with app.app_context():
+        progress = CourseWatchProgress.query.filter_by(student_id=student_id, course_id=7).one()
+        assert (progress.watch_progress, progress.last_watch_time, progress.total_watch_duration) == (31, 310.0, 310.0)
+        event.remove(db.engine, 'before_cursor_execute', count_write)
+    print("✓ 观看进度写缓冲测试通过")
+
+
+def test_failed_flush_keeps_data():
+    calls = []
+    def failing_flush(entries):
+        calls.append(entries)
+        if len(calls) == 1:
+            raise RuntimeError('database is locked')
+
+    buffer = ProgressBuffer(failing_flush, flush_interval=3600)
+    buffer.record(1, 2, 10, 100.0, 10.0)
+    try:
+        buffer.flush()
+        assert False, '写库失败应抛出异常'
+    except RuntimeError:
+        pass
+    # 失败期间又来一次心跳：进度取新值，时长合并
+    buffer.record(1, 2, 11, 110.0, 10.0)
+    assert buffer.pending(1, 2)['watch_duration'] == 20.0
+    assert buffer.flush() == 1
+    entry = calls[-1][(1, 2)]
+    assert (entry['watch_progress'], entry['watch_duration']) == (11, 20.0)
+    assert buffer.pending_count() == 0
+    print("✓ 写库失败重试测试通过")
+
+
+def test_pending_during_slow_flush():
+    seen = []
+    def slow_flush(entries):
+        # 写库尚未完成时读进度：这一批仍然可见，写库期间新到的心跳叠加在上面
+        seen.append(buffer.pending(1, 2))
+        buffer.record(1, 2, 12, 120.0, 5.0)
+        seen.append(buffer.pending(1, 2))
+        time.sleep(0.1)
+
+    buffer = ProgressBuffer(slow_flush, flush_interval=3600)
+    buffer.record(1, 2, 11, 110.0, 10.0)
+    assert buffer.flush() == 1
+    assert [(entry['watch_progress'], entry['last_watch_time'], entry['watch_duration']) for entry in seen] == [
+        (11, 110.0, 10.0), (12, 120.0, 15.0)]
+    # 写库完成后只剩写库期间新到的心跳
+    assert buffer.pending(1, 2)['watch_duration'] == 5.0
+    print("✓ 写库期间读进度不丢失正在写入的一批")
+
+
+def test_snapshot_does_not_double_count():
+    database, committed = {}, threading.Event()
+    def flush(entries):
+        for key, entry in entries.items():
+            database[key] = database.get(key, 0.0) + entry['watch_duration']
+        # 已提交，但这一批还没有移出 pending()
+        committed.set()
+        time.sleep(0.2)
+
+    buffer = ProgressBuffer(flush, flush_interval=3600)
+    buffer.record(1, 2, 11, 110.0, 10.0)
+    flusher = threading.Thread(target=buffer.flush)
+    flusher.start()
+    committed.wait(5)
+    # 读数据库记录和 pending() 在同一个 snapshot 内：等这一批移出 pending() 后才读，不会重复计入
+    with buffer.snapshot():
+        pending = buffer.pending(1, 2)
+        total = database.get((1, 2), 0.0) + (pending['watch_duration'] if pending else 0.0)
+    flusher.join()
+    assert total == 10.0
+    print("✓ 写库提交后读进度不会重复计入同一批观看时长")
+
+
+if __name__ == '__main__':
+    # 通过 pytest 运行，使用 conftest.py 中的临时数据库
+    sys.exit(pytest.main([__file__, '-q', '-s']))
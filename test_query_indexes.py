@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+常用查询的执行计划检查：用 SQLite EXPLAIN QUERY PLAN 确认每条热点查询都走索引，
+任何一条退化为全表扫描（SCAN 表名）即失败
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from app import app, db, Message, StudentQuiz, StudentAnswer, ErrorQuestionBank, CourseWatchProgress
+
+
+def hot_queries():
+    """与 app.py 中热点路径相同的查询条件"""
+    return {
+        'AI助教会话首条问题': Message.query.filter_by(
+            sender_id=1, session_id='s1', message_type='question'
+        ).order_by(Message.created_at),
+        'AI助教会话首条回答': Message.query.filter_by(
+            session_id='s1', message_type='answer'
+        ).order_by(Message.created_at),
+        '未读消息': Message.query.filter_by(receiver_id=1, is_read=False),
+        '群聊记录': Message.query.filter_by(course_id=1).order_by(Message.created_at.desc(), Message.id.desc()),
+        '学生测验记录': StudentQuiz.query.filter_by(quiz_id=1, student_id=1, status='completed'),
+        '测验作答': StudentAnswer.query.filter_by(student_quiz_id=1),
+        '错题库': ErrorQuestionBank.query.filter_by(student_id=1, question_id=1),
+        '观看进度': CourseWatchProgress.query.filter_by(student_id=1, course_id=1),
+    }
+
+
+def query_plan(conn, query):
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def test_hot_queries_use_indexes():
+    failures = []
+    with app.app_context():
+        with db.engine.connect() as conn:
+            for name, query in hot_queries().items():
+                plan = query_plan(conn, query)
+                # "SCAN message" 是全表扫描；"SEARCH ... USING INDEX" 或 "SCAN ... USING INDEX" 走了索引
+                full_scans = [step for step in plan if step.startswith('SCAN') and 'INDEX' not in step]
+                print(f"{name}: {' | '.join(plan)}")
+                if full_scans:
+                    failures.append(f"{name} 全表扫描: {full_scans}")
+    assert not failures, '\n'.join(failures)
+    print("✓ 热点查询均走索引")
+
+
+if __name__ == '__main__':
+    # 通过 pytest 运行，使用 conftest.py 中的临时数据库
+    sys.exit(pytest.main([__file__, '-q', '-s']))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测验排名与统计测试：交卷时增量维护的密集排名、平均分、百分位与全量重建结果一致（含同分、重新评分），
+学生交卷后排名表自动更新，教师批改/发布成绩页面的查询次数不随课程数、测验数、答卷数增长
+"""
+
+import os
+import sys
+import random
+from datetime import datetime
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy import event
+from app import (app, db, User, Course, StudentCourse, Quiz, StudentQuiz, QuizRanking, QuizStatistics,
+                 record_quiz_result, rebuild_quiz_statistics)
+
+
+def create_class(tag, course_count, quizzes_per_course, students_per_course):
+    """造课程、测验和已完成的答卷，交卷时逐条调用 record_quiz_result，返回 (教师ID, 测验ID列表, 学生ID列表)"""
+    rng = random.Random(tag)
+    with app.app_context():
+        teacher = User(username=f'qs_teacher_{tag}', password='x', role='teacher', student_id=f'QST{tag}')
+        db.session.add(teacher)
+        db.session.flush()
+        quiz_ids, student_ids = [], []
+        for c in range(course_count):
+            course = Course(course_code=f'QS{tag}_{c}', title=f'课程{c}', teacher_id=teacher.id)
+            db.session.add(course)
+            db.session.flush()
+            students = []
+            for n in range(students_per_course):
+                student = User(username=f'qs_{tag}_{c}_{n}', password='x', role='student', student_id=f'QS{tag}_{c}_{n}')
+                db.session.add(student)
+                db.session.flush()
+                db.session.add(StudentCourse(student_id=student.id, course_id=course.id))
+                students.append(student)
+                student_ids.append(student.id)
+            for q in range(quizzes_per_course):
+                quiz = Quiz(quiz_id=f'QSQ{tag}_{c}_{q}', title=f'测验{q}', teacher_id=teacher.id, course_id=course.id,
+                            knowledge_points='[]', difficulty='easy', time_limit=10)
+                db.session.add(quiz)
+                db.session.flush()
+                quiz_ids.append(quiz.id)
+                for student in students:
+                    # 分数取 5 的倍数，制造大量同分
+                    attempt = StudentQuiz(student_id=student.id, quiz_id=quiz.id, start_time=datetime.utcnow(),
+                                          end_time=datetime.utcnow(), status='completed',
+                                          total_score=float(rng.randrange(0, 21) * 5))
+                    db.session.add(attempt)
+                    db.session.flush()
+                    record_quiz_result(attempt)
+        db.session.commit()
+        return teacher.id, quiz_ids, student_ids
+
+
+def snapshot(quiz_ids):
+    with app.app_context():
+        rankings = sorted((r.quiz_id, r.student_quiz_id, r.total_score, r.dense_rank)
+                          for r in QuizRanking.query.filter(QuizRanking.quiz_id.in_(quiz_ids)))
+        statistics = sorted((s.quiz_id, s.attempt_count, round(s.mean_score, 6), s.min_score, s.max_score,
+                             s.median_score, s.p90_score)
+                            for s in QuizStatistics.query.filter(QuizStatistics.quiz_id.in_(quiz_ids)))
+        return rankings, statistics
+
+
+def test_incremental_matches_rebuild():
+    _, quiz_ids, _ = create_class('inc', 2, 2, 15)
+
+    # 重新评分：改几份答卷的分数
+    with app.app_context():
+        for attempt in StudentQuiz.query.filter(StudentQuiz.quiz_id == quiz_ids[0]).limit(4):
+            attempt.total_score = 100.0 - attempt.total_score
+            db.session.flush()
+            record_quiz_result(attempt)
+        db.session.commit()
+
+    incremental = snapshot(quiz_ids)
+    with app.app_context():
+        rebuild_quiz_statistics(quiz_ids)
+    assert snapshot(quiz_ids) == incremental
+
+    # 与直接计算的密集排名一致
+    with app.app_context():
+        for quiz_id in quiz_ids:
+            scores = sorted({r.total_score for r in QuizRanking.query.filter_by(quiz_id=quiz_id)}, reverse=True)
+            for ranking in QuizRanking.query.filter_by(quiz_id=quiz_id):
+                assert ranking.dense_rank == scores.index(ranking.total_score) + 1
+    print("✓ 增量排名与全量重建一致")
+
+
+def test_end_quiz_updates_ranking(login):
+    teacher_id, quiz_ids, student_ids = create_class('end', 1, 1, 2)
+    with app.app_context():
+        attempt = StudentQuiz(student_id=student_ids[0], quiz_id=quiz_ids[0], start_time=datetime.utcnow(),
+                              status='in_progress')
+        db.session.add(attempt)
+        db.session.commit()
+        attempt_id = attempt.id
+        before = QuizStatistics.query.filter_by(quiz_id=quiz_ids[0]).one().attempt_count
+
+    client = login(student_ids[0])
+    client.get(f'/student_end_quiz/{attempt_id}')
+
+    with app.app_context():
+        assert QuizRanking.query.filter_by(student_quiz_id=attempt_id).one().total_score == 0.0
+        assert QuizStatistics.query.filter_by(quiz_id=quiz_ids[0]).one().attempt_count == before + 1
+    print("✓ 交卷后排名与统计已更新")
+
+
+def test_teacher_pages_query_count(login):
+    counter = {'n': 0}
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        counter['n'] += 1
+    counts = {}
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count_query)
+    try:
+        for tag, size in (('small', (1, 1, 2)), ('large', (3, 4, 12))):
+            teacher_id, _, _ = create_class(tag, *size)
+            client = login(teacher_id)
+            for page in ('/teacher_grade_assignments', '/teacher_publish_grades'):
+                counter['n'] = 0
+                response = client.get(page)
+                assert response.status_code == 200
+                counts[(tag, page)] = counter['n']
+    finally:
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', count_query)
+    for page in ('/teacher_grade_assignments', '/teacher_publish_grades'):
+        assert counts[('small', page)] == counts[('large', page)], counts
+    print(f"✓ 教师成绩页查询次数固定：{counts}")
+
+
+if __name__ == '__main__':
+    # 通过 pytest 运行，使用 conftest.py 中的临时数据库
+    sys.exit(pytest.main([__file__, '-q', '-s']))
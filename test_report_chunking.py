@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+长报告分段测试：短报告不切分，长报告在标题处断开、每段不超过上限、内容不丢失，
+没有标题和空行的长文本（PDF 常见）按句子切，超长单句硬切
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AI_analysis.report_chunking import split_report, is_heading
+
+
+def squeeze(text):
+    return ''.join(text.split())
+
+
+def test_headings():
+    for line in ('# 引言', '第三章 实验设计', '二、相关工作', '（一）数据来源', '3.2 结果分析', '摘要', '参考文献：'):
+        assert is_heading(line), line
+    for line in ('这是一段普通的正文。', '2023年我们完成了实验' + '，' * 60, ''):
+        assert not is_heading(line), line
+    print("✓ 标题识别测试通过")
+
+
+def test_split_by_sections():
+    assert split_report('短报告', 100) == ['短报告']
+    assert split_report('  ', 100) == []
+
+    sections = [f"{n}、第{n}部分\n" + f"第{n}部分的正文内容。" * 12 for n in '一二三四五六']
+    text = '\n\n'.join(sections)
+    chunks = split_report(text, 300)
+    assert len(chunks) > 1 and all(len(chunk) <= 300 for chunk in chunks)
+    assert squeeze(''.join(chunks)) == squeeze(text)
+    # 放得下的章节不会被拆开，每段都从标题开始
+    assert all(is_heading(chunk.splitlines()[0]) for chunk in chunks)
+    print(f"✓ 按章节分段：{len(text)} 字分成 {len(chunks)} 段")
+
+
+def test_split_long_paragraphs():
+    # 没有标题、没有空行，一段到底
+    text = '这是一个很长的句子，描述实验过程。' * 200 + 'x' * 1500
+    chunks = split_report(text, 500)
+    assert all(len(chunk) <= 500 for chunk in chunks)
+    assert squeeze(''.join(chunks)) == squeeze(text)
+    # 除最后的超长单句外都在句号处断开
+    assert all(chunk.endswith('。') for chunk in chunks if 'x' not in chunk)
+    print("✓ 超长段落按句子切分测试通过")
+
+
+if __name__ == '__main__':
+    test_headings()
+    test_split_by_sections()
+    test_split_long_paragraphs()
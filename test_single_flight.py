@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+相同请求合并测试：同时到达的相同请求只执行一次 produce，所有订阅者收到完整、有序的事件；
+中途加入的订阅者先收到已产出的事件再收到后续事件；订阅者断开后释放订阅计数；结束后的相同请求重新执行；
+20 名学生同时向 /api/ai-tutor/chat 发同一个问题时只向大模型请求一次，只差运算符的问题不合并；
+异步版本同样合并请求，所有订阅者断开后取消上游
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from single_flight import SingleFlight, AsyncSingleFlight
+
+
+def slow_producer(calls, count=5, delay=0.05):
+    def produce():
+        calls.append(1)
+        for i in range(count):
+            time.sleep(delay)
+            yield {'type': 'answer', 'content': str(i)}
+    return produce
+
+
+def test_concurrent_requests_share_one_call():
+    flights, calls, results = SingleFlight(), [], []
+    def subscriber():
+        results.append(list(flights.stream('q', slow_producer(calls))))
+    threads = [threading.Thread(target=subscriber) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(events == [{'type': 'answer', 'content': str(i)} for i in range(5)] for events in results)
+    stats = flights.stats()
+    assert (stats['started'], stats['joined'], stats['in_flight']) == (1, 9, 0)
+    print("✓ 10 个同时到达的相同请求只执行一次")
+
+
+def test_late_joiner_replays_buffer():
+    flights, calls = SingleFlight(), []
+    first = flights.stream('q', slow_producer(calls, count=6, delay=0.05))
+    assert next(first)['content'] == '0'
+    time.sleep(0.12)
+    # 中途加入：立即拿到已产出的前几个事件，之后继续收到剩下的
+    late = flights.stream('q', slow_producer(calls))
+    assert [e['content'] for e in late] == ['0', '1', '2', '3', '4', '5']
+    assert [e['content'] for e in first] == ['1', '2', '3', '4', '5']
+    assert len(calls) == 1
+
+    # 上一次结束后，相同请求重新执行；不同的键互不影响
+    assert len(list(flights.stream('q', slow_producer(calls, count=1)))) == 1
+    assert len(list(flights.stream('other', slow_producer(calls, count=1)))) == 1
+    assert len(calls) == 3
+    print("✓ 中途加入的订阅者先重放已产出的事件")
+
+
+def test_disconnect_releases_subscriber():
+    flights, calls = SingleFlight(), []
+    first = flights.stream('q', slow_producer(calls, count=6, delay=0.05))
+    second = flights.stream('q', slow_producer(calls))
+    assert next(first)['content'] == next(second)['content'] == '0'
+    assert flights.stats()['subscribers'] == 2
+    # 一个订阅者中途断开：计数减一，生产继续，另一个订阅者收到完整回答
+    first.close()
+    assert flights.stats()['subscribers'] == 1
+    assert [e['content'] for e in second] == ['1', '2', '3', '4', '5']
+    assert flights.stats()['subscribers'] == 0 and len(calls) == 1
+    print("✓ 订阅者断开后释放订阅计数")
+
+
+def test_producer_error_ends_stream():
+    flights = SingleFlight()
+    def produce():
+        yield {'type': 'answer', 'content': '半句'}
+        raise RuntimeError('上游断开')
+    assert list(flights.stream('q', produce)) == [{'type': 'answer', 'content': '半句'}]
+    assert flights.stats()['in_flight'] == 0
+    print("✓ 生产出错时订阅者正常结束")
+
+
+@pytest.mark.usefixtures('fake_tutor_service')
+def test_tutor_chat_coalesces_identical_questions():
+    # 复用 AI 助教流式接口测试的本地假服务，首 token 前等 0.5 秒，让请求都在回答过程中到达
+    from test_llm_clients import FakeStreamingChat, reset_server
+    from app import app, tutor_flights
+    from tutor_cache import get_tutor_cache
+    reset_server()
+    get_tutor_cache().clear()
+    FakeStreamingChat.first_token_delay = 0.5
+
+    answers = []
+    def ask():
+        response = app.test_client().post('/api/ai-tutor/chat', json={'question': '投影上的第 3 题怎么做？'})
+        events = [line[len('data: '):] for line in response.get_data(as_text=True).split('\n\n') if line]
+        answers.append(''.join(json.loads(e)['content'] for e in events[:-1] if json.loads(e)['type'] == 'answer'))
+    try:
+        threads = [threading.Thread(target=ask) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+    finally:
+        FakeStreamingChat.first_token_delay = 0.2
+    assert answers == ['你好，同学'] * 20
+    assert FakeStreamingChat.requests == 1
+    assert tutor_flights.stats()['joined'] >= 19
+    print("✓ 20 个相同问题只请求大模型 1 次")
+
+
+@pytest.mark.usefixtures('fake_tutor_service')
+def test_tutor_chat_keeps_different_operators_apart():
+    from test_llm_clients import FakeStreamingChat, reset_server
+    from app import app, tutor_flights
+    from tutor_cache import get_tutor_cache
+    reset_server()
+    get_tutor_cache().clear()
+    FakeStreamingChat.first_token_delay = 0.5
+    joined = tutor_flights.stats()['joined']
+
+    # 只差运算符的两个问题同时在回答；大小写、空白不同的同一个问题仍然合并
+    questions = ['X+Y 等于几？', 'X*Y 等于几？', 'x+y  等于几？', 'x*y 等于几？']
+    def ask(question):
+        app.test_client().post('/api/ai-tutor/chat', json={'question': question}).get_data()
+    try:
+        threads = [threading.Thread(target=ask, args=(questions[i % 4],)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+    finally:
+        FakeStreamingChat.first_token_delay = 0.2
+    assert FakeStreamingChat.requests == 2
+    assert tutor_flights.stats()['joined'] - joined == 6
+    print("✓ 只差运算符的问题不会加入彼此的回答")
+
+
+def test_async_flight_coalesces_and_cancels():
+    async def run():
+        flights, calls, cancelled = AsyncSingleFlight(), [], []
+
+        async def produce():
+            calls.append(1)
+            try:
+                for i in range(5):
+                    await asyncio.sleep(0.05)
+                    yield str(i)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        async def collect():
+            return [event async for event in flights.stream('q', produce)]
+        results = await asyncio.gather(*[collect() for _ in range(10)])
+        assert results == [['0', '1', '2', '3', '4']] * 10 and len(calls) == 1
+
+        # 唯一的订阅者收到一个事件后断开：上游被取消，之后的相同请求重新发起
+        stream = flights.stream('q', produce)
+        assert await stream.__anext__() == '0'
+        await stream.aclose()
+        await asyncio.sleep(0.1)
+        assert cancelled == [1] and flights.stats()['cancelled'] == 1 and flights.stats()['in_flight'] == 0
+        assert await collect() == ['0', '1', '2', '3', '4'] and len(calls) == 3
+    asyncio.run(run())
+    print("✓ 异步合并与断开后取消上游测试通过")
+
+
+if __name__ == '__main__':
+    # 通过 pytest 运行，使用 conftest.py 中的临时数据库和假服务
+    sys.exit(pytest.main([__file__, '-q', '-s']))
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+幻灯片渲染器测试：python-pptx 兜底渲染器按页导出 1080 像素高的图片；
+LibreOffice 渲染器通过常驻 soffice 进程池转换（用假的 soffice / pdftoppm 脚本模拟），
+多次转换只冷启动一次，并发转换不超过进程池大小，进程退出或转换失败后自动重启；按环境变量选择渲染器
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import textwrap
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image
+from pptx import Presentation
+from pptx.util import Inches, Pt
+
+from slide_renderers import (SLIDE_HEIGHT, SofficePool, LibreOfficeRenderer, PptxTextRenderer,
+                             create_slide_renderer)
+
+# 假 soffice：带 --accept 时模拟冷启动后监听端口并常驻；带 --convert-to 时要求同一配置目录的常驻进程在运行，
+# 按幻灯片页数生成多页 PDF
+FAKE_SOFFICE = '''
+import os, re, sys, time, socket
+from pathlib import Path
+args = sys.argv[1:]
+profile = next(a.split('=', 1)[1] for a in args if a.startswith('-env:UserInstallation='))
+profile_dir = Path(profile[len('file://'):])
+log = os.environ['FAKE_SOFFICE_LOG']
+accept = next((a for a in args if a.startswith('--accept=')), None)
+if accept:
+    with open(log, 'a') as f:
+        f.write('start\\n')
+    time.sleep(float(os.environ.get('FAKE_SOFFICE_COLD_START', '0.5')))
+    port = int(re.search(r'port=(\\d+)', accept).group(1))
+    server = socket.socket()
+    server.bind(('127.0.0.1', port))
+    server.listen()
+    (profile_dir / 'port').write_text(str(port))
+    while True:
+        server.accept()[0].close()
+source = args[-1]
+outdir = args[args.index('--outdir') + 1]
+port = int((profile_dir / 'port').read_text())
+socket.create_connection(('127.0.0.1', port), timeout=1).close()
+with open(log, 'a') as f:
+    f.write('convert\\n')
+if 'broken' in source:
+    sys.exit(1)
+time.sleep(float(os.environ.get('FAKE_SOFFICE_CONVERT', '0')))
+from pptx import Presentation
+from PIL import Image
+pages = [Image.new('RGB', (160, 90), 'white') for _ in Presentation(source).slides]
+pdf = os.path.join(outdir, os.path.splitext(os.path.basename(source))[0] + '.pdf')
+pages[0].save(pdf, save_all=True, append_images=pages[1:])
+'''
+
+# 假 pdftoppm：按 PDF 页数生成 page-1.jpg ……，高度取 -scale-to-y
+FAKE_PDFTOPPM = '''
+import re, sys
+from PIL import Image
+args = sys.argv[1:]
+height = int(args[args.index('-scale-to-y') + 1])
+pages = len(re.findall(rb'/Type\\s*/Page\\b', open(args[-2], 'rb').read()))
+for number in range(1, pages + 1):
+    image = Image.effect_noise((height * 16 // 9, height), 64).convert('RGB')
+    image.save(f'{args[-1]}-{number}.jpg')
+'''
+
+
+def write_script(folder, name, source):
+    path = os.path.join(folder, name)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f'#!{sys.executable}\n' + textwrap.dedent(source))
+    os.chmod(path, 0o755)
+    return path
+
+
+def make_deck(path, slides):
+    presentation = Presentation()
+    for title, body in slides:
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = title
+        slide.placeholders[1].text = body
+        box = slide.shapes.add_textbox(Inches(1), Inches(6), Inches(4), Inches(1))
+        box.text_frame.text = '备注'
+        box.text_frame.paragraphs[0].runs[0].font.size = Pt(28)
+    presentation.save(path)
+    return path
+
+
+def fake_tools():
+    folder = tempfile.mkdtemp()
+    os.environ['FAKE_SOFFICE_LOG'] = os.path.join(folder, 'soffice.log')
+    os.environ['PDFTOPPM_BINARY'] = write_script(folder, 'pdftoppm', FAKE_PDFTOPPM)
+    return folder, write_script(folder, 'soffice', FAKE_SOFFICE)
+
+
+def soffice_calls():
+    with open(os.environ['FAKE_SOFFICE_LOG']) as f:
+        return f.read().split()
+
+
+def test_pptx_renderer():
+    folder = tempfile.mkdtemp()
+    deck = make_deck(os.path.join(folder, 'deck.pptx'), [('第一章 栈', '后进先出'), ('第二章 队列', '先进先出')])
+    output = os.path.join(folder, 'images')
+    logs = []
+    images = PptxTextRenderer().render(deck, output, logs.append)
+    assert [os.path.basename(image) for image in images] == ['slide_01.jpg', 'slide_02.jpg']
+    assert all(Image.open(image).size == (1440, SLIDE_HEIGHT) for image in images)
+    # 不存在的文件和 .ppt 文件返回空列表并记录错误
+    assert PptxTextRenderer().render(os.path.join(folder, 'missing.pptx'), output, logs.append) == []
+    legacy = shutil.copy(deck, deck.replace('.pptx', '.ppt'))
+    assert PptxTextRenderer().render(legacy, output, logs.append) == []
+    assert '[错误] PPT导出失败: python-pptx 只能读取 .pptx 文件' in logs
+    print("✓ python-pptx 渲染器按页导出图片")
+
+
+def test_libreoffice_pool_reuses_soffice():
+    folder, soffice = fake_tools()
+    deck = make_deck(os.path.join(folder, 'deck.pptx'), [(f'第{i}页', '内容') for i in range(1, 4)])
+    renderer = LibreOfficeRenderer(SofficePool(soffice, size=1, startup_timeout=10, convert_timeout=10))
+    try:
+        durations = []
+        for run in range(3):
+            output = os.path.join(folder, f'run{run}')
+            started = time.perf_counter()
+            images = renderer.render(deck, output, lambda message: None)
+            durations.append(time.perf_counter() - started)
+            assert [os.path.basename(image) for image in images] == ['slide_01.jpg', 'slide_02.jpg', 'slide_03.jpg']
+            assert Image.open(images[0]).size[1] == SLIDE_HEIGHT
+            # 中间生成的 PDF 已删除
+            assert sorted(os.listdir(output)) == ['slide_01.jpg', 'slide_02.jpg', 'slide_03.jpg']
+        # 只冷启动一次，之后的转换不再等待启动
+        assert soffice_calls() == ['start', 'convert', 'convert', 'convert']
+        assert max(durations[1:]) < durations[0]
+        assert renderer.pool.stats() == {'size': 1, 'running': 1, 'starts': 1, 'conversions': 3, 'failures': 0}
+
+        # 常驻进程退出、转换失败后，下次使用时重新启动
+        renderer.pool._instances[0].stop()
+        assert renderer.render(deck, os.path.join(folder, 'restart'), lambda message: None)
+        broken = make_deck(os.path.join(folder, 'broken.pptx'), [('坏文件', '')])
+        assert renderer.render(broken, os.path.join(folder, 'broken'), lambda message: None) == []
+        assert renderer.render(deck, os.path.join(folder, 'recovered'), lambda message: None)
+        stats = renderer.pool.stats()
+        assert (stats['starts'], stats['conversions'], stats['failures']) == (3, 5, 1)
+    finally:
+        renderer.close()
+    assert renderer.pool.stats()['running'] == 0
+    print(f"✓ 常驻 soffice 只冷启动一次：首次 {durations[0]:.2f} 秒，之后 {max(durations[1:]):.2f} 秒")
+
+
+def test_pool_limits_concurrency():
+    folder, soffice = fake_tools()
+    os.environ['FAKE_SOFFICE_CONVERT'] = '0.2'
+    deck = make_deck(os.path.join(folder, 'deck.pptx'), [('并发', '转换')])
+    renderer = LibreOfficeRenderer(SofficePool(soffice, size=2, startup_timeout=10, convert_timeout=10))
+    results = []
+    try:
+        threads = [threading.Thread(target=lambda i=i: results.append(
+            renderer.render(deck, os.path.join(folder, f'job{i}'), lambda message: None))) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        renderer.close()
+        del os.environ['FAKE_SOFFICE_CONVERT']
+    assert len(results) == 6 and all(len(images) == 1 for images in results)
+    assert soffice_calls().count('start') == 2 and renderer.pool.stats()['conversions'] == 6
+    print("✓ 6 个并发转换共用 2 个常驻 soffice 进程")
+
+
+def test_create_renderer_from_environment():
+    _, soffice = fake_tools()
+    os.environ['SOFFICE_BINARY'] = soffice
+    os.environ['SOFFICE_POOL_SIZE'] = '3'
+    try:
+        renderer = create_slide_renderer()
+        assert isinstance(renderer, LibreOfficeRenderer) and renderer.pool.size == 3
+        assert isinstance(create_slide_renderer('pptx'), PptxTextRenderer)
+        try:
+            create_slide_renderer('keynote')
+            assert False, '未知的渲染器应报错'
+        except ValueError:
+            pass
+    finally:
+        del os.environ['SOFFICE_BINARY'], os.environ['SOFFICE_POOL_SIZE']
+    print("✓ 按环境变量选择渲染器，找到 soffice 时默认用 LibreOffice")
+
+
+if __name__ == '__main__':
+    test_pptx_renderer()
+    test_libreoffice_pool_reuses_soffice()
+    test_pool_limits_concurrency()
+    test_create_renderer_from_environment()
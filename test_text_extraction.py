@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+报告文本提取测试：read_file_content 对 txt/docx/pdf 的结果与原来逐个解析的写法一致，
+PDF 多进程分页提取的顺序正确，同一内容的文件（换了路径）命中缓存，max_chars 提前结束且不写缓存，
+iter_text 完整读完后写缓存、中途停止不写
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from AI_analysis.file_upload import read_file_content
+from AI_analysis.text_extraction import iter_text, extract_text, extraction_cache, shutdown_pool
+from benchmark_text_extraction import write_sample_pdf, legacy_read_pdf
+
+workdir = tempfile.mkdtemp()
+
+
+def test_formats_match_legacy():
+    extraction_cache.clear()
+    # GBK 编码的文本文件
+    txt_path = os.path.join(workdir, 'report.txt')
+    with open(txt_path, 'w', encoding='gbk') as f:
+        f.write('实验报告\n第一节 数据结构')
+    assert read_file_content(txt_path) == '实验报告\n第一节 数据结构'
+    # Windows 换行和单独的 \r 与原来按文本模式读取的结果相同
+    crlf_path = os.path.join(workdir, 'crlf.md')
+    with open(crlf_path, 'wb') as f:
+        f.write('# 标题\r\n正文\r\n\r\n旧式换行\r结尾\r\n'.encode('utf-8'))
+    with open(crlf_path, 'r', encoding='utf-8') as f:
+        assert read_file_content(crlf_path) == f.read() == '# 标题\n正文\n\n旧式换行\n结尾\n'
+
+    from docx import Document
+    docx_path = os.path.join(workdir, 'report.docx')
+    document = Document()
+    for text in ('标题', '', '正文第一段'):
+        document.add_paragraph(text)
+    document.save(docx_path)
+    assert read_file_content(docx_path) == '\n'.join(p.text for p in Document(docx_path).paragraphs)
+
+    pdf_path = os.path.join(workdir, 'short.pdf')
+    write_sample_pdf(pdf_path, 3)
+    assert read_file_content(pdf_path) == legacy_read_pdf(pdf_path)
+
+    empty_path = os.path.join(workdir, 'empty.txt')
+    open(empty_path, 'w').close()
+    assert read_file_content(empty_path) == '无法读取文件内容，可能是编码问题'
+    assert read_file_content(os.path.join(workdir, 'missing.txt')).startswith('读取文件失败')
+    shutil.copy(txt_path, os.path.join(workdir, 'report.xyz'))
+    assert read_file_content(os.path.join(workdir, 'report.xyz')) == '不支持的文件格式'
+    print("✓ 各格式提取结果与原实现一致")
+
+
+def test_parallel_pdf_and_cache():
+    extraction_cache.clear()
+    pdf_path = os.path.join(workdir, 'long.pdf')
+    write_sample_pdf(pdf_path, 40)
+    expected = legacy_read_pdf(pdf_path)
+    try:
+        assert extract_text(pdf_path, workers=2) == expected
+        assert extraction_cache.stats()['misses'] == 1
+
+        # 同一内容换一个路径也命中缓存
+        copy_path = os.path.join(workdir, 'copy.pdf')
+        shutil.copy(pdf_path, copy_path)
+        assert read_file_content(copy_path) == expected
+        assert extraction_cache.stats()['hits'] == 1
+        assert ''.join(iter_text(copy_path)) == expected
+
+        # 只要开头：返回前缀，不写缓存；生成器中途停止
+        extraction_cache.clear()
+        assert extract_text(pdf_path, max_chars=500, workers=2) == expected[:500]
+        assert extraction_cache.stats()['entries'] == 0
+        import PyPDF2
+        pages = iter_text(pdf_path, workers=2)
+        assert next(pages) == PyPDF2.PdfReader(pdf_path).pages[0].extract_text()
+        pages.close()
+        assert extraction_cache.stats()['entries'] == 0
+
+        # 逐页读完后写入缓存，之后的读取直接命中
+        assert '\n'.join(iter_text(pdf_path, workers=2)) == expected
+        assert extraction_cache.stats()['entries'] == 1
+        hits = extraction_cache.stats()['hits']
+        assert extract_text(copy_path) == expected
+        assert extraction_cache.stats()['hits'] == hits + 1
+    finally:
+        shutdown_pool()
+    print("✓ PDF 并行提取与缓存测试通过")
+
+
+def test_cache_eviction():
+    from AI_analysis.text_extraction import ExtractionCache
+    cache = ExtractionCache(max_chars=10)
+    cache.put('a', '12345')
+    cache.put('b', '12345')
+    cache.get('a')
+    cache.put('c', '123')
+    assert cache.get('b') is None and cache.get('a') == '12345' and cache.get('c') == '123'
+    assert cache.stats()['chars'] == 8
+    print("✓ 提取缓存淘汰测试通过")
+
+
+if __name__ == '__main__':
+    test_formats_match_legacy()
+    test_parallel_pdf_and_cache()
+    test_cache_eviction()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并行语音合成测试：用假的 TTS 引擎模拟 pyttsx3（初始化和合成都要等待），
+多页同时合成、结果按提交顺序返回；每个工作进程只初始化一次引擎并在多次调用间复用；
+单页超时时结束并重启卡住的工作进程，其他页不受影响；失败按次数重试；引擎初始化失败时立即返回失败
+"""
+
+import os
+import sys
+import time
+import wave
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from tts_pool import TTSExecutor, clean_tts_text, get_tts_executor, set_tts_executor
+
+
+class FakeTTSEngine:
+    """
+    假的语音引擎：初始化等待 FAKE_TTS_INIT 秒，每个字等待 FAKE_TTS_PER_CHAR 秒，写出每个字 0.1 秒的静音 WAV；
+    文本含"卡住"时一直不返回，含"偶尔失败"时每个文件第一次合成抛出异常；初始化和合成记录到 FAKE_TTS_LOG
+    """
+
+    def __init__(self):
+        time.sleep(float(os.environ.get('FAKE_TTS_INIT', '0.2')))
+        self.log('init')
+
+    def log(self, event):
+        if os.environ.get('FAKE_TTS_LOG'):
+            with open(os.environ['FAKE_TTS_LOG'], 'a', encoding='utf-8') as f:
+                f.write(f'{event} {os.getpid()}\n')
+
+    def synthesize(self, text, filename, rate):
+        self.log('say')
+        if '卡住' in text:
+            time.sleep(3600)
+        if '偶尔失败' in text and not os.path.exists(filename + '.tried'):
+            open(filename + '.tried', 'w').close()
+            raise RuntimeError('声卡忙')
+        time.sleep(len(text) * float(os.environ.get('FAKE_TTS_PER_CHAR', '0.01')))
+        with wave.open(filename, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(16000)
+            f.writeframes(b'\0\0' * 1600 * len(text))
+        return f'假引擎生成成功（语速 {rate}）'
+
+
+class BrokenEngine:
+    def __init__(self):
+        raise RuntimeError('没有可用的语音驱动')
+
+
+def fake_log():
+    path = os.path.join(tempfile.mkdtemp(), 'tts.log')
+    os.environ['FAKE_TTS_LOG'] = path
+    return path
+
+
+def read_log(path):
+    with open(path, encoding='utf-8') as f:
+        return [line.split() for line in f]
+
+
+def frames(filename):
+    with wave.open(filename, 'rb') as f:
+        return f.getnframes()
+
+
+def test_ordered_results_and_reused_workers():
+    log = fake_log()
+    folder = tempfile.mkdtemp()
+    texts = [f'第{i}页：' + '讲解' * (10 - i) for i in range(10)]
+    filenames = [os.path.join(folder, f'audio_{i + 1:02d}.wav') for i in range(10)]
+    executor = TTSExecutor(FakeTTSEngine, workers=3, timeout=10)
+    try:
+        results = executor.map(list(zip(texts, filenames)), rate=180)
+        assert results == [(True, '假引擎生成成功（语速 180）')] * 10
+        # 文本长短不同、完成顺序不同，结果仍按页序对应各自的文件
+        assert [frames(filename) for filename in filenames] == [1600 * len(clean_tts_text(text)) for text in texts]
+        # 再合成一批：不再启动新进程、不再初始化引擎
+        assert executor.map([('第二批', os.path.join(folder, 'again.wav'))]) == [(True, '假引擎生成成功（语速 150）')]
+        events = read_log(log)
+        inits = {pid for event, pid in events if event == 'init'}
+        assert len(inits) == 3 and len(events) == 3 + 11
+        assert {pid for event, pid in events if event == 'say'} <= inits
+        stats = executor.stats()
+        assert (stats['running'], stats['completed'], stats['failures'], stats['restarts']) == (3, 11, 0, 0)
+    finally:
+        executor.close()
+    assert executor.stats()['running'] == 0
+    print("✓ 11 页由 3 个常驻工作进程合成，每个进程只初始化一次引擎，结果按页序返回")
+
+
+def test_timeout_restarts_worker():
+    log = fake_log()
+    folder = tempfile.mkdtemp()
+    items = [('正常的一页', os.path.join(folder, 'a.wav')), ('这一页会卡住', os.path.join(folder, 'b.wav')),
+             ('第三页偶尔失败', os.path.join(folder, 'c.wav')), ('最后一页', os.path.join(folder, 'd.wav'))]
+    executor = TTSExecutor(FakeTTSEngine, workers=2, timeout=1, retries=1)
+    try:
+        started = time.perf_counter()
+        results = executor.map(items)
+        elapsed = time.perf_counter() - started
+        assert results[0][0] and results[2][0] and results[3][0]
+        # 卡住的一页重试后仍超时，按失败返回，由调用方走降级方案
+        assert results[1] == (False, '生成超时（1 秒）')
+        assert elapsed < 10
+        stats = executor.stats()
+        assert (stats['timeouts'], stats['restarts'], stats['failures'], stats['running']) == (2, 2, 1, 2)
+        # 重启后的工作进程照常工作
+        assert executor.map([('重启之后', os.path.join(folder, 'e.wav'))])[0][0]
+    finally:
+        executor.close()
+    assert len([event for event, _ in read_log(log) if event == 'init']) == 4
+    print(f"✓ 卡住的一页超时后重启工作进程（{elapsed:.1f} 秒），失败一次的页重试成功")
+
+
+def test_engine_init_failure():
+    folder = tempfile.mkdtemp()
+    executor = TTSExecutor('test_tts_pool:BrokenEngine', workers=2, timeout=5, retries=0)
+    try:
+        started = time.perf_counter()
+        results = executor.map([(f'第{i}页', os.path.join(folder, f'{i}.wav')) for i in range(4)])
+        assert results == [(False, '语音引擎初始化失败: 没有可用的语音驱动')] * 4
+        assert time.perf_counter() - started < 5
+    finally:
+        executor.close()
+    print("✓ 引擎初始化失败时每页立即返回失败，不等待超时")
+
+
+def test_executor_from_environment():
+    os.environ.update({'TTS_ENGINE': 'test_tts_pool:FakeTTSEngine', 'TTS_WORKERS': '3', 'TTS_TASK_TIMEOUT': '7'})
+    set_tts_executor(None)
+    try:
+        executor = get_tts_executor()
+        assert get_tts_executor() is executor
+        assert (executor.engine, executor.workers, executor.timeout) == ('test_tts_pool:FakeTTSEngine', 3, 7.0)
+        # 没有提交任务时不启动工作进程
+        assert executor.stats()['running'] == 0
+    finally:
+        for name in ('TTS_ENGINE', 'TTS_WORKERS', 'TTS_TASK_TIMEOUT'):
+            del os.environ[name]
+        set_tts_executor(None)
+    print("✓ 按环境变量创建语音合成执行器")
+
+
+if __name__ == '__main__':
+    test_ordered_results_and_reused_workers()
+    test_timeout_restarts_worker()
+    test_engine_init_failure()
+    test_executor_from_environment()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI 助教异步接口测试：api.main 的 /api/ai-tutor/chat 与 Flask 版输出相同的 SSE 事件，
+20 个同时进行的对话不额外占用线程、相同问题只请求上游一次；
+历史对话和 FAQ 接口读取 Flask 的 session Cookie，返回与 Flask 版相同的结果
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+from datetime import datetime, timedelta
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# 复用 AI 助教流式接口测试的本地假服务
+from test_llm_clients import FakeStreamingChat, reset_server
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app as flask_app, db, User, Message, record_tutor_session, faq_builder
+from api.main import app as asgi_app
+from api.tutor import tutor_flights
+from tutor_cache import get_tutor_cache
+
+# AI 助教改用假服务（见 conftest.py）
+pytestmark = pytest.mark.usefixtures('fake_tutor_service')
+
+
+def parse_events(body):
+    events = [line[len('data: '):] for line in body.split('\n\n') if line]
+    assert events[-1] == '[DONE]'
+    return [json.loads(event) for event in events[:-1]]
+
+
+def test_chat_stream_matches_flask():
+    reset_server()
+    get_tutor_cache().clear()
+    with TestClient(asgi_app) as client:
+        response = client.post('/api/ai-tutor/chat', json={'question': '什么是递归？'})
+        assert response.headers['content-type'].startswith('text/event-stream')
+        assert parse_events(response.text) == [{'type': 'thinking', 'content': '想一想'},
+                                               {'type': 'answer', 'content': '你好'},
+                                               {'type': 'answer', 'content': '，同学'}]
+        # 第二次命中问答缓存，GET 方式同样支持
+        replayed = parse_events(client.get('/api/ai-tutor/chat', params={'question': '什么是递归'}).text)
+        assert ''.join(e['content'] for e in replayed if e['type'] == 'answer') == '你好，同学'
+        assert parse_events(client.post('/api/ai-tutor/chat', json={}).text) == [
+            {'type': 'error', 'content': '问题不能为空'}]
+    assert FakeStreamingChat.requests == 1
+    print("✓ 异步对话接口的 SSE 输出与 Flask 版一致")
+
+
+def test_concurrent_streams_do_not_hold_threads():
+    reset_server()
+    get_tutor_cache().clear()
+    FakeStreamingChat.first_token_delay = 0.5
+
+    async def run():
+        # 线程池只留 2 个线程：等待上游时不占线程，20 个对话仍然同时进行
+        import anyio.to_thread
+        anyio.to_thread.current_default_thread_limiter().total_tokens = 2
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://tutor') as client:
+            async def ask(question):
+                response = await client.post('/api/ai-tutor/chat', json={'question': question})
+                return parse_events(response.text)
+            started = time.perf_counter()
+            # 10 个不同的问题 + 10 个相同的问题
+            results = await asyncio.gather(*[ask(f'第{i}题怎么做') for i in range(10)],
+                                           *[ask('投影上的题怎么做') for _ in range(10)])
+            return results, time.perf_counter() - started
+
+    try:
+        results, elapsed = asyncio.run(run())
+    finally:
+        FakeStreamingChat.first_token_delay = 0.2
+    assert all(''.join(e['content'] for e in events if e['type'] == 'answer') == '你好，同学' for events in results)
+    # 10 个不同问题 + 1 个合并后的问题
+    assert FakeStreamingChat.requests == 11
+    assert tutor_flights.stats()['joined'] >= 9
+    # 每个上游请求 0.5 秒；若每个对话占一个线程，2 个线程至少要 11 / 2 * 0.5 秒
+    assert elapsed < 1.5, elapsed
+    print(f"✓ 20 个并发对话只请求上游 11 次，2 个线程用时 {elapsed:.2f} 秒")
+
+
+def test_history_and_faq_match_flask(login):
+    with flask_app.app_context():
+        user = User(username='async_tutor_student', password='x', role='student', student_id='AT1')
+        db.session.add(user)
+        db.session.flush()
+        start = datetime(2025, 3, 1, 9, 0)
+        for i, (session_id, question) in enumerate([('s1', '什么是栈'), ('s2', '什么是队列'), ('s3', '什么是栈')]):
+            question_message = Message(sender_id=user.id, receiver_id=None, content=question, session_id=session_id,
+                                       message_type='question', created_at=start + timedelta(minutes=2 * i))
+            answer_message = Message(sender_id=user.id, receiver_id=user.id, content=f'{question}的回答',
+                                     session_id=session_id, message_type='answer',
+                                     created_at=start + timedelta(minutes=2 * i + 1))
+            db.session.add_all([question_message, answer_message])
+            db.session.flush()
+            record_tutor_session(question_message, answer_message)
+        db.session.commit()
+        user_id = user.id
+    # 直接插入的消息不经过 save_conversation，手动处理一次常见问题聚类
+    faq_builder.run_once()
+
+    flask_client = login(user_id)
+    cookie = flask_app.session_interface.get_signing_serializer(flask_app).dumps({'user_id': user_id})
+
+    with TestClient(asgi_app, cookies={'session': cookie}) as client:
+        for url in ('/api/ai-tutor/history', '/api/ai-tutor/history/s1', '/api/ai-tutor/faq',
+                    '/api/ai-tutor/faq/search?keyword=队列'):
+            async_response = client.get(url)
+            flask_response = flask_client.get(url)
+            assert async_response.status_code == flask_response.status_code == 200
+            assert async_response.json() == flask_response.get_json(), url
+        assert client.get('/api/ai-tutor/faq').json()['faq'][0] == {
+            'question': '什么是栈', 'answer': '什么是栈的回答', 'frequency': 2}
+        assert client.get('/api/ai-tutor/faq/search?keyword=').status_code == 400
+    print("✓ 异步历史对话和 FAQ 接口与 Flask 版结果一致")
+
+
+if __name__ == '__main__':
+    # 通过 pytest 运行，使用 conftest.py 中的临时数据库和假服务
+    sys.exit(pytest.main([__file__, '-q', '-s']))
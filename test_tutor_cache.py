@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+助教问答语义缓存测试：换了标点、客套词、少量字词的问题命中同一条回答，不同的问题和只差数字、运算符的问题不命中，
+不同 scope 互不命中，超出容量淘汰最久未使用的条目，换一个进程（新实例）仍能命中，读写后关闭数据库连接；
+/api/ai-tutor/chat 第二次问相似问题时不请求大模型，按原来的 SSE 格式重放回答
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from tutor_cache import TutorAnswerCache, normalize_question, symbol_key, replay_events
+
+
+def new_cache(**kwargs):
+    return TutorAnswerCache(os.path.join(tempfile.mkdtemp(), 'tutor_cache.db'), **kwargs)
+
+
+def test_normalize_question():
+    assert normalize_question('老师，请问什么是 栈？') == '什么是栈'
+    assert normalize_question('什么是栈?') == normalize_question('什么是栈呢？')
+    assert normalize_question('ＴＣＰ三次握手') == 'tcp三次握手'
+    # 数字和运算符保留，小数点不当作句号
+    assert normalize_question('2 + 3 等于几？') == '2+3等于几'
+    assert normalize_question('3.5 乘 2 是多少。') == '3.5乘2是多少'
+    assert symbol_key(normalize_question('C++ 是什么')) == '+ +'
+    print("✓ 问题规范化测试通过")
+
+
+def test_near_duplicate_hits():
+    cache = new_cache()
+    cache.put('什么是栈？栈和队列有什么区别？', '栈是后进先出的……', thinking='先解释栈', scope='m')
+    cache.put('TCP三次握手的过程是怎样的', '第一次握手……', scope='m')
+    cache.put('二叉树的前序遍历怎么写', '递归访问根、左、右……', scope='m')
+
+    hit = cache.lookup('老师您好，请问：什么是栈? 栈和队列有什么区别', scope='m')
+    assert hit is not None and hit['answer'] == '栈是后进先出的……' and hit['thinking'] == '先解释栈'
+    # 换了说法、增减一两个字的问题也命中
+    assert cache.lookup('tcp三次握手过程是怎样的？', scope='m')['answer'] == '第一次握手……'
+    hit = cache.lookup('什么是栈，栈和队列的区别有什么', scope='m')
+    assert hit is not None and hit['answer'] == '栈是后进先出的……' and 0.85 <= hit['similarity'] < 1
+
+    # 只差一个关键字的问题不命中
+    assert cache.lookup('二叉树的中序遍历怎么写', scope='m') is None
+    assert cache.lookup('什么是队列', scope='m') is None
+    # 换了模型或提示词版本不命中
+    assert cache.lookup('什么是栈？栈和队列有什么区别？', scope='other') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (3, 3, 3)
+    assert stats['hit_rate'] == 0.5
+    print(f"✓ 相似问题命中测试通过（相似度 {hit['similarity']}）")
+
+
+def test_operators_do_not_collide():
+    cache = new_cache()
+    pairs = [('2+3等于几', ('2*3等于几', '2-3等于几', '2/3等于几', '23等于几')),
+             ('x>y时函数返回什么', ('x<y时函数返回什么', 'x=y时函数返回什么')),
+             ('C++的指针怎么用', ('C的指针怎么用', 'C#的指针怎么用')),
+             ('请计算表达式 a+b*c 在 C 语言里的值', ('请计算表达式 a+b-c 在 C 语言里的值',))]
+    for cached, others in pairs:
+        cache.put(cached, cached + '的回答', scope='m')
+    for cached, others in pairs:
+        assert cache.lookup(cached, scope='m')['answer'] == cached + '的回答'
+        # 只差运算符或符号的问题含义不同，不能重放别的问题的回答
+        for other in others:
+            assert cache.lookup(other, scope='m') is None, other
+    # 空白和标点不同仍是同一个问题
+    assert cache.lookup('2 + 3 等于几？', scope='m')['similarity'] == 1.0
+    print("✓ 只差数字或运算符的问题不命中缓存")
+
+
+def test_lru_and_persistence():
+    cache = new_cache(max_entries=3)
+    for question in ('什么是进程', '什么是线程池', '死锁的四个必要条件'):
+        cache.put(question, question + '的回答')
+        time.sleep(0.01)
+    assert cache.lookup('什么是进程？') is not None  # 进程最近用过，线程池成为最久未使用
+    cache.put('快速排序的时间复杂度', '平均 O(n log n)')
+    assert cache.lookup('什么是线程池') is None
+    assert cache.stats()['evictions'] == 1
+
+    # 同一个缓存文件，新进程（新实例）载入后也能命中
+    reloaded = TutorAnswerCache(cache.db_path, max_entries=3)
+    assert reloaded.stats()['entries'] == 3
+    assert reloaded.lookup('快速排序的时间复杂度？')['answer'] == '平均 O(n log n)'
+    assert reloaded.lookup('什么是线程池') is None
+    print("✓ LRU 淘汰与持久化测试通过")
+
+
+def test_connections_closed(monkeypatch):
+    cache, opened = new_cache(), []
+    connect = sqlite3.connect
+    def tracking_connect(database, *args, **kwargs):
+        conn = connect(database, *args, **kwargs)
+        if database == cache.db_path:
+            opened.append(conn)
+        return conn
+    monkeypatch.setattr(sqlite3, 'connect', tracking_connect)
+
+    cache.put('什么是进程', '进程的回答')
+    assert cache.lookup('什么是进程？') is not None
+    cache.clear()
+    # 写入、命中后更新使用时间、清空各用一个连接，用完都已关闭
+    assert len(opened) == 3
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute('SELECT 1')
+    print("✓ 缓存读写后关闭连接")
+
+
+def test_replay_events():
+    events = list(replay_events({'thinking': '想一想', 'answer': 'a' * 45}, piece_chars=20))
+    assert events[0] == {'type': 'thinking', 'content': '想一想'}
+    assert [len(e['content']) for e in events[1:]] == [20, 20, 5]
+    print("✓ 回答重放格式测试通过")
+
+
+@pytest.mark.usefixtures('fake_tutor_service')
+def test_tutor_chat_replays_cached_answer():
+    # 复用 AI 助教流式接口测试的本地假服务
+    from test_llm_clients import FakeStreamingChat, reset_server
+    from app import app
+    from tutor_cache import get_tutor_cache
+    reset_server()
+    get_tutor_cache().clear()
+    # 同一进程中其他测试也会用到缓存，命中次数按增量比较
+    hits = get_tutor_cache().stats()['hits']
+
+    def ask(question):
+        response = app.test_client().post('/api/ai-tutor/chat', json={'question': question})
+        events = [line[len('data: '):] for line in response.get_data(as_text=True).split('\n\n') if line]
+        assert events[-1] == '[DONE]'
+        return [json.loads(event) for event in events[:-1]]
+
+    first = ask('请问什么是哈希表的冲突？')
+    second = ask('什么是哈希表的冲突')
+    assert FakeStreamingChat.requests == 1
+    assert second == [{'type': 'thinking', 'content': '想一想'}, {'type': 'answer', 'content': '你好，同学'}]
+    assert ''.join(e['content'] for e in first if e['type'] == 'answer') == '你好，同学'
+    assert get_tutor_cache().stats()['hits'] == hits + 1
+    print("✓ AI 助教接口重放缓存回答测试通过")
+
+
+if __name__ == '__main__':
+    # 通过 pytest 运行，使用 conftest.py 中的临时数据库和假服务
+    sys.exit(pytest.main([__file__, '-q', '-s']))
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI 助教历史对话和 FAQ 测试：save_conversation 增量维护的 TutorSession 摘要与 rebuild_tutor_sessions
+全量重建一致；历史列表只用 1 次查询，结果与逐会话查询的旧实现相同；删除消息后摘要同步更新
+（FAQ 改为读后台聚类的结果，见 test_faq_clusters.py）
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy import event
+from app import (app, db, Message, TutorSession, tutor_history, rebuild_tutor_sessions)
+
+
+def legacy_history(user_id):
+    """旧实现：按会话分组后，每个会话再查两次第一条问题和回答"""
+    sessions = db.session.query(
+        Message.session_id, db.func.max(Message.created_at)
+    ).filter(
+        Message.sender_id == user_id, Message.message_type == 'question'
+    ).group_by(Message.session_id).order_by(db.func.max(Message.created_at).desc()).all()
+    history = []
+    for session_id, _ in sessions:
+        if not session_id:
+            continue
+        first_question = Message.query.filter_by(sender_id=user_id, session_id=session_id,
+                                                 message_type='question').order_by(Message.created_at).first()
+        first_answer = Message.query.filter_by(session_id=session_id,
+                                               message_type='answer').order_by(Message.created_at).first()
+        if first_question and first_answer:
+            history.append({'session_id': session_id, 'question': first_question.content,
+                            'answer': first_answer.content,
+                            'time': first_question.created_at.strftime('%Y-%m-%d %H:%M')})
+    return history
+
+
+def count_queries(func, *args):
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        return func(*args), len(statements)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def summaries():
+    return sorted((s.user_id, s.session_id, s.first_question, s.first_answer, s.first_question_at,
+                   s.last_activity_at, s.question_count) for s in TutorSession.query.all())
+
+
+def test_history_from_summary(create_user, login):
+    user_id = create_user('history_student', 'TH1')
+    client = login(user_id)
+    # 30 个会话，每个会话 1~4 轮问答
+    for session_index in range(30):
+        for turn in range(session_index % 4 + 1):
+            question = f'问题{(session_index + turn) % 25}'
+            response = client.post('/api/ai-tutor/save-conversation', json={
+                'question': question, 'answer': f'{question}的回答（会话{session_index}）',
+                'session_id': f's{session_index}'})
+            assert response.get_json()['success']
+
+    with app.app_context():
+        # 同一秒内保存的问答用 ID 区分先后，把时间错开，让新旧实现的排序条件一致
+        start = datetime(2025, 3, 1, 9, 0)
+        for index, message in enumerate(Message.query.order_by(Message.id)):
+            message.created_at = start + timedelta(minutes=index)
+        db.session.commit()
+        rebuild_tutor_sessions(batch_size=7)
+
+        history, history_queries = count_queries(tutor_history, user_id)
+        assert history_queries == 1, history_queries
+        assert history == legacy_history(user_id)
+        assert len(history) == 30 and history[0]['session_id'] == 's29'
+    print(f"✓ 历史对话 {history_queries} 次查询，结果与旧实现一致")
+
+
+def test_incremental_summary_matches_rebuild(create_user, login):
+    user_id = create_user('summary_student', 'TH2')
+    client = login(user_id)
+    for i in range(6):
+        client.post('/api/ai-tutor/save-conversation', json={
+            'question': f'第{i}问', 'answer': f'第{i}答', 'session_id': f'inc-{i % 2}'})
+
+    with app.app_context():
+        session_row = TutorSession.query.filter_by(user_id=user_id, session_id='inc-1').first()
+        assert (session_row.first_question, session_row.first_answer, session_row.question_count) == ('第1问', '第1答', 3)
+        before = summaries()
+        rebuild_tutor_sessions()
+        assert summaries() == before
+
+        # 删除会话的第一条回答后，摘要改用下一条回答；问题全部删除后摘要也删除
+        answer_id = Message.query.filter_by(sender_id=user_id, session_id='inc-1', content='第1答').first().id
+        question_ids = [m.id for m in Message.query.filter_by(sender_id=user_id, session_id='inc-0',
+                                                              message_type='question')]
+    client.post(f'/delete_message/{answer_id}')
+    for message_id in question_ids:
+        with app.app_context():
+            message = db.session.get(Message, message_id)
+            message.receiver_id = user_id
+            db.session.commit()
+        client.post(f'/delete_message/{message_id}')
+    with app.app_context():
+        assert TutorSession.query.filter_by(user_id=user_id, session_id='inc-1').first().first_answer == '第3答'
+        assert TutorSession.query.filter_by(user_id=user_id, session_id='inc-0').first() is None
+        assert [item['session_id'] for item in tutor_history(user_id)] == ['inc-1']
+    print("✓ 增量维护的助教会话摘要与全量重建一致，删除消息后同步更新")
+
+
+if __name__ == '__main__':
+    # 通过 pytest 运行，使用 conftest.py 中的临时数据库
+    sys.exit(pytest.main([__file__, '-q', '-s']))
